@@ -0,0 +1,312 @@
+""" Benchmarks for the hot paths of the optimiser.
+
+The benchmarks are written for airspeed velocity (asv), which reports the wall
+time (``time_*``), the peak memory (``peakmem_*``) and the quality and number
+of iterations (``track_*``). To benchmark the installed version of leidenalg,
+without creating new environments (and hence without network access), run
+
+  asv run --python=same --quick
+
+Alternatively, the benchmarks can be run without asv
+
+  python benchmarks/benchmarks.py --max-edges 100000
+
+All graphs are generated with a fixed seed. By default, graphs have at most
+1e6 edges; set LEIDENALG_BENCHMARK_MAX_EDGES (e.g. to 10000000) to include
+larger graphs.
+"""
+import os
+import resource
+import sys
+import time
+from functools import lru_cache
+
+import igraph as ig
+import leidenalg as la
+import numpy as np
+
+from leidenalg import _c_leiden
+
+MAX_EDGES = int(float(os.environ.get('LEIDENALG_BENCHMARK_MAX_EDGES', 1e6)))
+EDGES = [m for m in (10**3, 10**4, 10**5, 10**6, 10**7) if m <= MAX_EDGES]
+
+GENERATORS = ['erdos_renyi', 'power_law', 'sbm', 'lfr']
+
+PARTITION_TYPES = {
+    'Modularity': la.ModularityVertexPartition,
+    'RBConfiguration': la.RBConfigurationVertexPartition,
+    'RBER': la.RBERVertexPartition,
+    'CPM': la.CPMVertexPartition,
+    'Surprise': la.SurpriseVertexPartition,
+    'Significance': la.SignificanceVertexPartition,
+    }
+
+SETTINGS = {
+    'default': {},
+    'no_refinement': {'refine_partition': False},
+    'merge_nodes': {'optimise_routine': la.MERGE_NODES,
+                    'refine_routine': la.MERGE_NODES},
+    'all_neigh_comms': {'refine_consider_comms': la.ALL_NEIGH_COMMS},
+    'all_threads': {'n_threads': 0},
+    }
+
+AVERAGE_DEGREE = 20
+MIXING = 0.1 # Fraction of edges between communities
+SEED = 42
+
+#%%
+def _community_sizes(n, rng, power_law):
+  """ Sizes of planted communities, either all of the same size (SBM), or
+  power-law distributed (LFR-like)."""
+  if not power_law:
+    size = min(100, n)
+    sizes = np.full(n // size, size)
+  else:
+    min_size, max_size = min(20, n), max(min(20, n), n // 10)
+    sizes = np.minimum(min_size*(1 + rng.pareto(1.0, n // min_size + 1)), max_size)
+    sizes = sizes.astype(np.int64)
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), n) + 1]
+  sizes[-1] += n - sizes.sum()
+  return sizes[sizes > 0]
+
+@lru_cache(maxsize=None)
+def generate_edges(generator, m, seed=SEED):
+  """ Generate a random graph with (about) m edges and average degree
+  AVERAGE_DEGREE, returning the number of nodes and an array of edges."""
+  rng = np.random.default_rng(seed)
+  n = max(2*m // AVERAGE_DEGREE, 10)
+
+  if generator in ('power_law', 'lfr'):
+    # Chung-Lu type model with a power-law exponent of 2.5
+    fitness = (np.arange(n) + 1.0)**(-1/1.5)
+    fitness /= fitness.sum()
+    source = rng.choice(n, m, p=fitness)
+  else:
+    fitness = None
+    source = rng.integers(0, n, m)
+
+  if generator in ('sbm', 'lfr'):
+    sizes = _community_sizes(n, rng, power_law=(generator == 'lfr'))
+    start = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    # Shuffle the nodes, so that high degree nodes are spread over communities
+    membership = rng.permutation(np.repeat(np.arange(len(sizes)), sizes))
+    nodes = np.argsort(membership, kind='stable')
+    comm = membership[source]
+    target = nodes[start[comm] + (rng.random(m)*sizes[comm]).astype(np.int64)]
+    # Rewire a fraction of the edges to random nodes
+    between = rng.random(m) < MIXING
+    if fitness is None:
+      target[between] = rng.integers(0, n, between.sum())
+    else:
+      target[between] = rng.choice(n, between.sum(), p=fitness)
+  elif generator in ('erdos_renyi', 'power_law'):
+    if fitness is None:
+      target = rng.integers(0, n, m)
+    else:
+      target = rng.choice(n, m, p=fitness)
+  else:
+    raise ValueError('Unknown generator {0}.'.format(generator))
+
+  edges = np.column_stack((source, target))
+  edges = edges[source != target]
+  return n, edges
+
+@lru_cache(maxsize=None)
+def generate_graph(generator, m, seed=SEED):
+  n, edges = generate_edges(generator, m, seed)
+  return ig.Graph(n=n, edges=edges.tolist())
+
+def create_partition(graph, partition_type):
+  kwargs = {}
+  if partition_type == 'CPM':
+    # Communities should be considerably denser than the graph as a whole
+    kwargs['resolution_parameter'] = 10*graph.density()
+  return PARTITION_TYPES[partition_type](graph, **kwargs)
+
+def create_optimiser(setting='default'):
+  optimiser = la.Optimiser()
+  optimiser.set_rng_seed(SEED)
+  for attr, value in SETTINGS[setting].items():
+    setattr(optimiser, attr, value)
+  return optimiser
+
+def optimise_until_stable(optimiser, partition):
+  """ Optimise the partition until an iteration no longer improves the quality,
+  returning the number of iterations."""
+  itr = 1
+  while optimiser.optimise_partition(partition, n_iterations=1) > 0:
+    itr += 1
+  return itr
+
+#%%
+class _Benchmark:
+  number = 1
+  repeat = (1, 5, 30.0)
+  warmup_time = 0
+  timeout = 1800
+
+class OptimisePartition(_Benchmark):
+  """ The Leiden algorithm for each type of partition (with default settings)."""
+  params = [GENERATORS, EDGES, list(PARTITION_TYPES)]
+  param_names = ['graph', 'edges', 'partition']
+
+  def setup(self, generator, m, partition_type):
+    self.graph = generate_graph(generator, m)
+    self.partition = create_partition(self.graph, partition_type)
+    self.optimiser = create_optimiser()
+
+  def time_optimise_partition(self, generator, m, partition_type):
+    self.optimiser.optimise_partition(self.partition)
+
+  def peakmem_optimise_partition(self, generator, m, partition_type):
+    self.optimiser.optimise_partition(self.partition)
+
+  def track_quality(self, generator, m, partition_type):
+    self.optimiser.optimise_partition(self.partition)
+    return self.partition.quality()
+
+  def track_iterations(self, generator, m, partition_type):
+    return optimise_until_stable(self.optimiser, self.partition)
+
+class OptimiserSettings(_Benchmark):
+  """ The Leiden algorithm for modularity for different optimiser settings."""
+  params = [GENERATORS, EDGES, list(SETTINGS)]
+  param_names = ['graph', 'edges', 'setting']
+
+  def setup(self, generator, m, setting):
+    self.graph = generate_graph(generator, m)
+    self.partition = create_partition(self.graph, 'Modularity')
+    self.optimiser = create_optimiser(setting)
+
+  def time_optimise_partition(self, generator, m, setting):
+    self.optimiser.optimise_partition(self.partition)
+
+  def peakmem_optimise_partition(self, generator, m, setting):
+    self.optimiser.optimise_partition(self.partition)
+
+  def track_quality(self, generator, m, setting):
+    self.optimiser.optimise_partition(self.partition)
+    return self.partition.quality()
+
+  def track_iterations(self, generator, m, setting):
+    return optimise_until_stable(self.optimiser, self.partition)
+
+class MoveNodes(_Benchmark):
+  """ Moving nodes from a singleton partition, which mostly consists of
+  calculating diff_move for each type of partition."""
+  params = [GENERATORS, EDGES, list(PARTITION_TYPES)]
+  param_names = ['graph', 'edges', 'partition']
+
+  def setup(self, generator, m, partition_type):
+    self.graph = generate_graph(generator, m)
+    self.partition = create_partition(self.graph, partition_type)
+    self.optimiser = create_optimiser()
+
+  def time_move_nodes(self, generator, m, partition_type):
+    self.optimiser.move_nodes(self.partition)
+
+class MergeNodes(_Benchmark):
+  """ Merging nodes from a singleton partition."""
+  params = [GENERATORS, EDGES]
+  param_names = ['graph', 'edges']
+
+  def setup(self, generator, m):
+    self.graph = generate_graph(generator, m)
+    self.partition = create_partition(self.graph, 'Modularity')
+    self.optimiser = create_optimiser()
+
+  def time_merge_nodes(self, generator, m):
+    self.optimiser.merge_nodes(self.partition)
+
+class CollapseGraph(_Benchmark):
+  """ Aggregating the graph based on a partition. This calls the C function
+  directly, so that creating the aggregate graph in Python is not included."""
+  params = [GENERATORS, EDGES]
+  param_names = ['graph', 'edges']
+
+  def setup(self, generator, m):
+    self.graph = generate_graph(generator, m)
+    self.partition = create_partition(self.graph, 'Modularity')
+    create_optimiser().move_nodes(self.partition)
+
+  def time_collapse_graph(self, generator, m):
+    _c_leiden._MutableVertexPartition_aggregate_partition(self.partition._partition)
+
+  def peakmem_collapse_graph(self, generator, m):
+    _c_leiden._MutableVertexPartition_aggregate_partition(self.partition._partition)
+
+class CreatePartition(_Benchmark):
+  """ Creating a partition from an edge list, which mostly consists of creating
+  the graph. The memory depends on whether leidenalg is compiled with compact
+  indices and weights (see _c_leiden.INDEX_SIZE and _c_leiden.WEIGHT_SIZE)."""
+  params = [GENERATORS, EDGES]
+  param_names = ['graph', 'edges']
+
+  def setup(self, generator, m):
+    self.n, self.edges = generate_edges(generator, m)
+
+  def time_create_partition(self, generator, m):
+    la.ModularityVertexPartition((self.n, self.edges))
+
+  def peakmem_create_partition(self, generator, m):
+    la.ModularityVertexPartition((self.n, self.edges))
+
+#%%
+def _run_case(benchmark, params, queue):
+  """ Run a single case in a separate process, so that the peak RSS only
+  reflects this case."""
+  case = benchmark()
+  case.setup(*params)
+  name = [attr for attr in dir(benchmark) if attr.startswith('time_')][0]
+  start = time.perf_counter()
+  getattr(case, name)(*params)
+  elapsed = time.perf_counter() - start
+  result = {'time': elapsed,
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024}
+  if hasattr(case, 'track_quality'):
+    result['quality'] = case.partition.quality()
+    case.setup(*params)
+    result['iterations'] = case.track_iterations(*params)
+  queue.put(result)
+
+def main(argv=None):
+  import argparse
+  import itertools
+  import multiprocessing
+
+  benchmarks = [OptimisePartition, OptimiserSettings, MoveNodes, MergeNodes, CollapseGraph, CreatePartition]
+  parser = argparse.ArgumentParser(description='Run the leidenalg benchmarks without asv.')
+  parser.add_argument('--max-edges', type=float, default=1e5)
+  parser.add_argument('--benchmark', nargs='*', default=[b.__name__ for b in benchmarks])
+  parser.add_argument('--graph', nargs='*', default=GENERATORS)
+  args = parser.parse_args(argv)
+
+  context = multiprocessing.get_context('fork')
+  print('Index size: {0} bytes, weight size: {1} bytes'.format(
+        _c_leiden.INDEX_SIZE, _c_leiden.WEIGHT_SIZE))
+  print('{0:<18} {1:<32} {2:>10} {3:>12} {4:>12} {5:>10}'.format(
+        'benchmark', 'parameters', 'time (s)', 'peak RSS (MB)', 'quality', 'iterations'))
+  for benchmark in benchmarks:
+    if benchmark.__name__ not in args.benchmark:
+      continue
+    for params in itertools.product(*benchmark.params):
+      if params[0] not in args.graph or params[1] > args.max_edges:
+        continue
+      queue = context.Queue()
+      process = context.Process(target=_run_case, args=(benchmark, params, queue))
+      process.start()
+      process.join()
+      if process.exitcode != 0:
+        print('{0:<18} {1:<32} failed with exit code {2}'.format(
+              benchmark.__name__, ', '.join(str(p) for p in params), process.exitcode))
+        continue
+      result = queue.get()
+      print('{0:<18} {1:<32} {2:>10.3f} {3:>12.1f} {4:>12} {5:>10}'.format(
+            benchmark.__name__, ', '.join(str(p) for p in params),
+            result['time'], result['peak_rss'],
+            '{0:.4g}'.format(result['quality']) if 'quality' in result else '',
+            result.get('iterations', '')))
+      sys.stdout.flush()
+
+if __name__ == '__main__':
+  main()
@@ -18,6 +18,7 @@ class CPMVertexPartition : public LinearResolutionParameterVertexPartition
     virtual CPMVertexPartition* create(Graph* graph, vector<size_t> const& membership);
 
     virtual double diff_move(size_t v, size_t new_comm);
+    virtual void diff_moves(size_t v, vector<size_t> const& comms, double weight, vector<double>& improvs);
     virtual double quality(double resolution_parameter);
 
   protected:
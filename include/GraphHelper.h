@@ -7,6 +7,10 @@
 #include <set>
 #include <exception>
 #include <deque>
+#include <algorithm>
+#include <memory>
+#include <cstdint>
+#include <limits>
 
 #include <cstdbool>
 
@@ -24,6 +28,34 @@ using std::set;
 using std::deque;
 using std::make_pair;
 
+// Types in which the indices of nodes, edges and communities, and the weights
+// of edges and sizes of nodes, are stored in graphs and partitions. When
+// compiled with LEIDENALG_COMPACT_INDICES, indices are stored as 32 bit
+// integers, which halves the memory used for graphs with fewer than 2^32
+// nodes and edges. When compiled with LEIDENALG_COMPACT_WEIGHTS, weights are
+// stored as single precision floats. In both cases, all calculations are
+// still done using size_t and double, and totals (such as the strength of a
+// node or the total weight in a community) are always stored as double.
+#ifdef LEIDENALG_COMPACT_INDICES
+  typedef uint32_t index_t;
+#else
+  typedef size_t index_t;
+#endif
+
+#ifdef LEIDENALG_COMPACT_WEIGHTS
+  typedef float weight_t;
+#else
+  typedef double weight_t;
+#endif
+
+// Get a vector of indices as a vector of size_t, which only copies the
+// vector if the indices are stored using a different type.
+inline vector<size_t> const& as_size_t_vector(vector<size_t> const& values) { return values; };
+template <class T> vector<size_t> as_size_t_vector(vector<T> const& values)
+{
+  return vector<size_t>(values.begin(), values.end());
+};
+
 vector<size_t> range(size_t n);
 
 bool orderCSize(const size_t* A, const size_t* B);
@@ -64,6 +96,134 @@ inline size_t get_random_int(size_t from, size_t to, igraph_rng_t* rng)
 
 void shuffle(vector<size_t>& v, igraph_rng_t* rng);
 
+// A view on a contiguous part of an array of indices, such as the neighbours
+// of a node in a graph. It remains valid as long as the array is unchanged.
+class Span
+{
+  public:
+    Span(index_t const* begin, index_t const* end) : _begin(begin), _end(end) {};
+
+    inline index_t const* begin() const { return this->_begin; };
+    inline index_t const* end() const { return this->_end; };
+    inline size_t size() const { return this->_end - this->_begin; };
+    inline bool empty() const { return this->_end == this->_begin; };
+    inline size_t operator[](size_t idx) const { return this->_begin[idx]; };
+
+  private:
+    index_t const* _begin;
+    index_t const* _end;
+};
+
+// A read-only memory-mapped file, which is unmapped once it is no longer
+// used by any Array (see Graph::load).
+class MappedFile
+{
+  public:
+    MappedFile(const char* filename);
+    ~MappedFile();
+
+    inline char const* data() const { return this->_data; };
+    inline size_t size() const { return this->_size; };
+
+  private:
+    MappedFile(MappedFile const&);
+    MappedFile& operator=(MappedFile const&);
+
+    char const* _data;
+    size_t _size;
+    #ifdef _WIN32
+      void* _file;
+      void* _mapping;
+    #endif
+};
+
+// A contiguous array whose elements are either owned by the array, or stored
+// in a memory-mapped file, so that they can be shared by multiple processes.
+// The elements can only be read. To change them, the elements are released
+// as a vector (copying them from the file if necessary), which can then be
+// assigned to the array again.
+template <class T> class Array
+{
+  public:
+    Array() : _data(NULL), _size(0) {};
+    Array(Array const& other) { *this = other; };
+    Array(Array&& other) { *this = std::move(other); };
+
+    Array& operator=(Array const& other)
+    {
+      this->_values = other._values;
+      this->_file = other._file;
+      if (this->_file)
+        this->set_view(other._data, other._size);
+      else
+        this->set_view(this->_values.data(), this->_values.size());
+      return *this;
+    };
+
+    Array& operator=(Array&& other)
+    {
+      this->_values.swap(other._values);
+      this->_file = std::move(other._file);
+      if (this->_file)
+        this->set_view(other._data, other._size);
+      else
+        this->set_view(this->_values.data(), this->_values.size());
+      other._values.clear();
+      other.set_view(NULL, 0);
+      return *this;
+    };
+
+    Array& operator=(vector<T> values)
+    {
+      this->_values.swap(values);
+      this->_file.reset();
+      this->set_view(this->_values.data(), this->_values.size());
+      return *this;
+    };
+
+    // Copy values of another type, e.g. double weights to float weights.
+    template <class U> void assign(vector<U> const& values)
+    {
+      *this = vector<T>(values.begin(), values.end());
+    };
+
+    // Refer to size elements stored at the given offset (in bytes) of a file.
+    void map(std::shared_ptr<MappedFile> const& file, size_t offset, size_t size)
+    {
+      vector<T>().swap(this->_values);
+      this->_file = file;
+      this->set_view((T const*) (file->data() + offset), size);
+    };
+
+    vector<T> release()
+    {
+      vector<T> values;
+      if (this->_file)
+        values.assign(this->_data, this->_data + this->_size);
+      else
+        values.swap(this->_values);
+      this->_file.reset();
+      this->set_view(NULL, 0);
+      return values;
+    };
+
+    inline T const& operator[](size_t idx) const { return this->_data[idx]; };
+    inline T const* data() const { return this->_data; };
+    inline T const* begin() const { return this->_data; };
+    inline T const* end() const { return this->_data + this->_size; };
+    inline size_t size() const { return this->_size; };
+    inline bool empty() const { return this->_size == 0; };
+    inline bool is_mapped() const { return (bool) this->_file; };
+
+  private:
+    inline void set_view(T const* data, size_t size) { this->_data = data; this->_size = size; };
+
+    vector<T> _values;
+    std::shared_ptr<MappedFile> _file;
+    T const* _data;
+    size_t _size;
+};
+
 class Graph
 {
   public:
@@ -83,6 +243,9 @@ class Graph
       vector<double> const& node_sizes);
     Graph(igraph_t* graph, int correct_self_loops);
     Graph(igraph_t* graph);
+    Graph(size_t n, vector<size_t> const& edges, int directed,
+      vector<double> const& edge_weights,
+      vector<double> const& node_sizes, int correct_self_loops);
     Graph();
     ~Graph();
 
@@ -91,14 +254,52 @@ class Graph
     static Graph* GraphFromNodeSizes(igraph_t* graph, vector<double> const& node_sizes, int correct_self_loops);
     static Graph* GraphFromNodeSizes(igraph_t* graph, vector<double> const& node_sizes);
 
+    // Save the graph to a file that can be memory-mapped by load, which does
+    // not copy the graph, so that the graph is only read from disk when
+    // needed and can be shared by multiple processes.
+    void save(const char* filename);
+    static Graph* load(const char* filename);
+
     int has_self_loops();
+    int has_negative_weights();
     double possible_edges();
-    double possible_edges(double n);
+    // Inline, since it is called for each candidate community by the
+    // diff_move(s) of Significance and Surprise.
+    inline double possible_edges(double n)
+    {
+      double possible_edges = n*(n-1);
+      if (!this->is_directed())
+        possible_edges /= 2;
+      if (this->correct_self_loops())
+        possible_edges += n;
+      return possible_edges;
+    };
 
     Graph* collapse_graph(MutableVertexPartition* partition);
 
-    vector<size_t> const& get_neighbour_edges(size_t v, igraph_neimode_t mode);
-    vector<size_t> const& get_neighbours(size_t v, igraph_neimode_t mode);
+    void check_edge_update(vector<size_t> const& reweighted_edges, vector<double> const& new_weights,
+                           vector<size_t> const& removed_edges,
+                           vector<size_t> const& added_edges, vector<double> const& added_weights);
+    void update_edges(vector<size_t> const& reweighted_edges, vector<double> const& new_weights,
+                      vector<size_t> const& removed_edges,
+                      vector<size_t> const& added_edges, vector<double> const& added_weights);
+
+    // Get the neighbours (or incident edges) of a node, which are stored
+    // in the same order, so that neighbour_edges[i] connects to neighbours[i].
+    inline Span get_neighbour_edges(size_t v, igraph_neimode_t mode)
+    {
+      Adjacency const& adjacency = this->adjacency(mode);
+      return Span(adjacency.edges.data() + adjacency.offsets[v],
+                  adjacency.edges.data() + adjacency.offsets[v + 1]);
+    };
+
+    inline Span get_neighbours(size_t v, igraph_neimode_t mode)
+    {
+      Adjacency const& adjacency = this->adjacency(mode);
+      return Span(adjacency.neighbours.data() + adjacency.offsets[v],
+                  adjacency.neighbours.data() + adjacency.offsets[v + 1]);
+    };
+
     size_t get_random_neighbour(size_t v, igraph_neimode_t mode, igraph_rng_t* rng);
 
     inline size_t get_random_node(igraph_rng_t* rng)
@@ -106,15 +307,14 @@ class Graph
       return get_random_int(0, this->vcount() - 1, rng);
     };
 
-    inline igraph_t* get_igraph() { return this->_graph; };
-
-    inline size_t vcount() { return igraph_vcount(this->_graph); };
-    inline size_t ecount() { return igraph_ecount(this->_graph); };
+    inline size_t vcount() { return this->_vcount; };
+    inline size_t ecount() { return this->_edge_from.size(); };
     inline double total_weight() { return this->_total_weight; };
     inline double total_size() { return this->_total_size; };
     inline int is_directed() { return this->_is_directed; };
     inline double density() { return this->_density; };
     inline int correct_self_loops() { return this->_correct_self_loops; };
+    void set_correct_self_loops(int correct_self_loops);
     inline int is_weighted() { return this->_is_weighted; };
 
     // Get weight of edge based on attribute (or 1.0 if there is none).
@@ -128,8 +328,8 @@ class Graph
     };
 
     inline void edge(size_t eid, size_t &from, size_t &to) {
-      from = IGRAPH_FROM(this->get_igraph(), eid);
-      to = IGRAPH_TO(this->get_igraph(), eid);
+      from = this->_edge_from[eid];
+      to = this->_edge_to[eid];
     }
 
     inline vector<size_t> edge(size_t e)
@@ -171,32 +371,54 @@ class Graph
 
   protected:
 
-    int _remove_graph;
+    // The edges are stored in the same way as igraph does, so for undirected
+    // graphs the source of an edge is never smaller than its target.
+    size_t _vcount;
+    Array<index_t> _edge_from;
+    Array<index_t> _edge_to;
 
-    igraph_t* _graph;
-    igraph_vector_int_t _temp_igraph_vector;
+    void init_edges(igraph_t* graph);
+    void init_edges(size_t n, vector<size_t> const& edges, int directed);
+    static void check_index_range(size_t n, size_t m);
 
     // Utility variables to easily access the strength of each node
-    vector<double> _strength_in;
-    vector<double> _strength_out;
+    Array<double> _strength_in;
+    Array<double> _strength_out;
 
-    vector<size_t> _degree_in;
-    vector<size_t> _degree_out;
-    vector<size_t> _degree_all;
+    Array<index_t> _degree_in;
+    Array<index_t> _degree_out;
+    Array<index_t> _degree_all;
 
-    vector<double> _edge_weights; // Used for the weight of the edges.
-    vector<double> _node_sizes; // Used for the size of the nodes.
-    vector<double> _node_self_weights; // Used for the self weight of the nodes.
+    Array<weight_t> _edge_weights; // Used for the weight of the edges.
+    Array<weight_t> _node_sizes; // Used for the size of the nodes.
+    Array<weight_t> _node_self_weights; // Used for the self weight of the nodes.
 
-    void cache_neighbours(size_t v, igraph_neimode_t mode);
-    vector<size_t> _cached_neighs_from; size_t _current_node_cache_neigh_from;
-    vector<size_t> _cached_neighs_to;   size_t _current_node_cache_neigh_to;
-    vector<size_t> _cached_neighs_all;  size_t _current_node_cache_neigh_all;
+    // Adjacency in compressed sparse row format: the neighbours (and incident
+    // edges) of node v are stored from offsets[v] up to offsets[v + 1].
+    struct Adjacency
+    {
+      Array<index_t> offsets;
+      Array<index_t> neighbours;
+      Array<index_t> edges;
+    };
+    Adjacency _adjacency_in;
+    Adjacency _adjacency_out;
+    Adjacency _adjacency_all;
+
+    inline Adjacency const& adjacency(igraph_neimode_t mode)
+    {
+      if (!this->is_directed() || mode == IGRAPH_ALL)
+        return this->_adjacency_all; // igraph ignores mode for undirected graphs
+      else if (mode == IGRAPH_IN)
+        return this->_adjacency_in;
+      else if (mode == IGRAPH_OUT)
+        return this->_adjacency_out;
+      else
+        throw Exception("Incorrect mode specified.");
+    };
 
-    void cache_neighbour_edges(size_t v, igraph_neimode_t mode);
-    vector<size_t> _cached_neigh_edges_from; size_t _current_node_cache_neigh_edges_from;
-    vector<size_t> _cached_neigh_edges_to;   size_t _current_node_cache_neigh_edges_to;
-    vector<size_t> _cached_neigh_edges_all;  size_t _current_node_cache_neigh_edges_all;
+    void init_adjacency();
+    void init_sorted_adjacency(Adjacency& adjacency, Array<index_t> const& source, Array<index_t> const& target);
 
     double _total_weight;
     double _total_size;
@@ -206,7 +428,13 @@ class Graph
     int _correct_self_loops;
     double _density;
 
+    // Whether the graph has self loops or negative weights, determined when
+    // first needed (-1 until then), or read from the file by load.
+    int _has_self_loops;
+    int _has_negative_weights;
+
     void init_admin();
+    void init_density();
     void set_defaults();
     void set_default_edge_weight();
     void set_default_node_size();
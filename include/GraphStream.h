@@ -0,0 +1,76 @@
+#ifndef GRAPHSTREAM_H
+#define GRAPHSTREAM_H
+
+#include "GraphHelper.h"
+
+#include <unordered_map>
+
+/****************************************************************************
+Aggregate a graph of which the edges are streamed in chunks, without storing
+the edges themselves.
+
+In the first pass over the edges (cluster_edges), nodes are clustered as in
+the streaming algorithm of Hollocou et al. (2017): for each edge the node in
+the community with the lowest volume joins the community of the other node,
+as long as both nodes have a degree of at most max_degree and the community
+has fewer than max_comm_size nodes. In the second pass (aggregate_edges), the
+edges are aggregated to edges between communities. Only the state of the
+nodes and the aggregate graph are kept in memory. The aggregate graph of the
+edges so far can be made smaller during the second pass by merging its
+communities (merge_communities), for example those of an optimised
+partition of the aggregate graph.
+
+The aggregate graph (aggregate_graph) has the same quality for the
+aggregate partition as the original graph for the corresponding partition,
+similar to Graph::collapse_graph.
+****************************************************************************/
+
+class GraphStream
+{
+  public:
+    GraphStream(size_t n, int directed, double max_degree, size_t max_comm_size);
+    virtual ~GraphStream();
+
+    void cluster_edges(vector<size_t> const& edges, vector<double> const& weights);
+    void aggregate_edges(vector<size_t> const& edges, vector<double> const& weights);
+    void merge_communities(vector<size_t> const& membership);
+    Graph* aggregate_graph(int correct_self_loops);
+
+    inline size_t vcount() const { return this->_n; };
+    inline size_t n_communities() { this->renumber_communities(); return this->_n_communities; };
+    inline size_t membership(size_t v) { this->renumber_communities(); return this->_membership[v]; };
+    inline size_t aggregate_ecount() const { return this->_aggregate_weights.size(); };
+    inline bool has_self_loops() const { return this->_has_self_loops; };
+    inline int is_directed() const { return this->_directed; };
+
+  private:
+    struct PairHash
+    {
+      inline size_t operator()(pair<size_t, size_t> const& p) const
+      {
+        return (size_t) (p.first*0x9e3779b97f4a7c15ULL + p.second);
+      }
+    };
+
+    void check_edges(vector<size_t> const& edges, vector<double> const& weights);
+    void add_nodes(size_t n);
+    void renumber_communities();
+
+    size_t _n;
+    int _directed;
+    double _max_degree;
+    size_t _max_comm_size;
+    bool _has_self_loops;
+
+    vector<size_t> _membership;
+    vector<double> _degree;  // Degree of each node (only during the first pass)
+    vector<double> _volume;  // Total degree of each community (only during the first pass)
+
+    bool _is_renumbered;
+    size_t _n_communities;
+    vector<double> _csize;   // Number of nodes in each community
+
+    std::unordered_map<pair<size_t, size_t>, double, PairHash> _aggregate_weights;
+};
+
+#endif // GRAPHSTREAM_H
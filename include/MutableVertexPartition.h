@@ -16,6 +16,98 @@ using std::sort;
 using std::reverse;
 using std::priority_queue;
 
+/****************************************************************************
+The weights of a node to the communities of its neighbours, and those
+communities themselves, as cached by MutableVertexPartition.
+
+A node has at most as many neighbouring communities as it has neighbours, so
+for many communities the weights are stored in a small hash table (with open
+addressing and linear probing) of which the capacity is proportional to the
+degree of the node. Otherwise, the weights are stored in a dense vector
+indexed by community, which is faster as long as it is small enough to
+remain in the cache of the processor. In this way, the memory needed for
+large graphs scales with the degree of the nodes rather than with the number
+of communities, for each partition (or layer).
+****************************************************************************/
+class CommunityWeights
+{
+  public:
+    CommunityWeights() : _is_dense(true), _mask(0), _shift(0) {};
+
+    // Remove all weights, and prepare for the communities of at most
+    // nb_neighbours neighbours, out of n_communities communities.
+    void reset(size_t nb_neighbours, size_t n_communities);
+    void clear();
+
+    // Add weight w to community comm, and add the community to the
+    // neighbouring communities.
+    inline void add(size_t comm, double w)
+    {
+      double weight;
+      if (this->_is_dense)
+        weight = (this->_dense_weights[comm] += w);
+      else
+      {
+        size_t slot = this->slot(comm);
+        while (this->_keys[slot] != comm)
+        {
+          if (this->_keys[slot] == EMPTY)
+          {
+            this->_keys[slot] = comm;
+            this->_values[slot] = 0.0;
+            this->_used_slots.push_back(slot);
+            break;
+          }
+          slot = (slot + 1) & this->_mask;
+        }
+        weight = (this->_values[slot] += w);
+      }
+      // REMARK: Notice in the rare case of negative weights, being exactly equal
+      // for a certain community, that this community may then potentially be added multiple
+      // times to the _cached_neighs. However, I don' believe this causes any further issue,
+      // so that's why I leave this here as is.
+      if (weight != 0)
+        this->_communities.push_back(comm);
+    };
+
+    inline double get(size_t comm) const
+    {
+      if (this->_is_dense)
+        return comm < this->_dense_weights.size() ? this->_dense_weights[comm] : 0.0;
+
+      for (size_t slot = this->slot(comm); ; slot = (slot + 1) & this->_mask)
+      {
+        size_t key = this->_keys[slot];
+        if (key == comm)
+          return this->_values[slot];
+        if (key == EMPTY)
+          return 0.0;
+      }
+    };
+
+    inline vector<index_t> const& communities() const { return this->_communities; };
+
+  private:
+    static const index_t EMPTY = (index_t)(-1);
+    // Maximum number of communities for which a dense vector is always used.
+    static const size_t MAX_DENSE_COMMUNITIES = 1 << 17;
+
+    inline size_t slot(size_t comm) const
+    {
+      return (size_t) ((comm*0x9e3779b97f4a7c15ULL) >> this->_shift);
+    };
+
+    vector<index_t> _communities;   // Neighbouring communities
+
+    bool _is_dense;
+    vector<double> _dense_weights;  // Weight of each community (if dense)
+    vector<index_t> _keys;          // Community in each slot (if not dense)
+    vector<double> _values;         // Weight in each slot (if not dense)
+    vector<size_t> _used_slots;     // Slots in use (if not dense)
+    size_t _mask;
+    size_t _shift;
+};
+
 /****************************************************************************
 Contains a partition of graph.
 
@@ -54,13 +146,14 @@ class MutableVertexPartition
     virtual ~MutableVertexPartition();
 
     inline size_t membership(size_t v) { return this->_membership[v]; };
-    inline vector<size_t> const& membership() const { return this->_membership; };
+    inline vector<index_t> const& membership() const { return this->_membership; };
 
     double csize(size_t comm);
     size_t cnodes(size_t comm);
     vector<size_t> get_community(size_t comm);
     vector< vector<size_t> > get_communities();
     size_t n_communities();
+    inline size_t n_nonempty_communities() { return this->_n_communities - this->_empty_communities.size(); };
 
     void move_node(size_t v,size_t new_comm);
     virtual double diff_move(size_t v, size_t new_comm)
@@ -72,7 +165,21 @@ class MutableVertexPartition
       throw Exception("Function not implemented. This should be implented in a derived class, since the base class does not implement a specific method.");
     };
 
+    // Add weight*diff_move(v, comms[idx]) to improvs[idx] for all candidate
+    // communities. Derived classes can override this to calculate the terms
+    // that only depend on v (and its current community) once, and the
+    // differences for all communities in a single loop.
+    virtual void diff_moves(size_t v, vector<size_t> const& comms, double weight, vector<double>& improvs);
+
+    // Whether diff_move(v, comm) only depends on the communities of the
+    // neighbours of v and on the administration of the community of v and of
+    // comm, so that it does not change by moving other nodes between other
+    // communities. Derived classes that also depend on sums over all
+    // communities should return false.
+    virtual bool has_local_diff_move() { return true; };
+
     inline Graph* get_graph() { return this->graph; };
+    void copy_graph();
 
     void renumber_communities();
     void renumber_communities(vector<size_t> const& fixed_nodes, vector<size_t> const& fixed_membership);
@@ -88,6 +195,11 @@ class MutableVertexPartition
     void from_coarse_partition(vector<size_t> const& coarse_partition_membership, vector<size_t> const& coarse_node);
 
     void from_partition(MutableVertexPartition* partition);
+    void update_from_partition(MutableVertexPartition* partition, vector<size_t> const& nodes, vector<size_t> const& comms);
+
+    vector<size_t> update_edges(vector<size_t> const& reweighted_edges, vector<double> const& new_weights,
+                                vector<size_t> const& removed_edges,
+                                vector<size_t> const& added_edges, vector<double> const& added_weights);
 
     // Ariel notes - if nr. communities decreases, update : else 0 - why else 0?
     // Ariel TODO whats the diff. betwn InCom, FromComm, ToComm?
@@ -98,19 +210,23 @@ class MutableVertexPartition
     inline double total_weight_in_all_comms()         { return this->_total_weight_in_all_comms; };
     inline size_t total_possible_edges_in_all_comms() { return this->_total_possible_edges_in_all_comms; };
 
+    // Running sums over all communities, kept up to date by move_node, so
+    // that quality functions that are linear in these sums take O(1) time.
+    inline double total_weight_from_to_all_comms()    { return this->_total_weight_from_to_all_comms; };
+    inline double total_csize_squared_all_comms()     { return this->_total_csize_squared_all_comms; };
+    double possible_edges_in_all_comms();
+
+    // Number of changes to the administration, which can be used to check
+    // whether a value derived from it (e.g. the quality) is still valid.
+    inline size_t admin_version() const { return this->_admin_version; };
+
     // out-degree of node v to community comm
     inline double weight_to_comm(size_t v, size_t comm)
     {
       if (this->_current_node_cache_community_to != v)
-      {
-        this->cache_neigh_communities(v, IGRAPH_OUT);
-        this->_current_node_cache_community_to = v;
-      }
+        this->cache_neigh_communities(v, false);
 
-      if (comm < this->_cached_weight_to_community.size())
-        return this->_cached_weight_to_community[comm];
-      else
-        return 0.0;
+      return this->_cached_weight_to_community.get(comm);
     }
 
     inline double weight_from_comm(size_t v, size_t comm)
@@ -119,20 +235,14 @@ class MutableVertexPartition
         return weight_to_comm(v, comm);
 
       if (this->_current_node_cache_community_from != v)
-      {
-        this->cache_neigh_communities(v, IGRAPH_IN);
-        this->_current_node_cache_community_from = v;
-      }
+        this->cache_neigh_communities(v, false);
 
-      if (comm < this->_cached_weight_from_community.size())
-        return this->_cached_weight_from_community[comm];
-      else
-        return 0.0;
+      return this->_cached_weight_from_community.get(comm);
     }
 
-    vector<size_t> const& get_neigh_comms(size_t v, igraph_neimode_t);
+    vector<index_t> const& get_neigh_comms(size_t v, igraph_neimode_t);
     // Ariel - don't know what this is
-    vector<size_t> get_neigh_comms(size_t v, igraph_neimode_t mode, vector<size_t> const& constrained_membership);
+    vector<size_t> get_neigh_comms(size_t v, igraph_neimode_t mode, vector<index_t> const& constrained_membership);
 
     // By delegating the responsibility for deleting the graph to the partition,
     // we no longer have to worry about deleting this graph.
@@ -142,7 +252,7 @@ class MutableVertexPartition
 
     void init_admin();
 
-    vector<size_t> _membership; // Membership vector, i.e. \sigma_i = c means that node i is in community c
+    vector<index_t> _membership; // Membership vector, i.e. \sigma_i = c means that node i is in community c
 
     Graph* graph;
 
@@ -150,10 +260,26 @@ class MutableVertexPartition
     vector<double> _csize;
 
     // Number of nodes in community
-    vector< size_t > _cnodes;
+    vector<index_t> _cnodes;
 
     double weight_vertex_tofrom_comm(size_t v, size_t comm, igraph_neimode_t mode);
 
+    // Gather the weights of v to and from each of the communities (see
+    // weight_to_comm and weight_from_comm), the total weights to and from
+    // each of the communities, the internal weight of each of the
+    // communities, or the size of each of the communities, for diff_moves.
+    void gather_weights_tofrom_comms(size_t v, vector<size_t> const& comms);
+    void gather_total_weights_tofrom_comms(vector<size_t> const& comms);
+    void gather_total_weights_in_comms(vector<size_t> const& comms);
+    void gather_csizes(vector<size_t> const& comms);
+    vector<double> _comms_weight_to;
+    vector<double> _comms_weight_from;
+    vector<double> _comms_total_weight_to;
+    vector<double> _comms_total_weight_from;
+    vector<double> _comms_total_weight_in;
+    vector<double> _comms_csize;
+    vector<double> _comms_diff;
+
     void set_default_attrs();
 
   private:
@@ -167,21 +293,32 @@ class MutableVertexPartition
     // Keep track of the total internal weight
     double _total_weight_in_all_comms;
     size_t _total_possible_edges_in_all_comms;
+    // Keep track of the sum over all communities of the total weight from
+    // the community times the total weight to the community
+    double _total_weight_from_to_all_comms;
+    // Keep track of the sum of the squared community sizes
+    double _total_csize_squared_all_comms;
+    size_t _admin_version;
     size_t _n_communities;
 
-    vector<size_t> _empty_communities;
+    vector<index_t> _empty_communities;
 
-    void cache_neigh_communities(size_t v, igraph_neimode_t mode);
+    void cache_neigh_communities(size_t v, bool include_all);
+    void invalidate_cache();
+    void add_edge_weight(size_t v, size_t u, double w);
+    void init_community_sums();
 
-    size_t _current_node_cache_community_from; vector<double> _cached_weight_from_community; vector<size_t> _cached_neigh_comms_from;
-    size_t _current_node_cache_community_to;   vector<double> _cached_weight_to_community;   vector<size_t> _cached_neigh_comms_to;
-    size_t _current_node_cache_community_all;  vector<double> _cached_weight_all_community;  vector<size_t> _cached_neigh_comms_all;
+    size_t _current_node_cache_community_from; CommunityWeights _cached_weight_from_community;
+    size_t _current_node_cache_community_to;   CommunityWeights _cached_weight_to_community;
+    size_t _current_node_cache_community_all;  CommunityWeights _cached_weight_all_community;
 
     void clean_mem();
     void init_graph_admin();
 
     void update_n_communities();
 
+    template <class T, class U> void set_from_coarse_partition(T const& coarse_partition_membership, U const& coarse_node);
+
 };
 
 #endif // MUTABLEVERTEXPARTITION_H
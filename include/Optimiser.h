@@ -5,6 +5,14 @@
 #include <set>
 #include <map>
 #include <cfloat>
+#include <mutex>
+#include <thread>
+#include <condition_variable>
+#include <exception>
+#include <atomic>
+#include <algorithm>
+#include <chrono>
+#include <functional>
 
 #include <iostream>
 using std::cerr;
@@ -21,6 +29,43 @@ this diff_move. If no further improvement is possible, the graph is
 aggregated (collapse_graph) and the method is reiterated on that graph.
 ****************************************************************************/
 
+/****************************************************************************
+Statistics of a single aggregation level of optimise_partition.
+
+The times are in seconds. The numbers of visited, requeued and moved nodes
+concern moving (or merging) nodes on the aggregate graph, not the refinement.
+****************************************************************************/
+
+struct OptimiserLevelStats
+{
+  double move_nodes_time;            // Time spent moving nodes
+  double refine_time;                // Time spent refining the partition
+  double collapse_graph_time;        // Time spent collapsing the graphs
+  double from_coarse_partition_time; // Time spent updating the partitions from the aggregate partitions
+  size_t nodes_visited;              // Number of nodes considered for moving
+  size_t nodes_requeued;             // Number of nodes added to the queue again after a neighbour moved
+  size_t nodes_moved;                // Number of moves made
+  size_t n_communities_before;       // Number of communities before moving nodes
+  size_t n_communities_after;        // Number of communities after moving nodes
+  size_t collapsed_vcount;           // Number of nodes of the collapsed graph
+  size_t collapsed_ecount;           // Number of edges of the collapsed graph
+  double improvement;                // Improvement of moving nodes
+};
+
+/****************************************************************************
+Progress of an optimisation, passed to the progress callback of the
+Optimiser.
+****************************************************************************/
+
+struct OptimiserProgress
+{
+  size_t level;          // Aggregation level of optimise_partition
+  size_t nodes_visited;  // Number of nodes considered for moving at this level
+  size_t queue_size;     // Number of nodes still to be considered at this level
+  size_t n_communities;  // Current number of (non-empty) communities at this level
+  double improvement;    // Improvement so far
+};
+
 class Optimiser
 {
   public:
@@ -38,14 +83,19 @@ class Optimiser
     double optimise_partition(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed);
     double optimise_partition(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, size_t max_comm_size);
 
+    // Optimise the partition independently for each seed and keep the best result.
+    size_t optimise_partition_ensemble(MutableVertexPartition* partition, vector<size_t> const& seeds, int n_iterations, vector<double>& qualities, vector<size_t>& memberships, bool keep_memberships);
+
     double move_nodes(MutableVertexPartition* partition);
     double move_nodes(MutableVertexPartition* partition, int consider_comms);
     double move_nodes(MutableVertexPartition* partition, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes);
     double move_nodes(MutableVertexPartition* partition, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes, size_t max_comm_size);
+    double move_nodes(MutableVertexPartition* partition, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes, size_t max_comm_size, vector<size_t> const& nodes);
     double move_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, bool renumber_fixed_nodes);
     double move_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community);
     double move_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community, bool renumber_fixed_nodes);
     double move_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community, bool renumber_fixed_nodes, size_t max_comm_size);
+    double move_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community, bool renumber_fixed_nodes, size_t max_comm_size, vector<size_t> const& nodes);
 
     double merge_nodes(MutableVertexPartition* partition);
     double merge_nodes(MutableVertexPartition* partition, int consider_comms);
@@ -80,6 +130,23 @@ class Optimiser
     int refine_routine; // What routine to use for optimisation
     int consider_empty_community; // Determine whether to consider moving nodes to an empty community
     size_t max_comm_size; // Constrain the maximal community size.
+    size_t n_threads; // Number of threads used for moving nodes and refining (0 uses all available cores).
+
+    std::mutex mutex; // Held while optimising, so that the rng is not shared between threads.
+
+    vector<OptimiserLevelStats> last_run_stats; // Statistics of each level of the last call to optimise_partition.
+
+    // Called periodically while moving nodes and between aggregation levels.
+    // If it returns true, the optimisation is stopped, leaving the partition
+    // in a consistent state. It may be called from multiple threads by
+    // optimise_partition_ensemble, but never simultaneously.
+    std::function<bool(OptimiserProgress const&)> progress_callback;
+    inline bool is_cancelled() const { return this->cancelled; };
+
+    // Stop optimising once the time limit (in seconds from now) has passed,
+    // in the same way as when the progress callback stops the optimisation.
+    // A negative time limit removes the limit.
+    void set_time_limit(double time_limit);
 
     static const int ALL_COMMS = 1;       // Consider all communities for improvement.
     static const int ALL_NEIGH_COMMS = 2; // Consider all neighbour communities for improvement.
@@ -94,6 +161,37 @@ class Optimiser
   private:
     void print_settings();
 
+    size_t get_n_threads();
+    vector< vector<size_t> > get_active_layers(vector<Graph*> const& graphs);
+    void diff_move_layers(vector<MutableVertexPartition*> const& partitions, vector<double> const& layer_weights, vector<size_t> const& layers, size_t v, vector<size_t> const& comms, vector<double>& improvs);
+    double move_nodes_parallel(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community, bool renumber_fixed_nodes, size_t max_comm_size, vector<size_t> const& nodes, size_t nb_threads);
+
+    double refine_partition_parallel(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, MutableVertexPartition* constrained_partition, size_t max_comm_size, size_t nb_threads);
+    double move_nodes_constrained_subset(vector<MutableVertexPartition*> const& partitions, vector<double> const& layer_weights, int consider_comms, MutableVertexPartition* constrained_partition, vector< vector<size_t> > const& constrained_comms, vector< vector<size_t> > const& active_layers, vector<size_t> const& nodes, vector<bool>& is_node_stable, vector<bool>& comm_added, size_t max_comm_size, igraph_rng_t* rng);
+    double merge_nodes_constrained_subset(vector<MutableVertexPartition*> const& partitions, vector<double> const& layer_weights, int consider_comms, MutableVertexPartition* constrained_partition, vector< vector<size_t> > const& constrained_comms, vector< vector<size_t> > const& active_layers, vector<size_t> const& nodes, vector<bool>& comm_added, size_t max_comm_size, igraph_rng_t* rng);
+
+    bool report_progress(size_t nodes_visited, size_t queue_size, size_t n_communities, double improvement);
+    // Whether the time limit has passed, which only reads the deadline, so
+    // that it can also be checked from multiple threads.
+    inline bool deadline_passed() const
+    {
+      return this->has_deadline && std::chrono::steady_clock::now() >= this->deadline;
+    };
+    bool cancelled;            // Whether the progress callback stopped the last optimisation
+    size_t progress_level;     // Aggregation level reported to the progress callback
+    double progress_improvement; // Improvement of previous levels reported to the progress callback
+    bool has_deadline;         // Whether a time limit is set
+    std::chrono::steady_clock::time_point deadline;
+
+    // Number of nodes visited, requeued and moved by move_nodes and merge_nodes
+    size_t nb_nodes_visited;
+    size_t nb_nodes_requeued;
+    size_t nb_nodes_moved;
+
+    static const size_t PARALLEL_BATCH_SIZE = 1024; // Number of nodes considered simultaneously when moving nodes in parallel.
+    static const size_t PROGRESS_INTERVAL = 16384;  // Number of nodes considered between calls to the progress callback.
+    static const size_t DEADLINE_INTERVAL = 256;    // Number of nodes considered between checks of the time limit.
+
     igraph_rng_t rng;
 };
 
@@ -14,9 +14,14 @@ class SignificanceVertexPartition : public MutableVertexPartition
     virtual SignificanceVertexPartition* create(Graph* graph, vector<size_t> const& membership);
 
     virtual double diff_move(size_t v, size_t new_comm);
+    virtual void diff_moves(size_t v, vector<size_t> const& comms, double weight, vector<double>& improvs);
     virtual double quality();
   protected:
   private:
+    // The quality is not linear in sums over the communities, so it is
+    // cached until the administration changes (see admin_version).
+    double _quality;
+    size_t _quality_version;
 };
 
 #endif // SIGNIFICANCEVERTEXPARTITION_H
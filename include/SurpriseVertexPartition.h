@@ -17,6 +17,8 @@ class SurpriseVertexPartition: public MutableVertexPartition
     virtual SurpriseVertexPartition* create(Graph* graph, vector<size_t> const& membership);
 
     virtual double diff_move(size_t v, size_t new_comm);
+    virtual void diff_moves(size_t v, vector<size_t> const& comms, double weight, vector<double>& improvs);
+    virtual bool has_local_diff_move() { return false; };
     virtual double quality();
   protected:
   private:
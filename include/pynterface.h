@@ -14,6 +14,7 @@
 
 #include "python_partition_interface.h"
 #include "python_optimiser_interface.h"
+#include "python_stream_interface.h"
 
 #ifdef __cplusplus
 extern "C"
@@ -30,6 +31,10 @@ extern "C"
       {"_new_CPMVertexPartition",                                   (PyCFunction)_new_CPMVertexPartition,                                   METH_VARARGS | METH_KEYWORDS, ""},
       {"_new_RBERVertexPartition",                                  (PyCFunction)_new_RBERVertexPartition,                                  METH_VARARGS | METH_KEYWORDS, ""},
       {"_new_RBConfigurationVertexPartition",                       (PyCFunction)_new_RBConfigurationVertexPartition,                       METH_VARARGS | METH_KEYWORDS, ""},
+      {"_save_graph",                                               (PyCFunction)_save_graph,                                               METH_VARARGS | METH_KEYWORDS, ""},
+      {"_new_SharedGraph",                                          (PyCFunction)_new_SharedGraph,                                          METH_VARARGS | METH_KEYWORDS, ""},
+      {"_SharedGraph_get_info",                                     (PyCFunction)_SharedGraph_get_info,                                     METH_VARARGS | METH_KEYWORDS, ""},
+      {"_SharedGraph_get_py_igraph",                                (PyCFunction)_SharedGraph_get_py_igraph,                                METH_VARARGS | METH_KEYWORDS, ""},
 
       {"_MutableVertexPartition_diff_move",                         (PyCFunction)_MutableVertexPartition_diff_move,                         METH_VARARGS | METH_KEYWORDS, ""},
       {"_MutableVertexPartition_move_node",                         (PyCFunction)_MutableVertexPartition_move_node,                         METH_VARARGS | METH_KEYWORDS, ""},
@@ -48,14 +53,26 @@ extern "C"
       {"_MutableVertexPartition_weight_from_comm",                  (PyCFunction)_MutableVertexPartition_weight_from_comm,                  METH_VARARGS | METH_KEYWORDS, ""},
       {"_MutableVertexPartition_get_membership",                    (PyCFunction)_MutableVertexPartition_get_membership,                    METH_VARARGS | METH_KEYWORDS, ""},
       {"_MutableVertexPartition_set_membership",                    (PyCFunction)_MutableVertexPartition_set_membership,                    METH_VARARGS | METH_KEYWORDS, ""},
+      {"_MutableVertexPartition_get_membership_buffer",             (PyCFunction)_MutableVertexPartition_get_membership_buffer,             METH_VARARGS | METH_KEYWORDS, ""},
+      {"_MutableVertexPartition_get_nb_clusters",                   (PyCFunction)_MutableVertexPartition_get_nb_clusters,                   METH_VARARGS | METH_KEYWORDS, ""},
+      {"_MutableVertexPartition_update_edges",                      (PyCFunction)_MutableVertexPartition_update_edges,                      METH_VARARGS | METH_KEYWORDS, ""},
       {"_ResolutionParameterVertexPartition_get_resolution",        (PyCFunction)_ResolutionParameterVertexPartition_get_resolution,        METH_VARARGS | METH_KEYWORDS, ""},
       {"_ResolutionParameterVertexPartition_set_resolution",        (PyCFunction)_ResolutionParameterVertexPartition_set_resolution,        METH_VARARGS | METH_KEYWORDS, ""},
       {"_ResolutionParameterVertexPartition_quality",               (PyCFunction)_ResolutionParameterVertexPartition_quality,               METH_VARARGS | METH_KEYWORDS, ""},
 
+      {"_new_GraphStream",                      (PyCFunction)_new_GraphStream,                      METH_VARARGS | METH_KEYWORDS, ""},
+      {"_GraphStream_cluster_edges",            (PyCFunction)_GraphStream_cluster_edges,            METH_VARARGS | METH_KEYWORDS, ""},
+      {"_GraphStream_aggregate_edges",          (PyCFunction)_GraphStream_aggregate_edges,          METH_VARARGS | METH_KEYWORDS, ""},
+      {"_GraphStream_aggregate_partition",      (PyCFunction)_GraphStream_aggregate_partition,      METH_VARARGS | METH_KEYWORDS, ""},
+      {"_GraphStream_merge_communities",        (PyCFunction)_GraphStream_merge_communities,        METH_VARARGS | METH_KEYWORDS, ""},
+      {"_GraphStream_get_membership_buffer",    (PyCFunction)_GraphStream_get_membership_buffer,    METH_VARARGS | METH_KEYWORDS, ""},
+      {"_GraphStream_get_info",                 (PyCFunction)_GraphStream_get_info,                 METH_VARARGS | METH_KEYWORDS, ""},
+      {"_GraphStream_has_self_loops",           (PyCFunction)_GraphStream_has_self_loops,           METH_VARARGS | METH_KEYWORDS, ""},
 
       {"_new_Optimiser",                            (PyCFunction)_new_Optimiser,                            METH_NOARGS,                  ""},
       {"_Optimiser_optimise_partition",             (PyCFunction)_Optimiser_optimise_partition,             METH_VARARGS | METH_KEYWORDS, ""},
       {"_Optimiser_optimise_partition_multiplex",   (PyCFunction)_Optimiser_optimise_partition_multiplex,   METH_VARARGS | METH_KEYWORDS, ""},
+      {"_Optimiser_optimise_partition_ensemble",    (PyCFunction)_Optimiser_optimise_partition_ensemble,    METH_VARARGS | METH_KEYWORDS, ""},
       {"_Optimiser_move_nodes",                     (PyCFunction)_Optimiser_move_nodes,                     METH_VARARGS | METH_KEYWORDS, ""},
       {"_Optimiser_move_nodes_constrained",         (PyCFunction)_Optimiser_move_nodes_constrained,         METH_VARARGS | METH_KEYWORDS, ""},
       {"_Optimiser_merge_nodes",                    (PyCFunction)_Optimiser_merge_nodes,                    METH_VARARGS | METH_KEYWORDS, ""},
@@ -68,6 +85,7 @@ extern "C"
       {"_Optimiser_set_consider_empty_community",   (PyCFunction)_Optimiser_set_consider_empty_community,   METH_VARARGS | METH_KEYWORDS, ""},
       {"_Optimiser_set_refine_partition",           (PyCFunction)_Optimiser_set_refine_partition,           METH_VARARGS | METH_KEYWORDS, ""},
       {"_Optimiser_set_max_comm_size",              (PyCFunction)_Optimiser_set_max_comm_size,              METH_VARARGS | METH_KEYWORDS, ""},
+      {"_Optimiser_set_n_threads",                  (PyCFunction)_Optimiser_set_n_threads,                  METH_VARARGS | METH_KEYWORDS, ""},
 
       {"_Optimiser_get_consider_comms",             (PyCFunction)_Optimiser_get_consider_comms,             METH_VARARGS | METH_KEYWORDS, ""},
       {"_Optimiser_get_refine_consider_comms",      (PyCFunction)_Optimiser_get_refine_consider_comms,      METH_VARARGS | METH_KEYWORDS, ""},
@@ -76,6 +94,7 @@ extern "C"
       {"_Optimiser_get_consider_empty_community",   (PyCFunction)_Optimiser_get_consider_empty_community,   METH_VARARGS | METH_KEYWORDS, ""},
       {"_Optimiser_get_refine_partition",           (PyCFunction)_Optimiser_get_refine_partition,           METH_VARARGS | METH_KEYWORDS, ""},
       {"_Optimiser_get_max_comm_size",              (PyCFunction)_Optimiser_get_max_comm_size,              METH_VARARGS | METH_KEYWORDS, ""},
+      {"_Optimiser_get_n_threads",                  (PyCFunction)_Optimiser_get_n_threads,                  METH_VARARGS | METH_KEYWORDS, ""},
 
       {"_Optimiser_set_rng_seed",                   (PyCFunction)_Optimiser_set_rng_seed,                   METH_VARARGS | METH_KEYWORDS, ""},
 
@@ -125,6 +144,9 @@ extern "C"
       PyModule_AddIntConstant(module, "MOVE_NODES", Optimiser::MOVE_NODES);
       PyModule_AddIntConstant(module, "MERGE_NODES", Optimiser::MERGE_NODES);
 
+      PyModule_AddIntConstant(module, "INDEX_SIZE", sizeof(index_t));
+      PyModule_AddIntConstant(module, "WEIGHT_SIZE", sizeof(weight_t));
+
       if (module == NULL)
           INITERROR;
       struct module_state *st = GETSTATE(module);
@@ -13,6 +13,11 @@
 #include "Optimiser.h"
 #include "python_partition_interface.h"
 
+#include <string>
+#include <mutex>
+
+using std::string;
+
 #ifdef DEBUG
 #include <iostream>
   using std::cerr;
@@ -30,6 +35,7 @@ extern "C"
   PyObject* _new_Optimiser(PyObject *self, PyObject *args);
   PyObject* _Optimiser_optimise_partition(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _Optimiser_optimise_partition_multiplex(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _Optimiser_optimise_partition_ensemble(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _Optimiser_move_nodes(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _Optimiser_move_nodes_constrained(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _Optimiser_merge_nodes(PyObject *self, PyObject *args, PyObject *keywds);
@@ -42,6 +48,7 @@ extern "C"
   PyObject* _Optimiser_set_consider_empty_community(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _Optimiser_set_refine_partition(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _Optimiser_set_max_comm_size(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _Optimiser_set_n_threads(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _Optimiser_set_rng_seed(PyObject *self, PyObject *args, PyObject *keywds);
 
   PyObject* _Optimiser_get_consider_comms(PyObject *self, PyObject *args, PyObject *keywds);
@@ -51,6 +58,7 @@ extern "C"
   PyObject* _Optimiser_get_consider_empty_community(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _Optimiser_get_refine_partition(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _Optimiser_get_max_comm_size(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _Optimiser_get_n_threads(PyObject *self, PyObject *args, PyObject *keywds);
 
 #ifdef __cplusplus
 }
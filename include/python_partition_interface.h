@@ -13,6 +13,8 @@
 #include "Optimiser.h"
 
 #include <sstream>
+#include <cstring>
+#include <cstdint>
 
 #ifdef DEBUG
 #include <iostream>
@@ -20,20 +22,61 @@
   using std::endl;
 #endif
 
+// A graph that is shared by multiple partitions, created by _new_SharedGraph.
+// The graph itself is immutable, but whether self loops are corrected for
+// depends on the type of partition, so a copy of the graph is kept for each
+// setting, which is only created when a partition needs it.
+class SharedGraph
+{
+  public:
+    SharedGraph(Graph* graph);
+    ~SharedGraph();
+
+    Graph* get_graph(int correct_self_loops);
+    Graph* get_graph() { return this->_graphs[0]; };
+    bool has_negative_weights() { return this->_has_negative_weights; };
+
+  private:
+    Graph* _graphs[2];
+    bool _has_negative_weights;
+};
+
 MutableVertexPartition* create_partition(Graph* graph, char* method, vector<size_t>* initial_membership, double resolution_parameter);
 MutableVertexPartition* create_partition_from_py(PyObject* py_obj_graph, char* method, PyObject* py_initial_membership, PyObject* py_weights, PyObject* py_node_sizes, double resolution_parameter);
 
 Graph* create_graph_from_py(PyObject* py_obj_graph, PyObject* py_node_sizes);
 Graph* create_graph_from_py(PyObject* py_obj_graph, PyObject* py_node_sizes, PyObject* py_weights);
-Graph* create_graph_from_py(PyObject* py_obj_graph, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, bool correct_self_loops);
+Graph* create_graph_from_py(PyObject* py_obj_graph, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops);
+Graph* create_graph_from_igraph(igraph_t* py_graph, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops);
+Graph* load_graph_from_py(PyObject* py_filename, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops);
+Graph* get_shared_graph_from_py(PyObject* py_shared_graph, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops);
+void check_weights(vector<double> const& weights, bool check_positive_weight);
+Graph* create_graph_from_edges(PyObject* py_edge_list, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops);
+void read_node_sizes_and_weights(PyObject* py_node_sizes, PyObject* py_weights, size_t n, size_t m, bool check_positive_weight,
+                                 vector<double>& node_sizes, vector<double>& weights);
+vector<size_t> create_edge_vector(PyObject* py_edges, size_t n);
 
 vector<size_t> create_size_t_vector(PyObject* py_list);
+vector<size_t> create_index_vector(PyObject* py_list, size_t n, const char* error_message);
+vector<double> create_double_vector(PyObject* py_list, const char* error_message);
+
+bool read_buffer(PyObject* py_obj, vector<double>& result);
+bool read_buffer(PyObject* py_obj, vector<size_t>& result);
+bool read_buffer(PyObject* py_obj, vector<size_t>& result, size_t ncols);
 
 PyObject* capsule_MutableVertexPartition(MutableVertexPartition* partition);
+PyObject* capsule_MutableVertexPartition(MutableVertexPartition* partition, PyObject* py_obj_graph);
 MutableVertexPartition* decapsule_MutableVertexPartition(PyObject* py_partition);
 
 void del_MutableVertexPartition(PyObject *self);
 
+PyObject* capsule_SharedGraph(SharedGraph* shared_graph);
+SharedGraph* decapsule_SharedGraph(PyObject* py_shared_graph);
+bool is_shared_graph(PyObject* py_obj_graph);
+void del_SharedGraph(PyObject *self);
+
+PyObject* get_py_igraph(Graph* graph);
+
 #ifdef __cplusplus
 extern "C"
 {
@@ -44,6 +87,10 @@ extern "C"
   PyObject* _new_CPMVertexPartition(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _new_RBERVertexPartition(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _new_RBConfigurationVertexPartition(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _save_graph(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _new_SharedGraph(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _SharedGraph_get_info(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _SharedGraph_get_py_igraph(PyObject *self, PyObject *args, PyObject *keywds);
 
   PyObject* _MutableVertexPartition_diff_move(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _MutableVertexPartition_move_node(PyObject *self, PyObject *args, PyObject *keywds);
@@ -66,6 +113,9 @@ extern "C"
 
   PyObject* _MutableVertexPartition_get_membership(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _MutableVertexPartition_set_membership(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _MutableVertexPartition_get_membership_buffer(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _MutableVertexPartition_update_edges(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _MutableVertexPartition_get_nb_clusters(PyObject *self, PyObject *args, PyObject *keywds);
 
   PyObject* _ResolutionParameterVertexPartition_get_resolution(PyObject *self, PyObject *args, PyObject *keywds);
   PyObject* _ResolutionParameterVertexPartition_set_resolution(PyObject *self, PyObject *args, PyObject *keywds);
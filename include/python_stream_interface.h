@@ -0,0 +1,40 @@
+#ifndef PYNTERFACE_STREAM_H_INCLUDED
+#define PYNTERFACE_STREAM_H_INCLUDED
+
+#include <Python.h>
+#include <igraph.h>
+#include "GraphHelper.h"
+#include "GraphStream.h"
+#include "MutableVertexPartition.h"
+#include "python_partition_interface.h"
+
+#include <string>
+
+using std::string;
+
+#ifdef DEBUG
+#include <iostream>
+  using std::cerr;
+  using std::endl;
+#endif
+
+PyObject* capsule_GraphStream(GraphStream* stream);
+GraphStream* decapsule_GraphStream(PyObject* py_stream);
+void del_GraphStream(PyObject* py_stream);
+
+#ifdef __cplusplus
+extern "C"
+{
+#endif
+  PyObject* _new_GraphStream(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _GraphStream_cluster_edges(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _GraphStream_aggregate_edges(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _GraphStream_aggregate_partition(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _GraphStream_merge_communities(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _GraphStream_get_membership_buffer(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _GraphStream_get_info(PyObject *self, PyObject *args, PyObject *keywds);
+  PyObject* _GraphStream_has_self_loops(PyObject *self, PyObject *args, PyObject *keywds);
+#ifdef __cplusplus
+}
+#endif
+#endif // PYNTERFACE_STREAM_H_INCLUDED
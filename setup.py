@@ -327,6 +327,8 @@ class BuildConfiguration:
         self.extra_link_args = []
         self.define_macros = []
         self.extra_objects = []
+        self.compact_indices = False
+        self.compact_weights = False
         self.static_extension = False
         self.external = False
         self.use_pkgconfig = False
@@ -716,6 +718,19 @@ class BuildConfiguration:
             elif option == "--use-pkg-config":
                 opts_to_remove.append(idx)
                 self.use_pkgconfig = True
+            elif option == "--compact-indices":
+                opts_to_remove.append(idx)
+                self.compact_indices = True
+            elif option == "--compact-weights":
+                opts_to_remove.append(idx)
+                self.compact_weights = True
+
+        # Store indices as 32 bit integers and/or weights as single precision
+        # floats, reducing the memory usage of graphs and partitions.
+        for env_name, attr in [("LEIDENALG_COMPACT_INDICES", "compact_indices"),
+                               ("LEIDENALG_COMPACT_WEIGHTS", "compact_weights")]:
+            if env_name in os.environ:
+                setattr(self, attr, os.environ[env_name].lower() in ["true", "1", "on"])
 
         for idx in reversed(opts_to_remove):
             sys.argv[idx : (idx + 1)] = []
@@ -833,6 +848,10 @@ buildcfg.process_args_from_command_line()
 macros = []
 if should_build_abi3_wheel:
     macros.append(("Py_LIMITED_API", "0x03090000"))
+if buildcfg.compact_indices:
+    macros.append(("LEIDENALG_COMPACT_INDICES", "1"))
+if buildcfg.compact_weights:
+    macros.append(("LEIDENALG_COMPACT_WEIGHTS", "1"))
 leiden_ext = Extension('leidenalg._c_leiden',
                     sources = glob.glob(os.path.join('src', 'leidenalg', '*.cpp')),
                     py_limited_api=should_build_abi3_wheel,
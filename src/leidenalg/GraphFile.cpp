@@ -0,0 +1,310 @@
+#include "GraphHelper.h"
+
+#include <fstream>
+#include <cstring>
+
+#ifdef _WIN32
+  #include <windows.h>
+#else
+  #include <sys/mman.h>
+  #include <sys/stat.h>
+  #include <fcntl.h>
+  #include <unistd.h>
+#endif
+
+/****************************************************************************
+  Map a file in memory, read-only. The pages of the file are only read from
+  disk when they are accessed, and are shared with other processes that map
+  the same file.
+****************************************************************************/
+#ifdef _WIN32
+MappedFile::MappedFile(const char* filename)
+{
+  this->_data = NULL;
+  this->_size = 0;
+  this->_mapping = NULL;
+  this->_file = CreateFileA(filename, GENERIC_READ, FILE_SHARE_READ, NULL,
+                            OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, NULL);
+  if (this->_file == INVALID_HANDLE_VALUE)
+    throw Exception("Could not open graph file.");
+
+  LARGE_INTEGER size;
+  if (!GetFileSizeEx(this->_file, &size))
+  {
+    CloseHandle(this->_file);
+    throw Exception("Could not determine size of graph file.");
+  }
+  this->_size = (size_t) size.QuadPart;
+  if (this->_size == 0)
+    return;
+
+  this->_mapping = CreateFileMappingA(this->_file, NULL, PAGE_READONLY, 0, 0, NULL);
+  if (this->_mapping != NULL)
+    this->_data = (char const*) MapViewOfFile(this->_mapping, FILE_MAP_READ, 0, 0, 0);
+  if (this->_data == NULL)
+  {
+    if (this->_mapping != NULL)
+      CloseHandle(this->_mapping);
+    CloseHandle(this->_file);
+    throw Exception("Could not map graph file in memory.");
+  }
+}
+
+MappedFile::~MappedFile()
+{
+  if (this->_data != NULL)
+    UnmapViewOfFile(this->_data);
+  if (this->_mapping != NULL)
+    CloseHandle(this->_mapping);
+  CloseHandle(this->_file);
+}
+#else
+MappedFile::MappedFile(const char* filename)
+{
+  this->_data = NULL;
+  this->_size = 0;
+  int fd = open(filename, O_RDONLY);
+  if (fd < 0)
+    throw Exception("Could not open graph file.");
+
+  struct stat st;
+  if (fstat(fd, &st) != 0)
+  {
+    close(fd);
+    throw Exception("Could not determine size of graph file.");
+  }
+  this->_size = (size_t) st.st_size;
+  if (this->_size == 0)
+  {
+    close(fd);
+    return;
+  }
+
+  void* data = mmap(NULL, this->_size, PROT_READ, MAP_SHARED, fd, 0);
+  // The mapping remains valid after closing the file.
+  close(fd);
+  if (data == MAP_FAILED)
+    throw Exception("Could not map graph file in memory.");
+  this->_data = (char const*) data;
+}
+
+MappedFile::~MappedFile()
+{
+  if (this->_data != NULL)
+    munmap((void*) this->_data, this->_size);
+}
+#endif
+
+/****************************************************************************
+  The file format of a graph. The header is followed by all arrays of the
+  graph, including the strengths, degrees and adjacency, so that the graph
+  can be used without reading the whole file. Each array starts at a
+  multiple of GRAPH_FILE_ALIGNMENT bytes, given by offsets in the header,
+  and sizes gives the number of elements of each array. The arrays are
+  stored in the byte order of the machine that saved the graph, using
+  index_t and weight_t, which are checked when loading the graph.
+****************************************************************************/
+static const char GRAPH_FILE_MAGIC[8] = {'L', 'E', 'I', 'D', 'E', 'N', 'G', 'R'};
+static const uint64_t GRAPH_FILE_VERSION = 1;
+static const uint64_t GRAPH_FILE_BYTE_ORDER = 0x0102030405060708ULL;
+static const size_t GRAPH_FILE_ALIGNMENT = 64;
+
+enum GraphFileArray
+{
+  EDGE_FROM, EDGE_TO, EDGE_WEIGHTS,
+  NODE_SIZES, NODE_SELF_WEIGHTS,
+  STRENGTH_IN, STRENGTH_OUT,
+  DEGREE_IN, DEGREE_OUT, DEGREE_ALL,
+  ALL_OFFSETS, ALL_NEIGHBOURS, ALL_EDGES,
+  IN_OFFSETS, IN_NEIGHBOURS, IN_EDGES,
+  OUT_OFFSETS, OUT_NEIGHBOURS, OUT_EDGES,
+  NB_GRAPH_FILE_ARRAYS
+};
+
+struct GraphFileHeader
+{
+  char magic[8];
+  uint64_t version;
+  uint64_t byte_order;
+  uint64_t index_size;
+  uint64_t weight_size;
+  uint64_t n;
+  uint64_t m;
+  uint64_t is_directed;
+  uint64_t is_weighted;
+  uint64_t has_self_loops;
+  uint64_t has_negative_weights;
+  double total_weight;
+  double total_size;
+  uint64_t offsets[NB_GRAPH_FILE_ARRAYS];
+  uint64_t sizes[NB_GRAPH_FILE_ARRAYS];
+};
+
+/****************************************************************************
+  Save the graph, which can then be loaded by Graph::load.
+****************************************************************************/
+void Graph::save(const char* filename)
+{
+  vector< pair<void const*, size_t> > arrays(NB_GRAPH_FILE_ARRAYS);
+  vector<size_t> sizes(NB_GRAPH_FILE_ARRAYS);
+
+  #define GRAPH_FILE_ARRAY(idx, array) \
+    arrays[idx] = make_pair((void const*) (array).data(), (array).size()*sizeof(*(array).data()));\
+    sizes[idx] = (array).size();
+  GRAPH_FILE_ARRAY(EDGE_FROM, this->_edge_from);
+  GRAPH_FILE_ARRAY(EDGE_TO, this->_edge_to);
+  GRAPH_FILE_ARRAY(EDGE_WEIGHTS, this->_edge_weights);
+  GRAPH_FILE_ARRAY(NODE_SIZES, this->_node_sizes);
+  GRAPH_FILE_ARRAY(NODE_SELF_WEIGHTS, this->_node_self_weights);
+  GRAPH_FILE_ARRAY(STRENGTH_IN, this->_strength_in);
+  GRAPH_FILE_ARRAY(STRENGTH_OUT, this->_strength_out);
+  GRAPH_FILE_ARRAY(DEGREE_IN, this->_degree_in);
+  GRAPH_FILE_ARRAY(DEGREE_OUT, this->_degree_out);
+  GRAPH_FILE_ARRAY(DEGREE_ALL, this->_degree_all);
+  GRAPH_FILE_ARRAY(ALL_OFFSETS, this->_adjacency_all.offsets);
+  GRAPH_FILE_ARRAY(ALL_NEIGHBOURS, this->_adjacency_all.neighbours);
+  GRAPH_FILE_ARRAY(ALL_EDGES, this->_adjacency_all.edges);
+  GRAPH_FILE_ARRAY(IN_OFFSETS, this->_adjacency_in.offsets);
+  GRAPH_FILE_ARRAY(IN_NEIGHBOURS, this->_adjacency_in.neighbours);
+  GRAPH_FILE_ARRAY(IN_EDGES, this->_adjacency_in.edges);
+  GRAPH_FILE_ARRAY(OUT_OFFSETS, this->_adjacency_out.offsets);
+  GRAPH_FILE_ARRAY(OUT_NEIGHBOURS, this->_adjacency_out.neighbours);
+  GRAPH_FILE_ARRAY(OUT_EDGES, this->_adjacency_out.edges);
+  #undef GRAPH_FILE_ARRAY
+
+  GraphFileHeader header;
+  memset(&header, 0, sizeof(header));
+  memcpy(header.magic, GRAPH_FILE_MAGIC, sizeof(header.magic));
+  header.version = GRAPH_FILE_VERSION;
+  header.byte_order = GRAPH_FILE_BYTE_ORDER;
+  header.index_size = sizeof(index_t);
+  header.weight_size = sizeof(weight_t);
+  header.n = this->vcount();
+  header.m = this->ecount();
+  header.is_directed = this->is_directed();
+  header.is_weighted = this->is_weighted();
+  header.has_self_loops = this->has_self_loops();
+  header.has_negative_weights = this->has_negative_weights();
+  header.total_weight = this->total_weight();
+  header.total_size = this->total_size();
+
+  size_t pos = sizeof(header);
+  for (size_t i = 0; i < NB_GRAPH_FILE_ARRAYS; i++)
+  {
+    pos = (pos + GRAPH_FILE_ALIGNMENT - 1)/GRAPH_FILE_ALIGNMENT*GRAPH_FILE_ALIGNMENT;
+    header.offsets[i] = pos;
+    header.sizes[i] = sizes[i];
+    pos += arrays[i].second;
+  }
+
+  std::ofstream file(filename, std::ios::binary | std::ios::trunc);
+  if (!file)
+    throw Exception("Could not open graph file for writing.");
+
+  file.write((char const*) &header, sizeof(header));
+  const char padding[GRAPH_FILE_ALIGNMENT] = {0};
+  pos = sizeof(header);
+  for (size_t i = 0; i < NB_GRAPH_FILE_ARRAYS; i++)
+  {
+    file.write(padding, header.offsets[i] - pos);
+    file.write((char const*) arrays[i].first, arrays[i].second);
+    pos = header.offsets[i] + arrays[i].second;
+  }
+
+  file.close();
+  if (!file)
+    throw Exception("Could not write graph file.");
+}
+
+template <class T> static void map_array(Array<T>& array, std::shared_ptr<MappedFile> const& file,
+                                         GraphFileHeader const& header, size_t idx, size_t size)
+{
+  uint64_t offset = header.offsets[idx];
+  if (header.sizes[idx] != size)
+    throw Exception("Graph file has an array of incorrect size.");
+  if (offset % GRAPH_FILE_ALIGNMENT != 0 || offset > file->size() ||
+      size > (file->size() - offset)/sizeof(T))
+    throw Exception("Graph file is truncated or corrupt.");
+  array.map(file, offset, size);
+}
+
+/****************************************************************************
+  Load a graph saved by Graph::save, by mapping the file in memory. The graph
+  refers to the file, instead of copying it, until the graph is changed (see
+  update_edges). The correction of self loops is not stored in the file, and
+  is false by default, similar to the other constructors.
+****************************************************************************/
+Graph* Graph::load(const char* filename)
+{
+  std::shared_ptr<MappedFile> file = std::make_shared<MappedFile>(filename);
+
+  if (file->size() < sizeof(GraphFileHeader))
+    throw Exception("Graph file is truncated or corrupt.");
+
+  GraphFileHeader header;
+  memcpy(&header, file->data(), sizeof(header));
+  if (memcmp(header.magic, GRAPH_FILE_MAGIC, sizeof(header.magic)) != 0)
+    throw Exception("File is not a graph file.");
+  if (header.version != GRAPH_FILE_VERSION)
+    throw Exception("Graph file has an unsupported version.");
+  if (header.byte_order != GRAPH_FILE_BYTE_ORDER)
+    throw Exception("Graph file was saved on an incompatible platform.");
+  if (header.index_size != sizeof(index_t) || header.weight_size != sizeof(weight_t))
+    throw Exception("Graph file was saved with different index or weight types (see LEIDENALG_COMPACT_INDICES).");
+
+  size_t n = header.n;
+  size_t m = header.m;
+  bool directed = header.is_directed;
+
+  Graph* graph = new Graph();
+  try
+  {
+    graph->_vcount = n;
+    graph->_is_directed = directed;
+    graph->_is_weighted = header.is_weighted;
+    graph->_total_weight = header.total_weight;
+    graph->_total_size = header.total_size;
+
+    map_array(graph->_edge_from, file, header, EDGE_FROM, m);
+    map_array(graph->_edge_to, file, header, EDGE_TO, m);
+    map_array(graph->_edge_weights, file, header, EDGE_WEIGHTS, m);
+    map_array(graph->_node_sizes, file, header, NODE_SIZES, n);
+    map_array(graph->_node_self_weights, file, header, NODE_SELF_WEIGHTS, n);
+    map_array(graph->_strength_in, file, header, STRENGTH_IN, n);
+    map_array(graph->_degree_in, file, header, DEGREE_IN, n);
+    map_array(graph->_adjacency_all.offsets, file, header, ALL_OFFSETS, n + 1);
+    map_array(graph->_adjacency_all.neighbours, file, header, ALL_NEIGHBOURS, 2*m);
+    map_array(graph->_adjacency_all.edges, file, header, ALL_EDGES, 2*m);
+    if (directed)
+    {
+      map_array(graph->_strength_out, file, header, STRENGTH_OUT, n);
+      map_array(graph->_degree_out, file, header, DEGREE_OUT, n);
+      map_array(graph->_degree_all, file, header, DEGREE_ALL, n);
+      map_array(graph->_adjacency_in.offsets, file, header, IN_OFFSETS, n + 1);
+      map_array(graph->_adjacency_in.neighbours, file, header, IN_NEIGHBOURS, m);
+      map_array(graph->_adjacency_in.edges, file, header, IN_EDGES, m);
+      map_array(graph->_adjacency_out.offsets, file, header, OUT_OFFSETS, n + 1);
+      map_array(graph->_adjacency_out.neighbours, file, header, OUT_NEIGHBOURS, m);
+      map_array(graph->_adjacency_out.edges, file, header, OUT_EDGES, m);
+    }
+
+    if (graph->_adjacency_all.offsets[n] != 2*m ||
+        (directed && (graph->_adjacency_in.offsets[n] != m || graph->_adjacency_out.offsets[n] != m)))
+      throw Exception("Graph file is truncated or corrupt.");
+
+    // The flags are stored in the header, so that the edges do not have to be
+    // read from the file to determine them.
+    graph->_has_self_loops = header.has_self_loops;
+    graph->_has_negative_weights = header.has_negative_weights;
+
+    graph->_correct_self_loops = false;
+    graph->init_density();
+  }
+  catch (std::exception&)
+  {
+    delete graph;
+    throw;
+  }
+
+  return graph;
+}
@@ -72,24 +72,22 @@ Graph::Graph(igraph_t* graph,
   vector<double> const& node_sizes,
   vector<double> const& node_self_weights, int correct_self_loops)
 {
-  this->_graph = graph;
-  this->_remove_graph = false;
+  this->init_edges(graph);
 
   if (edge_weights.size() != this->ecount())
     throw Exception("Edge weights vector inconsistent length with the edge count of the graph.");
-  this->_edge_weights = edge_weights;
+  this->_edge_weights.assign(edge_weights);
   this->_is_weighted = true;
 
   if (node_sizes.size() != this->vcount())
     throw Exception("Node size vector inconsistent length with the vertex count of the graph.");
-  this->_node_sizes = node_sizes;
+  this->_node_sizes.assign(node_sizes);
 
   if (node_self_weights.size() != this->vcount())
     throw Exception("Node self weights vector inconsistent length with the vertex count of the graph.");
-  this->_node_self_weights = node_self_weights;
+  this->_node_self_weights.assign(node_self_weights);
 
   this->_correct_self_loops = correct_self_loops;
-  igraph_vector_int_init(&this->_temp_igraph_vector, this->vcount());
   this->init_admin();
 }
 
@@ -98,22 +96,20 @@ Graph::Graph(igraph_t* graph,
   vector<double> const& node_sizes,
   vector<double> const& node_self_weights)
 {
-  this->_graph = graph;
-  this->_remove_graph = false;
+  this->init_edges(graph);
 
   if (edge_weights.size() != this->ecount())
     throw Exception("Edge weights vector inconsistent length with the edge count of the graph.");
-  this->_edge_weights = edge_weights;
+  this->_edge_weights.assign(edge_weights);
   this->_is_weighted = true;
 
   if (node_sizes.size() != this->vcount())
     throw Exception("Node size vector inconsistent length with the vertex count of the graph.");
-  this->_node_sizes = node_sizes;
+  this->_node_sizes.assign(node_sizes);
 
   this->_correct_self_loops = this->has_self_loops();
 
-  this->_node_self_weights = node_self_weights;
-  igraph_vector_int_init(&this->_temp_igraph_vector, this->vcount());
+  this->_node_self_weights.assign(node_self_weights);
   this->init_admin();
 }
 
@@ -121,20 +117,18 @@ Graph::Graph(igraph_t* graph,
   vector<double> const& edge_weights,
   vector<double> const& node_sizes, int correct_self_loops)
 {
-  this->_graph = graph;
-  this->_remove_graph = false;
+  this->init_edges(graph);
 
   if (edge_weights.size() != this->ecount())
     throw Exception("Edge weights vector inconsistent length with the edge count of the graph.");
-  this->_edge_weights = edge_weights;
+  this->_edge_weights.assign(edge_weights);
   this->_is_weighted = true;
 
   if (node_sizes.size() != this->vcount())
     throw Exception("Node size vector inconsistent length with the vertex count of the graph.");
-  this->_node_sizes = node_sizes;
+  this->_node_sizes.assign(node_sizes);
 
   this->_correct_self_loops = correct_self_loops;
-  igraph_vector_int_init(&this->_temp_igraph_vector, this->vcount());
   this->init_admin();
   this->set_self_weights();
 }
@@ -143,20 +137,18 @@ Graph::Graph(igraph_t* graph,
   vector<double> const& edge_weights,
   vector<double> const& node_sizes)
 {
-  this->_graph = graph;
-  this->_remove_graph = false;
+  this->init_edges(graph);
   if (edge_weights.size() != this->ecount())
     throw Exception("Edge weights vector inconsistent length with the edge count of the graph.");
-  this->_edge_weights = edge_weights;
+  this->_edge_weights.assign(edge_weights);
   this->_is_weighted = true;
 
   if (node_sizes.size() != this->vcount())
     throw Exception("Node size vector inconsistent length with the vertex count of the graph.");
-  this->_node_sizes = node_sizes;
+  this->_node_sizes.assign(node_sizes);
 
   this->_correct_self_loops = this->has_self_loops();
 
-  igraph_vector_int_init(&this->_temp_igraph_vector, this->vcount());
   this->init_admin();
   this->set_self_weights();
 }
@@ -167,10 +159,9 @@ Graph* Graph::GraphFromEdgeWeights(igraph_t* graph, vector<double> const& edge_w
 
   if (edge_weights.size() != g->ecount())
     throw Exception("Edge weights vector inconsistent length with the edge count of the graph.");
-  g->_edge_weights = edge_weights;
+  g->_edge_weights.assign(edge_weights);
   g->_is_weighted = true;
   g->set_default_node_size();
-  igraph_vector_int_init(&g->_temp_igraph_vector, g->vcount());
   g->init_admin();
   g->set_self_weights();
 
@@ -183,10 +174,9 @@ Graph* Graph::GraphFromEdgeWeights(igraph_t* graph, vector<double> const& edge_w
 
   if (edge_weights.size() != g->ecount())
     throw Exception("Edge weights vector inconsistent length with the edge count of the graph.");
-  g->_edge_weights = edge_weights;
+  g->_edge_weights.assign(edge_weights);
   g->_is_weighted = true;
   g->set_default_node_size();
-  igraph_vector_int_init(&g->_temp_igraph_vector, g->vcount());
   g->init_admin();
   g->set_self_weights();
 
@@ -199,11 +189,10 @@ Graph* Graph::GraphFromNodeSizes(igraph_t* graph, vector<double> const& node_siz
 
   if (node_sizes.size() != g->vcount())
     throw Exception("Node size vector inconsistent length with the vertex count of the graph.");
-  g->_node_sizes = node_sizes;
+  g->_node_sizes.assign(node_sizes);
 
   g->set_default_edge_weight();
   g->_is_weighted = false;
-  igraph_vector_int_init(&g->_temp_igraph_vector, g->vcount());
   g->init_admin();
   g->set_self_weights();
   
@@ -214,19 +203,16 @@ Graph* Graph::GraphFromNodeSizes(igraph_t* graph, vector<double> const& node_siz
 {
   Graph* g = new Graph(graph);
 
-  g->_graph = graph;
-  g->_remove_graph = false;
   g->set_defaults();
   g->_is_weighted = false;
 
   if (node_sizes.size() != g->vcount())
     throw Exception("Node size vector inconsistent length with the vertex count of the graph.");
 
-  g->_node_sizes = node_sizes;
+  g->_node_sizes.assign(node_sizes);
 
   g->_correct_self_loops = g->has_self_loops();
 
-  igraph_vector_int_init(&g->_temp_igraph_vector, g->vcount());
   g->init_admin();
   g->set_self_weights();
 
@@ -235,73 +221,168 @@ Graph* Graph::GraphFromNodeSizes(igraph_t* graph, vector<double> const& node_siz
 
 Graph::Graph(igraph_t* graph, int correct_self_loops)
 {
-  this->_graph = graph;
-  this->_remove_graph = false;
+  this->init_edges(graph);
   this->_correct_self_loops = correct_self_loops;
   this->set_defaults();
   this->_is_weighted = false;
-  igraph_vector_int_init(&this->_temp_igraph_vector, this->vcount());
   this->init_admin();
   this->set_self_weights();
 }
 
 Graph::Graph(igraph_t* graph)
 {
-  this->_graph = graph;
-  this->_remove_graph = false;
+  this->init_edges(graph);
   this->set_defaults();
   this->_is_weighted = false;
 
   this->_correct_self_loops = this->has_self_loops();
 
-  igraph_vector_int_init(&this->_temp_igraph_vector, this->vcount());
+  this->init_admin();
+  this->set_self_weights();
+}
+
+Graph::Graph(size_t n, vector<size_t> const& edges, int directed,
+  vector<double> const& edge_weights,
+  vector<double> const& node_sizes, int correct_self_loops)
+{
+  this->init_edges(n, edges, directed);
+
+  // If no edge weights or node sizes are given, the defaults are used.
+  if (edge_weights.empty())
+    this->set_default_edge_weight();
+  else
+  {
+    if (edge_weights.size() != this->ecount())
+      throw Exception("Edge weights vector inconsistent length with the edge count of the graph.");
+    this->_edge_weights.assign(edge_weights);
+    this->_is_weighted = true;
+  }
+
+  if (node_sizes.empty())
+    this->set_default_node_size();
+  else
+  {
+    if (node_sizes.size() != this->vcount())
+      throw Exception("Node size vector inconsistent length with the vertex count of the graph.");
+    this->_node_sizes.assign(node_sizes);
+  }
+
+  this->_correct_self_loops = correct_self_loops;
   this->init_admin();
   this->set_self_weights();
 }
 
 Graph::Graph()
 {
-  this->_graph = new igraph_t();
-  this->_remove_graph = true;
+  this->init_edges(0, vector<size_t>(), false);
   this->set_defaults();
   this->_is_weighted = false;
   this->_correct_self_loops = false;
-  igraph_vector_int_init(&this->_temp_igraph_vector, this->vcount());
   this->init_admin();
   this->set_self_weights();
 }
 
 Graph::~Graph()
 {
-  if (this->_remove_graph)
+}
+
+/****************************************************************************
+  Copy the edges of an igraph_t, so that the graph does not depend on it
+  afterwards.
+****************************************************************************/
+void Graph::init_edges(igraph_t* graph)
+{
+  size_t m = igraph_ecount(graph);
+  this->_vcount = igraph_vcount(graph);
+  check_index_range(this->_vcount, m);
+  this->_is_directed = igraph_is_directed(graph);
+  vector<index_t> edge_from(m), edge_to(m);
+  for (size_t e = 0; e < m; e++)
   {
-    igraph_destroy(this->_graph);
-    delete this->_graph;
+    edge_from[e] = IGRAPH_FROM(graph, e);
+    edge_to[e] = IGRAPH_TO(graph, e);
   }
-  igraph_vector_int_destroy(&this->_temp_igraph_vector);
+  this->_edge_from = std::move(edge_from);
+  this->_edge_to = std::move(edge_to);
+  this->_has_self_loops = -1;
+  this->_has_negative_weights = -1;
 }
 
-int Graph::has_self_loops()
+/****************************************************************************
+  Check that the nodes and edges can be indexed using index_t. The adjacency
+  of all nodes refers to each edge twice, so that 2m should also fit.
+****************************************************************************/
+void Graph::check_index_range(size_t n, size_t m)
 {
-  igraph_bool_t has_self_loops;  
-  igraph_has_loop(this->_graph, &has_self_loops);
-  return has_self_loops;
+  size_t max_index = std::numeric_limits<index_t>::max();
+  if (n >= max_index || m > (max_index - 1)/2)
+    throw Exception("Graph is too large to be stored with compact indices.");
 }
 
-double Graph::possible_edges()
+/****************************************************************************
+  Set the edges from a list of consecutive pairs of nodes, like igraph_create.
+****************************************************************************/
+void Graph::init_edges(size_t n, vector<size_t> const& edges, int directed)
 {
-  return this->possible_edges(this->vcount());
+  if (edges.size() % 2 != 0)
+    throw Exception("Edge vector should contain pairs of nodes.");
+
+  size_t m = edges.size() / 2;
+  check_index_range(n, m);
+  this->_vcount = n;
+  this->_is_directed = directed;
+  vector<index_t> edge_from(m), edge_to(m);
+  for (size_t e = 0; e < m; e++)
+  {
+    size_t from = edges[2*e], to = edges[2*e + 1];
+    if (from >= n || to >= n)
+      throw Exception("Edge refers to a node that is not in the graph.");
+    // Like igraph, undirected edges are stored from the largest node.
+    if (!directed && from < to)
+      std::swap(from, to);
+    edge_from[e] = from;
+    edge_to[e] = to;
+  }
+  this->_edge_from = std::move(edge_from);
+  this->_edge_to = std::move(edge_to);
+  this->_has_self_loops = -1;
+  this->_has_negative_weights = -1;
 }
 
-double Graph::possible_edges(double n)
+int Graph::has_self_loops()
 {
-  double possible_edges = n*(n-1);
-  if (!this->is_directed())
-    possible_edges /= 2;
-  if (this->correct_self_loops())
-    possible_edges += n;
+  if (this->_has_self_loops < 0)
+  {
+    this->_has_self_loops = false;
+    size_t m = this->ecount();
+    for (size_t e = 0; e < m; e++)
+      if (this->_edge_from[e] == this->_edge_to[e])
+      {
+        this->_has_self_loops = true;
+        break;
+      }
+  }
+  return this->_has_self_loops;
+}
 
-  return possible_edges;
+int Graph::has_negative_weights()
+{
+  if (this->_has_negative_weights < 0)
+  {
+    this->_has_negative_weights = false;
+    for (double w : this->_edge_weights)
+      if (w < 0)
+      {
+        this->_has_negative_weights = true;
+        break;
+      }
+  }
+  return this->_has_negative_weights;
+}
+
+double Graph::possible_edges()
+{
+  return this->possible_edges(this->vcount());
 }
 
 void Graph::set_defaults()
@@ -315,8 +396,7 @@ void Graph::set_default_edge_weight()
   size_t m = this->ecount();
 
   // Set default edge weight of 1.0
-  this->_edge_weights.clear(); this->_edge_weights.resize(m);
-  fill(this->_edge_weights.begin(), this->_edge_weights.end(), 1.0);
+  this->_edge_weights = vector<weight_t>(m, 1.0);
   this->_is_weighted = false;
 }
 
@@ -325,8 +405,7 @@ void Graph::set_default_node_size()
   size_t n = this->vcount();
 
   // Set default node size of 1
-  this->_node_sizes.clear(); this->_node_sizes.resize(n);
-  fill(this->_node_sizes.begin(), this->_node_sizes.end(), 1);
+  this->_node_sizes = vector<weight_t>(n, 1.0);
 }
 
 void Graph::set_self_weights()
@@ -334,49 +413,35 @@ void Graph::set_self_weights()
   size_t n = this->vcount();
 
   // Set default self_weights of the total weight of any possible self-loops
-  this->_node_self_weights.clear(); this->_node_self_weights.resize(n);
-  for (size_t v = 0; v < n; v++)
+  vector<weight_t> node_self_weights(n, 0.0);
+  // There should be only one self loop, otherwise we use the last one (as
+  // igraph_get_eid does).
+  size_t m = this->ecount();
+  for (size_t e = 0; e < m; e++)
   {
-    #ifdef DEBUG
-      cerr << "\t" << "Size node " << v << ": " << this->node_size(v) << endl;
-    #endif
-    double self_weight = 0.0;
-    // There should be only one self loop
-    igraph_integer_t eid;
-    // Get edge id for self loop
-    igraph_get_eid(this->_graph, &eid, v, v, this->is_directed(), false);
-    if (eid >= 0)
-      self_weight = this->edge_weight(eid);
-
-    this->_node_self_weights[v] = self_weight;
-    #ifdef DEBUG
-      cerr << "\t" << "Self weight node " << v << ": " << self_weight << endl;
-    #endif
+    size_t v = this->_edge_from[e];
+    if (v == this->_edge_to[e])
+      node_self_weights[v] = this->edge_weight(e);
   }
+  this->_node_self_weights = std::move(node_self_weights);
+  #ifdef DEBUG
+    for (size_t v = 0; v < n; v++)
+      cerr << "\t" << "Self weight node " << v << ": " << this->_node_self_weights[v] << endl;
+  #endif
 }
 
 void Graph::init_admin()
 {
-
   size_t m = this->ecount();
   size_t n = this->vcount();
-  this->_is_directed = igraph_is_directed(this->_graph);
-
-  this->_strength_in.clear();
-  this->_strength_in.resize(n, 0.0);
 
-  this->_degree_in.clear();
-  this->_degree_in.resize(n, 0.0);
+  vector<double> strength_in(n, 0.0), strength_out;
+  vector<index_t> degree_in(n, 0), degree_out, degree_all;
 
   if (this->_is_directed) {
-    this->_strength_out.clear();
-    this->_strength_out.resize(n, 0.0);
-
-    this->_degree_out.clear();
-    this->_degree_out.resize(n, 0);
-
-    this->_degree_all.clear();
-    this->_degree_all.resize(n, 0);
+    strength_out.resize(n, 0.0);
+    degree_out.resize(n, 0);
+    degree_all.resize(n, 0);
   }
 
   // Determine total weight in the graph.
@@ -389,24 +454,30 @@ void Graph::init_admin()
     this->edge(e, from, to);
 
     if (this->is_directed()) {
-      this->_strength_in[to] += w;
-      this->_strength_out[from] += w;
+      strength_in[to] += w;
+      strength_out[from] += w;
 
-      this->_degree_in[to]++;
-      this->_degree_out[from]++;
-      this->_degree_all[to]++;
-      this->_degree_all[from]++;
+      degree_in[to]++;
+      degree_out[from]++;
+      degree_all[to]++;
+      degree_all[from]++;
     } else {
       // we only compute strength_in and degree_in for undirected graphs
-      this->_strength_in[to] += w;
-      this->_strength_in[from] += w;
+      strength_in[to] += w;
+      strength_in[from] += w;
 
       // recall that igraph ignores the mode for undirected graphs
-      this->_degree_in[to]++;
-      this->_degree_in[from]++;
+      degree_in[to]++;
+      degree_in[from]++;
     }
   }
 
+  this->_strength_in = std::move(strength_in);
+  this->_strength_out = std::move(strength_out);
+  this->_degree_in = std::move(degree_in);
+  this->_degree_out = std::move(degree_out);
+  this->_degree_all = std::move(degree_all);
+
   // Make sure to multiply by 2 for undirected graphs
   //if (!this->is_directed())
   //  this->_total_weight *= 2.0;
@@ -415,6 +486,18 @@ void Graph::init_admin()
   for (size_t v = 0; v < n; v++)
     this->_total_size += this->node_size(v);
 
+  this->init_density();
+  this->init_adjacency();
+}
+
+void Graph::set_correct_self_loops(int correct_self_loops)
+{
+  this->_correct_self_loops = correct_self_loops;
+  this->init_density();
+}
+
+void Graph::init_density()
+{
   // Calculate density;
   double w = this->total_weight();
   double n_size = this->total_size();
@@ -432,168 +515,145 @@ void Graph::init_admin()
     this->_density = w/normalise;
   else
     this->_density = 2*w/normalise;
+}
 
-  this->_current_node_cache_neigh_edges_from = n + 1;
-  this->_current_node_cache_neigh_edges_to = n + 1;
-  this->_current_node_cache_neigh_edges_all = n + 1;
+/****************************************************************************
+  Order the edges by the given node (e.g. their target) using a counting sort,
+  which takes O(n + m) time. Like igraph, multiple edges are ordered by
+  decreasing edge id.
+****************************************************************************/
+static vector<size_t> order_edges(Array<index_t> const& node, size_t n)
+{
+  size_t m = node.size();
+  vector<size_t> position(n + 1, 0);
+  for (size_t e = 0; e < m; e++)
+    position[node[e] + 1]++;
+  for (size_t v = 0; v < n; v++)
+    position[v + 1] += position[v];
 
-  this->_current_node_cache_neigh_from = n + 1;
-  this->_current_node_cache_neigh_to = n + 1;
-  this->_current_node_cache_neigh_all = n + 1;
+  vector<size_t> order(m);
+  for (size_t e = m; e-- > 0; )
+    order[position[node[e]]++] = e;
+  return order;
 }
 
-void Graph::cache_neighbour_edges(size_t v, igraph_neimode_t mode)
+/****************************************************************************
+  Store the neighbours (and incident edges) of all nodes, in the same order
+  as igraph_neighbors and igraph_incident provide them, so that the results
+  do not depend on how the graph was created. As the adjacency is not changed
+  afterwards, it can be used simultaneously by multiple threads.
+
+  The outgoing (incoming) edges of a node are sorted by their target (source),
+  like igraph does. Both directions are combined for IGRAPH_ALL: for
+  undirected graphs the outgoing edges go to nodes that are not larger and
+  the incoming edges come from nodes that are not smaller, so that they are
+  simply concatenated, while for directed graphs they are merged.
+****************************************************************************/
+void Graph::init_adjacency()
 {
-  #ifdef DEBUG
-    cerr << "void Graph::cache_neighbour_edges(" << v << ", " << mode << ");" << endl;
-  #endif
-  size_t degree = this->degree(v, mode);
-  #ifdef DEBUG
-    cerr << "Degree: " << degree << endl;
-  #endif
+  size_t n = this->vcount();
 
-  igraph_vector_int_t *incident_edges = &this->_temp_igraph_vector;
-  igraph_incident(this->_graph, incident_edges, v, mode);
+  vector<index_t> offsets(n + 1);
+  offsets[0] = 0;
+  for (size_t v = 0; v < n; v++)
+    offsets[v + 1] = offsets[v] + this->degree(v, IGRAPH_ALL);
 
-  vector<size_t>* _cached_neigh_edges = NULL;
-  switch (mode)
+  size_t nb_neighbours = offsets[n];
+  vector<index_t> neighbours(nb_neighbours);
+  vector<index_t> edges(nb_neighbours);
+
+  if (!this->is_directed())
   {
-    case IGRAPH_IN:
-      this->_current_node_cache_neigh_edges_from = v;
-      _cached_neigh_edges = &(this->_cached_neigh_edges_from);
-      break;
-    case IGRAPH_OUT:
-      this->_current_node_cache_neigh_edges_to = v;
-      _cached_neigh_edges = &(this->_cached_neigh_edges_to);
-      break;
-    case IGRAPH_ALL:
-      this->_current_node_cache_neigh_edges_all = v;
-      _cached_neigh_edges = &(this->_cached_neigh_edges_all);
-      break;
-  }
-  _cached_neigh_edges->assign(igraph_vector_int_get_ptr(incident_edges, 0),
-                              igraph_vector_int_get_ptr(incident_edges, degree));
-  #ifdef DEBUG
-    cerr << "Number of edges: " << _cached_neigh_edges->size() << endl;
-  #endif
+    // igraph ignores the mode for undirected graphs
+    this->_adjacency_in = Adjacency();
+    this->_adjacency_out = Adjacency();
 
-  #ifdef DEBUG
-    cerr << "exit void Graph::cache_neighbour_edges(" << v << ", " << mode << ");" << endl;
-  #endif
-}
+    // First place the outgoing edges of all nodes, then the incoming edges.
+    vector<size_t> position(offsets.begin(), offsets.end() - 1);
+    for (size_t e : order_edges(this->_edge_to, n))
+    {
+      size_t idx = position[this->_edge_from[e]]++;
+      neighbours[idx] = this->_edge_to[e];
+      edges[idx] = e;
+    }
+    for (size_t e : order_edges(this->_edge_from, n))
+    {
+      size_t idx = position[this->_edge_to[e]]++;
+      neighbours[idx] = this->_edge_from[e];
+      edges[idx] = e;
+    }
+    this->_adjacency_all.offsets = std::move(offsets);
+    this->_adjacency_all.neighbours = std::move(neighbours);
+    this->_adjacency_all.edges = std::move(edges);
+    return;
+  }
 
-vector<size_t> const& Graph::get_neighbour_edges(size_t v, igraph_neimode_t mode)
-{
-  if (!this->is_directed())
-    mode = IGRAPH_ALL; // igraph ignores mode for undirected graphs
+  this->init_sorted_adjacency(this->_adjacency_out, this->_edge_from, this->_edge_to);
+  this->init_sorted_adjacency(this->_adjacency_in, this->_edge_to, this->_edge_from);
+  Adjacency const& adjacency_out = this->_adjacency_out;
+  Adjacency const& adjacency_in = this->_adjacency_in;
 
-  switch (mode)
+  for (size_t v = 0; v < n; v++)
   {
-    case IGRAPH_IN:
-      if (this->_current_node_cache_neigh_edges_from != v)
-      {
-        cache_neighbour_edges(v, mode);
-        this->_current_node_cache_neigh_edges_from = v;
-      }
-      return this->_cached_neigh_edges_from;
-    case IGRAPH_OUT:
-      if (this->_current_node_cache_neigh_edges_to != v)
+    size_t idx = offsets[v];
+    size_t i1 = adjacency_out.offsets[v], j1 = adjacency_out.offsets[v + 1];
+    size_t i2 = adjacency_in.offsets[v], j2 = adjacency_in.offsets[v + 1];
+    while (i1 < j1 && i2 < j2)
+    {
+      size_t u1 = adjacency_out.neighbours[i1], u2 = adjacency_in.neighbours[i2];
+      if (u1 <= u2)
       {
-        cache_neighbour_edges(v, mode);
-        this->_current_node_cache_neigh_edges_to = v;
+        neighbours[idx] = u1;
+        edges[idx++] = adjacency_out.edges[i1++];
       }
-      return this->_cached_neigh_edges_to;
-    case IGRAPH_ALL:
-      if (this->_current_node_cache_neigh_edges_all != v)
+      if (u2 <= u1)
       {
-        cache_neighbour_edges(v, mode);
-        this->_current_node_cache_neigh_edges_all = v;
+        neighbours[idx] = u2;
+        edges[idx++] = adjacency_in.edges[i2++];
       }
-      return this->_cached_neigh_edges_all;
+    }
+    for (; i1 < j1; i1++, idx++)
+    {
+      neighbours[idx] = adjacency_out.neighbours[i1];
+      edges[idx] = adjacency_out.edges[i1];
+    }
+    for (; i2 < j2; i2++, idx++)
+    {
+      neighbours[idx] = adjacency_in.neighbours[i2];
+      edges[idx] = adjacency_in.edges[i2];
+    }
   }
-  throw Exception("Incorrect model for getting neighbour edges.");
+  this->_adjacency_all.offsets = std::move(offsets);
+  this->_adjacency_all.neighbours = std::move(neighbours);
+  this->_adjacency_all.edges = std::move(edges);
 }
 
-void Graph::cache_neighbours(size_t v, igraph_neimode_t mode)
+/****************************************************************************
+  Group the edges by their source, and sort them by their target.
+****************************************************************************/
+void Graph::init_sorted_adjacency(Adjacency& adjacency, Array<index_t> const& source, Array<index_t> const& target)
 {
-  #ifdef DEBUG
-    cerr << "void Graph::cache_neighbours(" << v << ", " << mode << ");" << endl;
-  #endif
-  size_t degree = this->degree(v, mode);
-  #ifdef DEBUG
-    cerr << "Degree: " << degree << endl;
-  #endif
-
-  igraph_vector_int_t *neighbours = &this->_temp_igraph_vector;
-  igraph_neighbors(this->_graph, neighbours, v, mode);
-
-  vector<size_t>* _cached_neighs = NULL;
-  switch (mode)
-  {
-    case IGRAPH_IN:
-      this->_current_node_cache_neigh_from = v;
-      _cached_neighs = &(this->_cached_neighs_from);
-      break;
-    case IGRAPH_OUT:
-      this->_current_node_cache_neigh_to = v;
-      _cached_neighs = &(this->_cached_neighs_to);
-      break;
-    case IGRAPH_ALL:
-      this->_current_node_cache_neigh_all = v;
-      _cached_neighs = &(this->_cached_neighs_all);
-      break;
-  }
-  _cached_neighs->assign(igraph_vector_int_get_ptr(neighbours, 0),
-                         igraph_vector_int_get_ptr(neighbours, degree));
-
-  #ifdef DEBUG
-    cerr << "Number of edges: " << _cached_neighs->size() << endl;
-  #endif
-
-  #ifdef DEBUG
-    cerr << "exit void Graph::cache_neighbours(" << v << ", " << mode << ");" << endl;
-  #endif
-}
+  size_t n = this->vcount();
+  size_t m = this->ecount();
 
-vector< size_t > const& Graph::get_neighbours(size_t v, igraph_neimode_t mode)
-{
-  if (!this->is_directed())
-    mode = IGRAPH_ALL; // igraph ignores mode for undirected graphs
+  vector<index_t> offsets(n + 1, 0);
+  for (size_t e = 0; e < m; e++)
+    offsets[source[e] + 1]++;
+  for (size_t v = 0; v < n; v++)
+    offsets[v + 1] += offsets[v];
 
-  switch (mode)
+  vector<index_t> neighbours(m);
+  vector<index_t> edges(m);
+  vector<size_t> position(offsets.begin(), offsets.end() - 1);
+  for (size_t e : order_edges(target, n))
   {
-    case IGRAPH_IN:
-      if (this->_current_node_cache_neigh_from != v)
-      {
-        cache_neighbours(v, mode);
-        this -> _current_node_cache_neigh_from = v;
-      }
-      #ifdef DEBUG
-        cerr << "Returning " << this->_cached_neighs_from.size() << " incoming neighbours" << endl;
-      #endif
-      return this->_cached_neighs_from;
-    case IGRAPH_OUT:
-      if (this->_current_node_cache_neigh_to != v)
-      {
-        cache_neighbours(v, mode);
-        this -> _current_node_cache_neigh_to = v;
-      }
-      #ifdef DEBUG
-        cerr << "Returning " << this->_cached_neighs_to.size() << " incoming neighbours" << endl;
-      #endif
-      return this->_cached_neighs_to;
-    case IGRAPH_ALL:
-      if (this->_current_node_cache_neigh_all != v)
-      {
-        cache_neighbours(v, mode);
-        this->_current_node_cache_neigh_all = v;
-      }
-      #ifdef DEBUG
-        cerr << "Returning " << this->_cached_neighs_all.size() << " incoming neighbours" << endl;
-      #endif
-      return this->_cached_neighs_all;
+    size_t idx = position[source[e]]++;
+    neighbours[idx] = target[e];
+    edges[idx] = e;
   }
-  throw Exception("Invalid mode for getting neighbours.");
+  adjacency.offsets = std::move(offsets);
+  adjacency.neighbours = std::move(neighbours);
+  adjacency.edges = std::move(edges);
 }
 
 /********************************************************************************
@@ -609,41 +669,26 @@ size_t Graph::get_random_neighbour(size_t v, igraph_neimode_t mode, igraph_rng_t
 
   if (this->is_directed() && mode != IGRAPH_ALL)
   {
-    if (mode == IGRAPH_OUT)
-    {
-      // Get indices of where neighbours are
-      size_t cum_degree_this_node = (size_t) VECTOR(this->_graph->os)[node];
-      size_t cum_degree_next_node = (size_t) VECTOR(this->_graph->os)[node+1];
-      // Get a random index from them
-      size_t rand_neigh_idx = get_random_int(cum_degree_this_node, cum_degree_next_node - 1, rng);
-      // Return the neighbour at that index
-      #ifdef DEBUG
-        cerr << "Degree: " << this->degree(node, mode) << " diff in cumulative: " << cum_degree_next_node - cum_degree_this_node << endl;
-      #endif
-      rand_neigh = VECTOR(this->_graph->to)[ (size_t)VECTOR(this->_graph->oi)[rand_neigh_idx] ];
-    }
-    else if (mode == IGRAPH_IN)
-    {
-      // Get indices of where neighbours are
-      size_t cum_degree_this_node = (size_t) VECTOR(this->_graph->is)[node];
-      size_t cum_degree_next_node = (size_t) VECTOR(this->_graph->is)[node+1];
-      // Get a random index from them
-      size_t rand_neigh_idx = get_random_int(cum_degree_this_node, cum_degree_next_node - 1, rng);
-      #ifdef DEBUG
-        cerr << "Degree: " << this->degree(node, mode) << " diff in cumulative: " << cum_degree_next_node - cum_degree_this_node << endl;
-      #endif
-      // Return the neighbour at that index
-      rand_neigh = VECTOR(this->_graph->from)[ (size_t)VECTOR(this->_graph->ii)[rand_neigh_idx] ];
-    }
+    Adjacency const& adjacency = this->adjacency(mode);
+    // Get indices of where neighbours are
+    size_t cum_degree_this_node = adjacency.offsets[node];
+    size_t cum_degree_next_node = adjacency.offsets[node+1];
+    // Get a random index from them
+    size_t rand_neigh_idx = get_random_int(cum_degree_this_node, cum_degree_next_node - 1, rng);
+    #ifdef DEBUG
+      cerr << "Degree: " << this->degree(node, mode) << " diff in cumulative: " << cum_degree_next_node - cum_degree_this_node << endl;
+    #endif
+    // Return the neighbour at that index
+    rand_neigh = adjacency.neighbours[rand_neigh_idx];
   }
-  else
+  else if (this->is_directed())
   {
     // both in- and out- neighbors in a directed graph.
-    size_t cum_outdegree_this_node = (size_t)VECTOR(this->_graph->os)[node];
-    size_t cum_indegree_this_node  = (size_t)VECTOR(this->_graph->is)[node];
+    size_t cum_outdegree_this_node = this->_adjacency_out.offsets[node];
+    size_t cum_indegree_this_node  = this->_adjacency_in.offsets[node];
 
-    size_t cum_outdegree_next_node = (size_t)VECTOR(this->_graph->os)[node+1];
-    size_t cum_indegree_next_node  = (size_t)VECTOR(this->_graph->is)[node+1];
+    size_t cum_outdegree_next_node = this->_adjacency_out.offsets[node+1];
+    size_t cum_indegree_next_node  = this->_adjacency_in.offsets[node+1];
 
     size_t total_outdegree = cum_outdegree_next_node - cum_outdegree_this_node;
     size_t total_indegree = cum_indegree_next_node - cum_indegree_this_node;
@@ -656,15 +701,23 @@ size_t Graph::get_random_neighbour(size_t v, igraph_neimode_t mode, igraph_rng_t
     // From among in or out neighbours?
     if (rand_idx < total_outdegree)
     { // From among outgoing neighbours
-      size_t rand_neigh_idx = cum_outdegree_this_node + rand_idx;
-      rand_neigh = VECTOR(this->_graph->to)[ (size_t)VECTOR(this->_graph->oi)[rand_neigh_idx] ];
+      rand_neigh = this->_adjacency_out.neighbours[cum_outdegree_this_node + rand_idx];
     }
     else
     { // From among incoming neighbours
-      size_t rand_neigh_idx = cum_indegree_this_node + rand_idx - total_outdegree;
-      rand_neigh = VECTOR(this->_graph->from)[ (size_t)VECTOR(this->_graph->ii)[rand_neigh_idx] ];
+      rand_neigh = this->_adjacency_in.neighbours[cum_indegree_this_node + rand_idx - total_outdegree];
     }
   }
+  else
+  {
+    // For undirected graphs the outgoing and incoming neighbours are simply
+    // concatenated in the adjacency.
+    size_t cum_degree_this_node = this->_adjacency_all.offsets[node];
+    size_t cum_degree_next_node = this->_adjacency_all.offsets[node+1];
+
+    size_t rand_idx = get_random_int(0, cum_degree_next_node - cum_degree_this_node - 1, rng);
+    rand_neigh = this->_adjacency_all.neighbours[cum_degree_this_node + rand_idx];
+  }
 
   return rand_neigh;
 }
@@ -690,8 +743,20 @@ Graph* Graph::collapse_graph(MutableVertexPartition* partition)
     cerr << "Collapsing to graph with " << partition->n_communities() << " nodes." << endl;
   #endif
 
+  size_t n = this->vcount();
   size_t n_collapsed = partition->n_communities();
-  vector<vector<size_t> > community_memberships = partition->get_communities();
+
+  // Group the nodes by community using a counting sort, so that the nodes of
+  // community c are nodes_by_comm[comm_offsets[c]] up to comm_offsets[c + 1].
+  vector<size_t> comm_offsets(n_collapsed + 1, 0);
+  for (size_t v = 0; v < n; v++)
+    comm_offsets[partition->membership(v) + 1]++;
+  for (size_t c = 0; c < n_collapsed; c++)
+    comm_offsets[c + 1] += comm_offsets[c];
+  vector<size_t> nodes_by_comm(n);
+  vector<size_t> position(comm_offsets.begin(), comm_offsets.end() - 1);
+  for (size_t v = 0; v < n; v++)
+    nodes_by_comm[position[partition->membership(v)]++] = v;
 
   vector<double> collapsed_weights;
   double total_collapsed_weight = 0.0;
@@ -700,12 +765,12 @@ Graph* Graph::collapse_graph(MutableVertexPartition* partition)
   vector<bool> neighbour_comm_added(n_collapsed, false);
 
   // collapsed edges for new graph
-  igraph_vector_int_t edges;
-  igraph_vector_int_init(&edges, 0);
+  vector<size_t> edges;
 
+  vector<size_t> neighbour_communities;
   for (size_t v_comm = 0; v_comm < n_collapsed; v_comm++) {
-    vector<size_t> neighbour_communities;
-    for (size_t v : community_memberships[v_comm]) {
+    for (size_t i = comm_offsets[v_comm]; i < comm_offsets[v_comm + 1]; i++) {
+        size_t v = nodes_by_comm[i];
         for (size_t e : this->get_neighbour_edges(v, IGRAPH_OUT)) {
             size_t from, to;
             this->edge(e, from, to);
@@ -731,8 +796,8 @@ Graph* Graph::collapse_graph(MutableVertexPartition* partition)
     }
 
     for (size_t u_comm : neighbour_communities) {
-        igraph_vector_int_push_back(&edges, v_comm);
-        igraph_vector_int_push_back(&edges, u_comm);
+        edges.push_back(v_comm);
+        edges.push_back(u_comm);
         collapsed_weights.push_back(edge_weight_to_community[u_comm]);
         total_collapsed_weight += edge_weight_to_community[u_comm];
 
@@ -740,25 +805,160 @@ Graph* Graph::collapse_graph(MutableVertexPartition* partition)
         edge_weight_to_community[u_comm] = 0.0;
         neighbour_comm_added[u_comm] = false;
     }
+    neighbour_communities.clear();
   }
 
-  // Create graph based on edges
-  igraph_t* graph = new igraph_t();
-  igraph_create(graph, &edges, n_collapsed, this->is_directed());
-  igraph_vector_int_destroy(&edges);
-
-  if ((size_t) igraph_vcount(graph) != partition->n_communities())
-    throw Exception("Something went wrong with collapsing the graph.");
-
   // Calculate new node sizes
   vector<double> csizes(n_collapsed, 0);
   for (size_t c = 0; c < partition->n_communities(); c++)
     csizes[c] = partition->csize(c);
 
-  Graph* G = new Graph(graph, collapsed_weights, csizes, this->_correct_self_loops);
-  G->_remove_graph = true;
+  // Create graph based on edges
+  Graph* G = new Graph(n_collapsed, edges, this->is_directed(), collapsed_weights, csizes, this->_correct_self_loops);
   #ifdef DEBUG
     cerr << "exit Graph::collapse_graph(vector<size_t> membership)" << endl << endl;
   #endif
   return G;
 }
+
+/****************************************************************************
+  Check whether the edges can be updated as specified (see update_edges),
+  throwing an exception if not. This only takes time proportional to the
+  number of changed edges.
+*****************************************************************************/
+void Graph::check_edge_update(vector<size_t> const& reweighted_edges, vector<double> const& new_weights,
+                              vector<size_t> const& removed_edges,
+                              vector<size_t> const& added_edges, vector<double> const& added_weights)
+{
+  size_t n = this->vcount();
+  size_t m = this->ecount();
+
+  if (reweighted_edges.size() != new_weights.size())
+    throw Exception("Number of new weights does not equal the number of reweighted edges.");
+
+  if (added_edges.size() % 2 != 0)
+    throw Exception("Added edges should contain pairs of nodes.");
+
+  if (!added_weights.empty() && 2*added_weights.size() != added_edges.size())
+    throw Exception("Number of added weights does not equal the number of added edges.");
+
+  vector<size_t> changed_edges(reweighted_edges);
+  changed_edges.insert(changed_edges.end(), removed_edges.begin(), removed_edges.end());
+  std::sort(changed_edges.begin(), changed_edges.end());
+  for (size_t i = 0; i < changed_edges.size(); i++)
+  {
+    if (changed_edges[i] >= m)
+      throw Exception("Edge to update is not in the graph.");
+    if (i > 0 && changed_edges[i] == changed_edges[i - 1])
+      throw Exception("Edge cannot be updated more than once.");
+  }
+
+  for (size_t v : added_edges)
+    if (v >= n)
+      throw Exception("Added edge refers to a node that is not in the graph.");
+
+  check_index_range(n, m + added_edges.size()/2);
+}
+
+/****************************************************************************
+  Update the edges of the graph in place: reweight edges, remove edges and
+  add edges. The reweighted and removed edges refer to the edge ids before
+  the update. As in igraph, the remaining edges keep their relative order,
+  and the added edges are appended, so edge ids after the first removed edge
+  change. The added edges are given as consecutive pairs of nodes and have a
+  weight of 1.0 if no added_weights are given.
+
+  The edges are updated in time proportional to the number of changed edges,
+  but the adjacency (and the degree and strength of nodes) is recalculated,
+  which takes O(n + m) time. Partitions of this graph should be updated using
+  MutableVertexPartition::update_edges.
+*****************************************************************************/
+void Graph::update_edges(vector<size_t> const& reweighted_edges, vector<double> const& new_weights,
+                         vector<size_t> const& removed_edges,
+                         vector<size_t> const& added_edges, vector<double> const& added_weights)
+{
+  this->check_edge_update(reweighted_edges, new_weights, removed_edges, added_edges, added_weights);
+
+  // Nodes of which the self loops change
+  vector<size_t> self_loop_nodes;
+
+  // The edges are changed in place, unless they are memory-mapped (see
+  // Array), in which case they are copied.
+  vector<index_t> edge_from = this->_edge_from.release();
+  vector<index_t> edge_to = this->_edge_to.release();
+  vector<weight_t> edge_weights = this->_edge_weights.release();
+
+  for (size_t i = 0; i < reweighted_edges.size(); i++)
+  {
+    size_t e = reweighted_edges[i];
+    edge_weights[e] = new_weights[i];
+    if (edge_from[e] == edge_to[e])
+      self_loop_nodes.push_back(edge_from[e]);
+  }
+
+  if (!removed_edges.empty())
+  {
+    size_t m = edge_from.size();
+    vector<bool> is_removed(m, false);
+    for (size_t e : removed_edges)
+    {
+      is_removed[e] = true;
+      if (edge_from[e] == edge_to[e])
+        self_loop_nodes.push_back(edge_from[e]);
+    }
+
+    size_t new_m = 0;
+    for (size_t e = 0; e < m; e++)
+    {
+      if (!is_removed[e])
+      {
+        edge_from[new_m] = edge_from[e];
+        edge_to[new_m] = edge_to[e];
+        edge_weights[new_m] = edge_weights[e];
+        new_m++;
+      }
+    }
+    edge_from.resize(new_m);
+    edge_to.resize(new_m);
+    edge_weights.resize(new_m);
+  }
+
+  for (size_t i = 0; i < added_edges.size() / 2; i++)
+  {
+    size_t from = added_edges[2*i], to = added_edges[2*i + 1];
+    if (!this->is_directed() && from < to)
+      std::swap(from, to);
+    edge_from.push_back(from);
+    edge_to.push_back(to);
+    edge_weights.push_back(added_weights.empty() ? 1.0 : added_weights[i]);
+    if (from == to)
+      self_loop_nodes.push_back(from);
+  }
+
+  this->_edge_from = std::move(edge_from);
+  this->_edge_to = std::move(edge_to);
+  this->_edge_weights = std::move(edge_weights);
+  this->_has_self_loops = -1;
+  this->_has_negative_weights = -1;
+
+  if (!reweighted_edges.empty() || !added_weights.empty())
+    this->_is_weighted = true;
+
+  this->init_admin();
+
+  // Update the self weight of nodes of which the self loops changed, using
+  // the last self loop (as set_self_weights does).
+  vector<weight_t> node_self_weights = this->_node_self_weights.release();
+  for (size_t v : self_loop_nodes)
+  {
+    double self_weight = 0.0;
+    size_t self_loop = this->ecount();
+    for (size_t e : this->get_neighbour_edges(v, IGRAPH_OUT))
+      if (this->_edge_from[e] == this->_edge_to[e] && (self_loop == this->ecount() || e > self_loop))
+        self_loop = e;
+    if (self_loop < this->ecount())
+      self_weight = this->edge_weight(self_loop);
+    node_self_weights[v] = self_weight;
+  }
+  this->_node_self_weights = std::move(node_self_weights);
+}
@@ -0,0 +1,248 @@
+#include "GraphStream.h"
+
+GraphStream::GraphStream(size_t n, int directed, double max_degree, size_t max_comm_size)
+{
+  this->_n = 0;
+  this->_directed = directed;
+  this->_max_degree = max_degree;
+  this->_max_comm_size = max_comm_size;
+  this->_has_self_loops = false;
+  this->_is_renumbered = false;
+  this->_n_communities = 0;
+  this->add_nodes(n);
+}
+
+GraphStream::~GraphStream()
+{
+}
+
+/****************************************************************************
+  Add nodes up to n, each in its own community. Nodes can only be added
+  during the first pass over the edges.
+*****************************************************************************/
+void GraphStream::add_nodes(size_t n)
+{
+  if (n <= this->_n)
+    return;
+
+  if (this->_is_renumbered)
+    throw Exception("Node in edge exceeds number of nodes in first pass.");
+
+  this->_membership.reserve(n);
+  for (size_t v = this->_n; v < n; v++)
+    this->_membership.push_back(v);
+  this->_degree.resize(n, 0.0);
+  this->_volume.resize(n, 0.0);
+  this->_csize.resize(n, 1.0);
+  this->_n = n;
+}
+
+void GraphStream::check_edges(vector<size_t> const& edges, vector<double> const& weights)
+{
+  if (edges.size() % 2 != 0)
+    throw Exception("Expected an even number of nodes for edges.");
+
+  if (!weights.empty() && weights.size() != edges.size()/2)
+    throw Exception("Number of weights does not equal the number of edges.");
+}
+
+/****************************************************************************
+  Cluster the nodes based on the edges, which are given as a flat vector of
+  pairs of nodes. If the weights are empty, all edges have a weight of 1.
+
+  For each edge, both nodes are considered for moving to the community of the
+  other node. The node in the community with the lowest volume (i.e. the total
+  degree of the community) moves, as long as the degrees of both nodes do not
+  exceed max_degree. High degree nodes hence remain where they are, and do not
+  pull whole communities together. In addition, a node does not move to a
+  community with max_comm_size nodes (unless max_comm_size is 0), as a single
+  edge is little evidence for moving a node, and the aggregate graph can only
+  merge communities, not split them. Directed edges are treated as undirected.
+*****************************************************************************/
+void GraphStream::cluster_edges(vector<size_t> const& edges, vector<double> const& weights)
+{
+  if (this->_is_renumbered)
+    throw Exception("Cannot cluster edges after aggregating edges.");
+
+  this->check_edges(edges, weights);
+
+  size_t n = this->_n;
+  for (size_t v : edges)
+    if (v >= n)
+      n = v + 1;
+  this->add_nodes(n);
+
+  size_t m = edges.size()/2;
+  for (size_t e = 0; e < m; e++)
+  {
+    size_t v = edges[2*e];
+    size_t u = edges[2*e + 1];
+    double w = weights.empty() ? 1.0 : weights[e];
+
+    this->_degree[v] += w;
+    this->_degree[u] += w;
+    size_t v_comm = this->_membership[v];
+    size_t u_comm = this->_membership[u];
+    this->_volume[v_comm] += w;
+    this->_volume[u_comm] += w;
+
+    if (v == u)
+    {
+      this->_has_self_loops = true;
+      continue;
+    }
+
+    if (v_comm == u_comm || this->_degree[v] > this->_max_degree || this->_degree[u] > this->_max_degree)
+      continue;
+
+    // Move the node in the community with the lowest volume
+    if (this->_volume[v_comm] > this->_volume[u_comm])
+    {
+      std::swap(v, u);
+      std::swap(v_comm, u_comm);
+    }
+
+    if (this->_max_comm_size > 0 && this->_csize[u_comm] >= this->_max_comm_size)
+      continue;
+
+    this->_volume[v_comm] -= this->_degree[v];
+    this->_volume[u_comm] += this->_degree[v];
+    this->_csize[v_comm] -= 1.0;
+    this->_csize[u_comm] += 1.0;
+    this->_membership[v] = u_comm;
+  }
+}
+
+/****************************************************************************
+  Renumber the communities consecutively (in order of the first node in each
+  community) once the first pass is done, and release the degrees and
+  volumes, which are no longer needed.
+*****************************************************************************/
+void GraphStream::renumber_communities()
+{
+  if (this->_is_renumbered)
+    return;
+
+  size_t n = this->_n;
+  vector<size_t> new_comm(n, n);
+  size_t n_communities = 0;
+  for (size_t v = 0; v < n; v++)
+  {
+    size_t comm = this->_membership[v];
+    if (new_comm[comm] == n)
+      new_comm[comm] = n_communities++;
+    this->_membership[v] = new_comm[comm];
+  }
+
+  this->_csize.assign(n_communities, 0.0);
+  for (size_t v = 0; v < n; v++)
+    this->_csize[this->_membership[v]] += 1.0;
+
+  this->_n_communities = n_communities;
+  vector<double>().swap(this->_degree);
+  vector<double>().swap(this->_volume);
+  this->_is_renumbered = true;
+}
+
+/****************************************************************************
+  Aggregate the edges to edges between the communities found in the first
+  pass. The edges should be identical to the edges of the first pass,
+  although they may be given in different chunks or in a different order.
+*****************************************************************************/
+void GraphStream::aggregate_edges(vector<size_t> const& edges, vector<double> const& weights)
+{
+  this->check_edges(edges, weights);
+  this->renumber_communities();
+
+  for (size_t v : edges)
+    if (v >= this->_n)
+      throw Exception("Node in edge exceeds number of nodes in first pass.");
+
+  size_t m = edges.size()/2;
+  for (size_t e = 0; e < m; e++)
+  {
+    size_t v_comm = this->_membership[edges[2*e]];
+    size_t u_comm = this->_membership[edges[2*e + 1]];
+    double w = weights.empty() ? 1.0 : weights[e];
+
+    // Undirected edges are stored from the largest community, as in Graph.
+    if (!this->_directed && v_comm < u_comm)
+      std::swap(v_comm, u_comm);
+
+    this->_aggregate_weights[make_pair(v_comm, u_comm)] += w;
+  }
+}
+
+/****************************************************************************
+  Merge the communities, where membership gives the new community of each
+  community, i.e. of each node of the aggregate graph. The aggregate edges so
+  far are merged accordingly, so that the aggregate graph remains the same as
+  when the edges were aggregated to the new communities directly. The new
+  communities are renumbered consecutively (in order of the first community in
+  each new community).
+*****************************************************************************/
+void GraphStream::merge_communities(vector<size_t> const& membership)
+{
+  this->renumber_communities();
+
+  size_t n_communities = this->_n_communities;
+  if (membership.size() != n_communities)
+    throw Exception("Membership vector does not have the same size as the number of communities.");
+
+  vector<size_t> new_comm(n_communities, n_communities);
+  size_t n_new_communities = 0;
+  for (size_t comm : membership)
+  {
+    if (comm >= n_communities)
+      throw Exception("Membership vector refers to a community that does not exist.");
+    if (new_comm[comm] == n_communities)
+      new_comm[comm] = n_new_communities++;
+  }
+
+  for (size_t v = 0; v < this->_n; v++)
+    this->_membership[v] = new_comm[membership[this->_membership[v]]];
+
+  this->_csize.assign(n_new_communities, 0.0);
+  for (size_t v = 0; v < this->_n; v++)
+    this->_csize[this->_membership[v]] += 1.0;
+  this->_n_communities = n_new_communities;
+
+  std::unordered_map<pair<size_t, size_t>, double, PairHash> aggregate_weights;
+  for (auto const& edge : this->_aggregate_weights)
+  {
+    size_t v_comm = new_comm[membership[edge.first.first]];
+    size_t u_comm = new_comm[membership[edge.first.second]];
+    if (!this->_directed && v_comm < u_comm)
+      std::swap(v_comm, u_comm);
+    aggregate_weights[make_pair(v_comm, u_comm)] += edge.second;
+  }
+  this->_aggregate_weights.swap(aggregate_weights);
+}
+
+/****************************************************************************
+  Create the aggregate graph of the edges aggregated so far, in which each
+  node represents a community, with the number of nodes in the community as
+  node size.
+*****************************************************************************/
+Graph* GraphStream::aggregate_graph(int correct_self_loops)
+{
+  this->renumber_communities();
+
+  vector< pair< pair<size_t, size_t>, double> > aggregate_edges(
+    this->_aggregate_weights.begin(), this->_aggregate_weights.end());
+  // Sort the edges, so that the graph does not depend on the hashing
+  std::sort(aggregate_edges.begin(), aggregate_edges.end());
+
+  size_t m = aggregate_edges.size();
+  vector<size_t> edges(2*m);
+  vector<double> weights(m);
+  for (size_t e = 0; e < m; e++)
+  {
+    edges[2*e] = aggregate_edges[e].first.first;
+    edges[2*e + 1] = aggregate_edges[e].first.second;
+    weights[e] = aggregate_edges[e].second;
+  }
+  vector< pair< pair<size_t, size_t>, double> >().swap(aggregate_edges);
+
+  return new Graph(this->_n_communities, edges, this->_directed, weights, this->_csize, correct_self_loops);
+}
@@ -33,11 +33,12 @@ MutableVertexPartition::MutableVertexPartition(Graph* graph,
 {
   this->destructor_delete_graph = false;
   this->graph = graph;
+  this->_admin_version = 0;
   if (membership.size() != graph->vcount())
   {
     throw Exception("Membership vector has incorrect size.");
   }
-  this->_membership = membership;
+  this->_membership.assign(membership.begin(), membership.end());
   this->init_admin();
 }
 
@@ -45,7 +46,11 @@ MutableVertexPartition::MutableVertexPartition(Graph* graph)
 {
   this->destructor_delete_graph = false;
   this->graph = graph;
-  this->_membership = range(graph->vcount());
+  this->_admin_version = 0;
+  size_t n = graph->vcount();
+  this->_membership.resize(n);
+  for (size_t v = 0; v < n; v++)
+    this->_membership[v] = v;
   this->init_admin();
 }
 
@@ -150,15 +155,7 @@ void MutableVertexPartition::init_admin()
   this->_cnodes.clear();
   this->_cnodes.resize(this->_n_communities);
 
-  this->_current_node_cache_community_from = n + 1; this->_cached_weight_from_community.resize(this->_n_communities, 0);
-  this->_current_node_cache_community_to = n + 1;   this->_cached_weight_to_community.resize(this->_n_communities, 0);
-  this->_current_node_cache_community_all = n + 1;  this->_cached_weight_all_community.resize(this->_n_communities, 0);
-  this->_cached_neigh_comms_all.resize(n);
-
-  if (this->get_graph()->is_directed()) {
-    this->_cached_neigh_comms_from.resize(n);
-    this->_cached_neigh_comms_to.resize(n);
-  }
+  this->invalidate_cache();
 
   this->_empty_communities.clear();
 
@@ -234,12 +231,48 @@ void MutableVertexPartition::init_admin()
       this->_empty_communities.push_back(c);
   }
 
+  this->init_community_sums();
+
   #ifdef DEBUG
     cerr << "exit MutableVertexPartition::init_admin()" << endl << endl;
   #endif
 
 }
 
+/****************************************************************************
+  Calculate the running sums over all communities from the administration of
+  each community, see move_node.
+*****************************************************************************/
+void MutableVertexPartition::init_community_sums()
+{
+  this->_total_weight_from_to_all_comms = 0.0;
+  this->_total_csize_squared_all_comms = 0.0;
+  for (size_t c = 0; c < this->_n_communities; c++)
+  {
+    this->_total_weight_from_to_all_comms += this->_total_weight_from_comm[c]*this->_total_weight_to_comm[c];
+    this->_total_csize_squared_all_comms += this->_csize[c]*this->_csize[c];
+  }
+  this->_admin_version++;
+}
+
+/****************************************************************************
+  The total number of possible edges within all communities, i.e. the sum of
+  Graph::possible_edges over the community sizes, which is calculated from
+  the sum of the squared community sizes. In contrast to
+  total_possible_edges_in_all_comms, this is also correct for non-integer
+  node sizes.
+*****************************************************************************/
+double MutableVertexPartition::possible_edges_in_all_comms()
+{
+  double n = this->graph->total_size();
+  double possible_edges = this->_total_csize_squared_all_comms - n;
+  if (!this->graph->is_directed())
+    possible_edges /= 2;
+  if (this->graph->correct_self_loops())
+    possible_edges += n;
+  return possible_edges;
+}
+
 void MutableVertexPartition::update_n_communities()
 {
   this->_n_communities = 0;
@@ -289,7 +322,7 @@ void MutableVertexPartition::relabel_communities(vector<size_t> const& new_comm_
   vector<double> new_total_weight_from_comm(nbcomms, 0.0);
   vector<double> new_total_weight_to_comm(nbcomms, 0.0);
   vector<double> new_csize(nbcomms, 0);
-  vector<size_t> new_cnodes(nbcomms, 0);
+  vector<index_t> new_cnodes(nbcomms, 0);
 
   // Relabel community admin
   for (size_t c = 0; c < new_comm_id.size(); c++) {
@@ -308,6 +341,7 @@ void MutableVertexPartition::relabel_communities(vector<size_t> const& new_comm_
   this->_total_weight_to_comm = new_total_weight_to_comm;
   this->_csize = new_csize;
   this->_cnodes = new_cnodes;
+  this->init_community_sums();
 
   this->_empty_communities.clear();
   for (size_t c = 0; c < nbcomms; c++) {
@@ -316,34 +350,14 @@ void MutableVertexPartition::relabel_communities(vector<size_t> const& new_comm_
     }
   }
 
-  // invalidate cached weight vectors
-  for (size_t c : this->_cached_neigh_comms_from)
-    this->_cached_weight_from_community[c] = 0;
-  this->_cached_neigh_comms_from.clear();
-  this->_cached_weight_from_community.resize(nbcomms, 0);
-  this->_current_node_cache_community_from = n + 1;
-
-  for (size_t c : this->_cached_neigh_comms_to)
-    this->_cached_weight_to_community[c] = 0;
-  this->_cached_neigh_comms_to.clear();
-  this->_cached_weight_to_community.resize(nbcomms, 0);
-  this->_current_node_cache_community_to = n + 1;
-
-  for (size_t c : this->_cached_neigh_comms_all)
-    this->_cached_weight_all_community[c] = 0;
-  this->_cached_neigh_comms_all.clear();
-  this->_cached_weight_all_community.resize(nbcomms, 0);
-  this->_current_node_cache_community_all = n + 1;
+  this->invalidate_cache();
 
   #ifdef DEBUG
     if (this->_csize.size() < this->_n_communities ||
         this->_cnodes.size() < this->_n_communities ||
         this->_total_weight_in_comm.size() < this->_n_communities ||
         this->_total_weight_to_comm.size() < this->_n_communities ||
-        this->_total_weight_from_comm.size() < this->_n_communities ||
-        this->_cached_weight_from_community.size() < this->_n_communities ||
-        this->_cached_weight_to_community.size() < this->_n_communities ||
-        this->_cached_weight_all_community.size() < this->_n_communities) {
+        this->_total_weight_from_comm.size() < this->_n_communities) {
       cerr << "ERROR: MutableVertexPartition bookkeeping is too small after rearrange_community_labels." << endl;
     }
 
@@ -422,6 +436,144 @@ vector<size_t> MutableVertexPartition::rank_order_communities(vector<MutableVert
 }
 
 
+/****************************************************************************
+  Invalidate the cached weights of a node to its neighbouring communities,
+  for example after relabelling the communities or changing the graph.
+*****************************************************************************/
+void MutableVertexPartition::invalidate_cache()
+{
+  size_t n = this->graph->vcount();
+
+  this->_cached_weight_from_community.clear();
+  this->_current_node_cache_community_from = n + 1;
+
+  this->_cached_weight_to_community.clear();
+  this->_current_node_cache_community_to = n + 1;
+
+  this->_cached_weight_all_community.clear();
+  this->_current_node_cache_community_all = n + 1;
+}
+
+/****************************************************************************
+  Replace the graph by a copy that is deleted with the partition, so that the
+  graph can be changed (e.g. by update_edges) without affecting other
+  partitions that use the same graph. The administration of the partition
+  remains valid, since the copy is identical to the graph.
+*****************************************************************************/
+void MutableVertexPartition::copy_graph()
+{
+  Graph* graph = new Graph(*this->graph);
+  if (this->destructor_delete_graph)
+    delete this->graph;
+  this->graph = graph;
+  this->destructor_delete_graph = true;
+}
+
+/****************************************************************************
+  Update the edges of the graph, and the administration of the partition, see
+  Graph::update_edges for how the edges are specified. The administration is
+  only updated for the changed edges, instead of recalculating it completely.
+
+  Returns the nodes whose neighbourhood changed, i.e. the endpoints of the
+  changed edges and their neighbours, in increasing order. Only these nodes
+  need to be considered when moving nodes afterwards, see
+  Optimiser::move_nodes.
+
+  Other partitions of the same graph are not updated.
+*****************************************************************************/
+vector<size_t> MutableVertexPartition::update_edges(vector<size_t> const& reweighted_edges, vector<double> const& new_weights,
+                                                    vector<size_t> const& removed_edges,
+                                                    vector<size_t> const& added_edges, vector<double> const& added_weights)
+{
+  // Check before changing anything
+  this->graph->check_edge_update(reweighted_edges, new_weights, removed_edges, added_edges, added_weights);
+
+  vector<size_t> endpoints;
+  size_t v, u;
+  for (size_t i = 0; i < reweighted_edges.size(); i++)
+  {
+    size_t e = reweighted_edges[i];
+    this->graph->edge(e, v, u);
+    this->add_edge_weight(v, u, new_weights[i] - this->graph->edge_weight(e));
+    endpoints.push_back(v); endpoints.push_back(u);
+  }
+
+  for (size_t e : removed_edges)
+  {
+    this->graph->edge(e, v, u);
+    this->add_edge_weight(v, u, -this->graph->edge_weight(e));
+    endpoints.push_back(v); endpoints.push_back(u);
+  }
+
+  for (size_t i = 0; i < added_edges.size() / 2; i++)
+  {
+    v = added_edges[2*i]; u = added_edges[2*i + 1];
+    this->add_edge_weight(v, u, added_weights.empty() ? 1.0 : added_weights[i]);
+    endpoints.push_back(v); endpoints.push_back(u);
+  }
+
+  this->graph->update_edges(reweighted_edges, new_weights, removed_edges, added_edges, added_weights);
+  this->invalidate_cache();
+
+  // Determine the endpoints and their neighbours
+  vector<bool> is_affected(this->graph->vcount(), false);
+  vector<size_t> affected_nodes;
+  for (size_t v : endpoints)
+  {
+    if (!is_affected[v])
+    {
+      is_affected[v] = true;
+      affected_nodes.push_back(v);
+    }
+  }
+  for (size_t v : endpoints)
+  {
+    for (size_t u : this->graph->get_neighbours(v, IGRAPH_ALL))
+    {
+      if (!is_affected[u])
+      {
+        is_affected[u] = true;
+        affected_nodes.push_back(u);
+      }
+    }
+  }
+  sort(affected_nodes.begin(), affected_nodes.end());
+  return affected_nodes;
+}
+
+/****************************************************************************
+  Add weight w of an edge from v to u to the administration (which may be
+  negative, to remove the weight of an edge), in the same way as init_admin.
+*****************************************************************************/
+void MutableVertexPartition::add_edge_weight(size_t v, size_t u, double w)
+{
+  size_t v_comm = this->_membership[v];
+  size_t u_comm = this->_membership[u];
+
+  this->_total_weight_from_to_all_comms -= this->_total_weight_from_comm[v_comm]*this->_total_weight_to_comm[v_comm];
+  if (u_comm != v_comm)
+    this->_total_weight_from_to_all_comms -= this->_total_weight_from_comm[u_comm]*this->_total_weight_to_comm[u_comm];
+
+  this->_total_weight_from_comm[v_comm] += w;
+  this->_total_weight_to_comm[u_comm] += w;
+  if (!this->graph->is_directed())
+  {
+    this->_total_weight_from_comm[u_comm] += w;
+    this->_total_weight_to_comm[v_comm] += w;
+  }
+  // If it is an edge within a community
+  if (v_comm == u_comm)
+  {
+    this->_total_weight_in_comm[v_comm] += w;
+    this->_total_weight_in_all_comms += w;
+  }
+
+  this->_total_weight_from_to_all_comms += this->_total_weight_from_comm[v_comm]*this->_total_weight_to_comm[v_comm];
+  if (u_comm != v_comm)
+    this->_total_weight_from_to_all_comms += this->_total_weight_from_comm[u_comm]*this->_total_weight_to_comm[u_comm];
+  this->_admin_version++;
+}
+
 /****************************************************************************
  Renumber the communities using the original fixed membership vector. Notice
  that this doesn't ensure any property of the community numbers.
@@ -501,7 +653,7 @@ void MutableVertexPartition::set_membership(vector<size_t> const& membership)
   #ifdef DEBUG
     cerr << "void MutableVertexPartition::set_membership(" << &membership << ")" << endl;
   #endif
-  this->_membership = membership;
+  this->_membership.assign(membership.begin(), membership.end());
 
   this->clean_mem();
   this->init_admin();
@@ -525,10 +677,6 @@ size_t MutableVertexPartition::add_empty_community()
   this->_total_weight_from_comm.resize(this->_n_communities); this->_total_weight_from_comm[new_comm] = 0;
   this->_total_weight_to_comm.resize(this->_n_communities);   this->_total_weight_to_comm[new_comm] = 0;
 
-  this->_cached_weight_all_community.resize(this->_n_communities);
-  this->_cached_weight_from_community.resize(this->_n_communities);
-  this->_cached_weight_to_community.resize(this->_n_communities);
-
   this->_empty_communities.push_back(new_comm);
   #ifdef DEBUG
     cerr << "Added empty community " << new_comm << endl;
@@ -574,6 +722,13 @@ void MutableVertexPartition::move_node(size_t v,size_t new_comm)
   // adaptation of the community sizes, otherwise the calculations are incorrect.
   if (new_comm != old_comm)
   {
+    // Remove the terms of both communities from the running sums, and add
+    // them again after the node has been moved.
+    this->_total_weight_from_to_all_comms -= this->_total_weight_from_comm[old_comm]*this->_total_weight_to_comm[old_comm] +
+                                             this->_total_weight_from_comm[new_comm]*this->_total_weight_to_comm[new_comm];
+    this->_total_csize_squared_all_comms -= this->_csize[old_comm]*this->_csize[old_comm] +
+                                            this->_csize[new_comm]*this->_csize[new_comm];
+
     double delta_possible_edges_in_comms = 2.0*node_size*(ptrdiff_t)(this->_csize[new_comm] - this->_csize[old_comm] + node_size)/(2.0 - this->graph->is_directed());
     _total_possible_edges_in_all_comms += delta_possible_edges_in_comms;
     #ifdef DEBUG
@@ -610,7 +765,7 @@ void MutableVertexPartition::move_node(size_t v,size_t new_comm)
     #ifdef DEBUG
       cerr << "Removing from empty communities (number of empty communities is " << this->_empty_communities.size() << ")." << endl;
     #endif
-    vector<size_t>::reverse_iterator it_comm = this->_empty_communities.rbegin();
+    vector<index_t>::reverse_iterator it_comm = this->_empty_communities.rbegin();
     while (it_comm != this->_empty_communities.rend() && *it_comm != new_comm)
     {
       #ifdef DEBUG
@@ -646,8 +801,8 @@ void MutableVertexPartition::move_node(size_t v,size_t new_comm)
     igraph_neimode_t mode = modes[mode_i];
 
     // Loop over all incident edges
-    vector<size_t> const& neighbours = this->graph->get_neighbours(v, mode);
-    vector<size_t> const& neighbour_edges = this->graph->get_neighbour_edges(v, mode);
+    Span neighbours = this->graph->get_neighbours(v, mode);
+    Span neighbour_edges = this->graph->get_neighbour_edges(v, mode);
 
     size_t degree = neighbours.size();
 
@@ -733,8 +888,24 @@ void MutableVertexPartition::move_node(size_t v,size_t new_comm)
     cerr << "Internal _total_weight_in_all_comms=" << this->_total_weight_in_all_comms
          << ", calculated check_total_weight_in_all_comms=" << check_total_weight_in_all_comms << endl;
   #endif
+  if (new_comm != old_comm)
+  {
+    this->_total_weight_from_to_all_comms += this->_total_weight_from_comm[old_comm]*this->_total_weight_to_comm[old_comm] +
+                                             this->_total_weight_from_comm[new_comm]*this->_total_weight_to_comm[new_comm];
+    this->_total_csize_squared_all_comms += this->_csize[old_comm]*this->_csize[old_comm] +
+                                            this->_csize[new_comm]*this->_csize[new_comm];
+  }
+  this->_admin_version++;
+
   // Update the membership vector
   this->_membership[v] = new_comm;
+
+  // The cached weights of neighbouring nodes to the communities are no longer
+  // correct after moving the node.
+  size_t n = this->graph->vcount();
+  this->_current_node_cache_community_from = n + 1;
+  this->_current_node_cache_community_to = n + 1;
+  this->_current_node_cache_community_all = n + 1;
   #ifdef DEBUG
     cerr << "exit MutableVertexPartition::move_node(" << v << ", " << new_comm << ")" << endl << endl;
   #endif
@@ -748,17 +919,17 @@ void MutableVertexPartition::move_node(size_t v,size_t new_comm)
 ****************************************************************************/
 void MutableVertexPartition::from_coarse_partition(vector<size_t> const& coarse_partition_membership)
 {
-  this->from_coarse_partition(coarse_partition_membership, this->_membership);
+  this->set_from_coarse_partition(coarse_partition_membership, this->_membership);
 }
 
 void MutableVertexPartition::from_coarse_partition(MutableVertexPartition* coarse_partition)
 {
-  this->from_coarse_partition(coarse_partition, this->_membership);
+  this->set_from_coarse_partition(coarse_partition->membership(), this->_membership);
 }
 
 void MutableVertexPartition::from_coarse_partition(MutableVertexPartition* coarse_partition, vector<size_t> const& coarse_node)
 {
-  this->from_coarse_partition(coarse_partition->membership(), coarse_node);
+  this->set_from_coarse_partition(coarse_partition->membership(), coarse_node);
 }
 
 /****************************************************************************
@@ -768,6 +939,12 @@ void MutableVertexPartition::from_coarse_partition(MutableVertexPartition* coars
  the coarser partition and thus has community coarse_partition_membership[coarse_node[i]].
 ****************************************************************************/
 void MutableVertexPartition::from_coarse_partition(vector<size_t> const& coarse_partition_membership, vector<size_t> const& coarse_node)
+{
+  this->set_from_coarse_partition(coarse_partition_membership, coarse_node);
+}
+
+// The memberships may either be stored as index_t or given as size_t.
+template <class T, class U> void MutableVertexPartition::set_from_coarse_partition(T const& coarse_partition_membership, U const& coarse_node)
 {
   // Read the coarser partition
   for (size_t v = 0; v < this->graph->vcount(); v++)
@@ -801,77 +978,291 @@ void MutableVertexPartition::from_partition(MutableVertexPartition* partition)
   this->init_admin();
 }
 
-void MutableVertexPartition::cache_neigh_communities(size_t v, igraph_neimode_t mode)
+/****************************************************************************
+ Update this partition to another partition of the same graph, which differs
+ only in the membership of the given nodes. The membership of these nodes and
+ the administration of the given communities are copied from the other
+ partition, so the communities should include all communities from and to
+ which the nodes were moved. This takes time proportional to the number of
+ nodes and communities, instead of the degree of the nodes when moving them.
+*****************************************************************************/
+void MutableVertexPartition::update_from_partition(MutableVertexPartition* partition, vector<size_t> const& nodes, vector<size_t> const& comms)
 {
-  // TODO: We can probably calculate at once the IN, OUT and ALL
-  // rather than this being called multiple times.
+  while (this->_n_communities < partition->_n_communities)
+    this->add_empty_community();
 
-  // Weight between vertex and community
-  #ifdef DEBUG
-    cerr << "double MutableVertexPartition::cache_neigh_communities(" << v << ", " << mode << ")." << endl;
-  #endif
-  vector<double>* _cached_weight_tofrom_community = NULL;
-  vector<size_t>* _cached_neighs_comms = NULL;
-  switch (mode)
+  for (size_t v : nodes)
+    this->_membership[v] = partition->_membership[v];
+
+  for (size_t comm : comms)
   {
-    case IGRAPH_IN:
-      _cached_weight_tofrom_community = &(this->_cached_weight_from_community);
-      _cached_neighs_comms = &(this->_cached_neigh_comms_from);
-      break;
-    case IGRAPH_OUT:
-      _cached_weight_tofrom_community = &(this->_cached_weight_to_community);
-      _cached_neighs_comms = &(this->_cached_neigh_comms_to);
-      break;
-    case IGRAPH_ALL:
-      _cached_weight_tofrom_community = &(this->_cached_weight_all_community);
-      _cached_neighs_comms = &(this->_cached_neigh_comms_all);
-      break;
+    bool was_empty = (this->_cnodes[comm] == 0);
+    this->_csize[comm] = partition->_csize[comm];
+    this->_cnodes[comm] = partition->_cnodes[comm];
+    this->_total_weight_in_comm[comm] = partition->_total_weight_in_comm[comm];
+    this->_total_weight_from_comm[comm] = partition->_total_weight_from_comm[comm];
+    this->_total_weight_to_comm[comm] = partition->_total_weight_to_comm[comm];
+
+    // Keep track of the empty communities, as in move_node
+    if (this->_cnodes[comm] == 0 && !was_empty)
+      this->_empty_communities.push_back(comm);
+    else if (this->_cnodes[comm] > 0 && was_empty)
+    {
+      vector<index_t>::reverse_iterator it_comm = this->_empty_communities.rbegin();
+      while (it_comm != this->_empty_communities.rend() && *it_comm != comm)
+        it_comm++;
+      if (it_comm != this->_empty_communities.rend())
+        this->_empty_communities.erase( (++it_comm).base() );
+    }
   }
 
-  // Reset cached communities
-  for (size_t c : *_cached_neighs_comms)
-       (*_cached_weight_tofrom_community)[c] = 0;
+  this->_total_weight_in_all_comms = partition->_total_weight_in_all_comms;
+  this->_total_possible_edges_in_all_comms = partition->_total_possible_edges_in_all_comms;
+  this->_total_weight_from_to_all_comms = partition->_total_weight_from_to_all_comms;
+  this->_total_csize_squared_all_comms = partition->_total_csize_squared_all_comms;
+  this->_admin_version++;
 
-  // Loop over all incident edges
-  vector<size_t> const& neighbours = this->graph->get_neighbours(v, mode);
-  vector<size_t> const& neighbour_edges = this->graph->get_neighbour_edges(v, mode);
+  this->invalidate_cache();
+}
 
-  size_t degree = neighbours.size();
+/****************************************************************************
+ Calculate the difference in quality of moving node v to each of the
+ communities, adding weight times the difference to improvs. By default, this
+ simply calls diff_move for each community.
+****************************************************************************/
+void MutableVertexPartition::diff_moves(size_t v, vector<size_t> const& comms, double weight, vector<double>& improvs)
+{
+  for (size_t idx = 0; idx < comms.size(); idx++)
+    improvs[idx] += weight*this->diff_move(v, comms[idx]);
+}
 
-  // Reset cached neighbours
-  _cached_neighs_comms->clear();
-  for (size_t idx = 0; idx < degree; idx++)
+void MutableVertexPartition::gather_weights_tofrom_comms(size_t v, vector<size_t> const& comms)
+{
+  // The weights to and from the communities are cached together.
+  if (this->_current_node_cache_community_to != v)
+    this->cache_neigh_communities(v, false);
+  CommunityWeights const& weight_to = this->_cached_weight_to_community;
+
+  // For undirected graphs the weight from a community equals the weight to a
+  // community (see weight_from_comm).
+  bool is_directed = this->graph->is_directed();
+  CommunityWeights const& weight_from = is_directed ? this->_cached_weight_from_community : weight_to;
+
+  size_t nb_comms = comms.size();
+  this->_comms_weight_to.resize(nb_comms);
+  this->_comms_weight_from.resize(nb_comms);
+  for (size_t idx = 0; idx < nb_comms; idx++)
   {
-    size_t u = neighbours[idx];
-    size_t e = neighbour_edges[idx];
+    size_t comm = comms[idx];
+    this->_comms_weight_to[idx] = weight_to.get(comm);
+    this->_comms_weight_from[idx] = weight_from.get(comm);
+  }
+}
 
-    // If it is an edge to the requested community
-    #ifdef DEBUG
-      size_t v_comm = this->_membership[v];
-    #endif
-    size_t comm = this->_membership[u];
-    // Get the weight of the edge
-    double w = this->graph->edge_weight(e);
-    // Self loops appear twice here if the graph is undirected, so divide by 2.0 in that case.
-    if (u == v && !this->graph->is_directed())
+void MutableVertexPartition::gather_total_weights_tofrom_comms(vector<size_t> const& comms)
+{
+  size_t nb_comms = comms.size();
+  this->_comms_total_weight_to.resize(nb_comms);
+  this->_comms_total_weight_from.resize(nb_comms);
+  for (size_t idx = 0; idx < nb_comms; idx++)
+  {
+    this->_comms_total_weight_to[idx] = this->total_weight_to_comm(comms[idx]);
+    this->_comms_total_weight_from[idx] = this->total_weight_from_comm(comms[idx]);
+  }
+}
+
+void MutableVertexPartition::gather_total_weights_in_comms(vector<size_t> const& comms)
+{
+  size_t nb_comms = comms.size();
+  this->_comms_total_weight_in.resize(nb_comms);
+  for (size_t idx = 0; idx < nb_comms; idx++)
+    this->_comms_total_weight_in[idx] = this->total_weight_in_comm(comms[idx]);
+}
+
+void MutableVertexPartition::gather_csizes(vector<size_t> const& comms)
+{
+  size_t nb_comms = comms.size();
+  size_t nb_csizes = this->_csize.size();
+  this->_comms_csize.resize(nb_comms);
+  for (size_t idx = 0; idx < nb_comms; idx++)
+    this->_comms_csize[idx] = comms[idx] < nb_csizes ? this->_csize[comms[idx]] : 0.0;
+}
+
+/****************************************************************************
+  Remove all weights, and prepare for the communities of at most
+  nb_neighbours neighbours, out of n_communities communities.
+
+  The hash table is at most half full, so that probing remains short. If
+  there are not too many communities, or if the hash table would not be
+  smaller than a dense vector of all communities, the dense vector is used
+  instead. A dense vector of more than MAX_DENSE_COMMUNITIES communities is
+  only needed for nodes of high degree, so it is released again once it is
+  much larger than necessary, for example when the next node uses the hash
+  table. Allocating it again costs no more than the neighbours of such a
+  node.
+*****************************************************************************/
+void CommunityWeights::reset(size_t nb_neighbours, size_t n_communities)
+{
+  this->clear();
+
+  size_t bits = 2;
+  if (n_communities > MAX_DENSE_COMMUNITIES)
+    while (((size_t)1 << bits) < 2*nb_neighbours)
+      bits++;
+  size_t capacity = (size_t)1 << bits;
+
+  this->_is_dense = (n_communities <= MAX_DENSE_COMMUNITIES || n_communities <= capacity);
+  if (this->_is_dense)
+  {
+    if (this->_dense_weights.size() < n_communities)
+      this->_dense_weights.resize(n_communities, 0.0);
+    else if (this->_dense_weights.size() > MAX_DENSE_COMMUNITIES &&
+             this->_dense_weights.size() > 4*n_communities)
+      vector<double>(n_communities, 0.0).swap(this->_dense_weights);
+  }
+  else
+  {
+    if (this->_dense_weights.size() > MAX_DENSE_COMMUNITIES)
+      vector<double>().swap(this->_dense_weights);
+
+    // Only the slots in use need to be emptied (see clear), so a table that
+    // is larger than necessary can be reused by using only part of it.
+    if (this->_keys.size() < capacity)
+    {
+      this->_keys.assign(capacity, (index_t) EMPTY);
+      this->_values.resize(capacity);
+    }
+    this->_mask = capacity - 1;
+    this->_shift = 64 - bits;
+  }
+}
+
+/****************************************************************************
+  Remove all weights. Any community with a nonzero weight is among the
+  neighbouring communities (see add), so only those need to be reset in the
+  dense vector.
+*****************************************************************************/
+void CommunityWeights::clear()
+{
+  if (this->_is_dense)
+  {
+    for (size_t c : this->_communities)
+      this->_dense_weights[c] = 0.0;
+  }
+  else
+  {
+    for (size_t slot : this->_used_slots)
+      this->_keys[slot] = EMPTY;
+    this->_used_slots.clear();
+  }
+  this->_communities.clear();
+}
+
+/****************************************************************************
+  Cache the weight of node v to and from each of its neighbouring
+  communities, and the neighbouring communities themselves, for IGRAPH_OUT
+  and IGRAPH_IN, and if include_all is true also for IGRAPH_ALL, in a single
+  pass over the neighbours.
+
+  For undirected graphs the mode is ignored, and the cache for IGRAPH_OUT
+  (see weight_to_comm) and IGRAPH_ALL are both filled. For directed graphs,
+  the outgoing and incoming neighbours are merged in the same order as the
+  neighbours for IGRAPH_ALL (see Graph::init_adjacency) if include_all is
+  true, so that the cache for IGRAPH_ALL is the same as when looping over
+  those neighbours. Otherwise they are simply looped over one after the
+  other, which is faster when only the weights to and from the communities
+  are needed (e.g. in diff_move).
+*****************************************************************************/
+void MutableVertexPartition::cache_neigh_communities(size_t v, bool include_all)
+{
+  #ifdef DEBUG
+    cerr << "double MutableVertexPartition::cache_neigh_communities(" << v << ", " << include_all << ")." << endl;
+  #endif
+  CommunityWeights& weight_to = this->_cached_weight_to_community;
+  CommunityWeights& weight_from = this->_cached_weight_from_community;
+  CommunityWeights& weight_all = this->_cached_weight_all_community;
+
+  // For undirected graphs the cache for IGRAPH_ALL is filled as well.
+  include_all = include_all || !this->graph->is_directed();
+
+  // Reset cached communities, of which there are at most as many as
+  // neighbours.
+  size_t nb_comms = this->_n_communities;
+  if (!this->graph->is_directed())
+  {
+    Span neighbours = this->graph->get_neighbours(v, IGRAPH_ALL);
+    Span neighbour_edges = this->graph->get_neighbour_edges(v, IGRAPH_ALL);
+    size_t degree = neighbours.size();
+    weight_to.reset(degree, nb_comms);
+    weight_all.reset(degree, nb_comms);
+    for (size_t idx = 0; idx < degree; idx++)
+    {
+      size_t u = neighbours[idx];
+      size_t comm = this->_membership[u];
+      double w = this->graph->edge_weight(neighbour_edges[idx]);
+      // Self loops appear twice here if the graph is undirected, so divide by 2.0 in that case.
+      if (u == v)
         w /= 2.0;
-    #ifdef DEBUG
-      cerr << "\t" << "Edge (" << v << "-" << u << "), Comm (" << v_comm << "-" << comm << ") weight: " << w << "." << endl;
-    #endif
-    (*_cached_weight_tofrom_community)[comm] += w;
-    // REMARK: Notice in the rare case of negative weights, being exactly equal
-    // for a certain community, that this community may then potentially be added multiple
-    // times to the _cached_neighs. However, I don' believe this causes any further issue,
-    // so that's why I leave this here as is.
-    if ((*_cached_weight_tofrom_community)[comm] != 0)
-      _cached_neighs_comms->push_back(comm);
+      #ifdef DEBUG
+        cerr << "\t" << "Edge (" << v << "-" << u << "), Comm (" << this->_membership[v] << "-" << comm << ") weight: " << w << "." << endl;
+      #endif
+      weight_to.add(comm, w);
+      weight_all.add(comm, w);
+    }
+    this->_current_node_cache_community_to = v;
+    this->_current_node_cache_community_all = v;
+  }
+  else
+  {
+    Span out_neighbours = this->graph->get_neighbours(v, IGRAPH_OUT);
+    Span out_edges = this->graph->get_neighbour_edges(v, IGRAPH_OUT);
+    Span in_neighbours = this->graph->get_neighbours(v, IGRAPH_IN);
+    Span in_edges = this->graph->get_neighbour_edges(v, IGRAPH_IN);
+    size_t j1 = out_neighbours.size(), j2 = in_neighbours.size();
+    weight_to.reset(j1, nb_comms);
+    weight_from.reset(j2, nb_comms);
+    if (include_all)
+      weight_all.reset(j1 + j2, nb_comms);
+    if (!include_all)
+    {
+      for (size_t i1 = 0; i1 < j1; i1++)
+        weight_to.add(this->_membership[out_neighbours[i1]], this->graph->edge_weight(out_edges[i1]));
+      for (size_t i2 = 0; i2 < j2; i2++)
+        weight_from.add(this->_membership[in_neighbours[i2]], this->graph->edge_weight(in_edges[i2]));
+    }
+    else
+    {
+      size_t i1 = 0, i2 = 0;
+      while (i1 < j1 || i2 < j2)
+      {
+        size_t u1 = i1 < j1 ? out_neighbours[i1] : SIZE_MAX;
+        size_t u2 = i2 < j2 ? in_neighbours[i2] : SIZE_MAX;
+        if (u1 <= u2 && i1 < j1)
+        {
+          size_t comm = this->_membership[u1];
+          double w = this->graph->edge_weight(out_edges[i1++]);
+          weight_to.add(comm, w);
+          weight_all.add(comm, w);
+        }
+        if (u2 <= u1 && i2 < j2)
+        {
+          size_t comm = this->_membership[u2];
+          double w = this->graph->edge_weight(in_edges[i2++]);
+          weight_from.add(comm, w);
+          weight_all.add(comm, w);
+        }
+      }
+      this->_current_node_cache_community_all = v;
+    }
+    this->_current_node_cache_community_to = v;
+    this->_current_node_cache_community_from = v;
   }
   #ifdef DEBUG
-    cerr << "exit Graph::cache_neigh_communities(" << v << ", " << mode << ")." << endl;
+    cerr << "exit Graph::cache_neigh_communities(" << v << ")." << endl;
   #endif
 }
 
-vector<size_t> const& MutableVertexPartition::get_neigh_comms(size_t v, igraph_neimode_t mode)
+vector<index_t> const& MutableVertexPartition::get_neigh_comms(size_t v, igraph_neimode_t mode)
 {
   if (!this->get_graph()->is_directed())
     mode = IGRAPH_ALL; // igraph ignores mode for undirected graphs
@@ -880,32 +1271,23 @@ vector<size_t> const& MutableVertexPartition::get_neigh_comms(size_t v, igraph_n
   {
     case IGRAPH_IN:
       if (this->_current_node_cache_community_from != v)
-      {
-        cache_neigh_communities(v, mode);
-        this->_current_node_cache_community_from = v;
-      }
-      return this->_cached_neigh_comms_from;
+        cache_neigh_communities(v, false);
+      return this->_cached_weight_from_community.communities();
     case IGRAPH_OUT:
       if (this->_current_node_cache_community_to != v)
-      {
-        cache_neigh_communities(v, mode);
-        this->_current_node_cache_community_to = v;
-      }
-      return this->_cached_neigh_comms_to;
+        cache_neigh_communities(v, false);
+      return this->_cached_weight_to_community.communities();
     case IGRAPH_ALL:
       if (this->_current_node_cache_community_all != v)
-      {
-        cache_neigh_communities(v, mode);
-        this->_current_node_cache_community_all = v;
-      }
-      return this->_cached_neigh_comms_all;
+        cache_neigh_communities(v, true);
+      return this->_cached_weight_all_community.communities();
   }
   throw Exception("Problem obtaining neighbour communities, invalid mode.");
 }
 
 // Get communities for all neighbours, even if they appear multiple times.
 // Only consider neighours that are in the same constrained community.
-vector<size_t> MutableVertexPartition::get_neigh_comms(size_t v, igraph_neimode_t mode, vector<size_t> const& constrained_membership)
+vector<size_t> MutableVertexPartition::get_neigh_comms(size_t v, igraph_neimode_t mode, vector<index_t> const& constrained_membership)
 {
   vector<size_t> neigh_comms;
   for (size_t u : this->graph->get_neighbours(v, mode))
@@ -1,5 +1,10 @@
 #include "Optimiser.h"
 
+static inline double seconds_since(std::chrono::steady_clock::time_point start)
+{
+  return std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+}
+
 /****************************************************************************
   Create a new Optimiser object
 
@@ -29,6 +34,14 @@ Optimiser::Optimiser()
   this->refine_partition = true;
   this->consider_empty_community = true;
   this->max_comm_size = 0;
+  this->n_threads = 1;
+  this->nb_nodes_visited = 0;
+  this->nb_nodes_requeued = 0;
+  this->nb_nodes_moved = 0;
+  this->cancelled = false;
+  this->progress_level = 0;
+  this->progress_improvement = 0.0;
+  this->has_deadline = false;
 
   igraph_rng_init(&rng, &igraph_rngtype_mt19937);
   igraph_rng_seed(&rng, time(NULL));
@@ -43,6 +56,94 @@ void Optimiser::print_settings()
 {
   cerr << "Consider communities method:\t" << this->consider_comms << endl;
   cerr << "Refine partition:\t" << this->refine_partition << endl;
+  cerr << "Number of threads:\t" << this->n_threads << endl;
+}
+
+/*****************************************************************************
+  Number of threads to use, where 0 indicates to use all available cores.
+*****************************************************************************/
+size_t Optimiser::get_n_threads()
+{
+  if (this->n_threads > 0)
+    return this->n_threads;
+  size_t nb_cores = std::thread::hardware_concurrency();
+  return nb_cores > 0 ? nb_cores : 1;
+}
+
+void Optimiser::set_time_limit(double time_limit)
+{
+  this->has_deadline = (time_limit >= 0);
+  if (this->has_deadline)
+    this->deadline = std::chrono::steady_clock::now() +
+      std::chrono::duration_cast<std::chrono::steady_clock::duration>(std::chrono::duration<double>(time_limit));
+}
+
+/*****************************************************************************
+  Call the progress callback (if any), and return whether the optimisation
+  should be stopped, either because the callback requested it or because the
+  time limit has passed. The improvement is relative to the start of the
+  current level, the improvement of previous levels is added.
+*****************************************************************************/
+bool Optimiser::report_progress(size_t nodes_visited, size_t queue_size, size_t n_communities, double improvement)
+{
+  if (this->deadline_passed())
+  {
+    this->cancelled = true;
+    return true;
+  }
+
+  if (!this->progress_callback)
+    return false;
+
+  OptimiserProgress progress;
+  progress.level = this->progress_level;
+  progress.nodes_visited = nodes_visited;
+  progress.queue_size = queue_size;
+  progress.n_communities = n_communities;
+  progress.improvement = this->progress_improvement + improvement;
+  this->cancelled = this->progress_callback(progress);
+  return this->cancelled;
+}
+
+/*****************************************************************************
+  Determine for each node the layers in which it is active, i.e. in which it
+  has any incident edges or a non-zero node size. Moving a node does not
+  change the quality of a layer in which it is not active, so that these
+  layers can be skipped when considering moves. For a single layer nothing
+  is skipped, and an empty vector is returned.
+*****************************************************************************/
+vector< vector<size_t> > Optimiser::get_active_layers(vector<Graph*> const& graphs)
+{
+  size_t nb_layers = graphs.size();
+  vector< vector<size_t> > active_layers;
+  if (nb_layers <= 1)
+    return active_layers;
+
+  size_t n = graphs[0]->vcount();
+  active_layers.resize(n);
+  for (size_t v = 0; v < n; v++)
+    for (size_t layer = 0; layer < nb_layers; layer++)
+      if (graphs[layer]->degree(v, IGRAPH_ALL) > 0 || graphs[layer]->node_size(v) != 0)
+        active_layers[v].push_back(layer);
+  return active_layers;
+}
+
+/*****************************************************************************
+  Calculate the improvement of moving node v to each of the communities in
+  comms, summed over the given layers. The layers are considered one at a
+  time, and the improvements of all communities are calculated in a single
+  call to diff_moves for each layer, so that the neighbour communities cached
+  for a layer are used for all communities at once.
+*****************************************************************************/
+void Optimiser::diff_move_layers(vector<MutableVertexPartition*> const& partitions, vector<double> const& layer_weights, vector<size_t> const& layers, size_t v, vector<size_t> const& comms, vector<double>& improvs)
+{
+  improvs.assign(comms.size(), 0.0);
+  for (size_t layer : layers)
+  {
+    MutableVertexPartition* partition = partitions[layer];
+    // Make sure to multiply it by the weight per layer
+    partition->diff_moves(v, comms, layer_weights[layer], improvs);
+  }
 }
 
 /*****************************************************************************
@@ -142,8 +243,18 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
   bool aggregate_further = true;
   // As long as there remains improvement iterate
   double improv = 0.0;
+  this->last_run_stats.clear();
+  this->cancelled = false;
   do
   {
+    OptimiserLevelStats stats = OptimiserLevelStats();
+    stats.n_communities_before = collapsed_partitions[0]->n_communities();
+    this->nb_nodes_visited = 0;
+    this->nb_nodes_requeued = 0;
+    this->nb_nodes_moved = 0;
+    this->progress_level = this->last_run_stats.size();
+    this->progress_improvement = improv;
+    std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
 
     // Optimise partition for collapsed graph
     #ifdef DEBUG
@@ -153,10 +264,17 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
       cerr << "Quality before moving " <<  q << endl;
     #endif
     if (this->optimise_routine == Optimiser::MOVE_NODES)
-      improv += this->move_nodes(collapsed_partitions, layer_weights, is_collapsed_membership_fixed, this->consider_comms, this->consider_empty_community, false, max_comm_size);
+      stats.improvement = this->move_nodes(collapsed_partitions, layer_weights, is_collapsed_membership_fixed, this->consider_comms, this->consider_empty_community, false, max_comm_size);
 
     else if (this->optimise_routine == Optimiser::MERGE_NODES)
-      improv += this->merge_nodes(collapsed_partitions, layer_weights, is_collapsed_membership_fixed, this->consider_comms, false, max_comm_size);
+      stats.improvement = this->merge_nodes(collapsed_partitions, layer_weights, is_collapsed_membership_fixed, this->consider_comms, false, max_comm_size);
+    improv += stats.improvement;
+
+    stats.move_nodes_time = seconds_since(start);
+    stats.nodes_visited = this->nb_nodes_visited;
+    stats.nodes_requeued = this->nb_nodes_requeued;
+    stats.nodes_moved = this->nb_nodes_moved;
+    stats.n_communities_after = collapsed_partitions[0]->n_communities();
 
     #ifdef DEBUG
       cerr << "Found " << collapsed_partitions[0]->n_communities() << " communities, improved " << improv << endl;
@@ -168,6 +286,7 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
 
     // Make sure improvement on coarser scale is reflected on the
     // scale of the graph as a whole.
+    start = std::chrono::steady_clock::now();
     for (size_t layer = 0; layer < nb_layers; layer++)
     {
       if (collapsed_partitions[layer] != partitions[layer])
@@ -178,6 +297,15 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
           partitions[layer]->from_coarse_partition(collapsed_partitions[layer]);
       }
     }
+    stats.from_coarse_partition_time = seconds_since(start);
+
+    // Stop when requested by the progress callback, after the moves have been
+    // reflected in the partitions.
+    if (this->cancelled)
+    {
+      this->last_run_stats.push_back(stats);
+      break;
+    }
 
     #ifdef DEBUG
       q = 0.0;
@@ -207,6 +335,7 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
       #ifdef DEBUG
         cerr << "\tBefore SLM " << collapsed_partitions[0]->n_communities() << " communities." << endl;
       #endif
+      start = std::chrono::steady_clock::now();
       for (size_t layer = 0; layer < nb_layers; layer++)
       {
         sub_collapsed_partitions[layer] = collapsed_partitions[layer]->create(collapsed_graphs[layer]);
@@ -216,14 +345,30 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
       #ifdef DEBUG
         cerr << "\tStarting refinement with " << sub_collapsed_partitions[0]->n_communities() << " communities." << endl;
       #endif
-      if (this->refine_routine == Optimiser::MOVE_NODES)
+      size_t nb_threads = this->get_n_threads();
+      if (nb_threads > 1)
+        this->refine_partition_parallel(sub_collapsed_partitions, layer_weights, collapsed_partitions[0], max_comm_size, nb_threads);
+      else if (this->refine_routine == Optimiser::MOVE_NODES)
         this->move_nodes_constrained(sub_collapsed_partitions, layer_weights, refine_consider_comms, collapsed_partitions[0], max_comm_size);
       else if (this->refine_routine == Optimiser::MERGE_NODES)
         this->merge_nodes_constrained(sub_collapsed_partitions, layer_weights, refine_consider_comms, collapsed_partitions[0], max_comm_size);
+      stats.refine_time = seconds_since(start);
       #ifdef DEBUG
         cerr << "\tAfter applying refinement found " << sub_collapsed_partitions[0]->n_communities() << " communities." << endl;
       #endif
 
+      // Stop if the time limit has passed, in which case the refinement may
+      // have stopped early, without aggregating the graph. The moves have
+      // already been reflected in the partitions.
+      if (this->deadline_passed())
+      {
+        this->cancelled = true;
+        for (size_t layer = 0; layer < nb_layers; layer++)
+          delete sub_collapsed_partitions[layer];
+        this->last_run_stats.push_back(stats);
+        break;
+      }
+
       // Determine new aggregate node per individual node
       for (size_t v = 0; v < n; v++)
       {
@@ -232,10 +377,12 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
       }
 
       // Collapse graph based on sub collapsed partition
+      start = std::chrono::steady_clock::now();
       for (size_t layer = 0; layer < nb_layers; layer++)
       {
         new_collapsed_graphs[layer] = collapsed_graphs[layer]->collapse_graph(sub_collapsed_partitions[layer]);
       }
+      stats.collapse_graph_time = seconds_since(start);
 
       // Determine the membership for the collapsed graph
       vector<size_t> new_collapsed_membership(new_collapsed_graphs[0]->vcount());
@@ -258,13 +405,6 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
         #endif // DEBUG
       }
 
-      // Determine which collapsed nodes are fixed
-      is_collapsed_membership_fixed.clear();
-      is_collapsed_membership_fixed.resize(new_collapsed_graphs[0]->vcount(), false);
-      for (size_t v = 0; v < n; v++)
-        if (is_membership_fixed[v])
-          is_collapsed_membership_fixed[aggregate_node_per_individual_node[v]] = true;
-
       // Create new collapsed partition
       for (size_t layer = 0; layer < nb_layers; layer++)
       {
@@ -274,9 +414,18 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
     }
     else
     {
+      // Determine new aggregate node per individual node
+      for (size_t v = 0; v < n; v++)
+      {
+        size_t aggregate_node = aggregate_node_per_individual_node[v];
+        aggregate_node_per_individual_node[v] = collapsed_partitions[0]->membership(aggregate_node);
+      }
+
       for (size_t layer = 0; layer < nb_layers; layer++)
       {
+        start = std::chrono::steady_clock::now();
         new_collapsed_graphs[layer] = collapsed_graphs[layer]->collapse_graph(collapsed_partitions[layer]);
+        stats.collapse_graph_time += seconds_since(start);
         // Create collapsed partition (i.e. default partition of each node in its own community).
         new_collapsed_partitions[layer] = collapsed_partitions[layer]->create(new_collapsed_graphs[layer]);
         #ifdef DEBUG
@@ -287,6 +436,17 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
       }
     }
 
+    stats.collapsed_vcount = new_collapsed_graphs[0]->vcount();
+    stats.collapsed_ecount = new_collapsed_graphs[0]->ecount();
+    this->last_run_stats.push_back(stats);
+
+    // Determine which collapsed nodes are fixed
+    is_collapsed_membership_fixed.clear();
+    is_collapsed_membership_fixed.resize(new_collapsed_graphs[0]->vcount(), false);
+    for (size_t v = 0; v < n; v++)
+      if (is_membership_fixed[v])
+        is_collapsed_membership_fixed[aggregate_node_per_individual_node[v]] = true;
+
     // Determine whether to aggregate further
     // If all is fixed, no need to aggregate
     aggregate_further = false;
@@ -346,6 +506,8 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
     #endif // DEBUG
 
   } while (aggregate_further);
+  this->progress_level = 0;
+  this->progress_improvement = 0.0;
 
   // Clean up memory after use.
   for (size_t layer = 0; layer < nb_layers; layer++)
@@ -363,7 +525,7 @@ double Optimiser::optimise_partition(vector<MutableVertexPartition*> partitions,
   q = 0.0;
   partitions[0]->renumber_communities();
   partitions[0]->renumber_communities(fixed_nodes, fixed_membership);
-  vector<size_t> const& membership = partitions[0]->membership();
+  vector<size_t> const& membership = as_size_t_vector(partitions[0]->membership());
   // We only renumber the communities for the first graph,
   // since the communities for the other graphs should just be equal
   // to the membership of the first graph.
@@ -406,6 +568,14 @@ double Optimiser::move_nodes(MutableVertexPartition* partition, vector<bool> con
   return this->move_nodes(partitions, layer_weights, is_membership_fixed, consider_comms, this->consider_empty_community, renumber_fixed_nodes, max_comm_size);
 }
 
+double Optimiser::move_nodes(MutableVertexPartition* partition, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes, size_t max_comm_size, vector<size_t> const& nodes)
+{
+  vector<MutableVertexPartition*> partitions(1);
+  partitions[0] = partition;
+  vector<double> layer_weights(1, 1.0);
+  return this->move_nodes(partitions, layer_weights, is_membership_fixed, consider_comms, this->consider_empty_community, renumber_fixed_nodes, max_comm_size, nodes);
+}
+
 double Optimiser::merge_nodes(MutableVertexPartition* partition)
 {
   return this->merge_nodes(partition, this->consider_comms);
@@ -496,8 +666,28 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
 
 double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community, bool renumber_fixed_nodes, size_t max_comm_size)
 {
+  // Consider all nodes
+  vector<size_t> nodes;
+  if (!partitions.empty())
+    nodes = range(partitions[0]->get_graph()->vcount());
+  return this->move_nodes(partitions, layer_weights, is_membership_fixed, consider_comms, consider_empty_community, renumber_fixed_nodes, max_comm_size, nodes);
+}
+
+/*****************************************************************************
+  Move nodes, initially only considering the specified nodes. Other nodes are
+  only considered once a neighbour has moved, so that the time this takes is
+  proportional to the part of the partition that changes, for example after
+  updating a few edges (see MutableVertexPartition::update_edges).
+******************************************************************************/
+double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community, bool renumber_fixed_nodes, size_t max_comm_size, vector<size_t> const& nodes)
+{
+  this->cancelled = false;
+  size_t nb_threads = this->get_n_threads();
+  if (nb_threads > 1)
+    return this->move_nodes_parallel(partitions, layer_weights, is_membership_fixed, consider_comms, consider_empty_community, renumber_fixed_nodes, max_comm_size, nodes, nb_threads);
+
   #ifdef DEBUG
-    cerr << "double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community, bool renumber_fixed_nodes, size_t max_comm_size)" << endl;
+    cerr << "double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community, bool renumber_fixed_nodes, size_t max_comm_size, vector<size_t> const& nodes)" << endl;
   #endif
   // Number of multiplex layers
   size_t nb_layers = partitions.size();
@@ -530,22 +720,30 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
       throw Exception("Number of nodes are not equal for all graphs.");
   // Number of moved nodes during one loop
   size_t nb_moves = 0;
+  // Number of visited and requeued nodes
+  size_t nb_visited = 0;
+  size_t nb_requeued = 0;
 
-  // Fixed nodes are also stable nodes
-  vector<bool> is_node_stable(is_membership_fixed);
+  // Only the nodes in the queue are unstable initially, fixed nodes are
+  // always stable
+  vector<bool> is_node_stable(n, true);
 
   // Establish vertex order
   // We normally initialize the normal vertex order
   // of considering node 0,1,...
   // But if we use a random order, we shuffle this order.
   // Also, we skip fixed nodes from the queue for efficiency reasons
-  vector<size_t> nodes;
-  for (size_t v = 0; v != is_membership_fixed.size(); v++) {
-    if (!is_membership_fixed[v])
-      nodes.push_back(v);
+  vector<size_t> unstable_nodes;
+  for (size_t v : nodes) {
+    if (v >= n)
+      throw Exception("Node to move is not in the graph.");
+    if (!is_membership_fixed[v] && is_node_stable[v]) {
+      unstable_nodes.push_back(v);
+      is_node_stable[v] = false;
+    }
   }
-  shuffle(nodes, &rng);
-  deque<size_t> vertex_order(nodes.begin(), nodes.end());
+  shuffle(unstable_nodes, &rng);
+  deque<size_t> vertex_order(unstable_nodes.begin(), unstable_nodes.end());
 
   // Initialize the degree vector
   // If we want to debug the function, we will calculate some additional values.
@@ -557,14 +755,34 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
 
   vector<bool> comm_added(partitions[0]->n_communities(), false);
   vector<size_t> comms;
+  vector<double> improvs;
+
+  // Only consider the layers in which a node is active
+  vector<size_t> const all_layers = range(nb_layers);
+  vector< vector<size_t> > const active_layers = this->get_active_layers(graphs);
 
   // As long as the queue is not empty
   while(!vertex_order.empty())
   {
+    // The time limit is checked more often than the progress is reported,
+    // since visiting a node of an aggregate graph may take long.
+    if (nb_visited % PROGRESS_INTERVAL == 0)
+    {
+      if (this->report_progress(nb_visited, vertex_order.size(), partitions[0]->n_nonempty_communities(), total_improv))
+        break;
+    }
+    else if (nb_visited % DEADLINE_INTERVAL == 0 && this->deadline_passed())
+    {
+      this->cancelled = true;
+      break;
+    }
+
     size_t v = vertex_order.front(); vertex_order.pop_front();
+    nb_visited += 1;
 
     // What is the current community of the node (this should be the same for all layers)
     size_t v_comm = partitions[0]->membership(v);
+    vector<size_t> const& v_layers = active_layers.empty() ? all_layers : active_layers[v];
 
     if (consider_comms == ALL_COMMS)
     {
@@ -585,7 +803,7 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
     else if (consider_comms == ALL_NEIGH_COMMS)
     {
       /****************************ALL NEIGH COMMS*****************************/
-      for (size_t layer = 0; layer < nb_layers; layer++)
+      for (size_t layer : v_layers)
       {
         for (size_t comm : partitions[layer]->get_neigh_comms(v, IGRAPH_ALL))
         {
@@ -647,6 +865,7 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
     size_t max_comm = v_comm;
     double max_improv = (0 < max_comm_size && max_comm_size < partitions[0]->csize(v_comm)) ? -INFINITY : 10*DBL_EPSILON;
     double v_size = graphs[0]->node_size(v);
+    size_t nb_comms = 0;
     for (size_t comm : comms)
     {
       // reset comm_added to all false
@@ -656,20 +875,19 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
       if (0 < max_comm_size && max_comm_size < partitions[0]->csize(comm) + v_size) {
         continue;
       }
+      comms[nb_comms++] = comm;
+    }
+    comms.resize(nb_comms);
 
-      double possible_improv = 0.0;
-
-      // Consider the improvement of moving to a community for all layers
-      for (size_t layer = 0; layer < nb_layers; layer++)
-      {
-        // Make sure to multiply it by the weight per layer
-        possible_improv += layer_weights[layer]*partitions[layer]->diff_move(v, comm);
-      }
+    // Consider the improvement of moving to a community for all layers
+    this->diff_move_layers(partitions, layer_weights, v_layers, v, comms, improvs);
 
-      if (possible_improv > max_improv)
+    for (size_t idx = 0; idx < nb_comms; idx++)
+    {
+      if (improvs[idx] > max_improv)
       {
-        max_comm = comm;
-        max_improv = possible_improv;
+        max_comm = comms[idx];
+        max_improv = improvs[idx];
       }
     }
 
@@ -722,9 +940,9 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
         #endif
 
         // Mark neighbours as unstable (if not in new community and not fixed)
-        for (Graph* graph : graphs)
+        for (size_t layer : v_layers)
         {
-          for (size_t u : graph->get_neighbours(v, IGRAPH_ALL))
+          for (size_t u : graphs[layer]->get_neighbours(v, IGRAPH_ALL))
           {
             // If the neighbour was stable and is not in the new community, we
             // should mark it as unstable, and add it to the queue, skipping
@@ -732,6 +950,7 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
             if (is_node_stable[u] && partitions[0]->membership(u) != max_comm && !is_membership_fixed[u])
             {
               vertex_order.push_back(u);
+              nb_requeued += 1;
               is_node_stable[u] = false;
             }
           }
@@ -741,10 +960,14 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
       }
   }
 
+  this->nb_nodes_visited += nb_visited;
+  this->nb_nodes_requeued += nb_requeued;
+  this->nb_nodes_moved += nb_moves;
+
   partitions[0]->renumber_communities();
   if (renumber_fixed_nodes)
     partitions[0]->renumber_communities(fixed_nodes, fixed_membership);
-  vector<size_t> const& membership = partitions[0]->membership();
+  vector<size_t> const& membership = as_size_t_vector(partitions[0]->membership());
   for (size_t layer = 1; layer < nb_layers; layer++)
   {
     partitions[layer]->set_membership(membership);
@@ -755,27 +978,34 @@ double Optimiser::move_nodes(vector<MutableVertexPartition*> partitions, vector<
   return total_improv;
 }
 
-double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, bool renumber_fixed_nodes)
-{
-  return this->merge_nodes(partitions, layer_weights, is_membership_fixed, this->consider_comms, renumber_fixed_nodes);
-}
-
-double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes)
-{
-  return this->merge_nodes(partitions, layer_weights, is_membership_fixed, consider_comms, renumber_fixed_nodes, this->max_comm_size);
-}
+/*****************************************************************************
+  Move nodes using multiple threads.
+
+  Nodes are taken from the queue in batches. The best community of all nodes
+  in a batch is determined simultaneously by different threads, based on the
+  partition at the start of the batch. The threads are started once, and
+  each thread uses its own copy of the partitions, which is kept up to date by
+  copying the changed nodes and communities from the partitions at the start
+  of each batch. The proposed moves are then carried out in the order of the
+  queue. The improvement of a move is only calculated again if the node or
+  the communities involved changed by an earlier move in the batch, so that
+  each move still improves the quality function.
+
+  The result therefore only depends on the random number generator, and not on
+  the number of threads (as long as there is more than one thread), although
+  it may differ from moving nodes using a single thread.
 
-double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes, size_t max_comm_size)
+  Parameters:
+    partitions -- The partitions to optimise.
+    layer_weights -- The weights used for the different layers.
+    nb_threads -- The number of threads to use.
+******************************************************************************/
+double Optimiser::move_nodes_parallel(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, int consider_empty_community, bool renumber_fixed_nodes, size_t max_comm_size, vector<size_t> const& nodes, size_t nb_threads)
 {
-  #ifdef DEBUG
-    cerr << "double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes, size_t max_comm)" << std::endl;
-  #endif
-
   // Number of multiplex layers
   size_t nb_layers = partitions.size();
   if (nb_layers == 0)
     return -1.0;
-
   // Get graphs
   vector<Graph*> graphs(nb_layers);
   for (size_t layer = 0; layer < nb_layers; layer++)
@@ -783,6 +1013,10 @@ double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector
   // Number of nodes in the graph
   size_t n = graphs[0]->vcount();
 
+  for (Graph* graph : graphs)
+    if (graph->vcount() != n)
+      throw Exception("Number of nodes are not equal for all graphs.");
+
   // Get the fixed membership for fixed nodes
   vector<size_t> fixed_nodes;
   vector<size_t> fixed_membership(n);
@@ -795,152 +1029,646 @@ double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector
     }
   }
 
-  // Total improvement while merging nodes
+  // Total improvement while moving nodes
   double total_improv = 0.0;
-
-  for (Graph* graph : graphs)
-    if (graph->vcount() != n)
-      throw Exception("Number of nodes are not equal for all graphs.");
-
-  // Establish vertex order, skipping fixed nodes
-  // We normally initialize the normal vertex order
-  // of considering node 0,1,...
-  vector<size_t> vertex_order;
-  for (size_t v = 0; v != n; v++)
-    if (!is_membership_fixed[v])
-      vertex_order.push_back(v);
-
-  // But if we use a random order, we shuffle this order.
-  shuffle(vertex_order, &rng);
-
-  vector<bool> comm_added(partitions[0]->n_communities(), false);
-  vector<size_t> comms;
-
-  // Iterate over all nodes
-  for (size_t v : vertex_order)
+  // Number of visited, requeued and moved nodes
+  size_t nb_visited = 0;
+  size_t nb_requeued = 0;
+  size_t nb_moves = 0;
+  size_t next_progress = 0;
+
+  // Only the nodes in the queue are unstable initially, fixed nodes are
+  // always stable
+  vector<bool> is_node_stable(n, true);
+
+  // Establish (random) vertex order, skipping fixed nodes
+  vector<size_t> unstable_nodes;
+  for (size_t v : nodes) {
+    if (v >= n)
+      throw Exception("Node to move is not in the graph.");
+    if (!is_membership_fixed[v] && is_node_stable[v]) {
+      unstable_nodes.push_back(v);
+      is_node_stable[v] = false;
+    }
+  }
+  shuffle(unstable_nodes, &rng);
+  deque<size_t> vertex_order(unstable_nodes.begin(), unstable_nodes.end());
+
+  // Each thread uses its own copy of the partitions, since determining the
+  // best community changes the cached weights of a partition.
+  vector< vector<MutableVertexPartition*> > thread_partitions(nb_threads, vector<MutableVertexPartition*>(nb_layers, NULL));
+  vector< vector<bool> > thread_comm_added(nb_threads);
+  vector< vector<size_t> > thread_comms(nb_threads);
+  vector< vector<double> > thread_improvs(nb_threads);
+
+  // Only consider the layers in which a node is active
+  vector<size_t> const all_layers = range(nb_layers);
+  vector< vector<size_t> > const active_layers = this->get_active_layers(graphs);
+  vector<std::exception_ptr> thread_exceptions(nb_threads);
+
+  // The improvement of a proposed move only needs to be calculated again if
+  // it depends on all communities, or if the node or the communities
+  // involved changed by an earlier move in the batch.
+  bool has_local_diff_move = true;
+  for (MutableVertexPartition* partition : partitions)
+    has_local_diff_move = has_local_diff_move && partition->has_local_diff_move();
+
+  vector<size_t> batch;
+  size_t batch_size = 0;
+  vector<size_t> rand_comms(PARALLEL_BATCH_SIZE, n);
+  vector<size_t> proposed_comms(PARALLEL_BATCH_SIZE, n);
+  vector<double> proposed_improvs(PARALLEL_BATCH_SIZE, 0.0);
+  size_t empty_comm = n;
+  // The nodes moved and the communities changed in the current batch, with
+  // which the threads update their copy of the partitions at the start of
+  // the next batch, and the nodes of which a neighbour moved.
+  vector<size_t> moved_nodes;
+  vector<size_t> changed_comms;
+  vector<size_t> changed_nodes;
+  vector<bool> is_comm_changed(n, false);
+  vector<bool> is_node_changed(n, false);
+
+  // Determine the best community for the node at position idx in the batch
+  auto consider_node = [&](size_t thread, size_t idx)
   {
-    // What is the current community of the node (this should be the same for all layers)
-    size_t v_comm = partitions[0]->membership(v);
-    // Clear comms
-    for (size_t comm : comms)
-      comm_added[comm] = false;
-    comms.clear();
+    vector<MutableVertexPartition*>& thread_partition = thread_partitions[thread];
+    vector<bool>& comm_added = thread_comm_added[thread];
+    vector<size_t>& comms = thread_comms[thread];
+    vector<double>& improvs = thread_improvs[thread];
 
-    #ifdef DEBUG
-      cerr << "Consider moving node " << v << " from " << v_comm << "." << endl;
-    #endif
+    size_t v = batch[idx];
+    size_t v_comm = thread_partition[0]->membership(v);
+    vector<size_t> const& v_layers = active_layers.empty() ? all_layers : active_layers[v];
 
-    if (partitions[0]->cnodes(v_comm) == 1)
+    if (consider_comms == ALL_COMMS)
     {
-      if (consider_comms == ALL_COMMS)
-      {
-        for(size_t comm = 0; comm < partitions[0]->n_communities(); comm++)
-        {
-          for (size_t layer = 0; layer < nb_layers; layer++)
-          {
-            if (partitions[layer]->cnodes(comm) > 0 && !comm_added[comm])
-            {
-              comms.push_back(comm);
-              comm_added[comm] = true;
-              break; // Break from for loop in layer
-            }
-          }
-
-        }
-      }
-      else if (consider_comms == ALL_NEIGH_COMMS)
+      for(size_t comm = 0; comm < thread_partition[0]->n_communities(); comm++)
       {
-        /****************************ALL NEIGH COMMS*****************************/
         for (size_t layer = 0; layer < nb_layers; layer++)
         {
-          for (size_t comm : partitions[layer]->get_neigh_comms(v, IGRAPH_ALL))
+          if (thread_partition[layer]->cnodes(comm) > 0 && !comm_added[comm])
           {
-            if (!comm_added[comm])
-            {
-                comms.push_back(comm);
-                comm_added[comm] = true;
-            }
+            comms.push_back(comm);
+            comm_added[comm] = true;
+            break; // Break from for loop in layer
           }
         }
       }
-      else if (consider_comms == RAND_COMM)
-      {
-        /****************************RAND COMM***********************************/
-        size_t rand_comm = partitions[0]->membership(graphs[0]->get_random_node(&rng));
-        // No need to check if random_comm is already added, we only add one comm
-        comms.push_back(rand_comm);
-        comm_added[rand_comm] = true;
-      }
-      else if (consider_comms == RAND_NEIGH_COMM)
+    }
+    else if (consider_comms == ALL_NEIGH_COMMS)
+    {
+      for (size_t layer : v_layers)
       {
-        /****************************RAND NEIGH COMM*****************************/
-        size_t rand_layer = get_random_int(0, nb_layers - 1, &rng);
-        size_t k = graphs[rand_layer]->degree(v, IGRAPH_ALL);
-        if (k > 0)
+        for (size_t comm : thread_partition[layer]->get_neigh_comms(v, IGRAPH_ALL))
         {
-          // Make sure there is also a probability not to move the node
-          if (get_random_int(0, k, &rng) > 0)
+          if (!comm_added[comm])
           {
-            size_t rand_comm = partitions[0]->membership(graphs[rand_layer]->get_random_neighbour(v, IGRAPH_ALL, &rng));
-            // No need to check if random_comm is already added, we only add one comm
-            comms.push_back(rand_comm);
-            comm_added[rand_comm] = true;
+            comms.push_back(comm);
+            comm_added[comm] = true;
           }
         }
       }
+    }
+    else if (rand_comms[idx] < n)
+    {
+      // The random community was already drawn before
+      comms.push_back(rand_comms[idx]);
+      comm_added[rand_comms[idx]] = true;
+    }
 
-      #ifdef DEBUG
-        cerr << "Consider " << comms.size() << " communities for moving node " << v << "." << endl;
-      #endif
-
-      size_t max_comm = v_comm;
-      double max_improv = (0 < max_comm_size && max_comm_size < partitions[0]->csize(v_comm)) ? -INFINITY : 0;
-      double v_size = graphs[0]->node_size(v);
-      for (size_t comm : comms)
-      {
-        // Do not create too-large communities.
-        if (0 < max_comm_size && max_comm_size < partitions[0]->csize(comm) + v_size) {
-          continue;
-        }
-
-        double possible_improv = 0.0;
+    // Check if we should move to an empty community
+    if (empty_comm < n && thread_partition[0]->cnodes(v_comm) > 1 && !comm_added[empty_comm])
+    {
+      comms.push_back(empty_comm);
+      comm_added[empty_comm] = true;
+    }
 
-        // Consider the improvement of moving to a community for all layers
-        for (size_t layer = 0; layer < nb_layers; layer++)
-        {
-          // Make sure to multiply it by the weight per layer
-          possible_improv += layer_weights[layer]*partitions[layer]->diff_move(v, comm);
-        }
-        #ifdef DEBUG
-          cerr << "Improvement of " << possible_improv << " when move to " << comm << "." << endl;
-        #endif
+    size_t max_comm = v_comm;
+    double max_improv = (0 < max_comm_size && max_comm_size < thread_partition[0]->csize(v_comm)) ? -INFINITY : 10*DBL_EPSILON;
+    double v_size = graphs[0]->node_size(v);
+    size_t nb_comms = 0;
+    for (size_t comm : comms)
+    {
+      // reset comm_added to all false
+      comm_added[comm] = false;
 
-        if (possible_improv >= max_improv)
-        {
-          max_comm = comm;
-          max_improv = possible_improv;
-        }
+      // Do not create too-large communities.
+      if (0 < max_comm_size && max_comm_size < thread_partition[0]->csize(comm) + v_size) {
+        continue;
       }
+      comms[nb_comms++] = comm;
+    }
+    comms.resize(nb_comms);
 
-      // If we actually plan to move the node
-      if (max_comm != v_comm)
+    // Consider the improvement of moving to a community for all layers
+    this->diff_move_layers(thread_partition, layer_weights, v_layers, v, comms, improvs);
+
+    for (size_t idx_comm = 0; idx_comm < nb_comms; idx_comm++)
+    {
+      if (improvs[idx_comm] > max_improv)
       {
-          // Keep track of improvement
-          total_improv += max_improv;
+        max_comm = comms[idx_comm];
+        max_improv = improvs[idx_comm];
+      }
+    }
+    comms.clear();
 
-          #ifdef DEBUG
-            // If we are debugging, calculate quality function
-            double q_improv = 0;
-          #endif
+    proposed_comms[idx] = max_comm;
+    proposed_improvs[idx] = max_improv;
+  };
 
-          for (size_t layer = 0; layer < nb_layers; layer++)
-          {
-            MutableVertexPartition* partition = partitions[layer];
+  // Threads take the nodes of the batch in chunks of this size, so that the
+  // work is balanced between the threads. Which thread considers which node
+  // does not affect the result, since all copies of the partitions are equal.
+  size_t const chunk_size = 16;
+  std::atomic<size_t> next_idx(0);
 
-            #ifdef DEBUG
-              // If we are debugging, calculate quality function
-              double q1 = partition->quality();
-            #endif
+  // Update the copy of the partitions of the thread with the moves of the
+  // previous batch, and consider the nodes of the current batch.
+  auto consider_batch = [&](size_t thread)
+  {
+    try
+    {
+      vector<MutableVertexPartition*>& thread_partition = thread_partitions[thread];
+      if (thread_partition[0] == NULL)
+      {
+        for (size_t layer = 0; layer < nb_layers; layer++)
+          thread_partition[layer] = partitions[layer]->create(graphs[layer], as_size_t_vector(partitions[layer]->membership()));
+        thread_comm_added[thread].resize(n, false);
+      }
+      else
+      {
+        for (size_t layer = 0; layer < nb_layers; layer++)
+          thread_partition[layer]->update_from_partition(partitions[layer], moved_nodes, changed_comms);
+      }
+
+      for (size_t begin = next_idx.fetch_add(chunk_size); begin < batch_size; begin = next_idx.fetch_add(chunk_size))
+      {
+        size_t end = std::min(begin + chunk_size, batch_size);
+        for (size_t idx = begin; idx < end; idx++)
+          consider_node(thread, idx);
+      }
+    }
+    catch (...)
+    {
+      thread_exceptions[thread] = std::current_exception();
+    }
+  };
+
+  // The threads are started once, and wait for each batch to start. The
+  // partitions are not changed while the threads consider the batch.
+  std::mutex batch_mutex;
+  std::condition_variable batch_started;
+  std::condition_variable batch_finished;
+  size_t batch_nb = 0;
+  size_t nb_busy_threads = 0;
+  bool stop_threads = false;
+
+  auto run_thread = [&](size_t thread)
+  {
+    size_t thread_batch_nb = 0;
+    while (true)
+    {
+      {
+        std::unique_lock<std::mutex> lock(batch_mutex);
+        batch_started.wait(lock, [&]() { return stop_threads || batch_nb != thread_batch_nb; });
+        if (stop_threads)
+          return;
+        thread_batch_nb = batch_nb;
+      }
+      consider_batch(thread);
+      {
+        std::lock_guard<std::mutex> lock(batch_mutex);
+        if (--nb_busy_threads == 0)
+          batch_finished.notify_one();
+      }
+    }
+  };
+
+  vector<std::thread> threads;
+  auto finish_threads = [&]()
+  {
+    {
+      std::lock_guard<std::mutex> lock(batch_mutex);
+      stop_threads = true;
+    }
+    batch_started.notify_all();
+    for (std::thread& thread : threads)
+      thread.join();
+    for (vector<MutableVertexPartition*>& thread_partition : thread_partitions)
+      for (MutableVertexPartition* partition : thread_partition)
+        delete partition;
+  };
+
+  try
+  {
+    for (size_t thread = 1; thread < nb_threads; thread++)
+      threads.push_back(std::thread(run_thread, thread));
+
+    // As long as the queue is not empty
+    while(!vertex_order.empty())
+    {
+      if (nb_visited >= next_progress)
+      {
+        next_progress = nb_visited + PROGRESS_INTERVAL;
+        if (this->report_progress(nb_visited, vertex_order.size(), partitions[0]->n_nonempty_communities(), total_improv))
+          break;
+      }
+      else if (this->deadline_passed())
+      {
+        this->cancelled = true;
+        break;
+      }
+
+      // Take the next batch of nodes from the queue
+      batch.clear();
+      while (!vertex_order.empty() && batch.size() < PARALLEL_BATCH_SIZE)
+      {
+        size_t v = vertex_order.front(); vertex_order.pop_front();
+        nb_visited += 1;
+        batch.push_back(v);
+        is_node_stable[v] = true;
+      }
+      batch_size = batch.size();
+
+      // Random communities are drawn beforehand, so that
+      // the result does not depend on the threads.
+      for (size_t idx = 0; idx < batch_size; idx++)
+      {
+        size_t v = batch[idx];
+        rand_comms[idx] = n;
+        if (consider_comms == RAND_COMM)
+        {
+          rand_comms[idx] = partitions[0]->membership(graphs[0]->get_random_node(&rng));
+        }
+        else if (consider_comms == RAND_NEIGH_COMM)
+        {
+          size_t rand_layer = get_random_int(0, nb_layers - 1, &rng);
+          if (graphs[rand_layer]->degree(v, IGRAPH_ALL) > 0)
+            rand_comms[idx] = partitions[0]->membership(graphs[rand_layer]->get_random_neighbour(v, IGRAPH_ALL, &rng));
+        }
+      }
+
+      // Determine an empty community, if any node in the batch may move there
+      empty_comm = n;
+      if (consider_empty_community)
+      {
+        for (size_t v : batch)
+        {
+          if (partitions[0]->cnodes(partitions[0]->membership(v)) > 1)
+          {
+            size_t n_comms = partitions[0]->n_communities();
+            empty_comm = partitions[0]->get_empty_community();
+            if (partitions[0]->n_communities() > n_comms)
+            {
+              for (size_t layer = 1; layer < nb_layers; layer++)
+                partitions[layer]->add_empty_community();
+            }
+            break;
+          }
+        }
+      }
+
+      // Consider the nodes in the batch in parallel
+      {
+        std::lock_guard<std::mutex> lock(batch_mutex);
+        next_idx = 0;
+        nb_busy_threads = threads.size();
+        batch_nb++;
+      }
+      batch_started.notify_all();
+      consider_batch(0);
+      {
+        std::unique_lock<std::mutex> lock(batch_mutex);
+        batch_finished.wait(lock, [&]() { return nb_busy_threads == 0; });
+      }
+
+      for (std::exception_ptr& exception : thread_exceptions)
+        if (exception)
+          std::rethrow_exception(exception);
+
+      // The threads have updated their copy of the partitions
+      moved_nodes.clear();
+      for (size_t comm : changed_comms)
+        is_comm_changed[comm] = false;
+      changed_comms.clear();
+      for (size_t u : changed_nodes)
+        is_node_changed[u] = false;
+      changed_nodes.clear();
+
+      // Carry out the proposed moves that still improve the quality
+      for (size_t idx = 0; idx < batch_size; idx++)
+      {
+        size_t v = batch[idx];
+        size_t v_comm = partitions[0]->membership(v);
+        size_t comm = proposed_comms[idx];
+
+        if (comm == v_comm)
+          continue;
+
+        // The empty community may have been used by another node in the batch
+        if (comm == empty_comm && partitions[0]->cnodes(comm) > 0)
+        {
+          if (partitions[0]->cnodes(v_comm) <= 1)
+            continue;
+          size_t n_comms = partitions[0]->n_communities();
+          comm = partitions[0]->get_empty_community();
+          if (partitions[0]->n_communities() > n_comms)
+          {
+            for (size_t layer = 1; layer < nb_layers; layer++)
+              partitions[layer]->add_empty_community();
+          }
+        }
+
+        // Do not create too-large communities.
+        if (0 < max_comm_size && max_comm_size < partitions[0]->csize(comm) + graphs[0]->node_size(v))
+          continue;
+
+        vector<size_t> const& v_layers = active_layers.empty() ? all_layers : active_layers[v];
+        double improv = proposed_improvs[idx];
+        if (comm != proposed_comms[idx] || is_node_changed[v] || is_comm_changed[v_comm] || is_comm_changed[comm] ||
+            (!has_local_diff_move && !moved_nodes.empty()))
+        {
+          double min_improv = (0 < max_comm_size && max_comm_size < partitions[0]->csize(v_comm)) ? -INFINITY : 10*DBL_EPSILON;
+          improv = 0.0;
+          for (size_t layer : v_layers)
+            improv += layer_weights[layer]*partitions[layer]->diff_move(v, comm);
+
+          if (improv <= min_improv)
+            continue;
+        }
+
+        total_improv += improv;
+        for (size_t layer = 0; layer < nb_layers; layer++)
+          partitions[layer]->move_node(v, comm);
+        nb_moves += 1;
+
+        moved_nodes.push_back(v);
+        for (size_t c : {v_comm, comm})
+        {
+          if (!is_comm_changed[c])
+          {
+            changed_comms.push_back(c);
+            is_comm_changed[c] = true;
+          }
+        }
+
+        // Mark neighbours as unstable (if not in new community and not fixed)
+        for (size_t layer : v_layers)
+        {
+          for (size_t u : graphs[layer]->get_neighbours(v, IGRAPH_ALL))
+          {
+            if (is_node_stable[u] && partitions[0]->membership(u) != comm && !is_membership_fixed[u])
+            {
+              vertex_order.push_back(u);
+              nb_requeued += 1;
+              is_node_stable[u] = false;
+            }
+            if (!is_node_changed[u])
+            {
+              changed_nodes.push_back(u);
+              is_node_changed[u] = true;
+            }
+          }
+        }
+      }
+    }
+  }
+  catch (...)
+  {
+    finish_threads();
+    throw;
+  }
+  finish_threads();
+
+  this->nb_nodes_visited += nb_visited;
+  this->nb_nodes_requeued += nb_requeued;
+  this->nb_nodes_moved += nb_moves;
+
+  partitions[0]->renumber_communities();
+  if (renumber_fixed_nodes)
+    partitions[0]->renumber_communities(fixed_nodes, fixed_membership);
+  vector<size_t> const& membership = as_size_t_vector(partitions[0]->membership());
+  for (size_t layer = 1; layer < nb_layers; layer++)
+  {
+    partitions[layer]->set_membership(membership);
+  }
+  return total_improv;
+}
+
+double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, bool renumber_fixed_nodes)
+{
+  return this->merge_nodes(partitions, layer_weights, is_membership_fixed, this->consider_comms, renumber_fixed_nodes);
+}
+
+double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes)
+{
+  return this->merge_nodes(partitions, layer_weights, is_membership_fixed, consider_comms, renumber_fixed_nodes, this->max_comm_size);
+}
+
+double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes, size_t max_comm_size)
+{
+  this->cancelled = false;
+  #ifdef DEBUG
+    cerr << "double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, vector<bool> const& is_membership_fixed, int consider_comms, bool renumber_fixed_nodes, size_t max_comm)" << std::endl;
+  #endif
+
+  // Number of multiplex layers
+  size_t nb_layers = partitions.size();
+  if (nb_layers == 0)
+    return -1.0;
+
+  // Get graphs
+  vector<Graph*> graphs(nb_layers);
+  for (size_t layer = 0; layer < nb_layers; layer++)
+    graphs[layer] = partitions[layer]->get_graph();
+  // Number of nodes in the graph
+  size_t n = graphs[0]->vcount();
+
+  // Get the fixed membership for fixed nodes
+  vector<size_t> fixed_nodes;
+  vector<size_t> fixed_membership(n);
+  if (renumber_fixed_nodes) {
+    for (size_t v = 0; v < n; v++) {
+      if (is_membership_fixed[v]) {
+        fixed_nodes.push_back(v);
+        fixed_membership[v] = partitions[0]->membership(v);
+      }
+    }
+  }
+
+  // Total improvement while merging nodes
+  double total_improv = 0.0;
+  // Number of visited and moved nodes
+  size_t nb_visited = 0;
+  size_t nb_moves = 0;
+
+  for (Graph* graph : graphs)
+    if (graph->vcount() != n)
+      throw Exception("Number of nodes are not equal for all graphs.");
+
+  // Establish vertex order, skipping fixed nodes
+  // We normally initialize the normal vertex order
+  // of considering node 0,1,...
+  vector<size_t> vertex_order;
+  for (size_t v = 0; v != n; v++)
+    if (!is_membership_fixed[v])
+      vertex_order.push_back(v);
+
+  // But if we use a random order, we shuffle this order.
+  shuffle(vertex_order, &rng);
+
+  vector<bool> comm_added(partitions[0]->n_communities(), false);
+  vector<size_t> comms;
+  vector<double> improvs;
+
+  // Only consider the layers in which a node is active
+  vector<size_t> const all_layers = range(nb_layers);
+  vector< vector<size_t> > const active_layers = this->get_active_layers(graphs);
+
+  // Iterate over all nodes
+  for (size_t v : vertex_order)
+  {
+    if (nb_visited % PROGRESS_INTERVAL == 0)
+    {
+      if (this->report_progress(nb_visited, vertex_order.size() - nb_visited, partitions[0]->n_nonempty_communities(), total_improv))
+        break;
+    }
+    else if (nb_visited % DEADLINE_INTERVAL == 0 && this->deadline_passed())
+    {
+      this->cancelled = true;
+      break;
+    }
+    nb_visited += 1;
+
+    // What is the current community of the node (this should be the same for all layers)
+    size_t v_comm = partitions[0]->membership(v);
+    vector<size_t> const& v_layers = active_layers.empty() ? all_layers : active_layers[v];
+    // Clear comms
+    for (size_t comm : comms)
+      comm_added[comm] = false;
+    comms.clear();
+
+    #ifdef DEBUG
+      cerr << "Consider moving node " << v << " from " << v_comm << "." << endl;
+    #endif
+
+    if (partitions[0]->cnodes(v_comm) == 1)
+    {
+      if (consider_comms == ALL_COMMS)
+      {
+        for(size_t comm = 0; comm < partitions[0]->n_communities(); comm++)
+        {
+          for (size_t layer = 0; layer < nb_layers; layer++)
+          {
+            if (partitions[layer]->cnodes(comm) > 0 && !comm_added[comm])
+            {
+              comms.push_back(comm);
+              comm_added[comm] = true;
+              break; // Break from for loop in layer
+            }
+          }
+
+        }
+      }
+      else if (consider_comms == ALL_NEIGH_COMMS)
+      {
+        /****************************ALL NEIGH COMMS*****************************/
+        for (size_t layer : v_layers)
+        {
+          for (size_t comm : partitions[layer]->get_neigh_comms(v, IGRAPH_ALL))
+          {
+            if (!comm_added[comm])
+            {
+                comms.push_back(comm);
+                comm_added[comm] = true;
+            }
+          }
+        }
+      }
+      else if (consider_comms == RAND_COMM)
+      {
+        /****************************RAND COMM***********************************/
+        size_t rand_comm = partitions[0]->membership(graphs[0]->get_random_node(&rng));
+        // No need to check if random_comm is already added, we only add one comm
+        comms.push_back(rand_comm);
+        comm_added[rand_comm] = true;
+      }
+      else if (consider_comms == RAND_NEIGH_COMM)
+      {
+        /****************************RAND NEIGH COMM*****************************/
+        size_t rand_layer = get_random_int(0, nb_layers - 1, &rng);
+        size_t k = graphs[rand_layer]->degree(v, IGRAPH_ALL);
+        if (k > 0)
+        {
+          // Make sure there is also a probability not to move the node
+          if (get_random_int(0, k, &rng) > 0)
+          {
+            size_t rand_comm = partitions[0]->membership(graphs[rand_layer]->get_random_neighbour(v, IGRAPH_ALL, &rng));
+            // No need to check if random_comm is already added, we only add one comm
+            comms.push_back(rand_comm);
+            comm_added[rand_comm] = true;
+          }
+        }
+      }
+
+      #ifdef DEBUG
+        cerr << "Consider " << comms.size() << " communities for moving node " << v << "." << endl;
+      #endif
+
+      size_t max_comm = v_comm;
+      double max_improv = (0 < max_comm_size && max_comm_size < partitions[0]->csize(v_comm)) ? -INFINITY : 0;
+      double v_size = graphs[0]->node_size(v);
+      size_t nb_comms = 0;
+      for (size_t comm : comms)
+      {
+        // reset comm_added to all false
+        comm_added[comm] = false;
+
+        // Do not create too-large communities.
+        if (0 < max_comm_size && max_comm_size < partitions[0]->csize(comm) + v_size) {
+          continue;
+        }
+        comms[nb_comms++] = comm;
+      }
+      comms.resize(nb_comms);
+
+      // Consider the improvement of moving to a community for all layers
+      this->diff_move_layers(partitions, layer_weights, v_layers, v, comms, improvs);
+
+      for (size_t idx = 0; idx < nb_comms; idx++)
+      {
+        #ifdef DEBUG
+          cerr << "Improvement of " << improvs[idx] << " when move to " << comms[idx] << "." << endl;
+        #endif
+
+        if (improvs[idx] >= max_improv)
+        {
+          max_comm = comms[idx];
+          max_improv = improvs[idx];
+        }
+      }
+
+      // If we actually plan to move the node
+      if (max_comm != v_comm)
+      {
+          // Keep track of improvement
+          total_improv += max_improv;
+          nb_moves += 1;
+
+          #ifdef DEBUG
+            // If we are debugging, calculate quality function
+            double q_improv = 0;
+          #endif
+
+          for (size_t layer = 0; layer < nb_layers; layer++)
+          {
+            MutableVertexPartition* partition = partitions[layer];
+
+            #ifdef DEBUG
+              // If we are debugging, calculate quality function
+              double q1 = partition->quality();
+            #endif
 
             // Actually move the node
             partition->move_node(v, max_comm);
@@ -968,10 +1696,13 @@ double Optimiser::merge_nodes(vector<MutableVertexPartition*> partitions, vector
       }
   }
 
+  this->nb_nodes_visited += nb_visited;
+  this->nb_nodes_moved += nb_moves;
+
   partitions[0]->renumber_communities();
   if (renumber_fixed_nodes)
     partitions[0]->renumber_communities(fixed_nodes, fixed_membership);
-  vector<size_t> const& membership = partitions[0]->membership();
+  vector<size_t> const& membership = as_size_t_vector(partitions[0]->membership());
   for (size_t layer = 1; layer < nb_layers; layer++)
   {
     partitions[layer]->set_membership(membership);
@@ -1008,40 +1739,134 @@ double Optimiser::move_nodes_constrained(vector<MutableVertexPartition*> partiti
   // Number of nodes in the graph
   size_t n = graphs[0]->vcount();
 
-  // Total improvement while moving nodes
-  double total_improv = 0.0;
-
   for (size_t layer = 0; layer < nb_layers; layer++)
     if (graphs[layer]->vcount() != n)
       throw Exception("Number of nodes are not equal for all graphs.");
-  // Number of moved nodes during one loop
-  size_t nb_moves = 0;
 
   // Establish vertex order
   // We normally initialize the normal vertex order
   // of considering node 0,1,...
-  vector<bool> is_node_stable(n, false);
   // But if we use a random order, we shuffle this order.
   vector<size_t> nodes = range(n);
   shuffle(nodes, &rng);
-  deque<size_t> vertex_order(nodes.begin(), nodes.end());
 
   vector< vector<size_t> > constrained_comms = constrained_partition->get_communities();
 
-  // Initialize the degree vector
-  // If we want to debug the function, we will calculate some additional values.
-  // In particular, the following consistencies could be checked:
-  // (1) - The difference in the quality function after a move should match
-  //       the reported difference when calling diff_move.
-  // (2) - The quality function should be exactly the same value after
-  //       aggregating/collapsing the graph.
+  // Only consider the layers in which a node is active
+  vector< vector<size_t> > const active_layers = this->get_active_layers(graphs);
+
+  vector<bool> is_node_stable(n, false);
+  vector<bool> comm_added(partitions[0]->n_communities(), false);
+
+  // Total improvement while moving nodes
+  double total_improv = this->move_nodes_constrained_subset(partitions, layer_weights, consider_comms, constrained_partition, constrained_comms, active_layers, nodes, is_node_stable, comm_added, max_comm_size, &rng);
+
+  partitions[0]->renumber_communities();
+  vector<size_t> const& membership = as_size_t_vector(partitions[0]->membership());
+  for (size_t layer = 1; layer < nb_layers; layer++)
+  {
+    partitions[layer]->set_membership(membership);
+    #ifdef DEBUG
+      cerr << "Renumbered communities for layer " << layer << " for " << partitions[layer]->n_communities() << " communities." << endl;
+    #endif //DEBUG
+  }
+  return total_improv;
+}
+
+double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, MutableVertexPartition* constrained_partition)
+{
+  return this->merge_nodes_constrained(partitions, layer_weights, this->refine_consider_comms, constrained_partition);
+}
+
+double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, int consider_comms, MutableVertexPartition* constrained_partition)
+{
+  return this->merge_nodes_constrained(partitions, layer_weights, refine_consider_comms, constrained_partition, this->max_comm_size);
+}
+
+double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, int consider_comms, MutableVertexPartition* constrained_partition, size_t max_comm_size)
+{
+  #ifdef DEBUG
+    cerr << "double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, int consider_comms, MutableVertexPartition* constrained_partition, size_t max_comm_size)" << std::endl;
+  #endif
+
+  // Number of multiplex layers
+  size_t nb_layers = partitions.size();
+  if (nb_layers == 0)
+    return -1.0;
+
+  // Get graphs
+  vector<Graph*> graphs(nb_layers);
+  for (size_t layer = 0; layer < nb_layers; layer++)
+    graphs[layer] = partitions[layer]->get_graph();
+  // Number of nodes in the graph
+  size_t n = graphs[0]->vcount();
+
+  for (size_t layer = 0; layer < nb_layers; layer++)
+    if (graphs[layer]->vcount() != n)
+      throw Exception("Number of nodes are not equal for all graphs.");
+
+  // Establish vertex order
+  // We normally initialize the normal vertex order
+  // of considering node 0,1,...
+  vector<size_t> vertex_order = range(n);
+
+  // But if we use a random order, we shuffle this order.
+  shuffle(vertex_order, &rng);
+
+  vector< vector<size_t> > constrained_comms = constrained_partition->get_communities();
+
+  // Only consider the layers in which a node is active
+  vector< vector<size_t> > const active_layers = this->get_active_layers(graphs);
 
   vector<bool> comm_added(partitions[0]->n_communities(), false);
+
+  // Total improvement while merging nodes
+  double total_improv = this->merge_nodes_constrained_subset(partitions, layer_weights, consider_comms, constrained_partition, constrained_comms, active_layers, vertex_order, comm_added, max_comm_size, &rng);
+
+  partitions[0]->renumber_communities();
+  vector<size_t> const& membership = as_size_t_vector(partitions[0]->membership());
+  for (size_t layer = 1; layer < nb_layers; layer++)
+  {
+    partitions[layer]->set_membership(membership);
+    #ifdef DEBUG
+      cerr << "Renumbered communities for layer " << layer << " for " << partitions[layer]->n_communities() << " communities." << endl;
+    #endif //DEBUG
+  }
+  return total_improv;
+}
+
+/*****************************************************************************
+  Move the nodes in the given order, where nodes are only moved to
+  communities within their constrained community. The order should only
+  contain complete constrained communities, and is_node_stable and
+  comm_added should be all false, as they are left after returning.
+******************************************************************************/
+double Optimiser::move_nodes_constrained_subset(vector<MutableVertexPartition*> const& partitions, vector<double> const& layer_weights, int consider_comms, MutableVertexPartition* constrained_partition, vector< vector<size_t> > const& constrained_comms, vector< vector<size_t> > const& active_layers, vector<size_t> const& nodes, vector<bool>& is_node_stable, vector<bool>& comm_added, size_t max_comm_size, igraph_rng_t* rng)
+{
+  size_t nb_layers = partitions.size();
+  vector<Graph*> graphs(nb_layers);
+  for (size_t layer = 0; layer < nb_layers; layer++)
+    graphs[layer] = partitions[layer]->get_graph();
+
+  // Total improvement while moving nodes
+  double total_improv = 0.0;
+  // Number of moved nodes during one loop
+  size_t nb_moves = 0;
+
+  deque<size_t> vertex_order(nodes.begin(), nodes.end());
   vector<size_t> comms;
+  vector<double> improvs;
+  vector<size_t> const all_layers = range(nb_layers);
+  size_t nb_visited = 0;
 
   // As long as the queue is not empty
   while(!vertex_order.empty())
   {
+    // Stop once the time limit has passed, leaving it to the caller to
+    // cancel the optimisation, as this may run in multiple threads.
+    if (++nb_visited % DEADLINE_INTERVAL == 0 && this->deadline_passed())
+      break;
+
     size_t v = vertex_order.front(); vertex_order.pop_front();
 
     // Clear comms
@@ -1051,6 +1876,7 @@ double Optimiser::move_nodes_constrained(vector<MutableVertexPartition*> partiti
 
     // What is the current community of the node (this should be the same for all layers)
     size_t v_comm = partitions[0]->membership(v);
+    vector<size_t> const& v_layers = active_layers.empty() ? all_layers : active_layers[v];
 
     if (consider_comms == ALL_COMMS)
     {
@@ -1069,7 +1895,7 @@ double Optimiser::move_nodes_constrained(vector<MutableVertexPartition*> partiti
     else if (consider_comms == ALL_NEIGH_COMMS)
     {
         /****************************ALL NEIGH COMMS*****************************/
-        for (size_t layer = 0; layer < nb_layers; layer++)
+        for (size_t layer : v_layers)
         {
           for (size_t comm : partitions[layer]->get_neigh_comms(v, IGRAPH_ALL, constrained_partition->membership()))
           {
@@ -1085,7 +1911,7 @@ double Optimiser::move_nodes_constrained(vector<MutableVertexPartition*> partiti
     {
       /****************************RAND COMM***********************************/
         size_t v_constrained_comm = constrained_partition->membership(v);
-        size_t random_idx = get_random_int(0, constrained_comms[v_constrained_comm].size() - 1, &rng);
+        size_t random_idx = get_random_int(0, constrained_comms[v_constrained_comm].size() - 1, rng);
         size_t rand_comm = constrained_comms[v_constrained_comm][random_idx];
         // No need to check if random_comm is already added, we only add one comm
         comms.push_back(rand_comm);
@@ -1097,14 +1923,14 @@ double Optimiser::move_nodes_constrained(vector<MutableVertexPartition*> partiti
         // Draw a random community among the neighbours, proportional to the
         // frequency of the communities among the neighbours.
         vector<size_t> all_neigh_comms_incl_dupes;
-        for (size_t layer = 0; layer < nb_layers; layer++)
+        for (size_t layer : v_layers)
         {
           vector<size_t> neigh_comm_layer = partitions[layer]->get_neigh_comms(v, IGRAPH_ALL, constrained_partition->membership());
           all_neigh_comms_incl_dupes.insert(all_neigh_comms_incl_dupes.end(), neigh_comm_layer.begin(), neigh_comm_layer.end());
         }
         if (all_neigh_comms_incl_dupes.size() > 0)
         {
-          size_t random_idx = get_random_int(0, all_neigh_comms_incl_dupes.size() - 1, &rng);
+          size_t random_idx = get_random_int(0, all_neigh_comms_incl_dupes.size() - 1, rng);
           size_t rand_comm = all_neigh_comms_incl_dupes[random_idx];
           // No need to check if random_comm is already added, we only add one comm
           comms.push_back(rand_comm);
@@ -1119,27 +1945,30 @@ double Optimiser::move_nodes_constrained(vector<MutableVertexPartition*> partiti
     size_t max_comm = v_comm;
     double max_improv = (0 < max_comm_size && max_comm_size < partitions[0]->csize(v_comm)) ? -INFINITY : 10*DBL_EPSILON;
     double v_size = graphs[0]->node_size(v);
+    size_t nb_comms = 0;
     for (size_t comm : comms)
     {
+      // reset comm_added to all false
+      comm_added[comm] = false;
+
       // Do not create too-large communities.
       if (0 < max_comm_size && max_comm_size < partitions[0]->csize(comm) + v_size) {
         continue;
       }
+      comms[nb_comms++] = comm;
+    }
+    comms.resize(nb_comms);
 
-      double possible_improv = 0.0;
-
-      // Consider the improvement of moving to a community for all layers
-      for (size_t layer = 0; layer < nb_layers; layer++)
-      {
-        // Make sure to multiply it by the weight per layer
-        possible_improv += layer_weights[layer]*partitions[layer]->diff_move(v, comm);
-      }
+    // Consider the improvement of moving to a community for all layers
+    this->diff_move_layers(partitions, layer_weights, v_layers, v, comms, improvs);
 
+    for (size_t idx = 0; idx < nb_comms; idx++)
+    {
       // Check if improvement is best
-      if (possible_improv > max_improv)
+      if (improvs[idx] > max_improv)
       {
-        max_comm = comm;
-        max_improv = possible_improv;
+        max_comm = comms[idx];
+        max_improv = improvs[idx];
       }
     }
 
@@ -1189,9 +2018,9 @@ double Optimiser::move_nodes_constrained(vector<MutableVertexPartition*> partiti
       #endif
 
       // Mark neighbours as unstable (if not in new community and not fixed)
-      for (Graph* graph : graphs)
+      for (size_t layer : v_layers)
       {
-        for (size_t u : graph->get_neighbours(v, IGRAPH_ALL))
+        for (size_t u : graphs[layer]->get_neighbours(v, IGRAPH_ALL))
         {
           // If the neighbour was stable and is not in the new community, we
           // should mark it as unstable, and add it to the queue, skipping
@@ -1211,72 +2040,44 @@ double Optimiser::move_nodes_constrained(vector<MutableVertexPartition*> partiti
       cerr << "Moved " << nb_moves << " nodes." << endl;
     #endif
   }
-  partitions[0]->renumber_communities();
-  vector<size_t> const& membership = partitions[0]->membership();
-  for (size_t layer = 1; layer < nb_layers; layer++)
-  {
-    partitions[layer]->set_membership(membership);
-    #ifdef DEBUG
-      cerr << "Renumbered communities for layer " << layer << " for " << partitions[layer]->n_communities() << " communities." << endl;
-    #endif //DEBUG
-  }
+  for (size_t comm : comms)
+    comm_added[comm] = false;
+  for (size_t v : nodes)
+    is_node_stable[v] = false;
   return total_improv;
 }
 
-double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, MutableVertexPartition* constrained_partition)
-{
-  return this->merge_nodes_constrained(partitions, layer_weights, this->refine_consider_comms, constrained_partition);
-}
-
-double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, int consider_comms, MutableVertexPartition* constrained_partition)
-{
-  return this->merge_nodes_constrained(partitions, layer_weights, refine_consider_comms, constrained_partition, this->max_comm_size);
-}
-
-double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, int consider_comms, MutableVertexPartition* constrained_partition, size_t max_comm_size)
+/*****************************************************************************
+  Merge the nodes in the given order, where nodes are only merged with
+  communities within their constrained community. The order should only
+  contain complete constrained communities, and comm_added should be all
+  false, as it is left after returning.
+******************************************************************************/
+double Optimiser::merge_nodes_constrained_subset(vector<MutableVertexPartition*> const& partitions, vector<double> const& layer_weights, int consider_comms, MutableVertexPartition* constrained_partition, vector< vector<size_t> > const& constrained_comms, vector< vector<size_t> > const& active_layers, vector<size_t> const& nodes, vector<bool>& comm_added, size_t max_comm_size, igraph_rng_t* rng)
 {
-  #ifdef DEBUG
-    cerr << "double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, int consider_comms, MutableVertexPartition* constrained_partition, size_t max_comm_size)" << std::endl;
-  #endif
-
-  // Number of multiplex layers
   size_t nb_layers = partitions.size();
-  if (nb_layers == 0)
-    return -1.0;
-
-  // Get graphs
   vector<Graph*> graphs(nb_layers);
   for (size_t layer = 0; layer < nb_layers; layer++)
     graphs[layer] = partitions[layer]->get_graph();
-  // Number of nodes in the graph
-  size_t n = graphs[0]->vcount();
 
   // Total improvement while merging nodes
   double total_improv = 0.0;
 
-  for (size_t layer = 0; layer < nb_layers; layer++)
-    if (graphs[layer]->vcount() != n)
-      throw Exception("Number of nodes are not equal for all graphs.");
-
-  // Establish vertex order
-  // We normally initialize the normal vertex order
-  // of considering node 0,1,...
-  vector<size_t> vertex_order = range(n);
-
-
-  // But if we use a random order, we shuffle this order.
-  shuffle(vertex_order, &rng);
-
-  vector< vector<size_t> > constrained_comms = constrained_partition->get_communities();
-
-  vector<bool> comm_added(partitions[0]->n_communities(), false);
   vector<size_t> comms;
+  vector<double> improvs;
+  vector<size_t> const all_layers = range(nb_layers);
+  size_t nb_visited = 0;
 
   // For each node
-  for (size_t v : vertex_order)
+  for (size_t v : nodes)
   {
+    // Stop once the time limit has passed (see move_nodes_constrained_subset).
+    if (++nb_visited % DEADLINE_INTERVAL == 0 && this->deadline_passed())
+      break;
+
     // What is the current community of the node (this should be the same for all layers)
     size_t v_comm = partitions[0]->membership(v);
+    vector<size_t> const& v_layers = active_layers.empty() ? all_layers : active_layers[v];
 
     if (partitions[0]->cnodes(v_comm) == 1)
     {
@@ -1301,7 +2102,7 @@ double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partit
       else if (consider_comms == ALL_NEIGH_COMMS)
       {
           /****************************ALL NEIGH COMMS*****************************/
-          for (size_t layer = 0; layer < nb_layers; layer++)
+          for (size_t layer : v_layers)
           {
             for (size_t u : partitions[layer]->get_graph()->get_neighbours(v, IGRAPH_ALL)) {
               if (constrained_partition->membership(v) == constrained_partition->membership(u)) {
@@ -1318,7 +2119,7 @@ double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partit
       {
         /****************************RAND COMM***********************************/
           size_t v_constrained_comm = constrained_partition->membership(v);
-          size_t random_idx = get_random_int(0, constrained_comms[v_constrained_comm].size() - 1, &rng);
+          size_t random_idx = get_random_int(0, constrained_comms[v_constrained_comm].size() - 1, rng);
           size_t rand_comm = constrained_comms[v_constrained_comm][random_idx];
           // No need to check if random_comm is already added, we only add one comm
           comms.push_back(rand_comm);
@@ -1330,7 +2131,7 @@ double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partit
           // Draw a random community among the neighbours, proportional to the
           // frequency of the communities among the neighbours.
           vector<size_t> all_neigh_comms_incl_dupes;
-          for (size_t layer = 0; layer < nb_layers; layer++)
+          for (size_t layer : v_layers)
           {
             vector<size_t> neigh_comm_layer = partitions[layer]->get_neigh_comms(v, IGRAPH_ALL, constrained_partition->membership());
             all_neigh_comms_incl_dupes.insert(all_neigh_comms_incl_dupes.end(), neigh_comm_layer.begin(), neigh_comm_layer.end());
@@ -1339,9 +2140,9 @@ double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partit
           if (k > 0)
           {
             // Make sure there is also a probability not to move the node
-            if (get_random_int(0, k, &rng) > 0)
+            if (get_random_int(0, k, rng) > 0)
             {
-              size_t random_idx = get_random_int(0, k - 1, &rng);
+              size_t random_idx = get_random_int(0, k - 1, rng);
               size_t rand_comm = all_neigh_comms_incl_dupes[random_idx];
               // No need to check if random_comm is already added, we only add one comm
               comms.push_back(rand_comm);
@@ -1357,6 +2158,7 @@ double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partit
       size_t max_comm = v_comm;
       double max_improv = (0 < max_comm_size && max_comm_size < partitions[0]->csize(v_comm)) ? -INFINITY : 0;
       double v_size = graphs[0]->node_size(v);
+      size_t nb_comms = 0;
       for (size_t comm : comms)
       {
         // reset comm_added to all false
@@ -1366,20 +2168,19 @@ double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partit
         if (0 < max_comm_size && max_comm_size < partitions[0]->csize(comm) + v_size) {
           continue;
         }
+        comms[nb_comms++] = comm;
+      }
+      comms.resize(nb_comms);
 
-        double possible_improv = 0.0;
-
-        // Consider the improvement of moving to a community for all layers
-        for (size_t layer = 0; layer < nb_layers; layer++)
-        {
-          // Make sure to multiply it by the weight per layer
-          possible_improv += layer_weights[layer]*partitions[layer]->diff_move(v, comm);
-        }
+      // Consider the improvement of moving to a community for all layers
+      this->diff_move_layers(partitions, layer_weights, v_layers, v, comms, improvs);
 
-        if (possible_improv >= max_improv)
+      for (size_t idx = 0; idx < nb_comms; idx++)
+      {
+        if (improvs[idx] >= max_improv)
         {
-          max_comm = comm;
-          max_improv = possible_improv;
+          max_comm = comms[idx];
+          max_improv = improvs[idx];
         }
       }
 
@@ -1429,14 +2230,286 @@ double Optimiser::merge_nodes_constrained(vector<MutableVertexPartition*> partit
       }
   }
 
+  for (size_t comm : comms)
+    comm_added[comm] = false;
+  return total_improv;
+}
+
+/*****************************************************************************
+  Refine the partitions by moving or merging the nodes within each
+  community of the constrained partition independently, using multiple
+  threads. The partitions should be a refinement of the constrained
+  partition, as is the case when refining in optimise_partition.
+
+  Each community of the constrained partition is refined starting from the
+  provided partitions, using its own random seed, after which the initial
+  membership is restored. The result is therefore the same regardless of
+  which thread refines which community.
+******************************************************************************/
+double Optimiser::refine_partition_parallel(vector<MutableVertexPartition*> partitions, vector<double> layer_weights, MutableVertexPartition* constrained_partition, size_t max_comm_size, size_t nb_threads)
+{
+  // Number of multiplex layers
+  size_t nb_layers = partitions.size();
+  if (nb_layers == 0)
+    return -1.0;
+  // Get graphs
+  vector<Graph*> graphs(nb_layers);
+  for (size_t layer = 0; layer < nb_layers; layer++)
+    graphs[layer] = partitions[layer]->get_graph();
+  // Number of nodes in the graph
+  size_t n = graphs[0]->vcount();
+
+  for (Graph* graph : graphs)
+    if (graph->vcount() != n)
+      throw Exception("Number of nodes are not equal for all graphs.");
+
+  vector< vector<size_t> > constrained_comms = constrained_partition->get_communities();
+  size_t nb_comms = constrained_comms.size();
+
+  // Only consider the layers in which a node is active
+  vector< vector<size_t> > const active_layers = this->get_active_layers(graphs);
+
+  // Random seeds are drawn beforehand, so that
+  // the result does not depend on the threads.
+  vector<size_t> comm_seeds(nb_comms);
+  for (size_t c = 0; c < nb_comms; c++)
+    comm_seeds[c] = get_random_int(0, 0x7FFFFFFF, &rng);
+
+  // Refine larger communities first, to balance the work between threads.
+  vector<size_t> comm_order;
+  for (size_t c = 0; c < nb_comms; c++)
+    if (constrained_comms[c].size() > 1)
+      comm_order.push_back(c);
+  std::stable_sort(comm_order.begin(), comm_order.end(),
+    [&constrained_comms](size_t c, size_t d) { return constrained_comms[c].size() > constrained_comms[d].size(); });
+
+  vector<size_t> const initial_membership = as_size_t_vector(partitions[0]->membership());
+  vector<size_t> membership(initial_membership);
+  vector<double> comm_improv(nb_comms, 0.0);
+
+  // Each thread uses its own copy of the partitions.
+  vector<std::exception_ptr> thread_exceptions(nb_threads);
+  std::atomic<size_t> next_comm(0);
+
+  auto refine_comms = [&](size_t thread)
+  {
+    vector<MutableVertexPartition*> thread_partition(nb_layers, NULL);
+    igraph_rng_t thread_rng;
+    igraph_rng_init(&thread_rng, &igraph_rngtype_mt19937);
+    try
+    {
+      for (size_t layer = 0; layer < nb_layers; layer++)
+        thread_partition[layer] = partitions[layer]->create(graphs[layer], initial_membership);
+      vector<bool> is_node_stable(n, false);
+      vector<bool> comm_added(thread_partition[0]->n_communities(), false);
+      size_t nb_refined = 0;
+
+      for (size_t idx = next_comm++; idx < comm_order.size(); idx = next_comm++)
+      {
+        size_t c = comm_order[idx];
+
+        // Stop once the time limit has passed, checking it after refining
+        // about DEADLINE_INTERVAL nodes, as communities may be small.
+        nb_refined += constrained_comms[c].size();
+        if (nb_refined >= DEADLINE_INTERVAL)
+        {
+          nb_refined = 0;
+          if (this->deadline_passed())
+            break;
+        }
+        vector<size_t> nodes(constrained_comms[c]);
+        igraph_rng_seed(&thread_rng, comm_seeds[c]);
+        shuffle(nodes, &thread_rng);
+
+        if (this->refine_routine == Optimiser::MOVE_NODES)
+          comm_improv[c] = this->move_nodes_constrained_subset(thread_partition, layer_weights, this->refine_consider_comms, constrained_partition, constrained_comms, active_layers, nodes, is_node_stable, comm_added, max_comm_size, &thread_rng);
+        else if (this->refine_routine == Optimiser::MERGE_NODES)
+          comm_improv[c] = this->merge_nodes_constrained_subset(thread_partition, layer_weights, this->refine_consider_comms, constrained_partition, constrained_comms, active_layers, nodes, comm_added, max_comm_size, &thread_rng);
+
+        // Record the refined membership and restore the initial membership
+        for (size_t v : nodes)
+          membership[v] = thread_partition[0]->membership(v);
+        for (size_t v : nodes)
+          for (size_t layer = 0; layer < nb_layers; layer++)
+            thread_partition[layer]->move_node(v, initial_membership[v]);
+      }
+    }
+    catch (...)
+    {
+      thread_exceptions[thread] = std::current_exception();
+    }
+    for (MutableVertexPartition* partition : thread_partition)
+      delete partition;
+    igraph_rng_destroy(&thread_rng);
+  };
+
+  vector<std::thread> threads;
+  for (size_t thread = 1; thread < nb_threads; thread++)
+    threads.push_back(std::thread(refine_comms, thread));
+  refine_comms(0);
+  for (std::thread& thread : threads)
+    thread.join();
+
+  for (std::exception_ptr& exception : thread_exceptions)
+    if (exception)
+      std::rethrow_exception(exception);
+
+  // Total improvement while refining
+  double total_improv = 0.0;
+  for (size_t c = 0; c < nb_comms; c++)
+    total_improv += comm_improv[c];
+
+  partitions[0]->set_membership(membership);
   partitions[0]->renumber_communities();
-  vector<size_t> const& membership = partitions[0]->membership();
+  vector<size_t> const& renumbered_membership = as_size_t_vector(partitions[0]->membership());
   for (size_t layer = 1; layer < nb_layers; layer++)
+    partitions[layer]->set_membership(renumbered_membership);
+  return total_improv;
+}
+
+/*****************************************************************************
+  Optimise the partition independently for each of the seeds and set the
+  partition to the membership of the run with the highest quality (the
+  first such run in case of ties).
+
+  Each run starts from the current membership of the partition and uses its
+  own optimiser, with the same settings as this optimiser, and its own
+  partition. All runs share the same graph. The runs are divided over the
+  threads, each run itself using a single thread, so that the result only
+  depends on the seeds, not on the number of threads.
+
+  The progress callback of this optimiser is called by the runs, one thread
+  at a time. Once a run is stopped, by the progress callback or the time
+  limit, the other runs are stopped as well, and runs that did not start yet
+  keep the initial membership.
+
+  Parameters:
+    partition        -- The partition to optimise.
+    seeds            -- The seed of the random number generator for each run.
+    n_iterations     -- The number of iterations of each run. If negative,
+                        iterate until an iteration does not improve the
+                        partition.
+    qualities        -- The quality of each run.
+    memberships      -- The membership of each run, one after the other,
+                        only filled if keep_memberships is true.
+    keep_memberships -- Whether to keep the membership of each run.
+
+  Returns the index of the best run.
+******************************************************************************/
+size_t Optimiser::optimise_partition_ensemble(MutableVertexPartition* partition, vector<size_t> const& seeds, int n_iterations, vector<double>& qualities, vector<size_t>& memberships, bool keep_memberships)
+{
+  size_t nb_runs = seeds.size();
+  if (nb_runs == 0)
+    throw Exception("At least one seed is required.");
+
+  Graph* graph = partition->get_graph();
+  size_t n = graph->vcount();
+
+  vector<size_t> const initial_membership = as_size_t_vector(partition->membership());
+  qualities.assign(nb_runs, partition->quality());
+  if (keep_memberships)
   {
-    partitions[layer]->set_membership(membership);
-    #ifdef DEBUG
-      cerr << "Renumbered communities for layer " << layer << " for " << partitions[layer]->n_communities() << " communities." << endl;
-    #endif //DEBUG
+    memberships.resize(nb_runs*n);
+    for (size_t run = 0; run < nb_runs; run++)
+      std::copy(initial_membership.begin(), initial_membership.end(), memberships.begin() + run*n);
   }
-  return total_improv;
+
+  // Serialise calls to the progress callback, and stop all runs once it
+  // stopped one of them.
+  std::atomic<bool> stop(false);
+  std::mutex progress_mutex;
+  std::function<bool(OptimiserProgress const&)> progress_callback;
+  if (this->progress_callback)
+    progress_callback = [&](OptimiserProgress const& progress)
+    {
+      std::lock_guard<std::mutex> lock(progress_mutex);
+      if (!stop && this->progress_callback(progress))
+        stop = true;
+      return (bool) stop;
+    };
+
+  // Each thread keeps the best membership of its own runs.
+  size_t nb_threads = std::min(this->get_n_threads(), nb_runs);
+  vector<std::exception_ptr> thread_exceptions(nb_threads);
+  vector<size_t> thread_best_run(nb_threads, nb_runs);
+  vector< vector<size_t> > thread_best_membership(nb_threads);
+  std::atomic<size_t> next_run(0);
+
+  auto optimise_runs = [&](size_t thread)
+  {
+    MutableVertexPartition* run_partition = NULL;
+    try
+    {
+      Optimiser optimiser;
+      optimiser.consider_comms = this->consider_comms;
+      optimiser.refine_partition = this->refine_partition;
+      optimiser.refine_consider_comms = this->refine_consider_comms;
+      optimiser.optimise_routine = this->optimise_routine;
+      optimiser.refine_routine = this->refine_routine;
+      optimiser.consider_empty_community = this->consider_empty_community;
+      optimiser.max_comm_size = this->max_comm_size;
+      optimiser.n_threads = 1;
+      optimiser.has_deadline = this->has_deadline;
+      optimiser.deadline = this->deadline;
+      optimiser.progress_callback = progress_callback;
+
+      for (size_t run = next_run++; run < nb_runs && !stop; run = next_run++)
+      {
+        run_partition = partition->create(graph, initial_membership);
+        optimiser.set_rng_seed(seeds[run]);
+        for (int itr = 0; n_iterations < 0 || itr < n_iterations; itr++)
+        {
+          double improv = optimiser.optimise_partition(run_partition);
+          if (optimiser.is_cancelled() || (n_iterations < 0 && improv <= 0))
+            break;
+        }
+        if (optimiser.is_cancelled())
+          stop = true;
+
+        qualities[run] = run_partition->quality();
+        vector<size_t> const& run_membership = as_size_t_vector(run_partition->membership());
+        if (keep_memberships)
+          std::copy(run_membership.begin(), run_membership.end(), memberships.begin() + run*n);
+
+        // Runs are taken in increasing order, so ties keep the earlier run.
+        size_t best_run = thread_best_run[thread];
+        if (best_run == nb_runs || qualities[run] > qualities[best_run])
+        {
+          thread_best_run[thread] = run;
+          thread_best_membership[thread] = run_membership;
+        }
+        delete run_partition;
+        run_partition = NULL;
+      }
+    }
+    catch (...)
+    {
+      thread_exceptions[thread] = std::current_exception();
+    }
+    delete run_partition;
+  };
+
+  vector<std::thread> threads;
+  for (size_t thread = 1; thread < nb_threads; thread++)
+    threads.push_back(std::thread(optimise_runs, thread));
+  optimise_runs(0);
+  for (std::thread& thread : threads)
+    thread.join();
+
+  for (std::exception_ptr& exception : thread_exceptions)
+    if (exception)
+      std::rethrow_exception(exception);
+  this->cancelled = stop;
+
+  size_t best_thread = 0;
+  for (size_t thread = 1; thread < nb_threads; thread++)
+  {
+    size_t run = thread_best_run[thread], best_run = thread_best_run[best_thread];
+    if (run < nb_runs && (best_run == nb_runs || qualities[run] > qualities[best_run] ||
+                          (qualities[run] == qualities[best_run] && run < best_run)))
+      best_thread = thread;
+  }
+
+  partition->set_membership(thread_best_membership[best_thread]);
+  return thread_best_run[best_thread];
 }
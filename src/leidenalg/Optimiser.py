@@ -1,7 +1,25 @@
 from . import _c_leiden
 from .VertexPartition import LinearResolutionParameterVertexPartition
+from .functions import SharedGraph
 from collections import namedtuple
+from array import array as _array
 from math import log, sqrt
+import random
+import threading
+import time
+
+class _ProgressCallback(object):
+  """ Calls the progress callback with the iteration added to the progress, and
+  keeps track of whether the callback requested to stop. """
+  def __init__(self, callback):
+    self.callback = callback
+    self.iteration = 0
+    self.stopped = False
+
+  def __call__(self, progress):
+    progress['iteration'] = self.iteration
+    self.stopped = bool(self.callback(progress))
+    return self.stopped
 
 class Optimiser(object):
   """ Class for doing community detection using the Leiden algorithm.
@@ -56,6 +74,12 @@ class Optimiser(object):
   Finally, the Optimiser class provides a routine to construct a
   :func:`resolution_profile` on a resolution parameter.
 
+  The optimisation routines release the GIL while running, so that different
+  partitions can be optimised simultaneously from multiple threads, for
+  example using a :class:`concurrent.futures.ThreadPoolExecutor`. Each thread
+  should then use its own partition. Calls on the same optimiser are
+  serialised, since they share the same random number generator.
+
   References
   ----------
 
@@ -71,6 +95,7 @@ class Optimiser(object):
   def __init__(self):
     """ Create a new Optimiser object """
     self._optimiser = _c_leiden._new_Optimiser()
+    self._thread_local = threading.local()
 
   #########################################################3
   # consider_comms
@@ -231,6 +256,108 @@ class Optimiser(object):
         raise ValueError("negative max_comm_size: %s" % value)
     _c_leiden._Optimiser_set_max_comm_size(self._optimiser, value)
 
+  #########################################################3
+  # n_threads
+  @property
+  def n_threads(self):
+    """ Number of threads used for moving nodes and refining the partition.
+
+    By default (one), nodes are moved using a single thread. If this is set to
+    a larger value, nodes are moved in parallel using this number of threads,
+    and the communities are refined in parallel, each community independently
+    of the others. If this is set to zero, all available cores are used. When
+    using multiple threads, the results may differ from using a single thread.
+    However, for a given random seed (see :func:`set_rng_seed`) the results are
+    the same, regardless of the number of threads.
+    """
+    return _c_leiden._Optimiser_get_n_threads(self._optimiser)
+
+  @n_threads.setter
+  def n_threads(self, value):
+    if value < 0:
+        raise ValueError("negative n_threads: %s" % value)
+    _c_leiden._Optimiser_set_n_threads(self._optimiser, value)
+
+  #########################################################3
+  # last_run_stats
+  @property
+  def last_run_stats(self):
+    """ Statistics of each level of the last call to :func:`optimise_partition`
+    or :func:`optimise_partition_multiplex` in the current thread.
+
+    Threads sharing this optimiser each see the statistics of their own last
+    call, and an empty list if they did not optimise yet.
+
+    This is a list with a dictionary for each level (i.e. each aggregate graph)
+    of each iteration, with the following keys:
+
+    ``iteration``, ``level``
+      The iteration and the level within the iteration.
+
+    ``move_nodes_time``, ``refine_time``, ``collapse_graph_time``, ``from_coarse_partition_time``
+      Time in seconds spent on moving nodes, refining the partition,
+      collapsing the graph and updating the partition from the aggregate
+      partition.
+
+    ``nodes_visited``, ``nodes_requeued``, ``nodes_moved``
+      Number of nodes considered for moving, the number of times a node was
+      added to the queue again after a neighbour moved, and the number of
+      moves made, when moving nodes (not when refining).
+
+    ``n_communities_before``, ``n_communities_after``
+      Number of communities before and after moving nodes.
+
+    ``collapsed_vcount``, ``collapsed_ecount``
+      Number of nodes and edges of the collapsed graph.
+
+    ``improvement``
+      Improvement in quality of moving nodes.
+
+    Examples
+    --------
+    >>> G = ig.Graph.Famous('Zachary')
+    >>> optimiser = la.Optimiser()
+    >>> partition = la.ModularityVertexPartition(G)
+    >>> diff = optimiser.optimise_partition(partition)
+    >>> time = sum(stats['move_nodes_time'] for stats in optimiser.last_run_stats)
+    """
+    return getattr(self._thread_local, 'last_run_stats', [])
+
+  def _optimise_iterations(self, optimise, quality, n_iterations, callback, time_limit, rel_tol):
+    """ Call ``optimise(progress, time_limit)`` for each iteration, and return
+    the total improvement, see :func:`optimise_partition`. The call should
+    return the improvement and the statistics of each level. """
+    itr = 0
+    diff = 0
+    last_run_stats = []
+    self._thread_local.last_run_stats = last_run_stats
+    progress = _ProgressCallback(callback) if callback is not None else None
+    start = time.monotonic()
+    continue_iteration = itr < n_iterations or n_iterations < 0
+    while continue_iteration:
+      if progress is not None:
+        progress.iteration = itr
+      remaining_time = -1.0
+      if time_limit is not None:
+        remaining_time = max(time_limit - (time.monotonic() - start), 0.0)
+      diff_inc, level_stats = optimise(progress, remaining_time)
+      for stats in level_stats:
+        stats['iteration'] = itr
+        last_run_stats.append(stats)
+      diff += diff_inc
+      itr += 1
+      if n_iterations < 0:
+        continue_iteration = (diff_inc > 0)
+      else:
+        continue_iteration = itr < n_iterations
+      if progress is not None and progress.stopped:
+        continue_iteration = False
+      if time_limit is not None and time.monotonic() - start >= time_limit:
+        continue_iteration = False
+      if rel_tol is not None and continue_iteration and diff_inc <= rel_tol*abs(quality()):
+        continue_iteration = False
+    return diff
+
   ##########################################################
   # Set rng seed
   def set_rng_seed(self, value):
@@ -243,7 +370,7 @@ class Optimiser(object):
     """
     _c_leiden._Optimiser_set_rng_seed(self._optimiser, value)
 
-  def optimise_partition(self, partition, n_iterations=2, is_membership_fixed=None):
+  def optimise_partition(self, partition, n_iterations=2, is_membership_fixed=None, callback=None, time_limit=None, rel_tol=None):
     """ Optimise the given partition.
 
     Parameters
@@ -261,6 +388,29 @@ class Optimiser(object):
       length of this list must be equal to the number of nodes. By default
       (None) all nodes can change community during the optimization.
 
+    callback : callable or None
+      Function that is called periodically while moving nodes, and at the
+      start of each level (i.e. each aggregate graph), with a dictionary with
+      the ``iteration``, the ``level``, the number of nodes considered at this
+      level (``nodes_visited``), the number of nodes still to be considered at
+      this level (``queue_size``), the current number of communities at this
+      level (``n_communities``) and the ``improvement`` of this iteration so
+      far. If it returns ``True``, the optimisation is stopped, leaving the
+      partition in a consistent state. Exceptions raised by the callback
+      also stop the optimisation, and are then propagated. Regardless of the
+      callback, the optimisation is stopped when a signal handler raises an
+      exception (for example :class:`KeyboardInterrupt` when pressing Ctrl-C).
+
+    time_limit : float or None
+      Maximum time in seconds to optimise. Once the time limit has passed,
+      the optimisation is stopped as if the ``callback`` returned ``True``,
+      also within an iteration. By default (None) there is no time limit.
+
+    rel_tol : float or None
+      Stop iterating once the improvement of an iteration is at most
+      ``rel_tol`` times the absolute quality. By default (None) only
+      ``n_iterations`` determines the number of iterations.
+
     Returns
     -------
     float
@@ -280,28 +430,134 @@ class Optimiser(object):
     >>> is_membership_fixed[4] = True
     >>> is_membership_fixed[6] = True
     >>> diff = optimiser.optimise_partition(partition, is_membership_fixed=is_membership_fixed)
-    """
 
-    itr = 0
-    diff = 0
-    continue_iteration = itr < n_iterations or n_iterations < 0
-    while continue_iteration:
-      diff_inc = _c_leiden._Optimiser_optimise_partition(
+    or, stopping after the first level:
+
+    >>> diff = optimiser.optimise_partition(partition, callback=lambda progress: progress['level'] > 0)
+
+    or, iterating for at most one second until the quality improves by at
+    most 0.1% per iteration:
+
+    >>> diff = optimiser.optimise_partition(partition, n_iterations=-1, time_limit=1, rel_tol=1e-3)
+    """
+    def optimise(progress, time_limit):
+      return _c_leiden._Optimiser_optimise_partition(
               self._optimiser,
               partition._partition,
               is_membership_fixed=is_membership_fixed,
+              callback=progress,
+              time_limit=time_limit
               )
-      diff += diff_inc
-      itr += 1
-      if n_iterations < 0:
-        continue_iteration = (diff_inc > 0)
-      else:
-        continue_iteration = itr < n_iterations
 
-    partition._update_internal_membership()
-    return diff
+    try:
+      return self._optimise_iterations(optimise, partition.quality,
+                                       n_iterations, callback, time_limit, rel_tol)
+    finally:
+      partition._update_internal_membership()
+
+  def optimise_partition_ensemble(self, partition, n_runs=10, seeds=None, n_iterations=2, return_memberships=False, time_limit=None):
+    """ Optimise the given partition independently for different seeds, and
+    keep the best result.
+
+    Each run starts from the current membership of the partition and runs
+    the Leiden algorithm with its own seed, using the settings of this
+    optimiser. The runs are divided over :attr:`n_threads` threads, each run
+    itself using a single thread. All runs share the same graph, so that
+    only a partition is created for each thread, not a copy of the graph.
+    Afterwards, the partition is set to the membership of the run with the
+    highest quality (the first such run in case of ties).
+
+    Parameters
+    ----------
+    partition
+      The :class:`~VertexPartition.MutableVertexPartition` to optimise.
+
+    n_runs : int
+      Number of runs, only used if no ``seeds`` are given.
+
+    seeds : list of int or None
+      Seed of the random number generator for each run. By default (None),
+      ``n_runs`` random seeds are used. The result only depends on the seeds,
+      not on the number of threads. A run with seed ``s`` gives the same
+      result as :func:`optimise_partition` after setting the seed to ``s``
+      with :func:`set_rng_seed`, if :attr:`n_threads` is 1.
+
+    n_iterations : int
+      Number of iterations of each run. If the number of iterations is
+      negative, each run continues until an iteration in which there was no
+      improvement.
+
+    return_memberships : bool
+      Whether to also return the membership of each run.
+
+    time_limit : float or None
+      Maximum time in seconds to optimise, after which all runs are stopped,
+      see :func:`optimise_partition`. Runs that did not start yet keep the
+      initial membership. By default (None) there is no time limit. All runs
+      are also stopped when a signal handler raises an exception (for example
+      :class:`KeyboardInterrupt` when pressing Ctrl-C), after which the
+      partition is set to the best run so far.
+
+    Returns
+    -------
+    list of float
+      The quality of each run.
+
+    numpy.ndarray or list of array.array
+      The membership of each run, only returned if ``return_memberships`` is
+      ``True``. This is an array of 64 bit integers with a row for each run
+      if NumPy is available, otherwise a list of :class:`array.array`.
+
+    See Also
+    --------
+    :func:`find_partition_ensemble`
+
+    Examples
+    --------
+    >>> G = ig.Graph.Famous('Zachary')
+    >>> optimiser = la.Optimiser()
+    >>> optimiser.n_threads = 0
+    >>> partition = la.ModularityVertexPartition(G)
+    >>> qualities = optimiser.optimise_partition_ensemble(partition, n_runs=4)
+    >>> partition.quality() == max(qualities)
+    True
+
+    or, keeping the membership of each run:
 
-  def optimise_partition_multiplex(self, partitions, layer_weights=None, n_iterations=2, is_membership_fixed=None):
+    >>> partition = la.ModularityVertexPartition(G)
+    >>> qualities, memberships = optimiser.optimise_partition_ensemble(
+    ...                             partition, seeds=[1, 2, 3, 4],
+    ...                             return_memberships=True)
+    """
+    if seeds is None:
+      seeds = [random.randrange(2**31) for run in range(n_runs)]
+    seeds = list(seeds)
+
+    try:
+      qualities, best_run, buffer = _c_leiden._Optimiser_optimise_partition_ensemble(
+              self._optimiser,
+              partition._partition,
+              seeds,
+              n_iterations=n_iterations,
+              return_memberships=return_memberships,
+              time_limit=time_limit if time_limit is not None else -1.0
+              )
+    finally:
+      partition._update_internal_membership()
+
+    if not return_memberships:
+      return qualities
+
+    n = len(partition.membership)
+    try:
+      import numpy as np
+    except ImportError:
+      memberships = [_array('q', buffer[run*n*8:(run + 1)*n*8]) for run in range(len(seeds))]
+    else:
+      memberships = np.frombuffer(buffer, dtype=np.int64).reshape(len(seeds), n)
+    return qualities, memberships
+
+  def optimise_partition_multiplex(self, partitions, layer_weights=None, n_iterations=2, is_membership_fixed=None, callback=None, time_limit=None, rel_tol=None):
     """ Optimise the given partitions simultaneously.
 
     Parameters
@@ -322,6 +578,30 @@ class Optimiser(object):
       are run. If the number of iterations is negative, the Leiden algorithm is
       run until an iteration in which there was no improvement.
 
+    callback : callable or None
+      Function that is called periodically while moving nodes, and at the
+      start of each level (i.e. each aggregate graph), with a dictionary with
+      the ``iteration``, the ``level``, the number of nodes considered at this
+      level (``nodes_visited``), the number of nodes still to be considered at
+      this level (``queue_size``), the current number of communities at this
+      level (``n_communities``) and the ``improvement`` of this iteration so
+      far. If it returns ``True``, the optimisation is stopped, leaving the
+      partitions in a consistent state. Exceptions raised by the callback
+      also stop the optimisation, and are then propagated. Regardless of the
+      callback, the optimisation is stopped when a signal handler raises an
+      exception (for example :class:`KeyboardInterrupt` when pressing Ctrl-C).
+
+    time_limit : float or None
+      Maximum time in seconds to optimise. Once the time limit has passed,
+      the optimisation is stopped as if the ``callback`` returned ``True``,
+      also within an iteration. By default (None) there is no time limit.
+
+    rel_tol : float or None
+      Stop iterating once the improvement of an iteration is at most
+      ``rel_tol`` times the absolute quality of the combined partitions. By
+      default (None) only ``n_iterations`` determines the number of
+      iterations.
+
     Returns
     -------
     float
@@ -387,27 +667,27 @@ class Optimiser(object):
     if not layer_weights:
       layer_weights = [1]*len(partitions)
 
-    itr = 0
-    diff = 0
-    continue_iteration = itr < n_iterations or n_iterations < 0
-    while continue_iteration:
-      diff_inc = _c_leiden._Optimiser_optimise_partition_multiplex(
+    def optimise(progress, time_limit):
+      return _c_leiden._Optimiser_optimise_partition_multiplex(
         self._optimiser,
         [partition._partition for partition in partitions],
         layer_weights,
-        is_membership_fixed)
-      diff += diff_inc
-      itr += 1
-      if n_iterations < 0:
-        continue_iteration = (diff_inc > 0)
-      else:
-        continue_iteration = itr < n_iterations
+        is_membership_fixed,
+        progress,
+        time_limit)
 
-    for partition in partitions:
-      partition._update_internal_membership()
-    return diff
+    def quality():
+      return sum(layer_weight*partition.quality()
+                 for partition, layer_weight in zip(partitions, layer_weights))
 
-  def move_nodes(self, partition, is_membership_fixed=None, consider_comms=None):
+    try:
+      return self._optimise_iterations(optimise, quality,
+                                       n_iterations, callback, time_limit, rel_tol)
+    finally:
+      for partition in partitions:
+        partition._update_internal_membership()
+
+  def move_nodes(self, partition, is_membership_fixed=None, consider_comms=None, nodes=None):
     """ Move nodes to alternative communities for *optimising* the partition.
 
     Parameters
@@ -424,6 +704,13 @@ class Optimiser(object):
       If ``None`` uses :attr:`consider_comms`, but can be set to
       something else.
 
+    nodes: list of int or None
+      Nodes that are considered initially. Other nodes are only considered
+      when one of their neighbours moves to another community. By default
+      (None) all nodes are considered initially. This can be used to only
+      consider the nodes affected by
+      :func:`~VertexPartition.MutableVertexPartition.update_edges`.
+
     Returns
     -------
     float
@@ -453,7 +740,7 @@ class Optimiser(object):
     if (consider_comms is None):
       consider_comms = self.consider_comms
     diff = _c_leiden._Optimiser_move_nodes(
-            self._optimiser, partition._partition, is_membership_fixed, consider_comms)
+            self._optimiser, partition._partition, is_membership_fixed, consider_comms, nodes)
     partition._update_internal_membership()
     return diff
 
@@ -638,7 +925,8 @@ class Optimiser(object):
     Returns
     -------
     list of :class:`~VertexPartition.MutableVertexPartition`
-      A list of partitions for different resolutions.
+      A list of partitions for different resolutions. All partitions use the
+      same :class:`SharedGraph`, which is only created once.
 
     Other Parameters
     ----------------
@@ -730,6 +1018,10 @@ class Optimiser(object):
       return partition
 
     assert issubclass(partition_type, LinearResolutionParameterVertexPartition), "Bisectioning only works on partitions with a linear resolution parameter."
+    # Only create the graph once for all partitions
+    if not isinstance(graph, SharedGraph):
+      graph = SharedGraph(graph, weights, kwargs.pop('node_sizes', None))
+      weights = None
     # Start actual bisectioning
     bisect_values = {}
     stack_res_range = []
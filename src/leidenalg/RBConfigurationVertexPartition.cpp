@@ -119,6 +119,54 @@ double RBConfigurationVertexPartition::diff_move(size_t v, size_t new_comm)
   return diff;
 }
 
+/*****************************************************************************
+  Calculate diff_move for all communities at once. The terms for the old
+  community are only calculated once, and the weights and total weights for
+  the new communities are gathered before the differences are calculated in a
+  single loop. The differences are identical to those of diff_move.
+*****************************************************************************/
+void RBConfigurationVertexPartition::diff_moves(size_t v, vector<size_t> const& comms, double weight, vector<double>& improvs)
+{
+  double total_weight = this->graph->total_weight()*(2.0 - this->graph->is_directed());
+  if (total_weight == 0.0)
+    return;
+
+  size_t nb_comms = comms.size();
+  size_t old_comm = this->_membership[v];
+  this->gather_weights_tofrom_comms(v, comms);
+  this->gather_total_weights_tofrom_comms(comms);
+
+  double w_to_old = this->weight_to_comm(v, old_comm);
+  double w_from_old = this->weight_from_comm(v, old_comm);
+  double k_out = this->graph->strength(v, IGRAPH_OUT);
+  double k_in = this->graph->strength(v, IGRAPH_IN);
+  double self_weight = this->graph->node_self_weight(v);
+  double K_out_old = this->total_weight_from_comm(old_comm);
+  double K_in_old = this->total_weight_to_comm(old_comm);
+  double resolution_parameter = this->resolution_parameter;
+  double diff_old = (w_to_old - resolution_parameter*k_out*K_in_old/total_weight) + \
+             (w_from_old - resolution_parameter*k_in*K_out_old/total_weight);
+
+  double const* w_to_new = this->_comms_weight_to.data();
+  double const* w_from_new = this->_comms_weight_from.data();
+  double const* K_in = this->_comms_total_weight_to.data();
+  double const* K_out = this->_comms_total_weight_from.data();
+  this->_comms_diff.resize(nb_comms);
+  double* diff = this->_comms_diff.data();
+  for (size_t idx = 0; idx < nb_comms; idx++)
+  {
+    double K_out_new = K_out[idx] + k_out;
+    double K_in_new = K_in[idx] + k_in;
+    double diff_new = (w_to_new[idx] + self_weight - resolution_parameter*k_out*K_in_new/total_weight) + \
+               (w_from_new[idx] + self_weight - resolution_parameter*k_in*K_out_new/total_weight);
+    diff[idx] = (diff_new - diff_old);
+  }
+
+  for (size_t idx = 0; idx < nb_comms; idx++)
+    if (comms[idx] != old_comm)
+      improvs[idx] += weight*diff[idx];
+}
+
 /*****************************************************************************
   Give the modularity of the partition.
 
@@ -130,7 +178,6 @@ double RBConfigurationVertexPartition::quality(double resolution_parameter)
   #ifdef DEBUG
     cerr << "double ModularityVertexPartition::quality()" << endl;
   #endif
-  double mod = 0.0;
 
   double m;
   if (this->graph->is_directed())
@@ -141,17 +188,12 @@ double RBConfigurationVertexPartition::quality(double resolution_parameter)
   if (m == 0)
     return 0.0;
 
-  for (size_t c = 0; c < this->n_communities(); c++)
-  {
-    double w = this->total_weight_in_comm(c);
-    double w_out = this->total_weight_from_comm(c);
-    double w_in = this->total_weight_to_comm(c);
-    #ifdef DEBUG
-      double csize = this->csize(c);
-      cerr << "\t" << "Comm: " << c << ", size=" << csize << ", w=" << w << ", w_out=" << w_out << ", w_in=" << w_in << "." << endl;
-    #endif
-    mod += w - resolution_parameter*w_out*w_in/((this->graph->is_directed() ? 1.0 : 4.0)*this->graph->total_weight());
-  }
+  double w = this->total_weight_in_all_comms();
+  double w_out_in = this->total_weight_from_to_all_comms();
+  #ifdef DEBUG
+    cerr << "\t" << "w=" << w << ", sum w_out*w_in=" << w_out_in << "." << endl;
+  #endif
+  double mod = w - resolution_parameter*w_out_in/((this->graph->is_directed() ? 1.0 : 4.0)*this->graph->total_weight());
   double q = (2.0 - this->graph->is_directed())*mod;
   #ifdef DEBUG
     cerr << "exit double RBConfigurationVertexPartition::quality()" << endl;
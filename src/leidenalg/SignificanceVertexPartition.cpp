@@ -10,11 +10,15 @@ SignificanceVertexPartition::SignificanceVertexPartition(Graph* graph,
       vector<size_t> const& membership) :
         MutableVertexPartition(graph,
         membership)
-{ }
+{
+  this->_quality_version = 0;
+}
 
 SignificanceVertexPartition::SignificanceVertexPartition(Graph* graph) :
         MutableVertexPartition(graph)
-{ }
+{
+  this->_quality_version = 0;
+}
 
 SignificanceVertexPartition* SignificanceVertexPartition::create(Graph* graph)
 {
@@ -127,6 +131,78 @@ double SignificanceVertexPartition::diff_move(size_t v, size_t new_comm)
   return diff;
 }
 
+/********************************************************************************
+   Calculate the differences of moving node v to each of the communities, as
+   in diff_move. The terms of the old community are the same for all
+   communities, so that only the two terms of the new community need to be
+   calculated for each community.
+*********************************************************************************/
+void SignificanceVertexPartition::diff_moves(size_t v, vector<size_t> const& comms, double weight, vector<double>& improvs)
+{
+  size_t nb_comms = comms.size();
+  size_t old_comm = this->membership(v);
+  this->gather_weights_tofrom_comms(v, comms);
+  this->gather_total_weights_in_comms(comms);
+  this->gather_csizes(comms);
+
+  double normalise = (2.0 - this->graph->is_directed());
+  double p = this->graph->density();
+  double nsize = this->graph->node_size(v);
+  double sw = this->graph->node_self_weight(v);
+
+  // Old comm, before and after the move
+  double n_old = this->csize(old_comm);
+  double N_old = this->graph->possible_edges(n_old);
+  double m_old = this->total_weight_in_comm(old_comm);
+  double q_old = 0.0;
+  if (N_old > 0)
+    q_old = m_old/N_old;
+  double n_oldx = n_old - nsize;
+  double N_oldx = this->graph->possible_edges(n_oldx);
+  double wtc = this->weight_to_comm(v, old_comm) - sw;
+  double wfc = this->weight_from_comm(v, old_comm) - sw;
+  double m_oldx = m_old - wtc/normalise - wfc/normalise - sw;
+  double q_oldx = 0.0;
+  if (N_oldx > 0)
+    q_oldx = m_oldx/N_oldx;
+  double S_old = (double)N_old*KLL(q_old, p);
+  double S_oldx = (double)N_oldx*KLL(q_oldx, p);
+
+  double const* w_to_new = this->_comms_weight_to.data();
+  double const* w_from_new = this->_comms_weight_from.data();
+  double const* m_in_new = this->_comms_total_weight_in.data();
+  double const* csize_new = this->_comms_csize.data();
+  this->_comms_diff.resize(nb_comms);
+  double* diff = this->_comms_diff.data();
+  for (size_t idx = 0; idx < nb_comms; idx++)
+  {
+    // New comm, before and after the move
+    double n_new = csize_new[idx];
+    double N_new = this->graph->possible_edges(n_new);
+    double m_new = m_in_new[idx];
+    double q_new = 0.0;
+    if (N_new > 0)
+      q_new = m_new/N_new;
+    double n_newx = n_new + nsize;
+    double N_newx = this->graph->possible_edges(n_newx);
+    double m_newx = m_new + w_to_new[idx]/normalise + w_from_new[idx]/normalise + sw;
+    double q_newx = 0.0;
+    if (N_newx > 0)
+      q_newx = m_newx/N_newx;
+
+    double comm_diff = 0.0;
+    if (N_oldx != N_new || q_oldx != q_new)
+      comm_diff += S_oldx - (double)N_new*KLL(q_new, p);
+    if (N_newx != N_old || q_newx != q_old)
+      comm_diff += (double)N_newx*KLL(q_newx, p) - S_old;
+    diff[idx] = comm_diff;
+  }
+
+  for (size_t idx = 0; idx < nb_comms; idx++)
+    if (comms[idx] != old_comm)
+      improvs[idx] += weight*diff[idx];
+}
+
 /********************************************************************************
    Calculate the significance of the partition.
 *********************************************************************************/
@@ -136,6 +212,8 @@ double SignificanceVertexPartition::quality()
     cerr << "double SignificanceVertexPartition::quality()";
     double n = this->graph->total_size();
   #endif
+  if (this->_quality_version == this->admin_version())
+    return this->_quality;
   double S = 0.0;
   double p = this->graph->density();
   #ifdef DEBUG
@@ -159,5 +237,7 @@ double SignificanceVertexPartition::quality()
     cerr << "exit SignificanceVertexPartition::quality()" << endl;
     cerr << "return " << S << endl << endl;
   #endif
+  this->_quality = S;
+  this->_quality_version = this->admin_version();
   return S;
 }
@@ -111,6 +111,63 @@ double SurpriseVertexPartition::diff_move(size_t v, size_t new_comm)
   return diff;
 }
 
+/********************************************************************************
+   Calculate the differences of moving node v to each of the communities, as
+   in diff_move. The surprise before the move is the same for all
+   communities, so that it is only calculated once.
+*********************************************************************************/
+void SurpriseVertexPartition::diff_moves(size_t v, vector<size_t> const& comms, double weight, vector<double>& improvs)
+{
+  double m = this->graph->total_weight();
+  if (m == 0)
+    return;
+
+  size_t nb_comms = comms.size();
+  size_t old_comm = this->membership(v);
+  this->gather_weights_tofrom_comms(v, comms);
+  this->gather_csizes(comms);
+
+  size_t nsize = this->graph->node_size(v);
+  double normalise = (2.0 - this->graph->is_directed());
+  size_t n = this->graph->total_size();
+  size_t n2 = this->graph->possible_edges(n);
+
+  // Before move
+  double mc = this->total_weight_in_all_comms();
+  size_t nc2 = this->total_possible_edges_in_all_comms();
+  double q = mc/m;
+  double s = (double)nc2/(double)n2;
+  double S = KLL(q, s);
+
+  // To old comm
+  size_t n_old = this->csize(old_comm);
+  double sw = this->graph->node_self_weight(v);
+  double wtc = this->weight_to_comm(v, old_comm) - sw;
+  double wfc = this->weight_from_comm(v, old_comm) - sw;
+  double m_old = wtc/normalise + wfc/normalise + sw;
+
+  double const* w_to_new = this->_comms_weight_to.data();
+  double const* w_from_new = this->_comms_weight_from.data();
+  double const* csize_new = this->_comms_csize.data();
+  this->_comms_diff.resize(nb_comms);
+  double* diff = this->_comms_diff.data();
+  for (size_t idx = 0; idx < nb_comms; idx++)
+  {
+    // To new comm
+    size_t n_new = csize_new[idx];
+    double m_new = w_to_new[idx]/normalise + w_from_new[idx]/normalise + sw;
+
+    double q_new = (mc - m_old + m_new)/m;
+    double delta_nc2 = 2.0*nsize*(ptrdiff_t)(n_new - n_old + nsize)/normalise;
+    double s_new = (double)(nc2 + delta_nc2)/(double)n2;
+    diff[idx] = m*(KLL(q_new, s_new) - S);
+  }
+
+  for (size_t idx = 0; idx < nb_comms; idx++)
+    if (comms[idx] != old_comm)
+      improvs[idx] += weight*diff[idx];
+}
+
 double SurpriseVertexPartition::quality()
 {
   #ifdef DEBUG
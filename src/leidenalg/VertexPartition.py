@@ -1,6 +1,7 @@
 import igraph as _ig
+from array import array as _array
 from . import _c_leiden
-from .functions import _get_py_capsule
+from .functions import _get_py_capsule, _get_py_graph, _get_py_vector, SharedGraph
 
 class MutableVertexPartition(_ig.VertexClustering):
   """ Contains a partition of a graph, derives from
@@ -48,20 +49,77 @@ class MutableVertexPartition(_ig.VertexClustering):
       node ``i`` is in community ``c``. If ``None``, it is initialised with a singleton
       partition community, i.e. ``membership[i] = i``.
     """
-    if initial_membership is not None:
-      initial_membership = list(initial_membership)
+    # If the graph is given as a tuple (n, edges), or as the filename of a
+    # saved graph, the graph is only created in C, and an ig.Graph is only
+    # created when requested (see _graph). A shared graph keeps its ig.Graph
+    # (if any).
+    if isinstance(graph, SharedGraph):
+      n = graph.vcount()
+      graph = graph._py_graph
+    elif isinstance(graph, tuple):
+      n = graph[0]
+      graph = None
+    elif isinstance(graph, (str, bytes)):
+      # The number of nodes is only known in C, which checks the membership.
+      n = None
+      graph = None
+    else:
+      n = graph.vcount()
 
-    super(MutableVertexPartition, self).__init__(graph, initial_membership)
+    if initial_membership is not None:
+      initial_membership = _get_py_vector(initial_membership)
+      if n is not None and len(initial_membership) != n:
+        raise ValueError("membership list has invalid length")
+
+    # The membership is maintained in C and is only converted to a list when it
+    # is actually requested (see membership). VertexClustering, which scans the
+    # membership in Python, is only initialised when it is needed (see
+    # __getattr__).
+    self._py_graph = graph
+    self._membership_list = None
+    self._nb_communities = 0
+    self._clustering_attrs = None
+
+  # Attributes of the partition itself, as opposed to those of VertexClustering
+  _partition_attrs = frozenset(['_partition', '_py_graph', '_membership_list',
+                                '_nb_communities', '_clustering_attrs'])
+
+  def __getattr__(self, name):
+    # This is only called for attributes that are not set, i.e. those of
+    # VertexClustering before it is initialised. It is then initialised with
+    # its own constructor for the current graph and membership, and the
+    # attributes it sets are removed again whenever the partition changes (see
+    # _reset_clustering).
+    if (name.startswith('__') or name in self._partition_attrs or
+        self.__dict__.get('_clustering_attrs', ()) is not None):
+      raise AttributeError("'{0}' object has no attribute '{1}'".format(
+        type(self).__name__, name))
+    attrs = set(self.__dict__)
+    _ig.VertexClustering.__init__(self, self.graph, self._get_membership_list())
+    self._clustering_attrs = set(self.__dict__) - attrs
+    return getattr(self, name)
+
+  def _reset_clustering(self):
+    if self._clustering_attrs is not None:
+      for name in self._clustering_attrs:
+        self.__dict__.pop(name, None)
+      self._clustering_attrs = None
+
+  @staticmethod
+  def _get_py_igraph(partition):
+    n, directed, edges, weights, node_sizes = _c_leiden._MutableVertexPartition_get_py_igraph(partition)
+    return _ig.Graph(n=n,
+                     directed=directed,
+                     edges=edges,
+                     edge_attrs={'weight': weights},
+                     vertex_attrs={'node_size': node_sizes})
 
   @classmethod
   def _FromCPartition(cls, partition):
-    n, directed, edges, weights, node_sizes = _c_leiden._MutableVertexPartition_get_py_igraph(partition)
-    graph = _ig.Graph(n=n,
-                      directed=directed,
-                      edges=edges,
-                      edge_attrs={'weight': weights},
-                      vertex_attrs={'node_size': node_sizes})
-    new_partition = cls(graph)
+    # Create the partition on an empty graph, the ig.Graph of the partition is
+    # only created from C when requested (see graph).
+    n = len(_c_leiden._MutableVertexPartition_get_membership_buffer(partition)) // 8
+    new_partition = cls((n, []))
     new_partition._partition = partition
     new_partition._update_internal_membership()
     return new_partition
@@ -93,17 +151,69 @@ class MutableVertexPartition(_ig.VertexClustering):
     new_partition = cls(partition.graph, partition.membership, **kwargs)
     return new_partition
 
+  @property
+  def graph(self):
+    """ The graph of the partition. If the partition was not created from an
+    :class:`ig.Graph`, it is only created when requested."""
+    if self._py_graph is None:
+      self._py_graph = self._get_py_igraph(self._partition)
+    return self._py_graph
+
+  @property
+  def membership(self):
+    """ The membership vector of the partition, as a list (see also
+    :attr:`membership_array`)."""
+    return self._get_membership_list()[:]
+
+  def _get_membership_list(self):
+    # Only retrieve the membership from C when it is needed
+    if self._membership_list is None:
+      self._membership_list = _c_leiden._MutableVertexPartition_get_membership(self._partition)
+    return self._membership_list
+
+  def __len__(self):
+    return self._nb_communities
+
   def _update_internal_membership(self):
-    self._membership = _c_leiden._MutableVertexPartition_get_membership(self._partition)
+    # Invalidate the membership, it is retrieved again when needed
+    self._membership_list = None
+    self._reset_clustering()
     # Reset the length of the object, i.e. the number of communities
-    if len(self._membership)>0:
-        self._len = max(m for m in self._membership if m is not None)+1
-    else:
-        self._len = 0
+    self._nb_communities = _c_leiden._MutableVertexPartition_get_nb_clusters(self._partition)
+
+  @property
+  def membership_array(self):
+    """ The membership as a contiguous array of 64 bit integers.
+
+    Returns
+    -------
+    numpy.ndarray or array.array
+      A NumPy array if NumPy is available, otherwise an :class:`array.array`.
+
+    Notes
+    -----
+    In contrast to :attr:`membership`, this does not create a Python integer
+    for each node, which is considerably faster for large graphs. The array is
+    a copy, so changing it does not change the partition; use
+    :func:`~VertexPartition.MutableVertexPartition.set_membership` for that.
+
+    Examples
+    --------
+    >>> G = ig.Graph.Famous('Zachary')
+    >>> partition = la.ModularityVertexPartition(G)
+    >>> list(partition.membership_array) == partition.membership
+    True
+    """
+    buffer = _c_leiden._MutableVertexPartition_get_membership_buffer(self._partition)
+    try:
+      import numpy as np
+    except ImportError:
+      return _array('q', buffer)
+    return np.frombuffer(buffer, dtype=np.int64)
 
   def set_membership(self, membership):
     """ Set membership. """
-    _c_leiden._MutableVertexPartition_set_membership(self._partition, list(membership))
+    _c_leiden._MutableVertexPartition_set_membership(self._partition, _get_py_vector(membership))
     self._update_internal_membership()
 
   # Calculate improvement *if* we move this node
@@ -175,8 +285,8 @@ class MutableVertexPartition(_ig.VertexClustering):
 
     if (not membership_partition is None):
       membership = partition_agg.membership
-      for v in self.graph.vs:
-        membership[self.membership[v.index]] = membership_partition.membership[v.index]
+      for aggregate_node, comm in zip(self._get_membership_list(), membership_partition._get_membership_list()):
+        membership[aggregate_node] = comm
       partition_agg.set_membership(membership)
 
     return partition_agg
@@ -200,8 +310,84 @@ class MutableVertexPartition(_ig.VertexClustering):
     """
     _c_leiden._MutableVertexPartition_move_node(self._partition, v, new_comm)
     # Make sure this move is also reflected in the membership vector of the python object
-    self._membership[v] = new_comm
-    self._modularity_dirty = True
+    if self._membership_list is not None:
+      self._membership_list[v] = new_comm
+    self._reset_clustering()
+    self._nb_communities = _c_leiden._MutableVertexPartition_get_nb_clusters(self._partition)
+
+  def update_edges(self, added_edges=None, added_weights=None,
+                   removed_edges=None, reweighted_edges=None, new_weights=None):
+    """ Update the edges of the graph of this partition in place.
+
+    The administration of the partition (e.g. the total weight within each
+    community) is only updated for the changed edges, and the membership is
+    not changed.
+
+    Parameters
+    ----------
+    added_edges : list of pairs of int, or array
+      Edges to add to the graph, as pairs of nodes. Added edges get the
+      highest edge ids, similar to :func:`ig.Graph.add_edges`.
+
+    added_weights : list of double, or array
+      Weights of the added edges. If :obj:`None`, the weights default to 1.
+
+    removed_edges : list of int, or array
+      Ids of the edges to remove from the graph. Similar to
+      :func:`ig.Graph.delete_edges`, the remaining edges keep their order, so
+      that the edge ids of edges after a removed edge change.
+
+    reweighted_edges : list of int, or array
+      Ids of edges of which the weight changes.
+
+    new_weights : list of double, or array
+      The new weights of ``reweighted_edges``.
+
+    Returns
+    -------
+    list of int
+      The nodes affected by the update, i.e. the endpoints of all changed
+      edges and their neighbours.
+
+    Notes
+    -----
+    The ids in ``removed_edges`` and ``reweighted_edges`` both refer to the
+    edges before the update, and an edge can only be changed once. Whether
+    self-loops are corrected for (see e.g. :class:`CPMVertexPartition`) is
+    determined when the partition is created, and does not change when adding
+    or removing self-loops.
+
+    After the update, :attr:`graph` no longer refers to the graph that was used
+    to create the partition, but to a new :class:`ig.Graph` that reflects the
+    updated edges (with ``weight`` and ``node_size`` attributes), similar to
+    :func:`~VertexPartition.MutableVertexPartition.aggregate_partition`.
+
+    The update itself rebuilds the adjacency structure of the graph, which
+    takes time proportional to the number of nodes and edges of the graph,
+    however small the change. Afterwards, only the affected nodes need to be
+    considered when optimising the partition, using the ``nodes`` argument of
+    :func:`Optimiser.move_nodes`. Moving these nodes takes time proportional to
+    the change, although :func:`Optimiser.move_nodes` still initialises some
+    state proportional to the number of nodes. This is much faster than
+    optimising the entire partition again, but updating many small changes
+    one by one is slower than combining them in a single update.
+
+    Examples
+    --------
+    >>> G = ig.Graph.Famous('Zachary')
+    >>> optimiser = la.Optimiser()
+    >>> partition = la.ModularityVertexPartition(G)
+    >>> diff = optimiser.optimise_partition(partition)
+    >>> nodes = partition.update_edges(added_edges=[(0, 33), (1, 33)],
+    ...                                removed_edges=[0])
+    >>> diff = optimiser.move_nodes(partition, nodes=nodes)
+    """
+    affected_nodes = _c_leiden._MutableVertexPartition_update_edges(self._partition,
+        added_edges, added_weights, removed_edges, reweighted_edges, new_weights)
+    # The graph is created again from the updated graph when requested
+    self._py_graph = None
+    self._reset_clustering()
+    return affected_nodes
 
   def from_coarse_partition(self, partition, coarse_node=None):
     """ Update current partition according to coarser partition.
@@ -253,7 +439,7 @@ class MutableVertexPartition(_ig.VertexClustering):
     """
     # Read the coarser partition
     _c_leiden._MutableVertexPartition_from_coarse_partition(self._partition,
-                                                             partition.membership, coarse_node)
+                                                             partition.membership_array, coarse_node)
     self._update_internal_membership()
 
   def renumber_communities(self):
@@ -430,8 +616,9 @@ class ModularityVertexPartition(MutableVertexPartition):
     """
     Parameters
     ----------
-    graph : :class:`ig.Graph`
-      Graph to define the partition on.
+    graph : :class:`ig.Graph`, tuple or sparse matrix
+      Graph to define the partition on. Can also be given as a tuple ``(n,
+      edges)`` or as a sparse matrix, see :func:`~leidenalg.find_partition`.
 
     initial_membership : list of int
       Initial membership for the partition. If :obj:`None` then defaults to a
@@ -440,8 +627,9 @@ class ModularityVertexPartition(MutableVertexPartition):
     weights : list of double, or edge attribute
       Weights of edges. Can be either an iterable or an edge attribute.
     """
+    graph, weights = _get_py_graph(graph, weights)
     if initial_membership is not None:
-      initial_membership = list(initial_membership)
+      initial_membership = _get_py_vector(initial_membership)
 
     super(ModularityVertexPartition, self).__init__(graph, initial_membership)
     pygraph_t = _get_py_capsule(graph)
@@ -450,8 +638,8 @@ class ModularityVertexPartition(MutableVertexPartition):
       if isinstance(weights, str):
         weights = graph.es[weights]
       else:
-        # Make sure it is a list
-        weights = list(weights)
+        # Make sure it is a list or a buffer
+        weights = _get_py_vector(weights)
 
     self._partition = _c_leiden._new_ModularityVertexPartition(pygraph_t,
         initial_membership, weights)
@@ -503,8 +691,9 @@ class SurpriseVertexPartition(MutableVertexPartition):
     """
     Parameters
     ----------
-    graph : :class:`ig.Graph`
-      Graph to define the partition on.
+    graph : :class:`ig.Graph`, tuple or sparse matrix
+      Graph to define the partition on. Can also be given as a tuple ``(n,
+      edges)`` or as a sparse matrix, see :func:`~leidenalg.find_partition`.
 
     initial_membership : list of int
       Initial membership for the partition. If :obj:`None` then defaults to a
@@ -520,8 +709,9 @@ class SurpriseVertexPartition(MutableVertexPartition):
       the number of nodes of a community. If a node already represents an 
       aggregation, this could be reflect in its node size.
     """
+    graph, weights = _get_py_graph(graph, weights)
     if initial_membership is not None:
-      initial_membership = list(initial_membership)
+      initial_membership = _get_py_vector(initial_membership)
 
     super(SurpriseVertexPartition, self).__init__(graph, initial_membership)
 
@@ -531,15 +721,15 @@ class SurpriseVertexPartition(MutableVertexPartition):
       if isinstance(weights, str):
         weights = graph.es[weights]
       else:
-        # Make sure it is a list
-        weights = list(weights)
+        # Make sure it is a list or a buffer
+        weights = _get_py_vector(weights)
 
     if node_sizes is not None:
       if isinstance(node_sizes, str):
         node_sizes = graph.vs[node_sizes]
       else:
-        # Make sure it is a list
-        node_sizes = list(node_sizes)
+        # Make sure it is a list or a buffer
+        node_sizes = _get_py_vector(node_sizes)
 
     self._partition = _c_leiden._new_SurpriseVertexPartition(pygraph_t,
         initial_membership, weights, node_sizes)
@@ -588,8 +778,9 @@ class SignificanceVertexPartition(MutableVertexPartition):
     """
     Parameters
     ----------
-    graph : :class:`ig.Graph`
-      Graph to define the partition on.
+    graph : :class:`ig.Graph`, tuple or sparse matrix
+      Graph to define the partition on. Can also be given as a tuple ``(n,
+      edges)`` or as a sparse matrix, see :func:`~leidenalg.find_partition`.
 
     initial_membership : list of int
       Initial membership for the partition. If :obj:`None` then defaults to a
@@ -602,8 +793,9 @@ class SignificanceVertexPartition(MutableVertexPartition):
       the number of nodes of a community. If a node already represents an 
       aggregation, this could be reflect in its node size.
     """
+    graph, _ = _get_py_graph(graph)
     if initial_membership is not None:
-      initial_membership = list(initial_membership)
+      initial_membership = _get_py_vector(initial_membership)
 
     super(SignificanceVertexPartition, self).__init__(graph, initial_membership)
 
@@ -613,8 +805,8 @@ class SignificanceVertexPartition(MutableVertexPartition):
       if isinstance(node_sizes, str):
         node_sizes = graph.vs[node_sizes]
       else:
-        # Make sure it is a list
-        node_sizes = list(node_sizes)
+        # Make sure it is a list or a buffer
+        node_sizes = _get_py_vector(node_sizes)
 
     self._partition = _c_leiden._new_SignificanceVertexPartition(pygraph_t, initial_membership, node_sizes)
     self._update_internal_membership()
@@ -643,7 +835,7 @@ class LinearResolutionParameterVertexPartition(MutableVertexPartition):
   """
   def __init__(self, graph, initial_membership=None):
     if initial_membership is not None:
-      initial_membership = list(initial_membership)
+      initial_membership = _get_py_vector(initial_membership)
 
     super(LinearResolutionParameterVertexPartition, self).__init__(graph, initial_membership)
 
@@ -707,8 +899,9 @@ class RBERVertexPartition(LinearResolutionParameterVertexPartition):
     """
     Parameters
     ----------
-    graph : :class:`ig.Graph`
-      Graph to define the partition on.
+    graph : :class:`ig.Graph`, tuple or sparse matrix
+      Graph to define the partition on. Can also be given as a tuple ``(n,
+      edges)`` or as a sparse matrix, see :func:`~leidenalg.find_partition`.
 
     initial_membership : list of int
       Initial membership for the partition. If :obj:`None` then defaults to a
@@ -727,8 +920,9 @@ class RBERVertexPartition(LinearResolutionParameterVertexPartition):
     resolution_parameter : double
       Resolution parameter.
     """
+    graph, weights = _get_py_graph(graph, weights)
     if initial_membership is not None:
-      initial_membership = list(initial_membership)
+      initial_membership = _get_py_vector(initial_membership)
 
     super(RBERVertexPartition, self).__init__(graph, initial_membership)
 
@@ -738,15 +932,15 @@ class RBERVertexPartition(LinearResolutionParameterVertexPartition):
       if isinstance(weights, str):
         weights = graph.es[weights]
       else:
-        # Make sure it is a list
-        weights = list(weights)
+        # Make sure it is a list or a buffer
+        weights = _get_py_vector(weights)
 
     if node_sizes is not None:
       if isinstance(node_sizes, str):
         node_sizes = graph.vs[node_sizes]
       else:
-        # Make sure it is a list
-        node_sizes = list(node_sizes)
+        # Make sure it is a list or a buffer
+        node_sizes = _get_py_vector(node_sizes)
 
     self._partition = _c_leiden._new_RBERVertexPartition(pygraph_t,
         initial_membership, weights, node_sizes, resolution_parameter)
@@ -810,8 +1004,9 @@ class RBConfigurationVertexPartition(LinearResolutionParameterVertexPartition):
     """
     Parameters
     ----------
-    graph : :class:`ig.Graph`
-      Graph to define the partition on.
+    graph : :class:`ig.Graph`, tuple or sparse matrix
+      Graph to define the partition on. Can also be given as a tuple ``(n,
+      edges)`` or as a sparse matrix, see :func:`~leidenalg.find_partition`.
 
     initial_membership : list of int
       Initial membership for the partition. If :obj:`None` then defaults to a
@@ -823,8 +1018,9 @@ class RBConfigurationVertexPartition(LinearResolutionParameterVertexPartition):
     resolution_parameter : double
       Resolution parameter.
     """
+    graph, weights = _get_py_graph(graph, weights)
     if initial_membership is not None:
-      initial_membership = list(initial_membership)
+      initial_membership = _get_py_vector(initial_membership)
 
     super(RBConfigurationVertexPartition, self).__init__(graph, initial_membership)
 
@@ -834,8 +1030,8 @@ class RBConfigurationVertexPartition(LinearResolutionParameterVertexPartition):
       if isinstance(weights, str):
         weights = graph.es[weights]
       else:
-        # Make sure it is a list
-        weights = list(weights)
+        # Make sure it is a list or a buffer
+        weights = _get_py_vector(weights)
 
     self._partition = _c_leiden._new_RBConfigurationVertexPartition(pygraph_t,
         initial_membership, weights, resolution_parameter)
@@ -894,8 +1090,9 @@ class CPMVertexPartition(LinearResolutionParameterVertexPartition):
     """
     Parameters
     ----------
-    graph : :class:`ig.Graph`
-      Graph to define the partition on.
+    graph : :class:`ig.Graph`, tuple or sparse matrix
+      Graph to define the partition on. Can also be given as a tuple ``(n,
+      edges)`` or as a sparse matrix, see :func:`~leidenalg.find_partition`.
 
     initial_membership : list of int
       Initial membership for the partition. If :obj:`None` then defaults to a
@@ -914,8 +1111,9 @@ class CPMVertexPartition(LinearResolutionParameterVertexPartition):
     resolution_parameter : double
       Resolution parameter.
     """
+    graph, weights = _get_py_graph(graph, weights)
     if initial_membership is not None:
-      initial_membership = list(initial_membership)
+      initial_membership = _get_py_vector(initial_membership)
 
     super(CPMVertexPartition, self).__init__(graph, initial_membership)
 
@@ -925,18 +1123,15 @@ class CPMVertexPartition(LinearResolutionParameterVertexPartition):
       if isinstance(weights, str):
         weights = graph.es[weights]
       else:
-        # Make sure it is a list
-        weights = list(weights)
+        # Make sure it is a list or a buffer
+        weights = _get_py_vector(weights)
 
     if node_sizes is not None:
       if isinstance(node_sizes, str):
         node_sizes = graph.vs[node_sizes]
       else:
-        # Make sure it is a list
-        node_sizes = list(node_sizes)
-
-    if correct_self_loops is None:
-      correct_self_loops = any(graph.is_loop())
+        # Make sure it is a list or a buffer
+        node_sizes = _get_py_vector(node_sizes)
 
     self._partition = _c_leiden._new_CPMVertexPartition(pygraph_t,
         initial_membership, weights, node_sizes, resolution_parameter, correct_self_loops)
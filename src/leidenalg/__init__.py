@@ -41,8 +41,12 @@ from .functions import MOVE_NODES
 from .functions import MERGE_NODES
 
 from .functions import find_partition
+from .functions import find_partition_ensemble
 from .functions import find_partition_multiplex
+from .functions import find_partition_streaming
 from .functions import find_partition_temporal
+from .functions import save_graph
+from .functions import SharedGraph
 from .functions import slices_to_layers
 from .functions import time_slices_to_layers
 
@@ -1,3 +1,4 @@
+import os
 import sys
 import igraph as _ig
 from . import _c_leiden
@@ -12,13 +13,174 @@ from ._c_leiden import MERGE_NODES
 from collections import Counter
 
 
+def _is_graph_file(graph):
+  return isinstance(graph, (str, bytes, os.PathLike))
+
 def _get_py_capsule(graph):
+  """ Return the graph as a capsule, or, if the graph is given as a tuple
+  ``(n, edges)`` or ``(n, edges, directed)``, as a tuple that is read in C.
+  The filename of a graph saved by :func:`save_graph` is also read in C."""
+  if _is_graph_file(graph):
+    return os.fspath(graph)
+  if isinstance(graph, SharedGraph):
+    return graph._shared_graph
+  if isinstance(graph, tuple):
+    if len(graph) == 2:
+      n, edges = graph
+      directed = False
+    elif len(graph) == 3:
+      n, edges, directed = graph
+    else:
+      raise ValueError("Expected a tuple (n, edges) or (n, edges, directed).")
+    try:
+      memoryview(edges)
+    except TypeError:
+      edges = list(edges)
+    return (int(n), edges, bool(directed))
   return graph.__graph_as_capsule()
 
+def _is_sparse_matrix(graph):
+  # Only check for sparse matrices if scipy has actually been imported
+  sparse = sys.modules.get('scipy.sparse')
+  return sparse is not None and sparse.issparse(graph)
+
+def _get_py_graph(graph, weights=None):
+  """ Return the graph either as an :class:`ig.Graph` or as a tuple ``(n, edges,
+  directed)``, together with the weights.
+
+  A sparse matrix ``A`` (or a tuple ``(A, directed)``) is converted to a tuple,
+  where ``A[i, j]`` is the weight of the edge from ``i`` to ``j``. If not
+  specified, the graph is considered undirected if ``A`` is symmetric. For
+  undirected graphs, only the upper triangle of ``A`` is used. The entries of
+  ``A`` are used as weights, unless weights are specified explicitly."""
+  if _is_graph_file(graph):
+    graph = os.fspath(graph)
+
+  directed = None
+  if isinstance(graph, tuple) and len(graph) == 2 and _is_sparse_matrix(graph[0]):
+    graph, directed = graph
+
+  if _is_sparse_matrix(graph):
+    import numpy as np
+    n_rows, n_cols = graph.shape
+    if n_rows != n_cols:
+      raise ValueError("Expected a square matrix.")
+    if directed is None:
+      directed = (graph != graph.T).nnz > 0
+    matrix = graph.tocoo()
+    source, target, values = matrix.row, matrix.col, matrix.data
+    if not directed:
+      upper = source <= target
+      source, target, values = source[upper], target[upper], values[upper]
+    graph = (n_rows, np.column_stack((source, target)), bool(directed))
+    if weights is None:
+      weights = np.asarray(values, dtype=float)
+
+  if isinstance(graph, SharedGraph) and weights is not None:
+    raise ValueError("Cannot specify weights for a shared graph.")
+
+  if isinstance(weights, str) and not isinstance(graph, _ig.Graph):
+    raise ValueError("Weights can only be given as an edge attribute for an ig.Graph.")
+
+  return graph, weights
+
+def _get_py_vector(values):
+  """ Return the values as a list, unless they support the buffer protocol
+  (e.g. a NumPy array), in which case they are read directly in C."""
+  try:
+    memoryview(values)
+    return values
+  except TypeError:
+    return list(values)
+
+class SharedGraph(object):
+  """ A graph that can be used by multiple partitions, without creating the
+  graph again for each partition.
+
+  Each partition creates its own copy of the graph in C++, including the
+  strengths, degrees and neighbours of each node. Partitions that are created
+  from a :class:`SharedGraph` instead all use the same graph, which is only
+  created once. This is useful when creating many partitions of the same
+  graph, for example for different resolution parameters (see
+  :func:`Optimiser.resolution_profile`), different types of partitions, or
+  different seeds.
+
+  The shared graph can not be changed. If the edges of a partition of the
+  shared graph are updated (see
+  :func:`~VertexPartition.MutableVertexPartition.update_edges`), the
+  partition first copies the graph. The graph is deleted once the shared
+  graph and all its partitions are deleted.
+
+  Parameters
+  ----------
+  graph : :class:`ig.Graph`, tuple or sparse matrix
+    The graph to share, see :func:`find_partition`.
+
+  weights : list of double, or edge attribute
+    Weights of edges. Can be either an iterable or an edge attribute. The
+    weights are part of the shared graph, and can not be specified again when
+    creating a partition.
+
+  node_sizes : list of double, or vertex attribute
+    Sizes of nodes, part of the shared graph, similar to ``weights``.
+
+  Examples
+  --------
+  >>> G = ig.Graph.Famous('Zachary')
+  >>> shared_graph = la.SharedGraph(G)
+  >>> partitions = [la.find_partition(shared_graph, la.CPMVertexPartition,
+  ...                                 resolution_parameter=res)
+  ...               for res in [0.05, 0.1, 0.5]]
+  >>> modularity = la.ModularityVertexPartition(shared_graph,
+  ...                                           partitions[0].membership)
+  """
+  def __init__(self, graph, weights=None, node_sizes=None):
+    graph, weights = _get_py_graph(graph, weights)
+    if isinstance(weights, str):
+      weights = graph.es[weights]
+    elif weights is not None:
+      weights = _get_py_vector(weights)
+    if isinstance(node_sizes, str):
+      node_sizes = graph.vs[node_sizes]
+    elif node_sizes is not None:
+      node_sizes = _get_py_vector(node_sizes)
+
+    self._shared_graph = _c_leiden._new_SharedGraph(_get_py_capsule(graph), weights, node_sizes)
+    self._n, self._m, self._directed = _c_leiden._SharedGraph_get_info(self._shared_graph)
+
+    # Keep the ig.Graph (if any), which is returned by the graph of partitions
+    self._py_graph = graph if isinstance(graph, _ig.Graph) else None
+
+  @property
+  def graph(self):
+    """ The :class:`ig.Graph`, including the weights (``weight``) and node
+    sizes (``node_size``) if it is not given as an :class:`ig.Graph`, in
+    which case it is only created when requested."""
+    if self._py_graph is None:
+      n, directed, edges, weights, node_sizes = _c_leiden._SharedGraph_get_py_igraph(self._shared_graph)
+      self._py_graph = _ig.Graph(n=n,
+                                 directed=directed,
+                                 edges=edges,
+                                 edge_attrs={'weight': weights},
+                                 vertex_attrs={'node_size': node_sizes})
+    return self._py_graph
+
+  def vcount(self):
+    """ The number of nodes of the graph."""
+    return self._n
+
+  def ecount(self):
+    """ The number of edges of the graph."""
+    return self._m
+
+  def is_directed(self):
+    """ Whether the graph is directed."""
+    return self._directed
+
 from .VertexPartition import *
 from .Optimiser import *
 
-def find_partition(graph, partition_type, initial_membership=None, weights=None, n_iterations=2, max_comm_size=0, seed=None, **kwargs):
+def find_partition(graph, partition_type, initial_membership=None, weights=None, n_iterations=2, max_comm_size=0, seed=None, time_limit=None, rel_tol=None, **kwargs):
   """ Detect communities using the default settings.
 
   This function detects communities given the specified method in the
@@ -31,8 +193,19 @@ def find_partition(graph, partition_type, initial_membership=None, weights=None,
 
   Parameters
   ----------
-  graph : :class:`ig.Graph`
-    The graph for which to detect communities.
+  graph : :class:`ig.Graph`, tuple or sparse matrix
+    The graph for which to detect communities. Alternatively, the graph can be
+    given as a tuple ``(n, edges)`` or ``(n, edges, directed)``, where ``n`` is
+    the number of nodes and ``edges`` contains the edges, for example as a
+    NumPy array with two columns. The graph is then created directly in C,
+    without creating a :class:`ig.Graph`. In that case, ``weights`` should be
+    given as values, not as an edge attribute. The graph can also be given as
+    a square ``scipy.sparse`` matrix ``A``, where ``A[i, j]`` is the weight of
+    the edge from ``i`` to ``j``, or a tuple ``(A, directed)``. Unless
+    specified, the graph is undirected if ``A`` is symmetric, and only the
+    upper triangle of ``A`` is then used. Finally, the graph can be given as
+    the filename of a graph saved by :func:`save_graph`, or as a
+    :class:`SharedGraph`.
 
   partition_type : type of :class:`
     The type of partition to use for optimisation.
@@ -57,6 +230,15 @@ def find_partition(graph, partition_type, initial_membership=None, weights=None,
     Seed for the random number generator. By default uses a random seed
     if nothing is specified.
 
+  time_limit : float or None
+    Maximum time in seconds to optimise, see
+    :func:`Optimiser.optimise_partition`. By default (None) there is no time
+    limit.
+
+  rel_tol : float or None
+    Stop iterating once the improvement of an iteration is at most ``rel_tol``
+    times the absolute quality, see :func:`Optimiser.optimise_partition`.
+
   **kwargs
     Remaining keyword arguments, passed on to constructor of
     ``partition_type``.
@@ -75,6 +257,16 @@ def find_partition(graph, partition_type, initial_membership=None, weights=None,
   >>> G = ig.Graph.Famous('Zachary')
   >>> partition = la.find_partition(G, la.ModularityVertexPartition)
 
+  The same graph can also be passed as an edge list
+
+  >>> partition = la.find_partition((G.vcount(), G.get_edgelist()),
+  ...                               la.ModularityVertexPartition)
+
+  or, iterating until convergence for at most two seconds
+
+  >>> partition = la.find_partition(G, la.ModularityVertexPartition,
+  ...                               n_iterations=-1, time_limit=2)
+
   """
   if not weights is None:
     kwargs['weights'] = weights
@@ -88,10 +280,388 @@ def find_partition(graph, partition_type, initial_membership=None, weights=None,
   if (not seed is None):
     optimiser.set_rng_seed(seed)
 
-  optimiser.optimise_partition(partition, n_iterations)
+  optimiser.optimise_partition(partition, n_iterations,
+                               time_limit=time_limit, rel_tol=rel_tol)
+
+  return partition
+
+def find_partition_ensemble(graph, partition_type, n_runs=10, initial_membership=None, weights=None, n_iterations=2, max_comm_size=0, seed=None, n_threads=0, return_memberships=False, time_limit=None, **kwargs):
+  """ Detect communities using multiple independent runs, and return the
+  best partition.
+
+  This runs the Leiden algorithm ``n_runs`` times with different seeds on
+  multiple threads, and returns the partition with the highest quality. All
+  runs share the same graph, so that the graph is not copied for each run.
+  Apart from the number of runs and threads, the parameters are the same as
+  for :func:`find_partition`.
+
+  Parameters
+  ----------
+  graph : :class:`ig.Graph`, tuple or sparse matrix
+    The graph for which to detect communities, see :func:`find_partition`.
+
+  partition_type : type of :class:`
+    The type of partition to use for optimisation.
+
+  n_runs : int
+    Number of independent runs.
+
+  initial_membership : list of int
+    Initial membership for the partition, from which each run starts. If
+    :obj:`None` then defaults to a singleton partition.
+
+  weights : list of double, or edge attribute
+    Weights of edges. Can be either an iterable or an edge attribute.
+
+  n_iterations : int
+    Number of iterations of each run. If the number of iterations is
+    negative, each run continues until an iteration in which there was no
+    improvement.
+
+  max_comm_size : non-negative int
+    Maximal total size of nodes in a community. If zero (the default), then
+    communities can be of any size.
+
+  seed : int
+    Seed of the first run, run ``k`` uses seed ``seed + k``, so that the
+    first run gives the same partition as :func:`find_partition` with the
+    same seed. By default uses random seeds if nothing is specified.
+
+  n_threads : int
+    Number of threads to use. If zero (the default), all available cores
+    are used. The result does not depend on the number of threads.
+
+  return_memberships : bool
+    Whether to also return the membership of each run.
+
+  time_limit : float or None
+    Maximum time in seconds to optimise, after which all runs are stopped.
+    By default (None) there is no time limit.
+
+  **kwargs
+    Remaining keyword arguments, passed on to constructor of
+    ``partition_type``.
+
+  Returns
+  -------
+  partition
+    The partition with the highest quality among all runs.
+
+  numpy.ndarray or list of array.array
+    The membership of each run, only returned if ``return_memberships`` is
+    ``True``, see :func:`Optimiser.optimise_partition_ensemble`.
+
+  See Also
+  --------
+  :func:`Optimiser.optimise_partition_ensemble`
+
+  Examples
+  --------
+  >>> G = ig.Graph.Famous('Zachary')
+  >>> partition = la.find_partition_ensemble(G, la.ModularityVertexPartition,
+  ...                                        n_runs=4, seed=42)
+
+  or, keeping the membership of each run
+
+  >>> partition, memberships = la.find_partition_ensemble(
+  ...                             G, la.ModularityVertexPartition,
+  ...                             n_runs=4, return_memberships=True)
+  """
+  if not weights is None:
+    kwargs['weights'] = weights
+  partition = partition_type(graph,
+                             initial_membership=initial_membership,
+                             **kwargs)
+  optimiser = Optimiser()
+
+  optimiser.max_comm_size = max_comm_size
+  optimiser.n_threads = n_threads
+
+  seeds = None
+  if (not seed is None):
+    seeds = [seed + run for run in range(n_runs)]
+
+  result = optimiser.optimise_partition_ensemble(partition, n_runs, seeds,
+                                                 n_iterations,
+                                                 return_memberships=return_memberships,
+                                                 time_limit=time_limit)
 
+  if return_memberships:
+    return partition, result[1]
   return partition
 
+def _read_edge_chunks(edges, format, chunk_size):
+  """ Yield the edges in chunks of at most ``chunk_size`` edges, as tuples
+  ``(edges, weights)``, see :func:`find_partition_streaming`."""
+  if callable(edges):
+    for chunk in edges():
+      if isinstance(chunk, tuple):
+        yield chunk
+      else:
+        yield chunk, None
+    return
+
+  import numpy as np
+  if format == 'tsv':
+    from itertools import islice
+    with open(edges, 'r') as f:
+      while True:
+        lines = [line for line in islice(f, chunk_size)]
+        if not lines:
+          break
+        lines = [line for line in lines if line.strip() and not line.lstrip().startswith('#')]
+        if not lines:
+          continue
+        data = np.loadtxt(lines, ndmin=2)
+        if data.shape[1] not in (2, 3):
+          raise ValueError("Expected two or three columns in edge file.")
+        weights = data[:, 2].copy() if data.shape[1] == 3 else None
+        yield data[:, :2].astype(np.int64), weights
+  elif format == 'binary':
+    record = np.dtype([('source', '<i8'), ('target', '<i8'), ('weight', '<f8')])
+    with open(edges, 'rb') as f:
+      while True:
+        data = f.read(chunk_size*record.itemsize)
+        if not data:
+          break
+        if len(data) % record.itemsize != 0:
+          raise ValueError("Edge file does not consist of (int64, int64, float64) records.")
+        data = np.frombuffer(data, dtype=record)
+        yield (np.column_stack((data['source'], data['target'])),
+               np.ascontiguousarray(data['weight']))
+  else:
+    raise ValueError("Unknown format {0}, expected 'tsv' or 'binary'.".format(format))
+
+def find_partition_streaming(edges, partition_type, n=0, directed=False, format='tsv', chunk_size=1000000, max_degree=None, max_stream_comm_size=10, max_aggregate_size=2.0, n_iterations=2, seed=None, **kwargs):
+  """ Detect communities while streaming the edges, without keeping the graph
+  in memory.
+
+  The edges are read twice, in chunks. In the first pass, nodes are clustered
+  while streaming the edges: for each edge, the node in the community with the
+  lowest total degree joins the community of the other node, as long as both
+  nodes have a degree of at most ``max_degree`` so far [1], and the community
+  has fewer than ``max_stream_comm_size`` nodes. In the second
+  pass, the edges are aggregated to edges between these communities. The
+  aggregate graph is then optimised using the Leiden algorithm, similar to
+  :func:`find_partition`. Only the state of each node and the aggregate graph
+  are kept in memory, not the edges themselves.
+
+  Since a single pass over the edges only clusters the nodes coarsely, the
+  aggregate graph may still have almost as many edges as the original graph.
+  Once the aggregate graph of the edges so far has more than
+  ``max_aggregate_size`` edges per node (checked after each chunk), it is
+  optimised using the Leiden algorithm, and its communities are merged
+  accordingly, before aggregating the remaining edges. In this way, the
+  memory is bounded by the number of nodes and the ``chunk_size``, not by the
+  number of edges.
+
+  Parameters
+  ----------
+  edges : str, path or callable
+    A file with the edges. Alternatively, a function that returns an iterable
+    over chunks of edges, each chunk either an array of edges with two
+    columns (or a list of pairs), or a tuple ``(edges, weights)``. The
+    function is called once for each pass, and should return the same edges
+    every time.
+
+  partition_type : type of :class:`MutableVertexPartition`
+    The type of partition to use for optimisation.
+
+  n : int
+    Number of nodes. Nodes that appear in the edges are always included, so
+    this only needs to be specified if there are nodes without any edges.
+
+  directed : bool
+    Whether the edges are directed. The edges are only considered as
+    directed when optimising the aggregate graph.
+
+  format : str
+    Format of the edge file, either ``'tsv'`` for lines with a source, a
+    target and optionally a weight, separated by whitespace (lines starting
+    with ``#`` are ignored), or ``'binary'`` for records of a 64 bit integer
+    source, a 64 bit integer target and a 64 bit float weight (in little
+    endian byte order). Reading files requires NumPy.
+
+  chunk_size : int
+    Number of edges that are read from the file at once.
+
+  max_degree : float
+    Only nodes with a (weighted) degree of at most ``max_degree`` are moved
+    while streaming, so that communities are not merged through high degree
+    nodes. If :obj:`None` (the default), the degree is not limited.
+
+  max_stream_comm_size : non-negative int
+    Maximal number of nodes in a community of the first pass. If zero, then
+    communities can be of any size.
+
+  max_aggregate_size : float or None
+    Maximal number of edges of the aggregate graph per node, beyond which
+    communities of the aggregate graph are merged while aggregating the
+    edges. If merging does not halve the number of edges, this limit is
+    doubled, so that the communities are not merged again for each chunk. If
+    :obj:`None`, the size of the aggregate graph is not limited.
+
+  n_iterations : int
+    Number of iterations to run the Leiden algorithm on the aggregate graph.
+    By default, 2 iterations are run. If the number of iterations is negative,
+    the Leiden algorithm is run until an iteration in which there was no
+    improvement.
+
+  seed : int
+    Seed for the random number generator. By default uses a random seed
+    if nothing is specified.
+
+  **kwargs
+    Remaining keyword arguments, passed on to constructor of
+    ``partition_type``, for example a ``resolution_parameter``. The weights
+    are given with the edges, and the node sizes of the aggregate graph are
+    the number of nodes in each community, so ``weights`` and ``node_sizes``
+    cannot be specified.
+
+  Returns
+  -------
+  numpy.ndarray or array.array
+    The membership of the nodes, as in
+    :attr:`~VertexPartition.MutableVertexPartition.membership_array`.
+
+  partition
+    The optimised partition of the aggregate graph, in which each node is a
+    community of the first pass. Its quality is identical to the quality of
+    the membership on the original graph.
+
+  Notes
+  -----
+  Nodes are never split from the communities of the first pass, so that the
+  quality is usually lower than the quality found by :func:`find_partition`.
+  A lower ``max_stream_comm_size`` results in fewer nodes that end up in the
+  wrong community, but also in a larger aggregate graph, which has at least
+  ``n/max_stream_comm_size`` nodes. Similarly, communities that are merged
+  because of ``max_aggregate_size`` are only based on part of the edges, so
+  that a larger ``max_aggregate_size`` results in a higher quality, at the
+  cost of more memory.
+
+  References
+  ----------
+  .. [1] Hollocou, A., Maudet, J., Bonald, T., & Lelarge, M. (2017). A
+         streaming algorithm for graph clustering. arXiv:1712.04337.
+
+  Examples
+  --------
+  >>> G = ig.Graph.Famous('Zachary')
+  >>> def chunks():
+  ...   edges = G.get_edgelist()
+  ...   for i in range(0, len(edges), 10):
+  ...     yield edges[i:i + 10]
+  >>> membership, partition = la.find_partition_streaming(chunks,
+  ...                                                     la.ModularityVertexPartition)
+  """
+  if max_degree is None:
+    max_degree = float('inf')
+  for name in ('weights', 'node_sizes'):
+    if kwargs.get(name) is not None:
+      raise ValueError("Cannot specify {0} when streaming edges.".format(name))
+  # The initial membership refers to the nodes, not to the aggregate graph.
+  kwargs = {name: value for name, value in kwargs.items()
+            if name not in ('weights', 'node_sizes', 'initial_membership')}
+
+  stream = _c_leiden._new_GraphStream(n, directed, max_degree, max_stream_comm_size)
+  for chunk_edges, chunk_weights in _read_edge_chunks(edges, format, chunk_size):
+    _c_leiden._GraphStream_cluster_edges(stream, _get_py_vector(chunk_edges), chunk_weights)
+
+  # The partition of a (nearly) empty graph only determines the type and
+  # parameters of the partition of the aggregate graph. It contains a self-loop
+  # if the edges do, so that self-loops are corrected for in the same way as
+  # for a partition of the original graph.
+  if _c_leiden._GraphStream_has_self_loops(stream):
+    empty_partition = partition_type((1, [(0, 0)], directed), **kwargs)
+  else:
+    empty_partition = partition_type((0, [], directed), **kwargs)
+
+  optimiser = Optimiser()
+  if (not seed is None):
+    optimiser.set_rng_seed(seed)
+
+  max_aggregate_ecount = None
+  if max_aggregate_size is not None:
+    max_aggregate_ecount = max_aggregate_size*_c_leiden._GraphStream_get_info(stream)[0]
+  for chunk_edges, chunk_weights in _read_edge_chunks(edges, format, chunk_size):
+    _c_leiden._GraphStream_aggregate_edges(stream, _get_py_vector(chunk_edges), chunk_weights)
+    if max_aggregate_ecount is None:
+      continue
+
+    aggregate_ecount = _c_leiden._GraphStream_get_info(stream)[2]
+    if aggregate_ecount > max_aggregate_ecount:
+      # Merge the communities of the aggregate graph so far.
+      partition = partition_type._FromCPartition(
+        _c_leiden._GraphStream_aggregate_partition(stream, empty_partition._partition))
+      optimiser.optimise_partition(partition, n_iterations)
+      _c_leiden._GraphStream_merge_communities(stream, partition._partition)
+      del partition
+
+      aggregate_ecount = _c_leiden._GraphStream_get_info(stream)[2]
+      if aggregate_ecount > max_aggregate_ecount/2:
+        max_aggregate_ecount *= 2
+
+  partition = partition_type._FromCPartition(
+    _c_leiden._GraphStream_aggregate_partition(stream, empty_partition._partition))
+  optimiser.optimise_partition(partition, n_iterations)
+
+  buffer = _c_leiden._GraphStream_get_membership_buffer(stream, partition._partition)
+  try:
+    import numpy as np
+  except ImportError:
+    from array import array
+    return array('q', buffer), partition
+  return np.frombuffer(buffer, dtype=np.int64), partition
+
+def save_graph(graph, filename, weights=None, node_sizes=None):
+  """ Save a graph to a file, which can be used instead of the graph itself.
+
+  The graph is stored in the internal format of the C++ library, including
+  the adjacency of each node. Partitions that are created from the filename
+  map the file in memory instead of reading it, so that creating the
+  partition is almost instantaneous, only the parts of the graph that are
+  accessed are read from disk, and multiple processes that use the same file
+  share its memory. The graph is only copied in memory when its edges are
+  updated (see :func:`MutableVertexPartition.update_edges`).
+
+  The file can only be loaded on a platform with the same byte order and
+  word size.
+
+  Parameters
+  ----------
+  graph : :class:`ig.Graph`, tuple or sparse matrix
+    The graph to save, see :func:`find_partition`.
+
+  filename : str or path
+    The file to save the graph to.
+
+  weights : list of double, or edge attribute
+    Weights of edges. Can be either an iterable or an edge attribute. The
+    weights are stored with the graph, and can not be changed when the graph
+    is loaded.
+
+  node_sizes : list of double, or vertex attribute
+    Sizes of nodes, stored with the graph, similar to ``weights``.
+
+  Examples
+  --------
+  >>> G = ig.Graph.Famous('Zachary')
+  >>> la.save_graph(G, 'zachary.graph') # doctest: +SKIP
+  >>> partition = la.find_partition('zachary.graph',
+  ...                               la.ModularityVertexPartition) # doctest: +SKIP
+  """
+  graph, weights = _get_py_graph(graph, weights)
+  if isinstance(weights, str):
+    weights = graph.es[weights]
+  elif weights is not None:
+    weights = _get_py_vector(weights)
+  if isinstance(node_sizes, str):
+    node_sizes = graph.vs[node_sizes]
+  elif node_sizes is not None:
+    node_sizes = _get_py_vector(node_sizes)
+  _c_leiden._save_graph(_get_py_capsule(graph), os.fspath(filename), weights, node_sizes)
+
 def find_partition_multiplex(graphs, partition_type, n_iterations=2, max_comm_size=0, seed=None, **kwargs):
   """ Detect communities for multiplex graphs.
 
@@ -103,7 +673,8 @@ def find_partition_multiplex(graphs, partition_type, n_iterations=2, max_comm_si
   Parameters
   ----------
   graphs : list of :class:`ig.Graph`
-    List of :class:`ig.Graph` graphs to optimise.
+    List of :class:`ig.Graph` graphs to optimise. Graphs can also be given as
+    edge lists or sparse matrices, see :func:`find_partition`.
 
   partition_type : type of :class:`MutableVertexPartition`
     The type of partition to use for optimisation (identical for all graphs).
@@ -17,6 +17,148 @@
     Optimiser* optimiser = decapsule_Optimiser(py_optimiser);
     delete optimiser;
   }
+
+  /****************************************************************************
+    Progress callback of the optimiser while the GIL is released. It acquires
+    the GIL to check for signals (e.g. KeyboardInterrupt) and to call the
+    Python callback (if any) with a dictionary of the progress, stopping the
+    optimisation if a signal handler or the callback raised an exception, or
+    if the callback returned True. The exception is kept until the GIL is
+    reacquired after optimising, when it should be restored.
+  ****************************************************************************/
+  class PythonProgress
+  {
+    public:
+      PythonProgress(PyObject* py_callback)
+      {
+        this->py_callback = (py_callback == Py_None) ? NULL : py_callback;
+        this->error_type = NULL;
+        this->error_value = NULL;
+        this->error_traceback = NULL;
+      };
+
+      ~PythonProgress()
+      {
+        Py_XDECREF(this->error_type);
+        Py_XDECREF(this->error_value);
+        Py_XDECREF(this->error_traceback);
+      };
+
+      bool operator()(OptimiserProgress const& progress)
+      {
+        PyGILState_STATE gil_state = PyGILState_Ensure();
+        bool stop = false;
+        if (PyErr_CheckSignals() < 0)
+          stop = true;
+        else if (this->py_callback != NULL)
+        {
+          PyObject* py_progress = Py_BuildValue("{s:n,s:n,s:n,s:n,s:d}",
+            "level", (Py_ssize_t) progress.level,
+            "nodes_visited", (Py_ssize_t) progress.nodes_visited,
+            "queue_size", (Py_ssize_t) progress.queue_size,
+            "n_communities", (Py_ssize_t) progress.n_communities,
+            "improvement", progress.improvement);
+          PyObject* py_result = NULL;
+          if (py_progress != NULL)
+          {
+            py_result = PyObject_CallFunctionObjArgs(this->py_callback, py_progress, NULL);
+            Py_DECREF(py_progress);
+          }
+          if (py_result == NULL)
+            stop = true;
+          else
+          {
+            stop = (PyObject_IsTrue(py_result) != 0);
+            Py_DECREF(py_result);
+          }
+        }
+        // Keep the first exception, which may be raised in any of the threads
+        // of optimise_partition_ensemble.
+        if (PyErr_Occurred())
+        {
+          if (this->error_type == NULL)
+            PyErr_Fetch(&this->error_type, &this->error_value, &this->error_traceback);
+          else
+            PyErr_Clear();
+        }
+        PyGILState_Release(gil_state);
+        return stop;
+      };
+
+      // Restore the exception raised while optimising (if any), and return
+      // whether there was one. Should be called with the GIL held.
+      bool restore_error()
+      {
+        if (this->error_type == NULL)
+          return false;
+        PyErr_Restore(this->error_type, this->error_value, this->error_traceback);
+        this->error_type = NULL;
+        this->error_value = NULL;
+        this->error_traceback = NULL;
+        return true;
+      };
+
+    private:
+      PyObject* py_callback;
+      PyObject* error_type;
+      PyObject* error_value;
+      PyObject* error_traceback;
+  };
+
+  // Use the progress callback and time limit for the optimiser, until going
+  // out of scope (while holding the mutex of the optimiser).
+  class ProgressGuard
+  {
+    public:
+      ProgressGuard(Optimiser* optimiser, PythonProgress& progress, double time_limit)
+      {
+        this->optimiser = optimiser;
+        optimiser->progress_callback = std::ref(progress);
+        optimiser->set_time_limit(time_limit);
+      };
+      ~ProgressGuard()
+      {
+        this->optimiser->progress_callback = nullptr;
+        this->optimiser->set_time_limit(-1);
+      };
+
+    private:
+      Optimiser* optimiser;
+  };
+// Convert the statistics of each level to a list of dictionaries, see
+// Optimiser.last_run_stats.
+static PyObject* build_last_run_stats(vector<OptimiserLevelStats> const& last_run_stats)
+{
+  PyObject* py_stats = PyList_New(last_run_stats.size());
+  if (py_stats == NULL)
+    return NULL;
+  for (size_t level = 0; level < last_run_stats.size(); level++)
+  {
+    OptimiserLevelStats const& stats = last_run_stats[level];
+    PyObject* py_level_stats = Py_BuildValue("{s:n,s:d,s:d,s:d,s:d,s:n,s:n,s:n,s:n,s:n,s:n,s:n,s:d}",
+      "level", (Py_ssize_t) level,
+      "move_nodes_time", stats.move_nodes_time,
+      "refine_time", stats.refine_time,
+      "collapse_graph_time", stats.collapse_graph_time,
+      "from_coarse_partition_time", stats.from_coarse_partition_time,
+      "nodes_visited", (Py_ssize_t) stats.nodes_visited,
+      "nodes_requeued", (Py_ssize_t) stats.nodes_requeued,
+      "nodes_moved", (Py_ssize_t) stats.nodes_moved,
+      "n_communities_before", (Py_ssize_t) stats.n_communities_before,
+      "n_communities_after", (Py_ssize_t) stats.n_communities_after,
+      "collapsed_vcount", (Py_ssize_t) stats.collapsed_vcount,
+      "collapsed_ecount", (Py_ssize_t) stats.collapsed_ecount,
+      "improvement", stats.improvement);
+    if (py_level_stats == NULL)
+    {
+      Py_DECREF(py_stats);
+      return NULL;
+    }
+    PyList_SET_ITEM(py_stats, level, py_level_stats);
+  }
+  return py_stats;
+}
+
 #ifdef __cplusplus
 extern "C"
 {
@@ -40,16 +182,19 @@ extern "C"
     PyObject* py_optimiser = NULL;
     PyObject* py_partition = NULL;
     PyObject* py_is_membership_fixed = NULL;
+    PyObject* py_callback = NULL;
+    double time_limit = -1;
 
-    static const char* kwlist[] = {"optimiser", "partition", "is_membership_fixed", NULL};
+    static const char* kwlist[] = {"optimiser", "partition", "is_membership_fixed", "callback", "time_limit", NULL};
 
     #ifdef DEBUG
       cerr << "Parsing arguments..." << endl;
     #endif
 
-    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OO|O", (char**) kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OO|OOd", (char**) kwlist,
                                      &py_optimiser, &py_partition,
-                                     &py_is_membership_fixed))
+                                     &py_is_membership_fixed, &py_callback,
+                                     &time_limit))
         return NULL;
 
     #ifdef DEBUG
@@ -94,17 +239,40 @@ extern "C"
       }
     }
 
+    // Release the GIL while optimising, all Python arguments have been converted.
     double q = 0.0;
+    vector<OptimiserLevelStats> last_run_stats;
+    bool failed = false;
+    string error_message;
+    PythonProgress progress(py_callback);
+    Py_BEGIN_ALLOW_THREADS
     try
     {
+      std::lock_guard<std::mutex> lock(optimiser->mutex);
+      ProgressGuard progress_guard(optimiser, progress, time_limit);
       q = optimiser->optimise_partition(partition, is_membership_fixed);
+      // Copy the statistics while holding the lock, another thread sharing
+      // this optimiser may overwrite them as soon as it is released.
+      last_run_stats = optimiser->last_run_stats;
     }
     catch (std::exception& e)
     {
-      PyErr_SetString(PyExc_ValueError, e.what());
+      error_message = e.what();
+      failed = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (failed)
+    {
+      PyErr_SetString(PyExc_ValueError, error_message.c_str());
       return NULL;
     }
-    return PyFloat_FromDouble(q);
+    if (progress.restore_error())
+      return NULL;
+    PyObject* py_last_run_stats = build_last_run_stats(last_run_stats);
+    if (py_last_run_stats == NULL)
+      return NULL;
+    return Py_BuildValue("dN", q, py_last_run_stats);
   }
 
   PyObject* _Optimiser_optimise_partition_multiplex(PyObject *self, PyObject *args, PyObject *keywds)
@@ -113,16 +281,19 @@ extern "C"
     PyObject* py_partitions = NULL;
     PyObject* py_layer_weights = NULL;
     PyObject* py_is_membership_fixed = NULL;
+    PyObject* py_callback = NULL;
+    double time_limit = -1;
 
-    static const char* kwlist[] = {"optimiser", "partitions", "layer_weights", "is_membership_fixed", NULL};
+    static const char* kwlist[] = {"optimiser", "partitions", "layer_weights", "is_membership_fixed", "callback", "time_limit", NULL};
 
     #ifdef DEBUG
       cerr << "Parsing arguments..." << endl;
     #endif
 
-    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OOO|O", (char**) kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OOO|OOd", (char**) kwlist,
                                      &py_optimiser, &py_partitions,
-                                     &py_layer_weights, &py_is_membership_fixed))
+                                     &py_layer_weights, &py_is_membership_fixed,
+                                     &py_callback, &time_limit))
         return NULL;
 
     size_t nb_partitions = (size_t)PyList_Size(py_partitions);
@@ -208,17 +379,146 @@ extern "C"
       cerr << "Using optimiser at address " << optimiser << endl;
     #endif
 
+    // Release the GIL while optimising, all Python arguments have been converted.
     double q = 0.0;
+    vector<OptimiserLevelStats> last_run_stats;
+    bool failed = false;
+    string error_message;
+    PythonProgress progress(py_callback);
+    Py_BEGIN_ALLOW_THREADS
     try
     {
+      std::lock_guard<std::mutex> lock(optimiser->mutex);
+      ProgressGuard progress_guard(optimiser, progress, time_limit);
       q = optimiser->optimise_partition(partitions, layer_weights, is_membership_fixed);
+      // Copy the statistics while holding the lock, another thread sharing
+      // this optimiser may overwrite them as soon as it is released.
+      last_run_stats = optimiser->last_run_stats;
     }
     catch (std::exception& e)
     {
-      PyErr_SetString(PyExc_ValueError, e.what());
+      error_message = e.what();
+      failed = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (failed)
+    {
+      PyErr_SetString(PyExc_ValueError, error_message.c_str());
       return NULL;
     }
-    return PyFloat_FromDouble(q);
+    if (progress.restore_error())
+      return NULL;
+    PyObject* py_last_run_stats = build_last_run_stats(last_run_stats);
+    if (py_last_run_stats == NULL)
+      return NULL;
+    return Py_BuildValue("dN", q, py_last_run_stats);
+  }
+
+  PyObject* _Optimiser_optimise_partition_ensemble(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_optimiser = NULL;
+    PyObject* py_partition = NULL;
+    PyObject* py_seeds = NULL;
+    int n_iterations = 2;
+    int return_memberships = false;
+    double time_limit = -1;
+
+    static const char* kwlist[] = {"optimiser", "partition", "seeds", "n_iterations", "return_memberships", "time_limit", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OOO|ipd", (char**) kwlist,
+                                     &py_optimiser, &py_partition, &py_seeds,
+                                     &n_iterations, &return_memberships,
+                                     &time_limit))
+        return NULL;
+
+    #ifdef DEBUG
+      cerr << "optimise_partition_ensemble(" << py_partition << ", n_iterations=" << n_iterations << ");" << endl;
+    #endif
+
+    Optimiser* optimiser = decapsule_Optimiser(py_optimiser);
+    MutableVertexPartition* partition = decapsule_MutableVertexPartition(py_partition);
+
+    if (!PyList_Check(py_seeds))
+    {
+      PyErr_SetString(PyExc_TypeError, "Expected list of seeds.");
+      return NULL;
+    }
+    size_t nb_runs = PyList_Size(py_seeds);
+    vector<size_t> seeds(nb_runs);
+    for (size_t run = 0; run < nb_runs; run++)
+    {
+      PyObject* py_item = PyList_GetItem(py_seeds, run);
+      if (!PyNumber_Check(py_item) || !PyIndex_Check(py_item))
+      {
+        PyErr_SetString(PyExc_TypeError, "Expected integer value for seed.");
+        return NULL;
+      }
+      PyObject* py_seed = PyNumber_Long(py_item);
+      if (py_seed == NULL)
+        return NULL;
+      seeds[run] = PyLong_AsSize_t(py_seed);
+      Py_DECREF(py_seed);
+      if (PyErr_Occurred())
+        return NULL;
+    }
+
+    // Release the GIL while optimising, all Python arguments have been converted.
+    size_t best_run = 0;
+    vector<double> qualities;
+    vector<size_t> memberships;
+    bool failed = false;
+    string error_message;
+    PythonProgress progress(Py_None);
+    Py_BEGIN_ALLOW_THREADS
+    try
+    {
+      std::lock_guard<std::mutex> lock(optimiser->mutex);
+      ProgressGuard progress_guard(optimiser, progress, time_limit);
+      best_run = optimiser->optimise_partition_ensemble(partition, seeds, n_iterations, qualities, memberships, return_memberships);
+    }
+    catch (std::exception& e)
+    {
+      error_message = e.what();
+      failed = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (failed)
+    {
+      PyErr_SetString(PyExc_ValueError, error_message.c_str());
+      return NULL;
+    }
+    if (progress.restore_error())
+      return NULL;
+
+    PyObject* py_qualities = PyList_New(nb_runs);
+    for (size_t run = 0; run < nb_runs; run++)
+      PyList_SET_ITEM(py_qualities, run, PyFloat_FromDouble(qualities[run]));
+
+    // Write the memberships as native 64 bit integers to a bytearray, as for
+    // the membership buffer of a partition.
+    PyObject* py_memberships = Py_None;
+    if (return_memberships)
+    {
+      py_memberships = PyByteArray_FromStringAndSize(NULL, memberships.size()*sizeof(int64_t));
+      if (py_memberships == NULL)
+      {
+        Py_DECREF(py_qualities);
+        return NULL;
+      }
+      int64_t* buffer = (int64_t*) PyByteArray_AsString(py_memberships);
+      for (size_t i = 0; i < memberships.size(); i++)
+        buffer[i] = (int64_t) memberships[i];
+    }
+    else
+      Py_INCREF(Py_None);
+
+    return Py_BuildValue("NnN", py_qualities, (Py_ssize_t) best_run, py_memberships);
   }
 
   PyObject* _Optimiser_move_nodes(PyObject *self, PyObject *args, PyObject *keywds)
@@ -227,16 +527,17 @@ extern "C"
     PyObject* py_partition = NULL;
     PyObject* py_is_membership_fixed = NULL;
     int consider_comms = -1;
+    PyObject* py_nodes = NULL;
 
-    static const char* kwlist[] = {"optimiser", "partition", "is_membership_fixed", "consider_comms", NULL};
+    static const char* kwlist[] = {"optimiser", "partition", "is_membership_fixed", "consider_comms", "nodes", NULL};
 
     #ifdef DEBUG
       cerr << "Parsing arguments..." << endl;
     #endif
 
-    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OO|Oi", (char**) kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OO|OiO", (char**) kwlist,
                                      &py_optimiser, &py_partition,
-                                     &py_is_membership_fixed, &consider_comms))
+                                     &py_is_membership_fixed, &consider_comms, &py_nodes))
         return NULL;
 
     #ifdef DEBUG
@@ -281,19 +582,52 @@ extern "C"
       }
     }
 
+    // By default consider all nodes
+    vector<size_t> nodes;
+    if (py_nodes != NULL && py_nodes != Py_None)
+    {
+      try
+      {
+        nodes = create_index_vector(py_nodes, n, "Expected nodes of the graph.");
+      }
+      catch (std::exception& e)
+      {
+        PyErr_SetString(PyExc_ValueError, e.what());
+        return NULL;
+      }
+    }
+    else
+      nodes = range(n);
+
     if (consider_comms < 0)
       consider_comms = optimiser->consider_comms;
 
-    double q  = 0.0;
+    // Release the GIL while optimising, all Python arguments have been converted.
+    double q = 0.0;
+    bool failed = false;
+    string error_message;
+    PythonProgress progress(NULL);
+    Py_BEGIN_ALLOW_THREADS
     try
     {
-      q = optimiser->move_nodes(partition, is_membership_fixed, consider_comms, true);
+      std::lock_guard<std::mutex> lock(optimiser->mutex);
+      ProgressGuard progress_guard(optimiser, progress, -1);
+      q = optimiser->move_nodes(partition, is_membership_fixed, consider_comms, true, optimiser->max_comm_size, nodes);
     }
     catch (std::exception& e)
     {
-      PyErr_SetString(PyExc_ValueError, e.what());
+      error_message = e.what();
+      failed = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (failed)
+    {
+      PyErr_SetString(PyExc_ValueError, error_message.c_str());
       return NULL;
     }
+    if (progress.restore_error())
+      return NULL;
     return PyFloat_FromDouble(q);
   }
 
@@ -360,16 +694,32 @@ extern "C"
     if (consider_comms < 0)
       consider_comms = optimiser->consider_comms;
 
+    // Release the GIL while optimising, all Python arguments have been converted.
     double q = 0.0;
+    bool failed = false;
+    string error_message;
+    PythonProgress progress(NULL);
+    Py_BEGIN_ALLOW_THREADS
     try
     {
+      std::lock_guard<std::mutex> lock(optimiser->mutex);
+      ProgressGuard progress_guard(optimiser, progress, -1);
       q = optimiser->merge_nodes(partition, is_membership_fixed, consider_comms, true);
     }
     catch (std::exception& e)
     {
-      PyErr_SetString(PyExc_ValueError, e.what());
+      error_message = e.what();
+      failed = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (failed)
+    {
+      PyErr_SetString(PyExc_ValueError, error_message.c_str());
       return NULL;
     }
+    if (progress.restore_error())
+      return NULL;
     return PyFloat_FromDouble(q);
   }
 
@@ -421,14 +771,26 @@ extern "C"
     if (consider_comms < 0)
       consider_comms = optimiser->refine_consider_comms;
 
+    // Release the GIL while optimising, all Python arguments have been converted.
     double q = 0.0;
+    bool failed = false;
+    string error_message;
+    Py_BEGIN_ALLOW_THREADS
     try
     {
+      std::lock_guard<std::mutex> lock(optimiser->mutex);
       q = optimiser->move_nodes_constrained(partition, consider_comms, constrained_partition);
     }
     catch (std::exception& e)
     {
-      PyErr_SetString(PyExc_ValueError, e.what());
+      error_message = e.what();
+      failed = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (failed)
+    {
+      PyErr_SetString(PyExc_ValueError, error_message.c_str());
       return NULL;
     }
     return PyFloat_FromDouble(q);
@@ -482,14 +844,26 @@ extern "C"
     if (consider_comms < 0)
       consider_comms = optimiser->refine_consider_comms;
 
+    // Release the GIL while optimising, all Python arguments have been converted.
     double q = 0.0;
+    bool failed = false;
+    string error_message;
+    Py_BEGIN_ALLOW_THREADS
     try
     {
+      std::lock_guard<std::mutex> lock(optimiser->mutex);
       q = optimiser->merge_nodes_constrained(partition, consider_comms, constrained_partition);
     }
     catch (std::exception& e)
     {
-      PyErr_SetString(PyExc_ValueError, e.what());
+      error_message = e.what();
+      failed = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (failed)
+    {
+      PyErr_SetString(PyExc_ValueError, error_message.c_str());
       return NULL;
     }
     return PyFloat_FromDouble(q);
@@ -922,6 +1296,66 @@ extern "C"
     return PyLong_FromSize_t(optimiser->max_comm_size);
   }
 
+  PyObject* _Optimiser_set_n_threads(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_optimiser = NULL;
+    size_t n_threads = 0;
+    static const char* kwlist[] = {"optimiser", "n_threads", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "On", (char**) kwlist,
+                                     &py_optimiser, &n_threads))
+        return NULL;
+
+    #ifdef DEBUG
+      cerr << "set_n_threads(" << n_threads << ");" << endl;
+    #endif
+
+    #ifdef DEBUG
+      cerr << "Capsule optimiser at address " << py_optimiser << endl;
+    #endif
+    Optimiser* optimiser = decapsule_Optimiser(py_optimiser);
+    #ifdef DEBUG
+      cerr << "Using optimiser at address " << optimiser << endl;
+    #endif
+
+    optimiser->n_threads = n_threads;
+
+    Py_INCREF(Py_None);
+    return Py_None;
+  }
+
+  PyObject* _Optimiser_get_n_threads(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_optimiser = NULL;
+    static const char* kwlist[] = {"optimiser", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O", (char**) kwlist,
+                                     &py_optimiser))
+        return NULL;
+
+    #ifdef DEBUG
+      cerr << "get_n_threads();" << endl;
+    #endif
+
+    #ifdef DEBUG
+      cerr << "Capsule optimiser at address " << py_optimiser << endl;
+    #endif
+    Optimiser* optimiser = decapsule_Optimiser(py_optimiser);
+    #ifdef DEBUG
+      cerr << "Using optimiser at address " << optimiser << endl;
+    #endif
+
+    return PyLong_FromSize_t(optimiser->n_threads);
+  }
+
   PyObject* _Optimiser_set_rng_seed(PyObject *self, PyObject *args, PyObject *keywds)
   {
     PyObject* py_optimiser = NULL;
@@ -951,7 +1385,12 @@ extern "C"
     #ifdef DEBUG
       cerr << "Setting seed to " << seed << endl;
     #endif
-    optimiser->set_rng_seed(seed);
+    Py_BEGIN_ALLOW_THREADS
+    {
+      std::lock_guard<std::mutex> lock(optimiser->mutex);
+      optimiser->set_rng_seed(seed);
+    }
+    Py_END_ALLOW_THREADS
 
     Py_INCREF(Py_None);
     return Py_None;
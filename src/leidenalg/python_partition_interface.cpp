@@ -10,17 +10,126 @@ Graph* create_graph_from_py(PyObject* py_obj_graph, PyObject* py_node_sizes, PyO
   return create_graph_from_py(py_obj_graph, py_node_sizes, py_weights, true, false);
 }
 
-Graph* create_graph_from_py(PyObject* py_obj_graph, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, bool correct_self_loops)
+Graph* create_graph_from_py(PyObject* py_obj_graph, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops)
 {
   #ifdef DEBUG
     cerr << "create_graph_from_py" << endl;
   #endif
 
+  // The graph is either a capsule of an igraph_t from Python, a tuple of
+  // (n, edges, directed), which is read directly without creating an igraph_t,
+  // or the filename of a graph saved by save_graph. The Graph copies the
+  // edges, so it no longer needs the igraph_t afterwards. A shared graph is
+  // not created at all, but is owned by its capsule, see
+  // capsule_MutableVertexPartition.
+  if (PyUnicode_Check(py_obj_graph) || PyBytes_Check(py_obj_graph))
+    return load_graph_from_py(py_obj_graph, py_node_sizes, py_weights, check_positive_weight, correct_self_loops);
+  if (is_shared_graph(py_obj_graph))
+    return get_shared_graph_from_py(py_obj_graph, py_node_sizes, py_weights, check_positive_weight, correct_self_loops);
+
+  if (PyTuple_Check(py_obj_graph))
+    return create_graph_from_edges(py_obj_graph, py_node_sizes, py_weights, check_positive_weight, correct_self_loops);
+
   igraph_t* py_graph = (igraph_t*) PyCapsule_GetPointer(py_obj_graph, NULL);
   #ifdef DEBUG
     cerr << "Got igraph_t " << py_graph << endl;
   #endif
 
+  return create_graph_from_igraph(py_graph, py_node_sizes, py_weights, check_positive_weight, correct_self_loops);
+}
+
+Graph* load_graph_from_py(PyObject* py_filename, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops)
+{
+  // The weights and node sizes are stored in the file itself.
+  if ((py_node_sizes != NULL && py_node_sizes != Py_None) ||
+      (py_weights != NULL && py_weights != Py_None))
+    throw Exception("Cannot specify weights or node sizes for a saved graph.");
+
+  PyObject* py_bytes = NULL;
+  if (!PyUnicode_FSConverter(py_filename, &py_bytes))
+  {
+    PyErr_Clear();
+    throw Exception("Expected a valid filename.");
+  }
+
+  Graph* graph = NULL;
+  try
+  {
+    graph = Graph::load(PyBytes_AsString(py_bytes));
+  }
+  catch (...)
+  {
+    Py_DECREF(py_bytes);
+    throw;
+  }
+  Py_DECREF(py_bytes);
+
+  // Whether there are negative weights or self loops is stored in the file,
+  // so that the edges of the file are not read here.
+  if (check_positive_weight && graph->has_negative_weights())
+  {
+    delete graph;
+    throw Exception("Cannot accept negative weights.");
+  }
+
+  // Only correct self loops if there are any
+  if (correct_self_loops < 0)
+    correct_self_loops = graph->has_self_loops();
+  graph->set_correct_self_loops(correct_self_loops);
+
+  return graph;
+}
+
+Graph* get_shared_graph_from_py(PyObject* py_shared_graph, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops)
+{
+  // The weights and node sizes are fixed when creating the shared graph.
+  if ((py_node_sizes != NULL && py_node_sizes != Py_None) ||
+      (py_weights != NULL && py_weights != Py_None))
+    throw Exception("Cannot specify weights or node sizes for a shared graph.");
+
+  SharedGraph* shared_graph = decapsule_SharedGraph(py_shared_graph);
+
+  if (check_positive_weight && shared_graph->has_negative_weights())
+    throw Exception("Cannot accept negative weights.");
+
+  // Only correct self loops if there are any
+  if (correct_self_loops < 0)
+    correct_self_loops = shared_graph->get_graph()->has_self_loops();
+
+  return shared_graph->get_graph(correct_self_loops);
+}
+
+SharedGraph::SharedGraph(Graph* graph)
+{
+  this->_graphs[0] = graph;
+  this->_graphs[1] = NULL;
+  this->_has_negative_weights = graph->has_negative_weights();
+}
+
+SharedGraph::~SharedGraph()
+{
+  delete this->_graphs[0];
+  delete this->_graphs[1];
+}
+
+/****************************************************************************
+  Get the graph with the given setting for correcting self loops. The graph
+  is created without correcting self loops, if a partition requires
+  correcting self loops, the graph is copied once.
+*****************************************************************************/
+Graph* SharedGraph::get_graph(int correct_self_loops)
+{
+  size_t i = correct_self_loops ? 1 : 0;
+  if (this->_graphs[i] == NULL)
+  {
+    this->_graphs[i] = new Graph(*this->_graphs[0]);
+    this->_graphs[i]->set_correct_self_loops(correct_self_loops);
+  }
+  return this->_graphs[i];
+}
+
+Graph* create_graph_from_igraph(igraph_t* py_graph, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops)
+{
   // If necessary create a weighted graph
   Graph* graph = NULL;
   #ifdef DEBUG
@@ -30,72 +139,16 @@ Graph* create_graph_from_py(PyObject* py_obj_graph, PyObject* py_node_sizes, PyO
   size_t n = igraph_vcount(py_graph);
   size_t m = igraph_ecount(py_graph);
 
-  vector<double> node_sizes;
-  vector<double> weights;
-  if (py_node_sizes != NULL && py_node_sizes != Py_None)
+  // Only correct self loops if there are any
+  if (correct_self_loops < 0)
   {
-    #ifdef DEBUG
-      cerr << "Reading node_sizes." << endl;
-    #endif
-
-    size_t nb_node_size = PyList_Size(py_node_sizes);
-    if (nb_node_size != n)
-    {
-      throw Exception("Node size vector not the same size as the number of nodes.");
-    }
-    node_sizes.resize(n);
-    for (size_t v = 0; v < n; v++)
-    {
-      PyObject* py_item = PyList_GetItem(py_node_sizes, v);
-      if (PyNumber_Check(py_item))
-      {
-        double e = PyFloat_AsDouble(py_item);
-        node_sizes[v] = e;
-      }
-      else
-      {
-        throw Exception("Expected numerical values for node sizes vector.");
-      }
-    }
+    igraph_bool_t has_self_loops;
+    igraph_has_loop(py_graph, &has_self_loops);
+    correct_self_loops = has_self_loops;
   }
 
-  if (py_weights != NULL && py_weights != Py_None)
-  {
-    #ifdef DEBUG
-      cerr << "Reading weights." << endl;
-    #endif
-    size_t nb_weights = PyList_Size(py_weights);
-    if (nb_weights != m)
-      throw Exception("Weight vector not the same size as the number of edges.");
-    weights.resize(m);
-    for (size_t e = 0; e < m; e++)
-    {
-      PyObject* py_item = PyList_GetItem(py_weights, e);
-      #ifdef DEBUG
-        //PyObject* py_item_repr = PyObject_Repr(py_item);
-        //const char* s = PyUnicode_AsUTF8(py_item_repr);
-        //cerr << "Got item " << e << ": " << s << endl;
-      #endif
-      if (PyNumber_Check(py_item))
-      {
-        weights[e] = PyFloat_AsDouble(py_item);
-      }
-      else
-      {
-        throw Exception("Expected floating point value for weight vector.");
-      }
-
-      if (check_positive_weight)
-        if (weights[e] < 0 )
-          throw Exception("Cannot accept negative weights.");
-
-      if (isnan(weights[e]))
-        throw Exception("Cannot accept NaN weights.");
-
-      if (!isfinite(weights[e]))
-        throw Exception("Cannot accept infinite weights.");
-    }
-  }
+  vector<double> node_sizes, weights;
+  read_node_sizes_and_weights(py_node_sizes, py_weights, n, m, check_positive_weight, node_sizes, weights);
 
   if (node_sizes.size() == n)
   {
@@ -122,33 +175,473 @@ Graph* create_graph_from_py(PyObject* py_obj_graph, PyObject* py_node_sizes, PyO
   return graph;
 }
 
+void read_node_sizes_and_weights(PyObject* py_node_sizes, PyObject* py_weights, size_t n, size_t m, bool check_positive_weight,
+                                 vector<double>& node_sizes, vector<double>& weights)
+{
+  if (py_node_sizes != NULL && py_node_sizes != Py_None)
+  {
+    #ifdef DEBUG
+      cerr << "Reading node_sizes." << endl;
+    #endif
+
+    node_sizes = create_double_vector(py_node_sizes, "Expected numerical values for node sizes vector.");
+    if (node_sizes.size() != n)
+    {
+      throw Exception("Node size vector not the same size as the number of nodes.");
+    }
+  }
+
+  if (py_weights != NULL && py_weights != Py_None)
+  {
+    #ifdef DEBUG
+      cerr << "Reading weights." << endl;
+    #endif
+    weights = create_double_vector(py_weights, "Expected floating point value for weight vector.");
+    if (weights.size() != m)
+      throw Exception("Weight vector not the same size as the number of edges.");
+
+    check_weights(weights, check_positive_weight);
+  }
+}
+
+void check_weights(vector<double> const& weights, bool check_positive_weight)
+{
+  // Check all weights at once
+  bool has_negative = false, has_nan = false, has_infinite = false;
+  for (double w : weights)
+  {
+    has_negative |= (w < 0);
+    has_nan |= isnan(w);
+    has_infinite |= isinf(w);
+  }
+
+  if (check_positive_weight && has_negative)
+    throw Exception("Cannot accept negative weights.");
+
+  if (has_nan)
+    throw Exception("Cannot accept NaN weights.");
+
+  if (has_infinite)
+    throw Exception("Cannot accept infinite weights.");
+}
+
+Graph* create_graph_from_edges(PyObject* py_edge_list, PyObject* py_node_sizes, PyObject* py_weights, bool check_positive_weight, int correct_self_loops)
+{
+  Py_ssize_t n = 0;
+  PyObject* py_edges = NULL;
+  int directed = false;
+  if (!PyArg_ParseTuple(py_edge_list, "nO|p", &n, &py_edges, &directed))
+  {
+    PyErr_Clear();
+    throw Exception("Expected a tuple (n, edges) or (n, edges, directed).");
+  }
+
+  if (n < 0)
+    throw Exception("Number of nodes cannot be negative.");
+
+  vector<size_t> edges = create_edge_vector(py_edges, n);
+  size_t m = edges.size() / 2;
+
+  // Only correct self loops if there are any
+  if (correct_self_loops < 0)
+  {
+    correct_self_loops = false;
+    for (size_t e = 0; e < m; e++)
+      if (edges[2*e] == edges[2*e + 1])
+      {
+        correct_self_loops = true;
+        break;
+      }
+  }
+
+  vector<double> node_sizes, weights;
+  read_node_sizes_and_weights(py_node_sizes, py_weights, n, m, check_positive_weight, node_sizes, weights);
+
+  return new Graph(n, edges, directed, weights, node_sizes, correct_self_loops);
+}
+
+vector<size_t> create_edge_vector(PyObject* py_edges, size_t n)
+{
+    // Edges are either given as a buffer with two columns (or a flat buffer),
+    // or as a sequence of pairs (or a flat sequence).
+    vector<size_t> result;
+    if (!read_buffer(py_edges, result, 2))
+    {
+      PyObject* py_seq = PySequence_Fast(py_edges, "");
+      if (py_seq == NULL)
+      {
+        PyErr_Clear();
+        throw Exception("Expected a sequence or a buffer of edges.");
+      }
+
+      size_t m = PySequence_Fast_GET_SIZE(py_seq);
+      result.reserve(2*m);
+      for (size_t i = 0; i < m; i++)
+      {
+        PyObject* py_item = PySequence_Fast_GET_ITEM(py_seq, i);
+        if (PyIndex_Check(py_item))
+          result.push_back(PyLong_AsSize_t(py_item));
+        else if (PySequence_Check(py_item) && PySequence_Size(py_item) == 2)
+        {
+          for (Py_ssize_t j = 0; j < 2; j++)
+          {
+            PyObject* py_node = PySequence_GetItem(py_item, j);
+            if (py_node == NULL || !PyIndex_Check(py_node))
+            {
+              Py_XDECREF(py_node);
+              Py_DECREF(py_seq);
+              PyErr_Clear();
+              throw Exception("Expected integer node indices for edges.");
+            }
+            result.push_back(PyLong_AsSize_t(py_node));
+            Py_DECREF(py_node);
+          }
+        }
+        else
+        {
+          Py_DECREF(py_seq);
+          throw Exception("Expected pairs of nodes for edges.");
+        }
+
+        if (PyErr_Occurred())
+        {
+          Py_DECREF(py_seq);
+          PyErr_Clear();
+          throw Exception("Expected non-negative integer node indices for edges.");
+        }
+      }
+      Py_DECREF(py_seq);
+    }
+
+    if (result.size() % 2 != 0)
+      throw Exception("Expected an even number of nodes for edges.");
+
+    for (size_t v : result)
+      if (v >= n)
+        throw Exception("Node in edge exceeds number of nodes.");
+
+    return result;
+}
+
 vector<size_t> create_size_t_vector(PyObject* py_list)
 {
-    size_t n = PyList_Size(py_list);
-    vector<size_t> result(n);
+    vector<size_t> result;
+    if (read_buffer(py_list, result))
+    {
+      size_t n = result.size();
+      for (size_t e : result)
+        if (e >= n)
+          throw Exception("Value cannot exceed length of list.");
+      return result;
+    }
+
+    PyObject* py_seq = py_list;
+    if (!PyList_Check(py_list))
+    {
+      py_seq = PySequence_List(py_list);
+      if (py_seq == NULL)
+      {
+        PyErr_Clear();
+        throw Exception("Expected a list or a buffer of integers.");
+      }
+    }
+    else
+      Py_INCREF(py_seq);
+
+    size_t n = PyList_Size(py_seq);
+    result.resize(n);
     for (size_t i = 0; i < n; i++)
     {
-      PyObject* py_item = PyList_GetItem(py_list, i);
+      PyObject* py_item = PyList_GetItem(py_seq, i);
       if (PyNumber_Check(py_item) && PyIndex_Check(py_item))
       {
         size_t e = PyLong_AsSize_t(PyNumber_Long(py_item));
         if (e >= n)
+        {
+          Py_DECREF(py_seq);
           throw Exception("Value cannot exceed length of list.");
+        }
         else
           result[i] = e;
       }
       else
+      {
+        Py_DECREF(py_seq);
         throw Exception("Value cannot exceed length of list.");
+      }
+    }
+    Py_DECREF(py_seq);
+    return result;
+}
+
+vector<size_t> create_index_vector(PyObject* py_list, size_t n, const char* error_message)
+{
+    // Indices (e.g. of nodes or edges) should all be smaller than n.
+    vector<size_t> result;
+    if (!read_buffer(py_list, result))
+    {
+      PyObject* py_seq = PySequence_Fast(py_list, "");
+      if (py_seq == NULL)
+      {
+        PyErr_Clear();
+        throw Exception(error_message);
+      }
+
+      size_t nb_items = PySequence_Fast_GET_SIZE(py_seq);
+      result.resize(nb_items);
+      for (size_t i = 0; i < nb_items; i++)
+      {
+        PyObject* py_item = PySequence_Fast_GET_ITEM(py_seq, i);
+        if (PyIndex_Check(py_item))
+          result[i] = PyLong_AsSize_t(py_item);
+        if (!PyIndex_Check(py_item) || PyErr_Occurred())
+        {
+          Py_DECREF(py_seq);
+          PyErr_Clear();
+          throw Exception(error_message);
+        }
+      }
+      Py_DECREF(py_seq);
     }
+
+    for (size_t i : result)
+      if (i >= n)
+        throw Exception(error_message);
+
     return result;
 }
 
+vector<double> create_double_vector(PyObject* py_list, const char* error_message)
+{
+    vector<double> result;
+    if (read_buffer(py_list, result))
+      return result;
+
+    PyObject* py_seq = py_list;
+    if (!PyList_Check(py_list))
+    {
+      py_seq = PySequence_List(py_list);
+      if (py_seq == NULL)
+      {
+        PyErr_Clear();
+        throw Exception(error_message);
+      }
+    }
+    else
+      Py_INCREF(py_seq);
+
+    size_t n = PyList_Size(py_seq);
+    result.resize(n);
+    for (size_t i = 0; i < n; i++)
+    {
+      PyObject* py_item = PyList_GetItem(py_seq, i);
+      if (PyNumber_Check(py_item))
+      {
+        result[i] = PyFloat_AsDouble(py_item);
+      }
+      else
+      {
+        Py_DECREF(py_seq);
+        throw Exception(error_message);
+      }
+    }
+    Py_DECREF(py_seq);
+    return result;
+}
+
+/****************************************************************************
+  Read a one-dimensional buffer (e.g. a NumPy array, an array.array or a
+  memoryview) directly from its memory, without creating Python objects for
+  the individual values. Returns false if the object does not support the
+  buffer protocol (or lists, which are handled separately), or if the values
+  are of a type that can not be read directly.
+****************************************************************************/
+#if !defined(Py_LIMITED_API) || Py_LIMITED_API+0 >= 0x030B0000
+template <class S> inline void convert_buffer_value(S value, double& result)
+{
+  result = (double) value;
+}
+
+template <class S> inline void convert_buffer_value(S value, size_t& result)
+{
+  if (value < 0)
+    throw Exception("Cannot accept negative values.");
+  result = (size_t) value;
+}
+
+inline void convert_buffer_value(double value, size_t& result)
+{
+  throw Exception("Expected integer values.");
+}
+
+inline void convert_buffer_value(float value, size_t& result)
+{
+  throw Exception("Expected integer values.");
+}
+
+inline void convert_buffer_value(bool value, size_t& result)
+{
+  result = (size_t) value;
+}
+
+template <class S, class T> bool read_typed_buffer_values(Py_buffer const& view, vector<T>& result)
+{
+  if (view.itemsize != sizeof(S))
+    return false;
+
+  // Two-dimensional buffers are read row by row
+  size_t nrows = view.shape[0];
+  size_t ncols = view.ndim == 2 ? view.shape[1] : 1;
+  Py_ssize_t row_stride = view.strides[0];
+  Py_ssize_t col_stride = view.ndim == 2 ? view.strides[1] : 0;
+  char const* buf = (char const*) view.buf;
+  result.resize(nrows*ncols);
+  for (size_t i = 0; i < nrows; i++)
+    for (size_t j = 0; j < ncols; j++)
+    {
+      S value;
+      memcpy(&value, buf + i*row_stride + j*col_stride, sizeof(S));
+      convert_buffer_value(value, result[i*ncols + j]);
+    }
+  return true;
+}
+
+/****************************************************************************
+  Read the values of a buffer of a type that can be read directly, returns
+  false for any other format (e.g. float16 or Python objects), which should
+  then be converted through the sequence protocol instead.
+****************************************************************************/
+template <class T> bool read_buffer_values(Py_buffer const& view, vector<T>& result)
+{
+  const char* format = view.format;
+  if (format == NULL)
+    format = "B";
+
+  // Only accept values in the native byte order
+  uint16_t one = 1;
+  bool little_endian = *((uint8_t*) &one) == 1;
+  if (format[0] == '@' || format[0] == '=')
+    format++;
+  else if (format[0] == '<' && little_endian)
+    format++;
+  else if ((format[0] == '>' || format[0] == '!') && !little_endian)
+    format++;
+
+  if (format[0] == '\0' || format[1] != '\0')
+    return false;
+
+  switch (format[0])
+  {
+    case 'd':
+      return read_typed_buffer_values<double>(view, result);
+    case 'f':
+      return read_typed_buffer_values<float>(view, result);
+    case '?':
+      return read_typed_buffer_values<bool>(view, result);
+    case 'b': case 'h': case 'i': case 'l': case 'q': case 'n':
+      switch (view.itemsize)
+      {
+        case 1: return read_typed_buffer_values<int8_t>(view, result);
+        case 2: return read_typed_buffer_values<int16_t>(view, result);
+        case 4: return read_typed_buffer_values<int32_t>(view, result);
+        case 8: return read_typed_buffer_values<int64_t>(view, result);
+        default: return false;
+      }
+    case 'B': case 'H': case 'I': case 'L': case 'Q': case 'N':
+      switch (view.itemsize)
+      {
+        case 1: return read_typed_buffer_values<uint8_t>(view, result);
+        case 2: return read_typed_buffer_values<uint16_t>(view, result);
+        case 4: return read_typed_buffer_values<uint32_t>(view, result);
+        case 8: return read_typed_buffer_values<uint64_t>(view, result);
+        default: return false;
+      }
+    default:
+      return false;
+  }
+}
+
+template <class T> bool read_buffer_object(PyObject* py_obj, vector<T>& result, size_t ncols)
+{
+  if (PyList_Check(py_obj) || !PyObject_CheckBuffer(py_obj))
+    return false;
+
+  // Objects whose buffer can not be read directly are converted through the
+  // sequence protocol instead.
+  Py_buffer view;
+  if (PyObject_GetBuffer(py_obj, &view, PyBUF_FORMAT | PyBUF_STRIDES) != 0)
+  {
+    PyErr_Clear();
+    return false;
+  }
+
+  bool is_read = false;
+  try
+  {
+    // If ncols > 0, also accept a two-dimensional buffer with ncols columns
+    if (ncols > 0 && view.ndim == 2)
+    {
+      if ((size_t) view.shape[1] != ncols)
+        throw Exception("Unexpected number of columns in buffer.");
+    }
+    else if (view.ndim != 1)
+      throw Exception("Expected a one-dimensional buffer.");
+    is_read = read_buffer_values(view, result);
+  }
+  catch (...)
+  {
+    PyBuffer_Release(&view);
+    throw;
+  }
+  PyBuffer_Release(&view);
+  return is_read;
+}
+#else
+template <class T> bool read_buffer_object(PyObject* py_obj, vector<T>& result, size_t ncols)
+{
+  return false;
+}
+#endif
+
+bool read_buffer(PyObject* py_obj, vector<double>& result)
+{
+  return read_buffer_object(py_obj, result, 0);
+}
+
+bool read_buffer(PyObject* py_obj, vector<size_t>& result)
+{
+  return read_buffer_object(py_obj, result, 0);
+}
+
+bool read_buffer(PyObject* py_obj, vector<size_t>& result, size_t ncols)
+{
+  return read_buffer_object(py_obj, result, ncols);
+}
+
 PyObject* capsule_MutableVertexPartition(MutableVertexPartition* partition)
 {
   PyObject* py_partition = PyCapsule_New(partition, "leidenalg.VertexPartition.MutableVertexPartition", del_MutableVertexPartition);
   return py_partition;
 }
 
+PyObject* capsule_MutableVertexPartition(MutableVertexPartition* partition, PyObject* py_obj_graph)
+{
+  // The partition deletes its graph, unless it is a shared graph, which is
+  // deleted with the capsule of the shared graph. The capsule of the
+  // partition then keeps a reference to the shared graph, so that the graph
+  // is not deleted while the partition still uses it.
+  bool is_shared = is_shared_graph(py_obj_graph);
+  partition->destructor_delete_graph = !is_shared;
+
+  PyObject* py_partition = capsule_MutableVertexPartition(partition);
+  if (is_shared && py_partition != NULL)
+  {
+    Py_INCREF(py_obj_graph);
+    PyCapsule_SetContext(py_partition, py_obj_graph);
+  }
+  return py_partition;
+}
+
 MutableVertexPartition* decapsule_MutableVertexPartition(PyObject* py_partition)
 {
   MutableVertexPartition* partition = (MutableVertexPartition*) PyCapsule_GetPointer(py_partition, "leidenalg.VertexPartition.MutableVertexPartition");
@@ -158,7 +651,61 @@ MutableVertexPartition* decapsule_MutableVertexPartition(PyObject* py_partition)
 void del_MutableVertexPartition(PyObject* py_partition)
 {
   MutableVertexPartition* partition = decapsule_MutableVertexPartition(py_partition);
+  PyObject* py_shared_graph = (PyObject*) PyCapsule_GetContext(py_partition);
   delete partition;
+  Py_XDECREF(py_shared_graph);
+}
+
+PyObject* capsule_SharedGraph(SharedGraph* shared_graph)
+{
+  PyObject* py_shared_graph = PyCapsule_New(shared_graph, "leidenalg.SharedGraph", del_SharedGraph);
+  return py_shared_graph;
+}
+
+SharedGraph* decapsule_SharedGraph(PyObject* py_shared_graph)
+{
+  SharedGraph* shared_graph = (SharedGraph*) PyCapsule_GetPointer(py_shared_graph, "leidenalg.SharedGraph");
+  return shared_graph;
+}
+
+bool is_shared_graph(PyObject* py_obj_graph)
+{
+  return PyCapsule_IsValid(py_obj_graph, "leidenalg.SharedGraph");
+}
+
+void del_SharedGraph(PyObject* py_shared_graph)
+{
+  SharedGraph* shared_graph = decapsule_SharedGraph(py_shared_graph);
+  delete shared_graph;
+}
+
+PyObject* get_py_igraph(Graph* graph)
+{
+  size_t n = graph->vcount();
+  size_t m = graph->ecount();
+
+  PyObject* edges = PyList_New(m);
+  for (size_t e = 0; e < m; e++)
+  {
+    vector<size_t> edge = graph->edge(e);
+    PyList_SetItem(edges, e, Py_BuildValue("(nn)", edge[0], edge[1]));
+  }
+
+  PyObject* weights = PyList_New(m);
+  for (size_t e = 0; e < m; e++)
+  {
+    PyObject* item = PyFloat_FromDouble(graph->edge_weight(e));
+    PyList_SetItem(weights, e, item);
+  }
+
+  PyObject* node_sizes = PyList_New(n);
+  for (size_t v = 0; v < n; v++)
+  {
+    PyObject* item = PyLong_FromSize_t(graph->node_size(v));
+    PyList_SetItem(node_sizes, v, item);
+  }
+
+  return Py_BuildValue("lOOOO", n, graph->is_directed() ? Py_True : Py_False, edges, weights, node_sizes);
 }
 
 #ifdef __cplusplus
@@ -194,10 +741,8 @@ extern "C"
       else
         partition = new ModularityVertexPartition(graph);
 
-      // Do *NOT* forget to remove the graph upon deletion
-      partition->destructor_delete_graph = true;
-
-      PyObject* py_partition = capsule_MutableVertexPartition(partition);
+      // Do *NOT* forget to remove the graph upon deletion, unless it is shared
+      PyObject* py_partition = capsule_MutableVertexPartition(partition, py_obj_graph);
       #ifdef DEBUG
         cerr << "Created capsule partition at address " << py_partition << endl;
       #endif
@@ -242,10 +787,8 @@ extern "C"
       else
         partition = new SignificanceVertexPartition(graph);
 
-      // Do *NOT* forget to remove the graph upon deletion
-      partition->destructor_delete_graph = true;
-
-      PyObject* py_partition = capsule_MutableVertexPartition(partition);
+      // Do *NOT* forget to remove the graph upon deletion, unless it is shared
+      PyObject* py_partition = capsule_MutableVertexPartition(partition, py_obj_graph);
       #ifdef DEBUG
         cerr << "Created capsule partition at address " << py_partition << endl;
       #endif
@@ -290,10 +833,8 @@ extern "C"
       else
         partition = new SurpriseVertexPartition(graph);
 
-      // Do *NOT* forget to remove the graph upon deletion
-      partition->destructor_delete_graph = true;
-
-      PyObject* py_partition = capsule_MutableVertexPartition(partition);
+      // Do *NOT* forget to remove the graph upon deletion, unless it is shared
+      PyObject* py_partition = capsule_MutableVertexPartition(partition, py_obj_graph);
       #ifdef DEBUG
         cerr << "Created capsule partition at address " << py_partition << endl;
       #endif
@@ -315,14 +856,23 @@ extern "C"
     PyObject* py_weights = NULL;
     PyObject* py_node_sizes = NULL;
     double resolution_parameter = 1.0;
-    int correct_self_loops = false;
+    PyObject* py_correct_self_loops = NULL;
 
     static const char* kwlist[] = {"graph", "initial_membership", "weights", "node_sizes", "resolution_parameter", "correct_self_loops", NULL};
 
-    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O|OOOdp", (char**) kwlist,
-                                     &py_obj_graph, &py_initial_membership, &py_weights, &py_node_sizes, &resolution_parameter, &correct_self_loops))
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O|OOOdO", (char**) kwlist,
+                                     &py_obj_graph, &py_initial_membership, &py_weights, &py_node_sizes, &resolution_parameter, &py_correct_self_loops))
         return NULL;
 
+    // If not specified, only correct self loops if there are any.
+    int correct_self_loops = -1;
+    if (py_correct_self_loops != NULL && py_correct_self_loops != Py_None)
+    {
+      correct_self_loops = PyObject_IsTrue(py_correct_self_loops);
+      if (correct_self_loops < 0)
+        return NULL;
+    }
+
     try
     {
 
@@ -340,10 +890,8 @@ extern "C"
       else
         partition = new CPMVertexPartition(graph, resolution_parameter);
 
-      // Do *NOT* forget to remove the graph upon deletion
-      partition->destructor_delete_graph = true;
-
-      PyObject* py_partition = capsule_MutableVertexPartition(partition);
+      // Do *NOT* forget to remove the graph upon deletion, unless it is shared
+      PyObject* py_partition = capsule_MutableVertexPartition(partition, py_obj_graph);
       #ifdef DEBUG
         cerr << "Created capsule partition at address " << py_partition << endl;
       #endif
@@ -389,10 +937,8 @@ extern "C"
       else
         partition = new RBERVertexPartition(graph, resolution_parameter);
 
-      // Do *NOT* forget to remove the graph upon deletion
-      partition->destructor_delete_graph = true;
-
-      PyObject* py_partition = capsule_MutableVertexPartition(partition);
+      // Do *NOT* forget to remove the graph upon deletion, unless it is shared
+      PyObject* py_partition = capsule_MutableVertexPartition(partition, py_obj_graph);
       #ifdef DEBUG
         cerr << "Created capsule partition at address " << py_partition << endl;
       #endif
@@ -437,10 +983,8 @@ extern "C"
       else
         partition = new RBConfigurationVertexPartition(graph, resolution_parameter);
 
-      // Do *NOT* forget to remove the graph upon deletion
-      partition->destructor_delete_graph = true;
-
-      PyObject* py_partition = capsule_MutableVertexPartition(partition);
+      // Do *NOT* forget to remove the graph upon deletion, unless it is shared
+      PyObject* py_partition = capsule_MutableVertexPartition(partition, py_obj_graph);
       #ifdef DEBUG
         cerr << "Created capsule partition at address " << py_partition << endl;
       #endif
@@ -455,6 +999,125 @@ extern "C"
     }
   }
 
+  PyObject* _save_graph(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_obj_graph = NULL;
+    PyObject* py_filename = NULL;
+    PyObject* py_weights = NULL;
+    PyObject* py_node_sizes = NULL;
+
+    static const char* kwlist[] = {"graph", "filename", "weights", "node_sizes", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OO&|OO", (char**) kwlist,
+                                     &py_obj_graph, PyUnicode_FSConverter, &py_filename, &py_weights, &py_node_sizes))
+        return NULL;
+
+    try
+    {
+      // Negative weights are checked when the graph is loaded, depending on
+      // the type of partition.
+      Graph* graph = create_graph_from_py(py_obj_graph, py_node_sizes, py_weights, false, false);
+      // A shared graph is deleted with its capsule
+      bool delete_graph = !is_shared_graph(py_obj_graph);
+      try
+      {
+        graph->save(PyBytes_AsString(py_filename));
+      }
+      catch (...)
+      {
+        if (delete_graph)
+          delete graph;
+        throw;
+      }
+      if (delete_graph)
+        delete graph;
+    }
+    catch (std::exception const & e )
+    {
+      Py_DECREF(py_filename);
+      string s = "Could not save graph: " + string(e.what());
+      PyErr_SetString(PyExc_BaseException, s.c_str());
+      return NULL;
+    }
+
+    Py_DECREF(py_filename);
+    Py_INCREF(Py_None);
+    return Py_None;
+  }
+
+  PyObject* _new_SharedGraph(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_obj_graph = NULL;
+    PyObject* py_weights = NULL;
+    PyObject* py_node_sizes = NULL;
+
+    static const char* kwlist[] = {"graph", "weights", "node_sizes", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O|OO", (char**) kwlist,
+                                     &py_obj_graph, &py_weights, &py_node_sizes))
+        return NULL;
+
+    if (is_shared_graph(py_obj_graph))
+    {
+      Py_INCREF(py_obj_graph);
+      return py_obj_graph;
+    }
+
+    try
+    {
+      // Negative weights are checked when creating a partition, depending on
+      // the type of partition, similar to _save_graph.
+      Graph* graph = create_graph_from_py(py_obj_graph, py_node_sizes, py_weights, false, false);
+      PyObject* py_shared_graph = capsule_SharedGraph(new SharedGraph(graph));
+      #ifdef DEBUG
+        cerr << "Created capsule shared graph at address " << py_shared_graph << endl;
+      #endif
+
+      return py_shared_graph;
+    }
+    catch (std::exception const & e )
+    {
+      string s = "Could not construct graph: " + string(e.what());
+      PyErr_SetString(PyExc_BaseException, s.c_str());
+      return NULL;
+    }
+  }
+
+  PyObject* _SharedGraph_get_info(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_shared_graph = NULL;
+
+    static const char* kwlist[] = {"shared_graph", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O", (char**) kwlist,
+                                     &py_shared_graph))
+        return NULL;
+
+    SharedGraph* shared_graph = decapsule_SharedGraph(py_shared_graph);
+    if (shared_graph == NULL)
+      return NULL;
+
+    Graph* graph = shared_graph->get_graph();
+    return Py_BuildValue("nnO", graph->vcount(), graph->ecount(), graph->is_directed() ? Py_True : Py_False);
+  }
+
+  PyObject* _SharedGraph_get_py_igraph(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_shared_graph = NULL;
+
+    static const char* kwlist[] = {"shared_graph", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O", (char**) kwlist,
+                                     &py_shared_graph))
+        return NULL;
+
+    SharedGraph* shared_graph = decapsule_SharedGraph(py_shared_graph);
+    if (shared_graph == NULL)
+      return NULL;
+
+    return get_py_igraph(shared_graph->get_graph());
+  }
+
   PyObject* _MutableVertexPartition_get_py_igraph(PyObject *self, PyObject *args, PyObject *keywds)
   {
     PyObject* py_partition = NULL;
@@ -483,33 +1146,7 @@ extern "C"
       cerr << "Using partition at address " << partition << endl;
     #endif
 
-    Graph* graph = partition->get_graph();
-
-    size_t n = graph->vcount();
-    size_t m = graph->ecount();
-
-    PyObject* edges = PyList_New(m);
-    for (size_t e = 0; e < m; e++)
-    {
-      vector<size_t> edge = graph->edge(e);
-      PyList_SetItem(edges, e, Py_BuildValue("(nn)", edge[0], edge[1]));
-    }
-
-    PyObject* weights = PyList_New(m);
-    for (size_t e = 0; e < m; e++)
-    {
-      PyObject* item = PyFloat_FromDouble(graph->edge_weight(e));
-      PyList_SetItem(weights, e, item);
-    }
-
-    PyObject* node_sizes = PyList_New(n);
-    for (size_t v = 0; v < n; v++)
-    {
-      PyObject* item = PyLong_FromSize_t(graph->node_size(v));
-      PyList_SetItem(node_sizes, v, item);
-    }
-
-    return Py_BuildValue("lOOOO", n, graph->is_directed() ? Py_True : Py_False, edges, weights, node_sizes);
+    return get_py_igraph(partition->get_graph());
   }
 
   PyObject* _MutableVertexPartition_from_coarse_partition(PyObject *self, PyObject *args, PyObject *keywds)
@@ -1009,7 +1646,7 @@ extern "C"
         return NULL;
 
     #ifdef DEBUG
-      cerr << "weight_to_comm(" << v << ", " << comm << ");" << endl;
+      cerr << "weight_from_comm(" << v << ", " << comm << ");" << endl;
     #endif
 
     #ifdef DEBUG
@@ -1034,7 +1671,7 @@ extern "C"
       cerr << "Using partition at address " << partition << endl;
     #endif
 
-    double diff = partition->weight_to_comm(v, comm);
+    double diff = partition->weight_from_comm(v, comm);
     return PyFloat_FromDouble(diff);
   }
 
@@ -1075,6 +1712,144 @@ extern "C"
     return py_membership;
   }
 
+  PyObject* _MutableVertexPartition_update_edges(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_partition = NULL;
+    PyObject* py_added_edges = NULL;
+    PyObject* py_added_weights = NULL;
+    PyObject* py_removed_edges = NULL;
+    PyObject* py_reweighted_edges = NULL;
+    PyObject* py_new_weights = NULL;
+
+    static const char* kwlist[] = {"partition", "added_edges", "added_weights", "removed_edges", "reweighted_edges", "new_weights", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O|OOOOO", (char**) kwlist,
+                                     &py_partition, &py_added_edges, &py_added_weights,
+                                     &py_removed_edges, &py_reweighted_edges, &py_new_weights))
+        return NULL;
+
+    #ifdef DEBUG
+      cerr << "update_edges();" << endl;
+    #endif
+
+    MutableVertexPartition* partition = decapsule_MutableVertexPartition(py_partition);
+    Graph* graph = partition->get_graph();
+
+    vector<size_t> affected_nodes;
+    try
+    {
+      vector<size_t> added_edges, removed_edges, reweighted_edges;
+      vector<double> added_weights, new_weights;
+      if (py_added_edges != NULL && py_added_edges != Py_None)
+        added_edges = create_edge_vector(py_added_edges, graph->vcount());
+      if (py_added_weights != NULL && py_added_weights != Py_None)
+        added_weights = create_double_vector(py_added_weights, "Expected floating point value for added weights.");
+      if (py_removed_edges != NULL && py_removed_edges != Py_None)
+        removed_edges = create_index_vector(py_removed_edges, graph->ecount(), "Expected edge ids of the graph for removed edges.");
+      if (py_reweighted_edges != NULL && py_reweighted_edges != Py_None)
+        reweighted_edges = create_index_vector(py_reweighted_edges, graph->ecount(), "Expected edge ids of the graph for reweighted edges.");
+      if (py_new_weights != NULL && py_new_weights != Py_None)
+        new_weights = create_double_vector(py_new_weights, "Expected floating point value for new weights.");
+
+      // Only CPM accepts negative weights (see _new_CPMVertexPartition)
+      bool check_positive_weight = dynamic_cast<CPMVertexPartition*>(partition) == NULL;
+      check_weights(added_weights, check_positive_weight);
+      check_weights(new_weights, check_positive_weight);
+
+      // A shared graph can not be changed, so use a copy of the graph instead,
+      // which no longer requires the shared graph (see
+      // capsule_MutableVertexPartition).
+      PyObject* py_shared_graph = (PyObject*) PyCapsule_GetContext(py_partition);
+      if (py_shared_graph != NULL)
+      {
+        partition->copy_graph();
+        PyCapsule_SetContext(py_partition, NULL);
+        Py_DECREF(py_shared_graph);
+      }
+
+      affected_nodes = partition->update_edges(reweighted_edges, new_weights, removed_edges, added_edges, added_weights);
+    }
+    catch (std::exception& e )
+    {
+      string s = "Could not update edges: " + string(e.what());
+      PyErr_SetString(PyExc_BaseException, s.c_str());
+      return NULL;
+    }
+
+    PyObject* py_affected_nodes = PyList_New(affected_nodes.size());
+    for (size_t i = 0; i < affected_nodes.size(); i++)
+      PyList_SET_ITEM(py_affected_nodes, i, PyLong_FromSize_t(affected_nodes[i]));
+    return py_affected_nodes;
+  }
+
+  PyObject* _MutableVertexPartition_get_membership_buffer(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_partition = NULL;
+    static const char* kwlist[] = {"partition", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O", (char**) kwlist,
+                                     &py_partition))
+        return NULL;
+
+    #ifdef DEBUG
+      cerr << "get_membership_buffer();" << endl;
+    #endif
+
+    MutableVertexPartition* partition = decapsule_MutableVertexPartition(py_partition);
+
+    // Write the membership as native 64 bit integers to a bytearray, which
+    // can be wrapped by NumPy (or array.array) without further conversion.
+    size_t n = partition->get_graph()->vcount();
+    PyObject* py_buffer = PyByteArray_FromStringAndSize(NULL, n*sizeof(int64_t));
+    if (py_buffer == NULL)
+      return NULL;
+
+    int64_t* membership = (int64_t*) PyByteArray_AsString(py_buffer);
+    for (size_t v = 0; v < n; v++)
+      membership[v] = (int64_t) partition->membership(v);
+
+    return py_buffer;
+  }
+
+  PyObject* _MutableVertexPartition_get_nb_clusters(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_partition = NULL;
+    static const char* kwlist[] = {"partition", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O", (char**) kwlist,
+                                     &py_partition))
+        return NULL;
+
+    #ifdef DEBUG
+      cerr << "get_nb_clusters();" << endl;
+    #endif
+
+    MutableVertexPartition* partition = decapsule_MutableVertexPartition(py_partition);
+
+    // The number of clusters as seen by igraph, i.e. the highest community
+    // in the membership plus one, which may differ from n_communities() when
+    // the last communities are empty.
+    size_t n = partition->get_graph()->vcount();
+    size_t nb_clusters = 0;
+    for (size_t v = 0; v < n; v++)
+      if (partition->membership(v) >= nb_clusters)
+        nb_clusters = partition->membership(v) + 1;
+
+    return PyLong_FromSize_t(nb_clusters);
+  }
+
   PyObject* _MutableVertexPartition_set_membership(PyObject *self, PyObject *args, PyObject *keywds)
   {
     PyObject* py_partition = NULL;
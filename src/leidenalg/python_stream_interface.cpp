@@ -0,0 +1,305 @@
+#include "python_stream_interface.h"
+
+PyObject* capsule_GraphStream(GraphStream* stream)
+{
+  PyObject* py_stream = PyCapsule_New(stream, "leidenalg.GraphStream", del_GraphStream);
+  return py_stream;
+}
+
+GraphStream* decapsule_GraphStream(PyObject* py_stream)
+{
+  GraphStream* stream = (GraphStream*) PyCapsule_GetPointer(py_stream, "leidenalg.GraphStream");
+  return stream;
+}
+
+void del_GraphStream(PyObject* py_stream)
+{
+  GraphStream* stream = decapsule_GraphStream(py_stream);
+  delete stream;
+}
+
+// Read a chunk of edges, and optionally weights, of a stream.
+static void read_edge_chunk(PyObject* py_edges, PyObject* py_weights, vector<size_t>& edges, vector<double>& weights)
+{
+  // Nodes are only bounded by the first pass (see GraphStream::add_nodes)
+  edges = create_edge_vector(py_edges, PY_SSIZE_T_MAX);
+  if (py_weights != NULL && py_weights != Py_None)
+  {
+    weights = create_double_vector(py_weights, "Expected floating point value for weights.");
+    check_weights(weights, true);
+  }
+}
+
+#ifdef __cplusplus
+extern "C"
+{
+#endif
+
+  PyObject* _new_GraphStream(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    Py_ssize_t n = 0;
+    int directed = false;
+    double max_degree = 0.0;
+    Py_ssize_t max_comm_size = 0;
+
+    static const char* kwlist[] = {"n", "directed", "max_degree", "max_comm_size", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "npdn", (char**) kwlist,
+                                     &n, &directed, &max_degree, &max_comm_size))
+        return NULL;
+
+    if (n < 0)
+    {
+      PyErr_SetString(PyExc_ValueError, "Number of nodes cannot be negative.");
+      return NULL;
+    }
+
+    if (max_comm_size < 0)
+    {
+      PyErr_SetString(PyExc_ValueError, "Maximal community size cannot be negative.");
+      return NULL;
+    }
+
+    GraphStream* stream = NULL;
+    try
+    {
+      stream = new GraphStream(n, directed, max_degree, max_comm_size);
+    }
+    catch (std::exception& e )
+    {
+      string s = "Could not construct graph stream: " + string(e.what());
+      PyErr_SetString(PyExc_BaseException, s.c_str());
+      return NULL;
+    }
+
+    return capsule_GraphStream(stream);
+  }
+
+  PyObject* _GraphStream_cluster_edges(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_stream = NULL;
+    PyObject* py_edges = NULL;
+    PyObject* py_weights = NULL;
+
+    static const char* kwlist[] = {"stream", "edges", "weights", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OO|O", (char**) kwlist,
+                                     &py_stream, &py_edges, &py_weights))
+        return NULL;
+
+    GraphStream* stream = decapsule_GraphStream(py_stream);
+
+    try
+    {
+      vector<size_t> edges;
+      vector<double> weights;
+      read_edge_chunk(py_edges, py_weights, edges, weights);
+      stream->cluster_edges(edges, weights);
+    }
+    catch (std::exception& e )
+    {
+      string s = "Could not cluster edges: " + string(e.what());
+      PyErr_SetString(PyExc_BaseException, s.c_str());
+      return NULL;
+    }
+
+    Py_INCREF(Py_None);
+    return Py_None;
+  }
+
+  PyObject* _GraphStream_aggregate_edges(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_stream = NULL;
+    PyObject* py_edges = NULL;
+    PyObject* py_weights = NULL;
+
+    static const char* kwlist[] = {"stream", "edges", "weights", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OO|O", (char**) kwlist,
+                                     &py_stream, &py_edges, &py_weights))
+        return NULL;
+
+    GraphStream* stream = decapsule_GraphStream(py_stream);
+
+    try
+    {
+      vector<size_t> edges;
+      vector<double> weights;
+      read_edge_chunk(py_edges, py_weights, edges, weights);
+      stream->aggregate_edges(edges, weights);
+    }
+    catch (std::exception& e )
+    {
+      string s = "Could not aggregate edges: " + string(e.what());
+      PyErr_SetString(PyExc_BaseException, s.c_str());
+      return NULL;
+    }
+
+    Py_INCREF(Py_None);
+    return Py_None;
+  }
+
+  PyObject* _GraphStream_aggregate_partition(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_stream = NULL;
+    PyObject* py_partition = NULL;
+
+    static const char* kwlist[] = {"stream", "partition", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OO", (char**) kwlist,
+                                     &py_stream, &py_partition))
+        return NULL;
+
+    GraphStream* stream = decapsule_GraphStream(py_stream);
+    // The partition only determines the type (and parameters) of the
+    // aggregate partition, similar to MutableVertexPartition::create, and
+    // whether self-loops are corrected for.
+    MutableVertexPartition* partition = decapsule_MutableVertexPartition(py_partition);
+
+    MutableVertexPartition* aggregate_partition = NULL;
+    try
+    {
+      Graph* aggregate_graph = stream->aggregate_graph(partition->get_graph()->correct_self_loops());
+      aggregate_partition = partition->create(aggregate_graph);
+      aggregate_partition->destructor_delete_graph = true;
+    }
+    catch (std::exception& e )
+    {
+      string s = "Could not create aggregate partition: " + string(e.what());
+      PyErr_SetString(PyExc_BaseException, s.c_str());
+      return NULL;
+    }
+
+    return capsule_MutableVertexPartition(aggregate_partition);
+  }
+
+  PyObject* _GraphStream_merge_communities(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_stream = NULL;
+    PyObject* py_partition = NULL;
+
+    static const char* kwlist[] = {"stream", "partition", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "OO", (char**) kwlist,
+                                     &py_stream, &py_partition))
+        return NULL;
+
+    GraphStream* stream = decapsule_GraphStream(py_stream);
+    // The communities of the stream are merged according to the partition of
+    // the aggregate graph.
+    MutableVertexPartition* partition = decapsule_MutableVertexPartition(py_partition);
+
+    try
+    {
+      stream->merge_communities(as_size_t_vector(partition->membership()));
+    }
+    catch (std::exception& e )
+    {
+      string s = "Could not merge communities: " + string(e.what());
+      PyErr_SetString(PyExc_BaseException, s.c_str());
+      return NULL;
+    }
+
+    Py_INCREF(Py_None);
+    return Py_None;
+  }
+
+  PyObject* _GraphStream_get_membership_buffer(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_stream = NULL;
+    PyObject* py_partition = NULL;
+
+    static const char* kwlist[] = {"stream", "partition", NULL};
+
+    #ifdef DEBUG
+      cerr << "Parsing arguments..." << endl;
+    #endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O|O", (char**) kwlist,
+                                     &py_stream, &py_partition))
+        return NULL;
+
+    GraphStream* stream = decapsule_GraphStream(py_stream);
+
+    // If a partition of the aggregate graph is given, nodes are in the
+    // community of their aggregate node.
+    MutableVertexPartition* partition = NULL;
+    if (py_partition != NULL && py_partition != Py_None)
+    {
+      partition = decapsule_MutableVertexPartition(py_partition);
+      if (partition->get_graph()->vcount() != stream->n_communities())
+      {
+        PyErr_SetString(PyExc_ValueError, "Partition is not a partition of the aggregate graph.");
+        return NULL;
+      }
+    }
+
+    // Write the membership as native 64 bit integers to a bytearray, similar
+    // to _MutableVertexPartition_get_membership_buffer.
+    size_t n = stream->vcount();
+    PyObject* py_buffer = PyByteArray_FromStringAndSize(NULL, n*sizeof(int64_t));
+    if (py_buffer == NULL)
+      return NULL;
+
+    int64_t* membership = (int64_t*) PyByteArray_AsString(py_buffer);
+    for (size_t v = 0; v < n; v++)
+    {
+      size_t comm = stream->membership(v);
+      membership[v] = (int64_t) (partition == NULL ? comm : partition->membership(comm));
+    }
+
+    return py_buffer;
+  }
+
+  PyObject* _GraphStream_get_info(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_stream = NULL;
+
+    static const char* kwlist[] = {"stream", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O", (char**) kwlist,
+                                     &py_stream))
+        return NULL;
+
+    GraphStream* stream = decapsule_GraphStream(py_stream);
+    return Py_BuildValue("nnn", (Py_ssize_t) stream->vcount(), (Py_ssize_t) stream->n_communities(),
+                         (Py_ssize_t) stream->aggregate_ecount());
+  }
+
+  PyObject* _GraphStream_has_self_loops(PyObject *self, PyObject *args, PyObject *keywds)
+  {
+    PyObject* py_stream = NULL;
+
+    static const char* kwlist[] = {"stream", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O", (char**) kwlist,
+                                     &py_stream))
+        return NULL;
+
+    GraphStream* stream = decapsule_GraphStream(py_stream);
+    return PyBool_FromLong(stream->has_self_loops());
+  }
+
+#ifdef __cplusplus
+}
+#endif
@@ -38,6 +38,21 @@ class OptimiserTest(unittest.TestCase):
         partition.sizes(), [1, 1, 1],
         msg="CPMVertexPartition(resolution_parameter=0.1) of one edge plus singleton after move nodes with fixed nodes is incorrect.")
 
+  def test_move_nodes_with_nodes(self):
+    G = ig.Graph.Full(100)
+    partition = leidenalg.CPMVertexPartition(G, resolution_parameter=0.5)
+    self.optimiser.move_nodes(partition, consider_comms=leidenalg.ALL_NEIGH_COMMS, nodes=[])
+    self.assertEqual(
+        len(partition), 100,
+        msg="Nodes were moved although no nodes were considered.")
+    # Other nodes are considered once their neighbours move
+    self.optimiser.move_nodes(partition, consider_comms=leidenalg.ALL_NEIGH_COMMS, nodes=[0])
+    self.assertListEqual(
+        partition.sizes(), [100],
+        msg="CPMVertexPartition(resolution_parameter=0.5) of complete graph after move nodes from a single node incorrect.")
+    with self.assertRaises(ValueError):
+      self.optimiser.move_nodes(partition, nodes=[100])
+
   def test_merge_nodes(self):
     G = ig.Graph.Full(100)
     partition = leidenalg.CPMVertexPartition(G, resolution_parameter=0.5)
@@ -71,6 +86,30 @@ class OptimiserTest(unittest.TestCase):
           partition.diff_move(v.index, c), 1e-10, # Allow for a small difference up to rounding error.
           msg="Was able to move a node to a better community, violating node optimality.")
 
+  def test_move_nodes_improvement(self):
+    for directed in [False, True]:
+      G = ig.Graph.Erdos_Renyi(100, p=5./100, directed=directed, loops=True)
+      G.es['weight'] = [1.0 + (e.index % 3) for e in G.es]
+      for partition_type, kwargs in [
+          (leidenalg.ModularityVertexPartition, {}),
+          (leidenalg.RBConfigurationVertexPartition, {'resolution_parameter': 0.5}),
+          (leidenalg.CPMVertexPartition, {'resolution_parameter': 0.1}),
+          (leidenalg.CPMVertexPartition, {'resolution_parameter': 0.1, 'correct_self_loops': False}),
+          (leidenalg.RBERVertexPartition, {'resolution_parameter': 0.5})]:
+        partition = partition_type(G, weights='weight', **kwargs)
+        quality = partition.quality()
+        diff = self.optimiser.move_nodes(partition, consider_comms=leidenalg.ALL_NEIGH_COMMS)
+        self.assertAlmostEqual(
+          partition.quality() - quality, diff, places=8,
+          msg="Improvement of move nodes for {0} (directed={1}) does not equal difference in quality.".format(partition_type.__name__, directed))
+      for partition_type in [leidenalg.SignificanceVertexPartition, leidenalg.SurpriseVertexPartition]:
+        partition = partition_type(G)
+        quality = partition.quality()
+        diff = self.optimiser.move_nodes(partition, consider_comms=leidenalg.ALL_NEIGH_COMMS)
+        self.assertAlmostEqual(
+          partition.quality() - quality, diff, places=8,
+          msg="Improvement of move nodes for {0} (directed={1}) does not equal difference in quality.".format(partition_type.__name__, directed))
+
   def test_optimiser(self):
     G = reduce(ig.Graph.disjoint_union, (ig.Graph.Tree(10, 3, mode=ig.TREE_UNDIRECTED) for i in range(10)))
     partition = leidenalg.CPMVertexPartition(G, resolution_parameter=0)
@@ -80,6 +119,16 @@ class OptimiserTest(unittest.TestCase):
         partition.sizes(), 10*[10],
         msg="After optimising partition failed to find different components with CPMVertexPartition(resolution_parameter=0)")
 
+  def test_optimiser_without_refinement(self):
+    G = reduce(ig.Graph.disjoint_union, (ig.Graph.Tree(10, 3, mode=ig.TREE_UNDIRECTED) for i in range(10)))
+    partition = leidenalg.CPMVertexPartition(G, resolution_parameter=0)
+    self.optimiser.consider_comms=leidenalg.ALL_NEIGH_COMMS
+    self.optimiser.refine_partition = False
+    self.optimiser.optimise_partition(partition, n_iterations=-1)
+    self.assertListEqual(
+        partition.sizes(), 10*[10],
+        msg="After optimising partition without refinement failed to find different components with CPMVertexPartition(resolution_parameter=0)")
+
   def test_optimiser_with_max_comm_size(self):
     G = ig.Graph.Full(100)
     partition = leidenalg.CPMVertexPartition(G, resolution_parameter=0)
@@ -153,6 +202,212 @@ class OptimiserTest(unittest.TestCase):
         partition.sizes(), 2*[50],
         msg="After optimising partition failed to find bipartite structure with CPMVertexPartition(resolution_parameter=-0.1)")
 
+  def test_optimiser_multiplex_inactive_layer(self):
+    G = ig.Graph.Famous('Zachary')
+    H = ig.Graph(G.vcount())
+    def optimise(graphs, node_sizes):
+      optimiser = leidenalg.Optimiser()
+      optimiser.set_rng_seed(42)
+      partitions = [leidenalg.CPMVertexPartition(graph, node_sizes=node_size, resolution_parameter=0.1)
+                    for graph, node_size in zip(graphs, node_sizes)]
+      optimiser.optimise_partition_multiplex(partitions)
+      return partitions[0].membership
+    self.assertListEqual(
+      optimise([G, H], [None, [0]*H.vcount()]), optimise([G], [None]),
+      msg="Adding a layer in which no node is active changes the multiplex optimisation.")
+
+  def test_optimiser_threads(self):
+    from concurrent.futures import ThreadPoolExecutor
+    graphs = [ig.Graph.Erdos_Renyi(100, p=5./100) for i in range(4)]
+    def optimise(G):
+      optimiser = leidenalg.Optimiser()
+      optimiser.set_rng_seed(42)
+      partition = leidenalg.ModularityVertexPartition(G)
+      optimiser.optimise_partition(partition)
+      return partition.membership
+    expected = [optimise(G) for G in graphs]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+      memberships = list(executor.map(optimise, graphs))
+    self.assertListEqual(
+      memberships, expected,
+      msg="Optimising partitions in parallel threads yields different results than sequentially.")
+
+  def test_shared_optimiser_threads(self):
+    import threading
+    graphs = [ig.Graph.Erdos_Renyi(2000 + 100*i, m=10000) for i in range(4)]
+    results = [None]*len(graphs)
+    errors = []
+    def optimise(i):
+      try:
+        partition = leidenalg.ModularityVertexPartition(graphs[i])
+        diff = self.optimiser.optimise_partition(partition, callback=lambda progress: False)
+        results[i] = (diff, self.optimiser.last_run_stats)
+      except Exception as e:
+        errors.append(e)
+    threads = [threading.Thread(target=optimise, args=(i,), daemon=True)
+               for i in range(len(graphs))]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join(timeout=60)
+      self.assertFalse(thread.is_alive(), msg="Threads sharing an optimiser deadlocked.")
+    self.assertListEqual(errors, [])
+    for G, (diff, stats) in zip(graphs, results):
+      self.assertEqual(stats[0]['n_communities_before'], G.vcount(),
+        msg="Statistics come from the run of another thread.")
+      self.assertAlmostEqual(
+        sum(s['improvement'] for s in stats), diff,
+        msg="Statistics come from the run of another thread.")
+
+  def test_last_run_stats(self):
+    G = ig.Graph.Famous('Zachary')
+    for n_threads in [1, 2]:
+      self.optimiser.n_threads = n_threads
+      partition = leidenalg.ModularityVertexPartition(G)
+      diff = self.optimiser.optimise_partition(partition, n_iterations=2)
+      stats = self.optimiser.last_run_stats
+      self.assertSetEqual(set(s['iteration'] for s in stats), {0, 1})
+      self.assertAlmostEqual(
+        sum(s['improvement'] for s in stats), diff,
+        msg="Improvements per level do not add up to the total improvement.")
+      first = stats[0]
+      self.assertEqual(first['level'], 0)
+      self.assertEqual(first['n_communities_before'], G.vcount())
+      self.assertEqual(first['nodes_visited'], G.vcount() + first['nodes_requeued'])
+      self.assertGreater(first['nodes_moved'], 0)
+      for s in stats:
+        self.assertGreaterEqual(s['move_nodes_time'], 0.0)
+        self.assertLessEqual(s['n_communities_after'], s['collapsed_vcount'])
+
+  def test_optimiser_callback(self):
+    G = ig.Graph.Erdos_Renyi(100, p=5./100)
+    for n_threads in [1, 2]:
+      self.optimiser.n_threads = n_threads
+      progress = []
+      def stop_at_second_level(p):
+        progress.append(p)
+        return p['level'] > 0
+      partition = leidenalg.ModularityVertexPartition(G)
+      diff = self.optimiser.optimise_partition(partition, n_iterations=2, callback=stop_at_second_level)
+      self.assertEqual(progress[0]['nodes_visited'], 0)
+      self.assertEqual(progress[0]['n_communities'], G.vcount())
+      self.assertEqual(progress[-1]['level'], 1)
+      self.assertSetEqual(set(p['iteration'] for p in progress), {0})
+      self.assertEqual(len(partition), progress[-1]['n_communities'])
+      self.assertAlmostEqual(
+        partition.quality(), leidenalg.ModularityVertexPartition(G, initial_membership=partition.membership).quality(),
+        msg="Partition is inconsistent after stopping the optimisation.")
+      self.assertAlmostEqual(diff, progress[-1]['improvement'])
+
+  def test_optimiser_callback_exception(self):
+    G = ig.Graph.Erdos_Renyi(100, p=5./100)
+    def fail(progress):
+      raise RuntimeError("Stop")
+    partition = leidenalg.ModularityVertexPartition(G)
+    with self.assertRaises(RuntimeError):
+      self.optimiser.optimise_partition(partition, callback=fail)
+    self.assertEqual(len(partition), G.vcount())
+
+  def test_optimiser_time_limit(self):
+    G = ig.Graph.Erdos_Renyi(100, p=5./100)
+    partition = leidenalg.ModularityVertexPartition(G)
+    diff = self.optimiser.optimise_partition(partition, n_iterations=-1, time_limit=0)
+    self.assertEqual(diff, 0.0)
+    self.assertEqual(len(partition), G.vcount())
+    self.assertEqual(len(self.optimiser.last_run_stats), 1)
+
+    partition = leidenalg.find_partition(G, leidenalg.ModularityVertexPartition, n_iterations=-1, time_limit=60)
+    self.assertGreater(partition.quality(), 0.0)
+
+  def test_optimiser_rel_tol(self):
+    G = ig.Graph.Erdos_Renyi(100, p=5./100)
+    partition = leidenalg.ModularityVertexPartition(G)
+    self.optimiser.optimise_partition(partition, n_iterations=10, rel_tol=10.0)
+    self.assertSetEqual(set(s['iteration'] for s in self.optimiser.last_run_stats), {0})
+
+  def test_optimise_partition_ensemble(self):
+    G = ig.Graph.Erdos_Renyi(500, p=5./500)
+    seeds = [3, 1, 4, 1, 5]
+    def optimise_ensemble(n_threads):
+      optimiser = leidenalg.Optimiser()
+      optimiser.n_threads = n_threads
+      partition = leidenalg.ModularityVertexPartition(G)
+      qualities, memberships = optimiser.optimise_partition_ensemble(
+        partition, seeds=seeds, return_memberships=True)
+      return partition, qualities, memberships
+    partition, qualities, memberships = optimise_ensemble(1)
+    self.assertEqual(len(memberships), len(seeds))
+    for seed, quality, membership in zip(seeds, qualities, memberships):
+      run_partition = leidenalg.find_partition(G, leidenalg.ModularityVertexPartition, seed=seed)
+      self.assertListEqual(list(membership), run_partition.membership)
+      self.assertAlmostEqual(quality, run_partition.quality())
+    best_run = qualities.index(max(qualities))
+    self.assertListEqual(partition.membership, list(memberships[best_run]))
+    partition3, qualities3, memberships3 = optimise_ensemble(3)
+    self.assertListEqual(partition3.membership, partition.membership,
+      msg="Ensemble of runs depends on the number of threads.")
+    self.assertListEqual(qualities3, qualities)
+
+  def test_optimise_partition_ensemble_time_limit(self):
+    G = ig.Graph.Erdos_Renyi(500, p=5./500)
+    optimiser = leidenalg.Optimiser()
+    optimiser.n_threads = 3
+    partition = leidenalg.ModularityVertexPartition(G)
+    quality = partition.quality()
+    qualities, memberships = optimiser.optimise_partition_ensemble(
+      partition, n_runs=5, return_memberships=True, time_limit=0)
+    self.assertEqual(len(qualities), 5)
+    for run_quality, membership in zip(qualities, memberships):
+      self.assertAlmostEqual(run_quality, quality)
+      self.assertListEqual(list(membership), list(range(G.vcount())))
+    self.assertEqual(len(partition), G.vcount())
+
+  def test_move_nodes_n_threads(self):
+    G = ig.Graph.Erdos_Renyi(2000, p=5./2000)
+    def move_nodes(n_threads):
+      optimiser = leidenalg.Optimiser()
+      optimiser.set_rng_seed(42)
+      optimiser.n_threads = n_threads
+      partition = leidenalg.ModularityVertexPartition(G)
+      optimiser.optimise_partition(partition)
+      return partition
+    partition2 = move_nodes(2)
+    partition4 = move_nodes(4)
+    self.assertListEqual(
+      partition2.membership, partition4.membership,
+      msg="Moving nodes in parallel depends on the number of threads.")
+    self.assertGreater(
+      partition2.quality(), 0,
+      msg="Moving nodes in parallel does not improve the partition.")
+    with self.assertRaises(ValueError):
+      self.optimiser.n_threads = -1
+
+  def test_move_nodes_n_threads_improvement(self):
+    G = ig.Graph.Erdos_Renyi(2000, p=5./2000)
+    self.optimiser.n_threads = 4
+    for partition_type in [leidenalg.ModularityVertexPartition,
+                           leidenalg.SurpriseVertexPartition]:
+      partition = partition_type(G)
+      quality = partition.quality()
+      diff = self.optimiser.move_nodes(partition)
+      self.assertAlmostEqual(
+        partition.quality() - quality, diff,
+        msg="Improvement of moving nodes in parallel is incorrect for {0}.".format(partition_type.__name__))
+
+  def test_refine_n_threads(self):
+    G = ig.Graph.Erdos_Renyi(2000, p=5./2000)
+    def refine(n_threads):
+      optimiser = leidenalg.Optimiser()
+      optimiser.set_rng_seed(42)
+      optimiser.n_threads = n_threads
+      optimiser.refine_routine = leidenalg.MOVE_NODES
+      partition = leidenalg.SurpriseVertexPartition(G)
+      optimiser.optimise_partition(partition)
+      return partition.membership
+    self.assertListEqual(
+      refine(2), refine(3),
+      msg="Refining in parallel depends on the number of threads.")
+
   def test_resolution_profile(self):
     G = ig.Graph.Famous('Zachary')
     profile = self.optimiser.resolution_profile(G, leidenalg.CPMVertexPartition, resolution_range=(0,1))
@@ -163,6 +418,89 @@ class OptimiserTest(unittest.TestCase):
       profile[-1].sizes(), [1]*G.vcount(),
       msg="Resolution profile incorrect: at resolution 1, not equal to a singleton partition for CPM.")
 
+  def test_find_partition_streaming(self):
+    G = ig.Graph.Famous('Zachary')
+    G.add_edge(0, 0)
+    G.es['weight'] = [1 + (e % 3) for e in range(G.ecount())]
+    edges = G.get_edgelist()
+    def chunks():
+      for i in range(0, len(edges), 10):
+        yield edges[i:i + 10], G.es[i:i + 10]['weight']
+
+    for partition_type in [leidenalg.ModularityVertexPartition, leidenalg.CPMVertexPartition]:
+      membership, partition = leidenalg.find_partition_streaming(
+        chunks, partition_type, max_stream_comm_size=5, seed=42)
+      self.assertEqual(len(membership), G.vcount())
+      self.assertLessEqual(max(partition.graph.vs['node_size']), 5)
+      self.assertAlmostEqual(
+        partition.quality(),
+        partition_type(G, initial_membership=list(membership), weights='weight').quality(),
+        msg="Quality of aggregate partition after streaming not equal to quality of membership.")
+
+    # The second pass contains a node that is not in the first pass
+    passes = []
+    def inconsistent_chunks():
+      passes.append(len(passes))
+      return [edges + [(0, 34)]] if len(passes) > 1 else [edges]
+    with self.assertRaises(BaseException):
+      leidenalg.find_partition_streaming(inconsistent_chunks, leidenalg.ModularityVertexPartition)
+
+  def test_find_partition_streaming_max_aggregate_size(self):
+    G = ig.Graph.Famous('Zachary')
+    G.add_edge(0, 0)
+    G.es['weight'] = [1 + (e % 3) for e in range(G.ecount())]
+    edges = G.get_edgelist()
+    def chunks():
+      for i in range(0, len(edges), 10):
+        yield edges[i:i + 10], G.es[i:i + 10]['weight']
+
+    for partition_type in [leidenalg.ModularityVertexPartition, leidenalg.CPMVertexPartition]:
+      membership, partition = leidenalg.find_partition_streaming(
+        chunks, partition_type, max_stream_comm_size=2, max_aggregate_size=0.5, seed=42,
+        weights=None, node_sizes=None, initial_membership=list(range(G.vcount())))
+      self.assertEqual(len(membership), G.vcount())
+      self.assertGreater(max(partition.graph.vs['node_size']), 2,
+        msg="Communities not merged when exceeding maximal aggregate size.")
+      self.assertAlmostEqual(sum(partition.graph.es['weight']), sum(G.es['weight']))
+      self.assertAlmostEqual(
+        partition.quality(),
+        partition_type(G, initial_membership=list(membership), weights='weight').quality(),
+        msg="Quality of aggregate partition after merging not equal to quality of membership.")
+
+    with self.assertRaises(ValueError):
+      leidenalg.find_partition_streaming(chunks, leidenalg.ModularityVertexPartition, weights='weight')
+
+  def test_find_partition_streaming_file(self):
+    try:
+      import numpy as np
+    except ImportError:
+      raise unittest.SkipTest('Reading edge files requires numpy')
+    import os
+    import tempfile
+
+    G = ig.Graph.Famous('Zachary')
+    edges = np.array(G.get_edgelist())
+    weights = np.arange(G.ecount()) % 3 + 1.0
+    with tempfile.TemporaryDirectory() as directory:
+      tsv = os.path.join(directory, 'edges.tsv')
+      with open(tsv, 'w') as f:
+        f.write('# source\ttarget\tweight\n')
+        for (source, target), weight in zip(edges, weights):
+          f.write('{0}\t{1}\t{2}\n'.format(source, target, weight))
+
+      binary = os.path.join(directory, 'edges.bin')
+      records = np.zeros(len(edges), dtype=[('source', '<i8'), ('target', '<i8'), ('weight', '<f8')])
+      records['source'], records['target'], records['weight'] = edges[:, 0], edges[:, 1], weights
+      records.tofile(binary)
+
+      membership_tsv, partition = leidenalg.find_partition_streaming(
+        tsv, leidenalg.ModularityVertexPartition, n=40, chunk_size=7, seed=42)
+      membership_bin, _ = leidenalg.find_partition_streaming(
+        binary, leidenalg.ModularityVertexPartition, n=40, format='binary', chunk_size=7, seed=42)
+      self.assertListEqual(list(membership_tsv), list(membership_bin))
+      self.assertEqual(len(membership_tsv), 40)
+      self.assertAlmostEqual(sum(partition.graph.es['weight']), weights.sum())
+
 #%%
 if __name__ == '__main__':
   #%%
@@ -2,6 +2,9 @@ import unittest
 import igraph as ig
 import leidenalg
 import random
+import os
+import tempfile
+from array import array
 from copy import deepcopy
 
 from ddt import ddt, data, unpack
@@ -147,6 +150,24 @@ class BaseTest:
           s, partition.total_weight_in_all_comms())
         )
 
+    @data(*graphs)
+    def test_quality_after_moves(self, graph):
+      kwargs = {}
+      if 'weight' in graph.es.attributes() and self.partition_type != leidenalg.SignificanceVertexPartition:
+        kwargs['weights'] = 'weight'
+      partition = self.partition_type(graph, **kwargs)
+      self.optimiser.optimise_partition(partition)
+      for v in range(0, graph.vcount(), 3):
+        partition.move_node(v, partition.membership[(7*v) % graph.vcount()])
+      # The quality is tracked while moving nodes, but calculated from scratch
+      # for a new partition.
+      new_partition = self.partition_type(graph, initial_membership=partition.membership, **kwargs)
+      self.assertAlmostEqual(
+        partition.quality(),
+        new_partition.quality(),
+        places=5,
+        msg='Quality after moving nodes not equal to quality of the same partition.')
+
     @data(*graphs)
     def test_copy(self, graph):
       if 'weight' in graph.es.attributes() and self.partition_type != leidenalg.SignificanceVertexPartition:
@@ -178,6 +199,126 @@ class BaseTest:
           partition.membership[0], partition2.membership[0])
         )
 
+    @data(*graphs)
+    def test_update_edges(self, graph):
+      is_weighted = 'weight' in graph.es.attributes()
+      if is_weighted and self.partition_type == leidenalg.SignificanceVertexPartition:
+        raise unittest.SkipTest('Significance doesn\'t handle weighted graphs')
+
+      graph = graph.copy()
+      if not is_weighted:
+        graph.es['weight'] = 1.0
+      partition = self.partition_type(graph, weights='weight')
+      self.optimiser.optimise_partition(partition)
+
+      # Self-loops are neither added nor removed, as whether self-loops are
+      # corrected for is only determined when creating the partition.
+      rng = random.Random(42)
+      edges = [e.index for e in graph.es if not e.is_loop()]
+      edges = rng.sample(edges, min(4, len(edges)))
+      reweighted_edges, removed_edges = edges[:2], edges[2:]
+      new_weights = [rng.random() for e in reweighted_edges] if is_weighted else []
+      added_edges = [tuple(rng.sample(range(graph.vcount()), 2)) for i in range(5)]
+      added_weights = [rng.random() if is_weighted else 1.0 for e in added_edges]
+
+      nodes = partition.update_edges(
+        added_edges=added_edges, added_weights=added_weights,
+        removed_edges=removed_edges,
+        reweighted_edges=reweighted_edges if is_weighted else None,
+        new_weights=new_weights if is_weighted else None)
+
+      if is_weighted:
+        graph.es[reweighted_edges]['weight'] = new_weights
+      graph.delete_edges(removed_edges)
+      graph.add_edges(added_edges, attributes={'weight': added_weights})
+      self.assertListEqual(partition.graph.get_edgelist(), graph.get_edgelist())
+      self.assertTrue(set(v for e in added_edges for v in e) <= set(nodes))
+
+      new_partition = self.partition_type(graph, initial_membership=partition.membership, weights='weight')
+      self.assertAlmostEqual(
+        partition.quality(),
+        new_partition.quality(),
+        places=5,
+        msg='Quality after updating edges ({0}) not equal to quality of partition of updated graph ({1}).'.format(
+          partition.quality(), new_partition.quality())
+        )
+      for c in range(len(partition)):
+        self.assertAlmostEqual(partition.total_weight_in_comm(c), new_partition.total_weight_in_comm(c), places=5)
+        self.assertAlmostEqual(partition.total_weight_from_comm(c), new_partition.total_weight_from_comm(c), places=5)
+
+      diff = self.optimiser.move_nodes(partition, nodes=nodes)
+      self.assertGreaterEqual(diff, 0)
+
+      with self.assertRaises(BaseException):
+        partition.update_edges(removed_edges=[graph.ecount()])
+
+    @data(*graphs)
+    def test_saved_graph(self, graph):
+      is_weighted = 'weight' in graph.es.attributes()
+      if is_weighted and self.partition_type == leidenalg.SignificanceVertexPartition:
+        raise unittest.SkipTest('Significance doesn\'t handle weighted graphs')
+
+      weights = 'weight' if is_weighted else None
+      with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'graph')
+        leidenalg.save_graph(graph, filename, weights=weights)
+
+        partition = self.partition_type(graph, weights=weights) if is_weighted else self.partition_type(graph)
+        saved_partition = self.partition_type(filename)
+        self.assertListEqual(saved_partition.graph.get_edgelist(), graph.get_edgelist())
+
+        optimiser = leidenalg.Optimiser()
+        optimiser.set_rng_seed(0)
+        optimiser.optimise_partition(partition)
+        optimiser.set_rng_seed(0)
+        optimiser.optimise_partition(saved_partition)
+        self.assertListEqual(saved_partition.membership, partition.membership)
+        self.assertAlmostEqual(saved_partition.quality(), partition.quality(), places=5)
+
+        # Updating the edges copies the graph, instead of changing the file.
+        edges = [e.index for e in graph.es if not e.is_loop()][:1]
+        saved_partition.update_edges(removed_edges=edges)
+        partition.update_edges(removed_edges=edges)
+        self.assertAlmostEqual(saved_partition.quality(), partition.quality(), places=5)
+        self.assertEqual(self.partition_type(filename).graph.ecount(), graph.ecount())
+
+        with self.assertRaises(BaseException):
+          self.partition_type(filename, initial_membership=[0]*(graph.vcount() + 1))
+
+    @data(*graphs)
+    def test_shared_graph(self, graph):
+      is_weighted = 'weight' in graph.es.attributes()
+      if is_weighted and self.partition_type == leidenalg.SignificanceVertexPartition:
+        raise unittest.SkipTest('Significance doesn\'t handle weighted graphs')
+
+      weights = 'weight' if is_weighted else None
+      shared_graph = leidenalg.SharedGraph(graph, weights=weights)
+      partition = self.partition_type(graph, weights=weights) if is_weighted else self.partition_type(graph)
+      shared_partition = self.partition_type(shared_graph)
+      other_partition = self.partition_type(shared_graph)
+      self.assertIs(shared_partition.graph, graph)
+
+      optimiser = leidenalg.Optimiser()
+      optimiser.set_rng_seed(0)
+      optimiser.optimise_partition(partition)
+      optimiser.set_rng_seed(0)
+      optimiser.optimise_partition(shared_partition)
+      self.assertListEqual(shared_partition.membership, partition.membership)
+      self.assertAlmostEqual(shared_partition.quality(), partition.quality(), places=5)
+
+      # Updating the edges copies the graph, instead of changing the shared graph.
+      edges = [e.index for e in graph.es if not e.is_loop()][:1]
+      shared_partition.update_edges(removed_edges=edges)
+      partition.update_edges(removed_edges=edges)
+      self.assertAlmostEqual(shared_partition.quality(), partition.quality(), places=5)
+      self.assertEqual(other_partition.quality(), self.partition_type(shared_graph).quality())
+
+      # The shared graph remains alive as long as its partitions.
+      del shared_graph
+      optimiser.optimise_partition(other_partition)
+
+      with self.assertRaises(BaseException):
+        self.partition_type(leidenalg.SharedGraph(graph), weights=[1.0]*graph.ecount())
 
 class ModularityVertexPartitionTest(BaseTest.MutableVertexPartitionTest):
   def setUp(self):
@@ -208,6 +349,162 @@ class CPMVertexPartitionTest(BaseTest.MutableVertexPartitionTest):
             layer_weights=[1, -1, -1])
     self.assertEqual(len(partition), 1)
 
+  def test_shared_graph_self_loops(self):
+    graph = ig.Graph.Famous('Zachary')
+    graph.add_edges([(0, 0), (1, 1)])
+    membership = [v % 3 for v in range(graph.vcount())]
+    shared_graph = leidenalg.SharedGraph(graph)
+    for correct_self_loops in [None, True, False]:
+      partition = leidenalg.CPMVertexPartition(
+          graph, initial_membership=membership, resolution_parameter=0.1,
+          correct_self_loops=correct_self_loops)
+      shared_partition = leidenalg.CPMVertexPartition(
+          shared_graph, initial_membership=membership, resolution_parameter=0.1,
+          correct_self_loops=correct_self_loops)
+      self.assertAlmostEqual(shared_partition.quality(), partition.quality())
+    self.assertAlmostEqual(
+        leidenalg.ModularityVertexPartition(shared_graph, membership).quality(),
+        leidenalg.ModularityVertexPartition(graph, membership).quality())
+
+  def test_saved_graph_self_loops_negative_weights(self):
+    graph = ig.Graph.Famous('Zachary')
+    graph.add_edges([(0, 0), (1, 1)])
+    weights = [1.0]*graph.ecount()
+    weights[0] = -1.0
+    membership = [v % 3 for v in range(graph.vcount())]
+    with tempfile.TemporaryDirectory() as directory:
+      filename = os.path.join(directory, 'graph')
+      leidenalg.save_graph(graph, filename, weights=weights)
+      for correct_self_loops in [None, True, False]:
+        partition = leidenalg.CPMVertexPartition(
+            graph, initial_membership=membership, weights=weights,
+            resolution_parameter=0.1, correct_self_loops=correct_self_loops)
+        saved_partition = leidenalg.CPMVertexPartition(
+            filename, initial_membership=membership,
+            resolution_parameter=0.1, correct_self_loops=correct_self_loops)
+        self.assertAlmostEqual(saved_partition.quality(), partition.quality())
+      with self.assertRaises(BaseException):
+        leidenalg.ModularityVertexPartition(filename)
+
+  def test_buffer_input(self):
+    graph = ig.Graph.Famous('Zachary')
+    weights = [random.random() for e in range(graph.ecount())]
+    node_sizes = [random.randint(1, 3) for v in range(graph.vcount())]
+    membership = [v % 3 for v in range(graph.vcount())]
+    partition = leidenalg.CPMVertexPartition(
+        graph, initial_membership=membership, weights=weights,
+        node_sizes=node_sizes, resolution_parameter=0.1)
+    buffer_partition = leidenalg.CPMVertexPartition(
+        graph, initial_membership=array('q', membership),
+        weights=array('d', weights), node_sizes=array('i', node_sizes),
+        resolution_parameter=0.1)
+    self.assertListEqual(partition.membership, buffer_partition.membership)
+    self.assertAlmostEqual(partition.quality(), buffer_partition.quality())
+
+    buffer_partition.set_membership(array('l', [0]*graph.vcount()))
+    self.assertEqual(len(buffer_partition), 1)
+
+    with self.assertRaises(BaseException):
+      leidenalg.CPMVertexPartition(
+          graph, weights=array('d', [float('nan')]*graph.ecount()))
+    with self.assertRaises(BaseException):
+      leidenalg.CPMVertexPartition(
+          graph, initial_membership=array('d', membership))
+
+  def test_buffer_input_other_formats(self):
+    try:
+      import numpy as np
+    except ImportError:
+      raise unittest.SkipTest('Test requires numpy')
+    # Buffers that can not be read directly are converted as a sequence.
+    graph = ig.Graph.Famous('Zachary')
+    weights = np.random.rand(graph.ecount()).astype(np.float16)
+    membership = [v % 3 for v in range(graph.vcount())]
+    partition = leidenalg.CPMVertexPartition(
+        graph, initial_membership=membership, weights=[float(w) for w in weights])
+    for buffer_weights, buffer_membership in [(weights, np.array(membership, dtype=object)),
+                                              (weights.astype(object), membership)]:
+      buffer_partition = leidenalg.CPMVertexPartition(
+          graph, initial_membership=buffer_membership, weights=buffer_weights)
+      self.assertListEqual(partition.membership, buffer_partition.membership)
+      self.assertAlmostEqual(partition.quality(), buffer_partition.quality())
+
+  def test_membership_array(self):
+    graph = ig.Graph.Famous('Zachary')
+    partition = leidenalg.CPMVertexPartition(graph, resolution_parameter=0.1)
+    self.optimiser.optimise_partition(partition)
+    membership = partition.membership
+    self.assertListEqual(list(partition.membership_array), membership)
+    self.assertEqual(len(partition), max(membership) + 1)
+
+    partition.move_node(0, len(partition) - 1)
+    self.assertEqual(partition.membership_array[0], len(partition) - 1)
+    self.assertListEqual(list(partition.membership_array), partition.membership)
+
+  def test_edge_list(self):
+    graph = ig.Graph.Famous('Zachary')
+    weights = [random.random() for e in range(graph.ecount())]
+    partition = leidenalg.CPMVertexPartition(
+        graph, weights=weights, resolution_parameter=0.1)
+    edge_list_partition = leidenalg.CPMVertexPartition(
+        (graph.vcount(), array('q', [v for e in graph.get_edgelist() for v in e])),
+        weights=weights, resolution_parameter=0.1)
+    self.assertAlmostEqual(partition.quality(), edge_list_partition.quality())
+    self.assertEqual(edge_list_partition.graph.vcount(), graph.vcount())
+    self.assertListEqual(edge_list_partition.graph.get_edgelist(), graph.get_edgelist())
+
+    directed_partition = leidenalg.ModularityVertexPartition(
+        (graph.vcount(), graph.get_edgelist(), True))
+    self.assertTrue(directed_partition.graph.is_directed())
+
+    with self.assertRaises(BaseException):
+      leidenalg.CPMVertexPartition((graph.vcount() - 1, graph.get_edgelist()))
+
+  def test_weight_to_comm_many_communities(self):
+    # With this many communities the weights to the neighbouring communities
+    # are cached in a hash table instead of a dense vector.
+    n = 200000
+    edges = [(v, (v + 1) % n) for v in range(n)] + [(v, (7*v + 3) % n) for v in range(n)]
+    weights = [1.0 + (e % 5) for e in range(len(edges))]
+    membership = [v % 150000 for v in range(n)]
+    partition = leidenalg.CPMVertexPartition(
+        (n, edges, True), initial_membership=membership, weights=weights)
+    partition.move_node(10, membership[11])
+    membership[10] = membership[11]
+    for v in [0, 10, 11, 149999, 150000, n - 1]:
+      weight_to, weight_from = {}, {}
+      for (u, w), weight in zip(edges, weights):
+        if u == v:
+          weight_to[membership[w]] = weight_to.get(membership[w], 0) + weight
+        if w == v:
+          weight_from[membership[u]] = weight_from.get(membership[u], 0) + weight
+      for c in set(weight_to) | set(weight_from) | {membership[v], 12345}:
+        self.assertAlmostEqual(partition.weight_to_comm(v, c), weight_to.get(c, 0))
+        self.assertAlmostEqual(partition.weight_from_comm(v, c), weight_from.get(c, 0))
+
+  def test_sparse_matrix(self):
+    try:
+      import scipy.sparse
+    except ImportError:
+      raise unittest.SkipTest('Sparse matrices require scipy')
+
+    graph = ig.Graph.Famous('Zachary')
+    graph.es['weight'] = [random.random() for e in range(graph.ecount())]
+    partition = leidenalg.CPMVertexPartition(
+        graph, weights='weight', resolution_parameter=0.1)
+    for matrix in [scipy.sparse.csr_matrix(graph.get_adjacency(attribute='weight').data),
+                   scipy.sparse.coo_matrix(graph.get_adjacency(attribute='weight').data)]:
+      sparse_partition = leidenalg.CPMVertexPartition(
+          matrix, resolution_parameter=0.1)
+      self.assertFalse(sparse_partition.graph.is_directed())
+      self.assertEqual(sparse_partition.graph.ecount(), graph.ecount())
+      self.assertAlmostEqual(partition.quality(), sparse_partition.quality())
+
+    directed_partition = leidenalg.CPMVertexPartition(
+        (scipy.sparse.csr_matrix(graph.get_adjacency().data), True))
+    self.assertTrue(directed_partition.graph.is_directed())
+    self.assertEqual(directed_partition.graph.ecount(), 2*graph.ecount())
+
 class SurpriseVertexPartitionTest(BaseTest.MutableVertexPartitionTest):
   def setUp(self):
     super(SurpriseVertexPartitionTest, self).setUp()